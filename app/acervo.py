@@ -0,0 +1,389 @@
+import os
+import json
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from app.normalizador import normalizar_texto
+from app.cache import CACHE_TTL
+from app.metricas import contar
+from app.triagem import TextoTriado
+
+# Banco do acervo de mensagens já processadas. Desligado por padrão: guarda o texto e os
+# cabeçalhos de cada e-mail enviado, então só é ativado definindo o caminho (ex: acervo/mensagens.db)
+ACERVO_DB_PATH = os.getenv("ACERVO_DB_PATH", "")
+# Metadados lidos do upload (remetente, data...) são gravados em transações deste tamanho
+ACERVO_LOTE_ESCRITA = int(os.getenv("ACERVO_LOTE_ESCRITA", "500"))
+# Máximo de chaves por SELECT ... IN (...) nas consultas em lote (limite de parâmetros do SQLite)
+_CHAVES_POR_CONSULTA = 500
+
+
+def hash_normalizado(normalizado: str) -> str:
+    """Chave de uma mensagem cujo texto já passou por normalizar_texto/preprocessar_texto."""
+    return hashlib.sha256(normalizado.encode("utf-8", errors="surrogatepass")).hexdigest()
+
+
+def hash_mensagem(texto: str) -> str:
+    """Chave de uma mensagem no acervo: hash do texto normalizado."""
+    return hash_normalizado(normalizar_texto(texto))
+
+
+def _data_epoch(valor: str):
+    # "Date:" do e-mail -> timestamp (None se ausente ou inválido)
+    if not valor:
+        return None
+    try:
+        data = parsedate_to_datetime(valor)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.timestamp()
+
+
+def _data_iso(epoch):
+    if epoch is None:
+        return None
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def _consulta_fts(texto: str) -> str:
+    # Cada palavra vira um termo entre aspas (sem operadores do FTS5 vindos do usuário)
+    termos = [t.replace('"', '""') for t in texto.split() if t.strip('"')]
+    return " ".join(f'"{t}"' for t in termos)
+
+
+class AcervoMensagens:
+    """
+    Acervo persistente (SQLite) das mensagens já processadas, pela chave hash_mensagem:
+    texto, metadados do e-mail (Message-ID, remetente, assunto, data), label, score e
+    resposta, além das análises parciais por bloco. Serve para:
+      - pular, em novos uploads, as mensagens já vistas (a classificação e a resposta
+        saem daqui, sem chamar a IA);
+      - consultas por label, data, remetente e texto (FTS5) sem nenhuma chamada ao modelo.
+    Label e resposta são gravados com a versão que os gerou (modelos da rota + versão do
+    prompt + temperatura, os mesmos campos de chave_cache) e só são reaproveitados com a
+    mesma versão e dentro de `ttl` segundos (CACHE_TTL): trocar o modelo ou o prompt
+    não devolve resultados antigos.
+    As escritas vão para uma fila consumida por uma única thread (quem grava não espera o
+    disco); as leituras são síncronas e, no código assíncrono, rodam em asyncio.to_thread.
+    """
+
+    def __init__(self, caminho_db: str = ACERVO_DB_PATH, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        Path(caminho_db).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(caminho_db, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS mensagens ("
+            " hash TEXT PRIMARY KEY, message_id TEXT, remetente TEXT, assunto TEXT, data REAL,"
+            " texto TEXT, label TEXT, score REAL, versao TEXT, classificado_em REAL,"
+            " resposta TEXT, resposta_label TEXT, resposta_versao TEXT, respondido_em REAL,"
+            " criado_em REAL NOT NULL, atualizado_em REAL NOT NULL)"
+        )
+        for coluna in ("label", "data", "remetente", "message_id"):
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS mensagens_{coluna} ON mensagens ({coluna})")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS parciais (chave TEXT PRIMARY KEY, dados TEXT NOT NULL, criado_em REAL NOT NULL)"
+        )
+        self.fts = self._criar_fts()
+        self._pendentes = []
+        self._escritas = queue.Queue()
+        threading.Thread(target=self._escrever, name="acervo-escrita", daemon=True).start()
+
+    def _criar_fts(self) -> bool:
+        # Índice de texto completo (FTS5, external content); sem FTS5 a busca usa LIKE
+        try:
+            self._db.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS mensagens_fts USING fts5("
+                " assunto, texto, remetente, content='mensagens', content_rowid='rowid')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._db.executescript(
+            "CREATE TRIGGER IF NOT EXISTS mensagens_ai AFTER INSERT ON mensagens BEGIN"
+            "  INSERT INTO mensagens_fts(rowid, assunto, texto, remetente)"
+            "  VALUES (new.rowid, new.assunto, new.texto, new.remetente);"
+            " END;"
+            "CREATE TRIGGER IF NOT EXISTS mensagens_ad AFTER DELETE ON mensagens BEGIN"
+            "  INSERT INTO mensagens_fts(mensagens_fts, rowid, assunto, texto, remetente)"
+            "  VALUES ('delete', old.rowid, old.assunto, old.texto, old.remetente);"
+            " END;"
+            "CREATE TRIGGER IF NOT EXISTS mensagens_au AFTER UPDATE OF assunto, texto, remetente ON mensagens BEGIN"
+            "  INSERT INTO mensagens_fts(mensagens_fts, rowid, assunto, texto, remetente)"
+            "  VALUES ('delete', old.rowid, old.assunto, old.texto, old.remetente);"
+            "  INSERT INTO mensagens_fts(rowid, assunto, texto, remetente)"
+            "  VALUES (new.rowid, new.assunto, new.texto, new.remetente);"
+            " END;"
+        )
+        return True
+
+    # --- Escrita ---
+
+    def _escrever(self):
+        # Thread de escrita: executa as gravações na ordem em que foram enfileiradas
+        while True:
+            sql, linhas = self._escritas.get()
+            try:
+                with self._lock:
+                    self._db.execute("BEGIN")
+                    try:
+                        self._db.executemany(sql, linhas)
+                    except Exception:
+                        self._db.execute("ROLLBACK")
+                        raise
+                    self._db.execute("COMMIT")
+                contar("autou_acervo_escritas_total", resultado="ok")
+            except Exception:
+                # Uma gravação perdida só faz a mensagem passar de novo pela IA no próximo envio
+                contar("autou_acervo_escritas_total", resultado="erro")
+            finally:
+                self._escritas.task_done()
+
+    def _enfileirar(self, sql: str, linhas: list):
+        # Uma transação por item da fila
+        self._escritas.put((sql, linhas))
+
+    def aguardar_escritas(self):
+        """Bloqueia até todas as gravações enfileiradas terminarem (ex: no encerramento do servidor)."""
+        self._escritas.join()
+
+    def anotar(self, texto: str, cabecalhos: dict = None):
+        """
+        Registra uma mensagem lida de um upload (com os cabeçalhos do e-mail, se houver).
+        As escritas são agrupadas (ACERVO_LOTE_ESCRITA); chame descarregar() no fim da leitura.
+        Não altera label/resposta de uma mensagem já conhecida.
+        """
+        normalizado = normalizar_texto(texto)
+        if not normalizado:
+            return
+        cab = cabecalhos or {}
+        message_id = (cab.get("message-id") or "").strip().strip("<>") or None
+        assunto = cab.get("subject")
+        if assunto is None and normalizado.startswith("Assunto: "):
+            assunto = normalizado.split("\n", 1)[0][len("Assunto: "):]
+        agora = time.time()
+        self._pendentes.append((hash_normalizado(normalizado), message_id, cab.get("from"), assunto,
+                                _data_epoch(cab.get("date")), normalizado, agora, agora))
+        if len(self._pendentes) >= ACERVO_LOTE_ESCRITA:
+            self.descarregar()
+
+    def descarregar(self):
+        """Envia para gravação as mensagens anotadas ainda pendentes."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+        if not pendentes:
+            return
+        self._enfileirar(
+            "INSERT INTO mensagens (hash, message_id, remetente, assunto, data, texto, criado_em, atualizado_em)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(hash) DO UPDATE SET"
+            "  message_id = COALESCE(excluded.message_id, message_id),"
+            "  remetente = COALESCE(excluded.remetente, remetente),"
+            "  assunto = COALESCE(excluded.assunto, assunto),"
+            "  data = COALESCE(excluded.data, data)",
+            pendentes,
+        )
+
+    def registrar_classificacoes(self, itens: list, versao: str):
+        """Grava [(texto, {"label", "score"}), ...] gerados na `versao` (uma transação por chamada)."""
+        if not itens:
+            return
+        agora = time.time()
+        linhas = []
+        for texto, resultado in itens:
+            normalizado = normalizar_texto(texto)
+            linhas.append((hash_normalizado(normalizado), normalizado, resultado.get("label"),
+                           resultado.get("score"), versao, agora, agora, agora))
+        self._enfileirar(
+            "INSERT INTO mensagens (hash, texto, label, score, versao, classificado_em, criado_em, atualizado_em)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(hash) DO UPDATE SET label = excluded.label, score = excluded.score,"
+            "  versao = excluded.versao, classificado_em = excluded.classificado_em,"
+            "  atualizado_em = excluded.atualizado_em",
+            linhas,
+        )
+
+    def registrar_resposta(self, texto: str, label: str, resposta: str, versao: str):
+        """Grava a resposta gerada na `versao` (válida enquanto o label e a versão forem os mesmos)."""
+        agora = time.time()
+        self._enfileirar(
+            "UPDATE mensagens SET resposta = ?, resposta_label = ?, resposta_versao = ?, respondido_em = ?,"
+            " atualizado_em = ? WHERE hash = ?",
+            [(resposta, label, versao, agora, agora, hash_mensagem(texto))],
+        )
+
+    def guardar_parcial(self, chave: str, dados: dict):
+        self._enfileirar(
+            "INSERT OR REPLACE INTO parciais (chave, dados, criado_em) VALUES (?, ?, ?)",
+            [(chave, json.dumps(dados, ensure_ascii=False), time.time())],
+        )
+
+    # --- Leitura ---
+
+    def _validos_desde(self) -> float:
+        return time.time() - self.ttl
+
+    def _consultar_hashes(self, colunas: str, condicao: str, hashes: list, params: tuple) -> dict:
+        # hash -> linha, em SELECTs de até _CHAVES_POR_CONSULTA chaves
+        linhas = {}
+        unicos = list(dict.fromkeys(hashes))
+        for inicio in range(0, len(unicos), _CHAVES_POR_CONSULTA):
+            parte = unicos[inicio:inicio + _CHAVES_POR_CONSULTA]
+            marcadores = ", ".join("?" * len(parte))
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT hash, {colunas} FROM mensagens WHERE hash IN ({marcadores}) AND {condicao}",
+                    (*parte, *params),
+                ).fetchall()
+            linhas.update((row[0], row[1:]) for row in rows)
+        return linhas
+
+    def obter_varios(self, chaves: list, versao: str) -> dict:
+        """
+        {chave: {"label", "score"}} das mensagens já classificadas na `versao` entre as `chaves`
+        (hash_mensagem), numa consulta por lote; as ausentes ficam fora do dicionário.
+        """
+        linhas = self._consultar_hashes(
+            "label, score", "label IS NOT NULL AND versao = ? AND classificado_em >= ?",
+            chaves, (versao, self._validos_desde()),
+        )
+        return {chave: {"label": label, "score": score} for chave, (label, score) in linhas.items()}
+
+    def obter(self, chave: str, versao: str):
+        """{"label", "score"} de uma mensagem já classificada na `versao` (chave = hash_mensagem), ou None."""
+        return self.obter_varios([chave], versao).get(chave)
+
+    def obter_respostas(self, itens: list, versao: str) -> list:
+        """
+        Respostas já geradas na `versao` para [(texto, label), ...] (None onde não houver),
+        numa consulta por lote.
+        """
+        hashes = [hash_mensagem(texto) for texto, _ in itens]
+        linhas = self._consultar_hashes(
+            "resposta, resposta_label", "resposta_versao = ? AND respondido_em >= ?",
+            hashes, (versao, self._validos_desde()),
+        )
+        respostas = []
+        for chave, (_, label) in zip(hashes, itens):
+            resposta, label_guardado = linhas.get(chave, (None, None))
+            respostas.append(resposta if label_guardado == label else None)
+        return respostas
+
+    def obter_resposta(self, texto: str, label: str, versao: str):
+        """Resposta já gerada na `versao` para a mensagem com esse label, ou None."""
+        return self.obter_respostas([(texto, label)], versao)[0]
+
+    def obter_parcial(self, chave: str):
+        # A chave já traz modelo e versão do prompt (chave_cache); aqui só vale o prazo
+        with self._lock:
+            row = self._db.execute(
+                "SELECT dados FROM parciais WHERE chave = ? AND criado_em >= ?", (chave, self._validos_desde())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def consultar(self, label: str = None, remetente: str = None, desde: float = None, ate: float = None,
+                  texto: str = None, limite: int = 50, offset: int = 0) -> dict:
+        """
+        Busca no acervo (sem chamar a IA). Filtros combinados com E:
+        label exato, remetente (trecho), data (timestamps) e texto (FTS5 em assunto/corpo/remetente).
+        Retorna {"total": N, "itens": [...]} ordenado da mensagem mais recente para a mais antiga.
+        """
+        condicoes = []
+        params = []
+        if label:
+            condicoes.append("m.label = ?")
+            params.append(label)
+        if remetente:
+            condicoes.append("m.remetente LIKE ?")
+            params.append(f"%{remetente}%")
+        if desde is not None:
+            condicoes.append("m.data >= ?")
+            params.append(desde)
+        if ate is not None:
+            condicoes.append("m.data < ?")
+            params.append(ate)
+        origem = "mensagens m"
+        if texto and texto.strip():
+            consulta = _consulta_fts(texto)
+            if self.fts and consulta:
+                origem = "mensagens_fts f JOIN mensagens m ON m.rowid = f.rowid"
+                condicoes.append("mensagens_fts MATCH ?")
+                params.append(consulta)
+            else:
+                condicoes.append("(m.texto LIKE ? OR m.assunto LIKE ?)")
+                params.extend([f"%{texto.strip()}%"] * 2)
+        where = (" WHERE " + " AND ".join(condicoes)) if condicoes else ""
+        # A busca enxerga tudo o que já foi enviado para gravação
+        self.aguardar_escritas()
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM {origem}{where}", params).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT m.hash, m.message_id, m.remetente, m.assunto, m.data, m.label, m.score, m.resposta,"
+                f" substr(m.texto, 1, 300) FROM {origem}{where}"
+                " ORDER BY m.data IS NULL, m.data DESC, m.criado_em DESC LIMIT ? OFFSET ?",
+                params + [limite, offset],
+            ).fetchall()
+        itens = [
+            {"id": r[0], "message_id": r[1], "remetente": r[2], "assunto": r[3], "data": _data_iso(r[4]),
+             "label": r[5], "score": r[6], "resposta": r[7], "trecho": r[8]}
+            for r in rows
+        ]
+        return {"total": total, "itens": itens}
+
+    def resumo(self) -> dict:
+        """Totais do acervo: mensagens, por label e com resposta."""
+        self.aguardar_escritas()
+        with self._lock:
+            total, com_resposta = self._db.execute(
+                "SELECT COUNT(*), COUNT(resposta) FROM mensagens"
+            ).fetchone()
+            por_label = dict(self._db.execute(
+                "SELECT COALESCE(label, 'nao_classificada'), COUNT(*) FROM mensagens GROUP BY 1"
+            ).fetchall())
+        return {"total": total, "com_resposta": com_resposta, "por_label": por_label}
+
+
+_acervo = None
+_acervo_lock = threading.Lock()
+
+
+def obter_acervo():
+    """Acervo compartilhado do processo (None se ACERVO_DB_PATH estiver vazio)."""
+    global _acervo
+    if not ACERVO_DB_PATH:
+        return None
+    with _acervo_lock:
+        if _acervo is None:
+            _acervo = AcervoMensagens(ACERVO_DB_PATH)
+    return _acervo
+
+
+def anotar_emails(mensagens, preparar=None):
+    """
+    Percorre MensagemEmail's (ex: iterar_emails_mbox), registra cada uma no acervo
+    com os cabeçalhos e gera o texto (passado por `preparar`, se informado); o texto
+    das mensagens com veredito da triagem sai como TextoTriado (app/triagem.py).
+    """
+    acervo = obter_acervo()
+    try:
+        for m in mensagens:
+            if not m.texto:
+                continue
+            texto = preparar(m.texto) if preparar else m.texto
+            if m.triagem is not None:
+                texto = TextoTriado(texto, m.triagem)
+            if acervo is not None:
+                acervo.anotar(texto, m.cabecalhos)
+            yield texto
+    finally:
+        if acervo is not None:
+            acervo.descarregar()
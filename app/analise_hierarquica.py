@@ -0,0 +1,340 @@
+import os
+import json
+import asyncio
+import hashlib
+
+import httpx
+
+from app.nlp_utils import (
+    _modelo_da_tarefa,
+    preprocessar_texto,
+    _chamar_lote_com_retry,
+    gerar_analise_geral_async,
+)
+from app.acervo import obter_acervo
+from app.metricas import medir
+from app.resiliencia import DisjuntorAberto
+from app.contratos import FORMATO_ANALISE, interpretar_analise
+from app.cache import chave_cache, obter_cache
+from app.lotes import LimiteAdaptativo, executar_em_lotes, iterar_em_lotes, iterar_em_thread, encadear
+from app.tokens import estimar_tokens, caracteres_para_tokens
+from app.duplicatas import DUPLICATAS_ATIVO, condensar_mensagens, marcar_peso, peso
+
+# Orçamento de tokens de entrada por bloco (cada bloco vira uma chamada "map")
+ANALISE_ORCAMENTO_TOKENS = int(os.getenv("ANALISE_ORCAMENTO_TOKENS", "12000"))
+# Blocos analisados em paralelo
+ANALISE_EM_VOO = int(os.getenv("ANALISE_EM_VOO", "4"))
+# Quantas análises parciais são combinadas por chamada de redução
+ANALISE_FAN_IN = max(2, int(os.getenv("ANALISE_FAN_IN", "8")))
+
+PROMPT_VERSAO_ANALISE_PARCIAL = "anal-map-v2"
+PROMPT_VERSAO_ANALISE_REDUCAO = "anal-red-v1"
+
+SEPARADOR = "\n\n---\n\n"
+# Fronteira definida pelo conteúdo: em média 1 a cada N mensagens fecha o bloco
+# (depois de um tamanho mínimo). Assim, inserir mensagens novas só muda os blocos
+# vizinhos e os demais continuam batendo no cache.
+_DIVISOR_FRONTEIRA = 8
+
+
+def _eh_fronteira(texto: str) -> bool:
+    h = hashlib.blake2b(texto.encode("utf-8", errors="surrogatepass"), digest_size=4).digest()
+    return int.from_bytes(h, "big") % _DIVISOR_FRONTEIRA == 0
+
+
+def _pedacos(texto: str, max_caracteres: int):
+    """
+    Divide uma mensagem maior que o orçamento em pedaços, cortando de preferência
+    em quebras de parágrafo/linha.
+    """
+    while len(texto) > max_caracteres:
+        corte = texto.rfind("\n\n", 0, max_caracteres)
+        if corte <= 0:
+            corte = texto.rfind("\n", 0, max_caracteres)
+        if corte <= 0:
+            corte = max_caracteres
+        yield texto[:corte]
+        texto = texto[corte:].lstrip()
+    if texto:
+        yield texto
+
+
+def dividir_em_blocos(mensagens, orcamento_tokens: int = None):
+    """
+    Agrupa as mensagens (iterável de textos) em blocos de até `orcamento_tokens`
+    tokens estimados. Gera listas de textos; consome a entrada sob demanda.
+    """
+    orcamento = orcamento_tokens or ANALISE_ORCAMENTO_TOKENS
+    minimo = orcamento // 4
+    max_caracteres = caracteres_para_tokens(orcamento)
+
+    bloco = []
+    tokens = 0
+    for msg in mensagens:
+        if not msg or not msg.strip():
+            continue
+        for pedaco in _pedacos(msg.strip(), max_caracteres):
+            t = estimar_tokens(pedaco)
+            if bloco and tokens + t > orcamento:
+                yield bloco
+                bloco, tokens = [], 0
+            bloco.append(pedaco)
+            tokens += t
+            if tokens >= minimo and _eh_fronteira(pedaco):
+                yield bloco
+                bloco, tokens = [], 0
+    if bloco:
+        yield bloco
+
+
+def _somar_uso(meta: dict, data: dict):
+    uso = (data or {}).get("usage") or {}
+    total = meta["usage"]
+    for campo in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        total[campo] += uso.get(campo, 0) or 0
+
+
+def _normalizar_parcial(analise: dict, mensagens: int) -> dict:
+    # Garante o formato {resumo, temas, acoes, mensagens}, com limites nas listas
+    if not isinstance(analise, dict):
+        raise ValueError("Análise parcial não é um objeto JSON.")
+    temas = [str(t) for t in (analise.get("temas") or []) if t][:10]
+    acoes = [str(a) for a in (analise.get("acoes") or []) if a][:5]
+    return {"resumo": str(analise.get("resumo") or ""), "temas": temas, "acoes": acoes, "mensagens": mensagens}
+
+
+async def _mapear_bloco(bloco: list, limite: LimiteAdaptativo, meta: dict):
+    """
+    Análise parcial de um bloco (etapa "map"). Retorna None se o bloco falhar,
+    para que a análise final siga com os demais.
+    """
+    texto = SEPARADOR.join(bloco)
+    cache = obter_cache()
+    acervo = obter_acervo()
+    chave = None
+    if cache is not None or acervo is not None:
+        chave = chave_cache("analise_parcial", preprocessar_texto(texto), _modelo_da_tarefa("analise"), PROMPT_VERSAO_ANALISE_PARCIAL, 0.0)
+    if cache is not None:
+        em_cache = await cache.obter_async(chave)
+        if em_cache is not None:
+            meta["cache"]["hits"] += 1
+            return em_cache
+        meta["cache"]["misses"] += 1
+    if acervo is not None:
+        # Blocos sem mudança de uma caixa já analisada (os cortes dependem só do conteúdo)
+        guardado = await asyncio.to_thread(acervo.obter_parcial, chave)
+        if guardado is not None:
+            meta.setdefault("acervo", {"parciais": 0})["parciais"] += 1
+            if cache is not None:
+                cache.guardar(chave, guardado)
+            return guardado
+
+    system = "Você é um assistente que analisa um bloco de e-mails (parte de uma caixa maior) e fornece um JSON com insights."
+    user = (
+        "Receba o bloco de e-mails abaixo (separados por ---) e devolva EXCLUSIVAMENTE um JSON com as chaves:\n\n"
+        " - resumo: string com 2 a 5 frases sobre o bloco\n"
+        " - temas: lista com até 10 temas (frases curtas)\n"
+        " - acoes: lista com até 5 ações práticas (curtas e acionáveis)\n\n"
+        "Um e-mail precedido de \"[N mensagens semelhantes]\" representa N e-mails quase iguais: pese-o por N.\n"
+        "NÃO adicione textos fora do JSON.\n\n"
+        "Conteúdo para análise:\n" + texto + "\n\n"
+        "Retorne SOMENTE o JSON final, nada além disso."
+    )
+    try:
+        conteudo, data = await _chamar_lote_com_retry(system, user, 600, limite, formato=FORMATO_ANALISE,
+                                                      tarefa="analise")
+        parcial = _normalizar_parcial(interpretar_analise(conteudo), sum(peso(t) for t in bloco))
+    except (httpx.HTTPError, ValueError, DisjuntorAberto) as e:
+        meta["blocos_com_erro"] += 1
+        meta.setdefault("erros", []).append(str(e))
+        return None
+
+    _somar_uso(meta, data)
+    if cache is not None:
+        cache.guardar(chave, parcial)
+    if acervo is not None:
+        acervo.guardar_parcial(chave, parcial)
+    return parcial
+
+
+def _combinar_localmente(grupo: list) -> dict:
+    """
+    Redução sem IA (usada se a chamada de redução falhar): junta os resumos e
+    mantém os temas/ações mais frequentes, na ordem em que apareceram.
+    """
+    def _mais_frequentes(chave, limite):
+        contagem = {}
+        for parcial in grupo:
+            for item in parcial.get(chave, []):
+                contagem[item] = contagem.get(item, 0) + parcial.get("mensagens", 1)
+        return sorted(contagem, key=lambda item: -contagem[item])[:limite]
+
+    return {
+        "resumo": " ".join(p["resumo"] for p in grupo if p.get("resumo")),
+        "temas": _mais_frequentes("temas", 10),
+        "acoes": _mais_frequentes("acoes", 5),
+        "mensagens": sum(p.get("mensagens", 1) for p in grupo),
+    }
+
+
+async def _reduzir_grupo(grupo: list, limite: LimiteAdaptativo, meta: dict) -> dict:
+    """
+    Combina várias análises parciais em uma só (etapa "reduce").
+    """
+    if len(grupo) == 1:
+        return grupo[0]
+
+    entrada = json.dumps(grupo, ensure_ascii=False, sort_keys=True)
+    mensagens = sum(p.get("mensagens", 1) for p in grupo)
+    cache = obter_cache()
+    chave = None
+    if cache is not None:
+        chave = chave_cache("analise_reducao", entrada, _modelo_da_tarefa("analise"), PROMPT_VERSAO_ANALISE_REDUCAO, 0.0)
+        em_cache = await cache.obter_async(chave)
+        if em_cache is not None:
+            meta["cache"]["hits"] += 1
+            return em_cache
+        meta["cache"]["misses"] += 1
+
+    system = "Você é um assistente que combina análises parciais de e-mails em uma análise única em JSON."
+    user = (
+        "Abaixo está uma lista JSON de análises parciais, cada uma de um bloco de e-mails "
+        "(o campo 'mensagens' indica quantos e-mails o bloco tinha; dê mais peso aos blocos maiores).\n"
+        "Combine-as e devolva EXCLUSIVAMENTE um JSON com as chaves:\n\n"
+        " - resumo: string com 3 a 8 frases claras e objetivas sobre o conjunto\n"
+        " - temas: lista com EXATAMENTE os 10 principais temas (ou menos, se não houver 10 distintos)\n"
+        " - acoes: lista com EXATAMENTE as 5 ações mais importantes (ou menos, se não houver 5 distintas)\n\n"
+        "Regras obrigatórias:\n"
+        " • Agrupe temas e ações semelhantes.\n"
+        " • NÃO adicione textos fora do JSON.\n\n"
+        "Análises parciais:\n" + entrada + "\n\n"
+        "Retorne SOMENTE o JSON final, nada além disso."
+    )
+    try:
+        with medir("analise_reducao"):
+            conteudo, data = await _chamar_lote_com_retry(system, user, 1000, limite, formato=FORMATO_ANALISE,
+                                                          tarefa="analise")
+        combinado = _normalizar_parcial(interpretar_analise(conteudo), mensagens)
+    except (httpx.HTTPError, ValueError, DisjuntorAberto) as e:
+        meta["reducoes_locais"] += 1
+        meta.setdefault("erros", []).append(str(e))
+        return _combinar_localmente(grupo)
+
+    _somar_uso(meta, data)
+    if chave is not None:
+        cache.guardar(chave, combinado)
+    return combinado
+
+
+def _agrupar_parciais(parciais: list, orcamento_tokens: int):
+    # Grupos de até ANALISE_FAN_IN parciais, respeitando o orçamento de tokens
+    grupo = []
+    tokens = 0
+    for parcial in parciais:
+        t = estimar_tokens(json.dumps(parcial, ensure_ascii=False))
+        if len(grupo) >= 2 and (len(grupo) >= ANALISE_FAN_IN or tokens + t > orcamento_tokens):
+            yield grupo
+            grupo, tokens = [], 0
+        grupo.append(parcial)
+        tokens += t
+    if grupo:
+        yield grupo
+
+
+def _blocos_da_entrada(mensagens, orcamento: int, duplicatas: dict = None):
+    # Leitura da entrada, agrupamento de quase duplicatas e divisão em blocos, tudo sob demanda
+    # (roda fora do event loop, em iterar_em_thread)
+    if duplicatas is not None:
+        mensagens = (marcar_peso(texto, n) for texto, n in condensar_mensagens(mensagens, contagem=duplicatas))
+    return dividir_em_blocos(mensagens, orcamento)
+
+
+async def gerar_analise_hierarquica_async(mensagens, orcamento_tokens: int = None, max_em_voo: int = None,
+                                         parciais_salvos: dict = None, ao_concluir_bloco=None):
+    """
+    Análise em duas etapas para caixas grandes:
+      - map: divide as mensagens em blocos por orçamento de tokens e analisa os blocos em paralelo;
+      - reduce: combina as análises parciais em rodadas (até ANALISE_FAN_IN por chamada)
+        até sobrar uma, no mesmo formato {resumo, temas, acoes} de gerar_analise_geral.
+    Se tudo couber em um bloco, usa gerar_analise_geral_async diretamente.
+    As análises parciais ficam em cache por bloco: reanalisar a caixa com poucas mensagens
+    novas só refaz os blocos afetados.
+    Para retomar uma execução interrompida (jobs), `parciais_salvos` ({indice_do_bloco: parcial})
+    pula os blocos já analisados e a corrotina `ao_concluir_bloco(indice, parcial)` é aguardada a cada bloco novo.
+    Com DUPLICATAS_ATIVO, mensagens quase idênticas entram uma vez só, marcadas com o
+    tamanho do grupo (marcar_peso), em vez de repetir o texto.
+    A entrada (iterável síncrono, ex: leitura do mbox) é lida, agrupada e dividida em blocos
+    fora do event loop, conforme os blocos são analisados.
+    Retorna (analise_json, meta)
+    """
+    orcamento = orcamento_tokens or ANALISE_ORCAMENTO_TOKENS
+    duplicatas = {} if DUPLICATAS_ATIVO else None
+    blocos = iterar_em_thread(_blocos_da_entrada(mensagens, orcamento, duplicatas))
+    primeiros = []
+    async for bloco in blocos:
+        primeiros.append(bloco)
+        if len(primeiros) == 2:
+            break
+    if not primeiros:
+        return {}, {"source": "none"}
+    if len(primeiros) == 1:
+        with medir("analise"):
+            analise, meta = await gerar_analise_geral_async(SEPARADOR.join(primeiros[0]))
+        if duplicatas is not None:
+            meta["duplicatas"] = duplicatas
+        return analise, meta
+
+    meta = {
+        "source": "openai",
+        "modo": "hierarquico",
+        "blocos": 0,
+        "blocos_com_erro": 0,
+        "blocos_retomados": 0,
+        "rodadas_reducao": 0,
+        "reducoes_locais": 0,
+        "cache": {"hits": 0, "misses": 0},
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+    if duplicatas is not None:
+        meta["duplicatas"] = duplicatas
+    limite = LimiteAdaptativo(max_em_voo or ANALISE_EM_VOO)
+
+    salvos = parciais_salvos or {}
+
+    async def _mapear(item):
+        indice, bloco = item
+        if indice in salvos:
+            meta["blocos_retomados"] += 1
+            return salvos[indice]
+        with medir("analise_bloco"):
+            parcial = await _mapear_bloco(bloco, limite, meta)
+        if parcial is not None and ao_concluir_bloco is not None:
+            await ao_concluir_bloco(indice, parcial)
+        return parcial
+
+    async def _reduzir(grupo):
+        return await _reduzir_grupo(grupo, limite, meta)
+
+    async def _numerados():
+        indice = 0
+        async for bloco in encadear(primeiros, blocos):
+            yield indice, bloco
+            indice += 1
+
+    parciais = {}
+    async for indice, parcial in iterar_em_lotes(_numerados(), _mapear, limite):
+        meta["blocos"] += 1
+        if parcial is not None:
+            parciais[indice] = parcial
+    if not parciais:
+        raise ValueError("Nenhum bloco pôde ser analisado.")
+
+    # Mantém a ordem original dos blocos nas rodadas de redução
+    nivel = [parciais[i] for i in sorted(parciais)]
+    while len(nivel) > 1:
+        meta["rodadas_reducao"] += 1
+        nivel = await executar_em_lotes(_agrupar_parciais(nivel, orcamento), _reduzir, limite)
+
+    final = nivel[0]
+    analise = {"resumo": final["resumo"], "temas": final["temas"], "acoes": final["acoes"]}
+    return analise, meta
@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from app.metricas import obter_registro
+
+# Configuração do cache de resultados (classificações, respostas e análises)
+CACHE_ATIVO = os.getenv("CACHE_ATIVO", "1") != "0"
+CACHE_MAX_ITENS = int(os.getenv("CACHE_MAX_ITENS", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))
+# Se definido, ativa a camada em disco (SQLite), que sobrevive a reinícios
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH")
+# Espera máxima (ms) de uma leitura no disco; passou disso (outro worker gravando), conta como miss
+CACHE_DISCO_TIMEOUT_MS = int(os.getenv("CACHE_DISCO_TIMEOUT_MS", "50"))
+# Gravações em disco por transação (a thread de escrita junta as que estiverem na fila)
+CACHE_LOTE_ESCRITA = int(os.getenv("CACHE_LOTE_ESCRITA", "256"))
+# Intervalo (s) entre as limpezas das entradas vencidas no disco
+CACHE_LIMPEZA_INTERVALO = float(os.getenv("CACHE_LIMPEZA_INTERVALO", "3600"))
+
+_SQL_GUARDAR = "INSERT OR REPLACE INTO cache (chave, valor, expira_em) VALUES (?, ?, ?)"
+
+
+def chave_cache(tipo: str, texto: str, modelo: str, versao_prompt: str, temperatura: float, extra: str = "") -> str:
+    """
+    Chave endereçada por conteúdo: hash do texto (já pré-processado) junto com
+    modelo, versão do prompt e temperatura. `extra` diferencia variações (ex: label).
+    """
+    h = hashlib.sha256()
+    for parte in (tipo, modelo, versao_prompt, repr(float(temperatura)), extra):
+        h.update(parte.encode("utf-8"))
+        h.update(b"\x00")
+    h.update(texto.encode("utf-8", errors="surrogatepass"))
+    return h.hexdigest()
+
+
+class CacheResultados:
+    """
+    Cache em dois níveis:
+      - memória: LRU com limite de itens e TTL;
+      - disco (opcional): tabela SQLite consultada quando a memória não tem a chave.
+    As gravações em disco vão para uma thread de escrita (várias por transação), que também
+    apaga as entradas vencidas a cada CACHE_LIMPEZA_INTERVALO; guardar() nunca espera o disco.
+    Os valores precisam ser serializáveis em JSON.
+    """
+
+    def __init__(self, max_itens: int = CACHE_MAX_ITENS, ttl: float = CACHE_TTL, caminho_db: str = CACHE_DB_PATH):
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._lock_db = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if caminho_db:
+            # Conexão de leitura: espera pouco pela trava do SQLite (ver CACHE_DISCO_TIMEOUT_MS)
+            self._db = self._conectar(caminho_db, CACHE_DISCO_TIMEOUT_MS)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache (chave TEXT PRIMARY KEY, valor TEXT NOT NULL, expira_em REAL NOT NULL)"
+            )
+            self._escritas = queue.Queue()
+            threading.Thread(target=self._escrever, args=(caminho_db,), name="cache-escrita", daemon=True).start()
+
+    @staticmethod
+    def _conectar(caminho_db: str, timeout_ms: int):
+        db = sqlite3.connect(caminho_db, check_same_thread=False, isolation_level=None, timeout=timeout_ms / 1000)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"PRAGMA busy_timeout={int(timeout_ms)}")
+        return db
+
+    def obter(self, chave: str):
+        """Retorna o valor em cache ou None (conta hit/miss). Pode consultar o disco: em código assíncrono, use obter_async."""
+        valor = self._obter_memoria(chave)
+        if valor is None and self._db is not None:
+            valor = self._obter_disco(chave)
+        return self._contar(valor)
+
+    async def obter_async(self, chave: str):
+        """Como obter, mas a consulta ao disco (se a memória não tiver a chave) roda fora do event loop."""
+        valor = self._obter_memoria(chave)
+        if valor is None and self._db is not None:
+            valor = await asyncio.to_thread(self._obter_disco, chave)
+        return self._contar(valor)
+
+    def _obter_memoria(self, chave: str):
+        agora = time.time()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em > agora:
+                self._memoria.move_to_end(chave)
+                return valor
+            del self._memoria[chave]
+            return None
+
+    def _obter_disco(self, chave: str):
+        # Disco ocupado não segura a requisição: a consulta desiste e conta como miss
+        if not self._lock_db.acquire(timeout=CACHE_DISCO_TIMEOUT_MS / 1000):
+            return None
+        try:
+            row = self._db.execute("SELECT valor, expira_em FROM cache WHERE chave = ?", (chave,)).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        finally:
+            self._lock_db.release()
+        if row is None or row[1] <= time.time():
+            return None
+        valor = json.loads(row[0])
+        with self._lock:
+            self._guardar_memoria(chave, valor, row[1])
+        return valor
+
+    def _contar(self, valor):
+        with self._lock:
+            if valor is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return valor
+
+    def guardar(self, chave: str, valor):
+        expira_em = time.time() + self.ttl
+        with self._lock:
+            self._guardar_memoria(chave, valor, expira_em)
+        if self._db is not None:
+            self._escritas.put((chave, json.dumps(valor, ensure_ascii=False), expira_em))
+
+    def _guardar_memoria(self, chave: str, valor, expira_em: float):
+        self._memoria[chave] = (expira_em, valor)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_itens:
+            self._memoria.popitem(last=False)
+
+    def _escrever(self, caminho_db: str):
+        # Thread de escrita: grava o que estiver na fila em uma transação e, no intervalo, limpa o disco.
+        # Tem conexão própria, que espera mais pela trava (vários workers gravam no mesmo arquivo).
+        db = self._conectar(caminho_db, 5000)
+        proxima_limpeza = time.monotonic() + CACHE_LIMPEZA_INTERVALO
+        while True:
+            try:
+                linhas = [self._escritas.get(timeout=max(0.0, proxima_limpeza - time.monotonic()))]
+            except queue.Empty:
+                linhas = []
+            while linhas and len(linhas) < CACHE_LOTE_ESCRITA:
+                try:
+                    linhas.append(self._escritas.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if linhas:
+                    db.execute("BEGIN")
+                    db.executemany(_SQL_GUARDAR, linhas)
+                    db.execute("COMMIT")
+                if time.monotonic() >= proxima_limpeza:
+                    proxima_limpeza = time.monotonic() + CACHE_LIMPEZA_INTERVALO
+                    self._apagar_expirados(db)
+            except sqlite3.Error:
+                # Uma gravação perdida só faz o resultado ser calculado de novo
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+            finally:
+                for _ in linhas:
+                    self._escritas.task_done()
+
+    @staticmethod
+    def _apagar_expirados(db):
+        db.execute("DELETE FROM cache WHERE expira_em <= ?", (time.time(),))
+
+    def aguardar_escritas(self):
+        """Bloqueia até as gravações em disco enfileiradas terminarem (ex: no encerramento do servidor)."""
+        if self._db is not None:
+            self._escritas.join()
+
+    def limpar_expirados(self):
+        # Remove agora as entradas vencidas do disco (a thread de escrita também faz isso
+        # a cada CACHE_LIMPEZA_INTERVALO; a memória expira de forma preguiçosa)
+        if self._db is not None:
+            with self._lock_db:
+                self._apagar_expirados(self._db)
+
+    def estatisticas(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "itens_memoria": len(self._memoria), "disco": self._db is not None}
+
+
+def somar_contadores_cache(*metas) -> dict:
+    # Soma os contadores {"hits", "misses"} de vários blocos de meta (para a resposta do endpoint)
+    total = {"hits": 0, "misses": 0}
+    for meta in metas:
+        contadores = (meta or {}).get("cache") or {}
+        total["hits"] += contadores.get("hits", 0)
+        total["misses"] += contadores.get("misses", 0)
+    return total
+
+
+_cache = None
+
+
+def obter_cache():
+    # Instância única do cache por processo (None se o cache estiver desativado)
+    global _cache
+    if not CACHE_ATIVO:
+        return None
+    if _cache is None:
+        _cache = CacheResultados()
+    return _cache
+
+
+def _coletar_metricas():
+    # hits/misses do cache para o /metrics (contados pelo próprio CacheResultados)
+    if _cache is None:
+        return []
+    return [
+        ("autou_cache_consultas_total", {"resultado": "hit"}, _cache.hits),
+        ("autou_cache_consultas_total", {"resultado": "miss"}, _cache.misses),
+    ]
+
+
+obter_registro().registrar_coletor(_coletar_metricas)
@@ -0,0 +1,309 @@
+"""
+Classificador local (hashing + TF-IDF + regressão logística multinomial em NumPy/SciPy).
+
+Roda antes da IA: as mensagens em que o modelo local está confiante não vão para a rede,
+só as de baixa confiança seguem para o caminho em lote de classificar_com_openai.
+
+Treino/avaliação pela linha de comando:
+    python -m app.classificador_local treinar historico.jsonl rotulos_llm.jsonl --saida modelo.npz
+    python -m app.classificador_local avaliar rotulos_llm.jsonl --modelo modelo.npz
+Cada linha dos arquivos .jsonl é {"texto": "...", "label": "produtivo|improdutivo|neutro"}
+(opcionalmente com "origem": "llm" | "humano").
+"""
+import os
+import re
+import sys
+import json
+import zlib
+import argparse
+import threading
+import importlib.util
+from pathlib import Path
+
+# NumPy/SciPy são opcionais: sem eles o tier local fica desativado
+NUMPY_DISPONIVEL = importlib.util.find_spec("numpy") is not None and importlib.util.find_spec("scipy") is not None
+if NUMPY_DISPONIVEL:
+    import numpy as np
+    from scipy import sparse
+
+CLASSIFICADOR_LOCAL_ATIVO = os.getenv("CLASSIFICADOR_LOCAL_ATIVO", "1") != "0"
+CLASSIFICADOR_LOCAL_PATH = os.getenv(
+    "CLASSIFICADOR_LOCAL_PATH", str(Path(__file__).parent / "modelos" / "classificador_local.npz")
+)
+# Probabilidade mínima para aceitar o rótulo local sem consultar a IA
+CLASSIFICADOR_LOCAL_CONFIANCA = float(os.getenv("CLASSIFICADOR_LOCAL_CONFIANCA", "0.85"))
+# Quantas mensagens são vetorizadas de uma vez
+CLASSIFICADOR_LOCAL_LOTE = int(os.getenv("CLASSIFICADOR_LOCAL_LOTE", "64"))
+# Se definido, os rótulos devolvidos pela IA são registrados aqui (JSONL) para o próximo treino
+CLASSIFICACOES_LOG_PATH = os.getenv("CLASSIFICACOES_LOG_PATH")
+
+LABELS = ("produtivo", "improdutivo", "neutro")
+_RE_PALAVRA = re.compile(r"\w+", re.UNICODE)
+
+
+def _termos(texto: str) -> list:
+    # Unigramas e bigramas de palavras em minúsculas
+    palavras = _RE_PALAVRA.findall(texto.lower())
+    return palavras + [a + " " + b for a, b in zip(palavras, palavras[1:])]
+
+
+def vetorizar(textos: list, bits: int = 18):
+    """
+    Hashing vectorizer: cada termo vira uma coluna crc32(termo) mod 2**bits.
+    Retorna uma matriz CSR (n_textos x 2**bits) com contagens log(1 + tf).
+    """
+    mascara = (1 << bits) - 1
+    indices = []
+    valores = []
+    ponteiros = [0]
+    for texto in textos:
+        colunas = np.fromiter(
+            (zlib.crc32(t.encode("utf-8", errors="surrogatepass")) & mascara for t in _termos(texto or "")),
+            dtype=np.int64,
+        )
+        colunas, contagens = np.unique(colunas, return_counts=True)
+        indices.append(colunas)
+        valores.append(np.log1p(contagens).astype(np.float32))
+        ponteiros.append(ponteiros[-1] + len(colunas))
+    matriz = sparse.csr_matrix(
+        (
+            np.concatenate(valores) if valores else np.zeros(0, np.float32),
+            np.concatenate(indices) if indices else np.zeros(0, np.int64),
+            np.asarray(ponteiros, dtype=np.int64),
+        ),
+        shape=(len(textos), 1 << bits),
+    )
+    return matriz
+
+
+def _normalizar_linhas(matriz):
+    # Normalização L2 por linha (mensagens longas não dominam)
+    normas = np.sqrt(np.asarray(matriz.multiply(matriz).sum(axis=1)).ravel())
+    normas[normas == 0] = 1.0
+    return sparse.diags(1.0 / normas) @ matriz
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class ClassificadorLocal:
+    """
+    Modelo linear sobre features hashing + IDF.
+    `pesos` tem forma (2**bits, n_classes); `metricas` guarda a validação do treino.
+    """
+
+    def __init__(self, pesos, vies, idf, classes, bits: int, metricas: dict = None):
+        self.pesos = pesos
+        self.vies = vies
+        self.idf = idf
+        self.classes = list(classes)
+        self.bits = bits
+        self.metricas = metricas or {}
+
+    def _features(self, textos: list):
+        return _normalizar_linhas(vetorizar(textos, self.bits) @ sparse.diags(self.idf))
+
+    def probabilidades(self, textos: list):
+        return _softmax(np.asarray(self._features(textos) @ self.pesos) + self.vies)
+
+    def prever(self, textos: list) -> list:
+        """Retorna [(label, probabilidade), ...] para um lote de textos."""
+        if not textos:
+            return []
+        probs = self.probabilidades(textos)
+        melhores = probs.argmax(axis=1)
+        return [(self.classes[j], float(probs[i, j])) for i, j in enumerate(melhores)]
+
+    def prever_confiantes(self, textos: list, confianca: float = None) -> list:
+        """
+        Igual a prever(), mas devolve None nas posições em que a probabilidade
+        ficou abaixo de `confianca` (essas mensagens devem ir para a IA).
+        """
+        limiar = CLASSIFICADOR_LOCAL_CONFIANCA if confianca is None else confianca
+        return [
+            {"label": label, "score": round(prob, 4)} if prob >= limiar else None
+            for label, prob in self.prever(textos)
+        ]
+
+    def salvar(self, caminho: str):
+        Path(caminho).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(
+            caminho,
+            pesos=self.pesos.astype(np.float32),
+            vies=self.vies.astype(np.float32),
+            idf=self.idf.astype(np.float32),
+            classes=np.array(self.classes),
+            bits=np.array(self.bits),
+            metricas=np.array(json.dumps(self.metricas)),
+        )
+
+    @classmethod
+    def carregar(cls, caminho: str) -> "ClassificadorLocal":
+        with np.load(caminho, allow_pickle=False) as dados:
+            return cls(
+                pesos=dados["pesos"],
+                vies=dados["vies"],
+                idf=dados["idf"],
+                classes=[str(c) for c in dados["classes"]],
+                bits=int(dados["bits"]),
+                metricas=json.loads(str(dados["metricas"])),
+            )
+
+
+def treinar(textos: list, labels: list, bits: int = 18, epocas: int = 300, taxa: float = 2.0,
+            regularizacao: float = 1e-4) -> ClassificadorLocal:
+    """
+    Treina a regressão logística multinomial com gradiente descendente (lote completo,
+    com momento) sobre a matriz esparsa de features.
+    """
+    classes = [c for c in LABELS if c in set(labels)] + sorted(set(labels) - set(LABELS))
+    contagens = vetorizar(textos, bits)
+    # IDF suavizado, calculado sobre as colunas hashing
+    df = np.bincount(contagens.indices, minlength=1 << bits)
+    idf = (np.log((1 + len(textos)) / (1 + df)) + 1.0).astype(np.float32)
+    x = _normalizar_linhas(contagens @ sparse.diags(idf)).tocsr()
+    xt = x.T.tocsr()
+
+    y = np.zeros((len(textos), len(classes)), dtype=np.float32)
+    y[np.arange(len(textos)), [classes.index(l) for l in labels]] = 1.0
+
+    pesos = np.zeros((1 << bits, len(classes)), dtype=np.float32)
+    vies = np.zeros(len(classes), dtype=np.float32)
+    vel_p = np.zeros_like(pesos)
+    vel_v = np.zeros_like(vies)
+    n = max(1, len(textos))
+    for _ in range(epocas):
+        erro = _softmax(np.asarray(x @ pesos) + vies) - y
+        grad_p = np.asarray(xt @ erro) / n + regularizacao * pesos
+        grad_v = erro.mean(axis=0)
+        vel_p = 0.9 * vel_p - taxa * grad_p
+        vel_v = 0.9 * vel_v - taxa * grad_v
+        pesos += vel_p
+        vies += vel_v
+    return ClassificadorLocal(pesos, vies, idf, classes, bits)
+
+
+def avaliar(modelo: ClassificadorLocal, textos: list, labels: list, confianca: float = None) -> dict:
+    """
+    Concordância do modelo local com os rótulos de referência (ex: rótulos da IA):
+      - concordancia: em todas as mensagens;
+      - cobertura: fração que o modelo resolveria sozinho (acima da confiança);
+      - concordancia_confiantes: concordância só nessas mensagens (o que deixaria de ir à IA).
+    """
+    limiar = CLASSIFICADOR_LOCAL_CONFIANCA if confianca is None else confianca
+    previsoes = modelo.prever(textos)
+    total = len(previsoes)
+    acertos = sum(1 for (p, _), l in zip(previsoes, labels) if p == l)
+    confiantes = [(p, l) for (p, prob), l in zip(previsoes, labels) if prob >= limiar]
+    acertos_conf = sum(1 for p, l in confiantes if p == l)
+    return {
+        "amostras": total,
+        "concordancia": round(acertos / total, 4) if total else None,
+        "cobertura": round(len(confiantes) / total, 4) if total else None,
+        "concordancia_confiantes": round(acertos_conf / len(confiantes), 4) if confiantes else None,
+        "confianca": limiar,
+    }
+
+
+def ler_exemplos(*caminhos, somente_origem: str = None):
+    """Lê arquivos JSONL {"texto", "label"[, "origem"]} e retorna (textos, labels)."""
+    textos, labels = [], []
+    for caminho in caminhos:
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if not linha:
+                    continue
+                item = json.loads(linha)
+                if somente_origem and item.get("origem") != somente_origem:
+                    continue
+                texto, label = item.get("texto"), str(item.get("label", "")).lower()
+                if texto and label:
+                    textos.append(texto)
+                    labels.append(label)
+    return textos, labels
+
+
+_lock_log = threading.Lock()
+
+
+def registrar_rotulos_llm(textos: list, resultados: list):
+    """
+    Acrescenta os rótulos devolvidos pela IA ao log de treino (se CLASSIFICACOES_LOG_PATH
+    estiver definido). Falhas de escrita não interrompem a classificação.
+    """
+    if not CLASSIFICACOES_LOG_PATH:
+        return
+    linhas = [
+        json.dumps({"texto": t, "label": r.get("label"), "score": r.get("score"), "origem": "llm"}, ensure_ascii=False)
+        for t, r in zip(textos, resultados)
+    ]
+    try:
+        with _lock_log, open(CLASSIFICACOES_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write("\n".join(linhas) + "\n")
+    except OSError:
+        pass
+
+
+_modelo = None
+_modelo_carregado = False
+
+
+def obter_classificador_local():
+    # Instância única do modelo (None se desativado, sem NumPy/SciPy ou sem arquivo treinado)
+    global _modelo, _modelo_carregado
+    if not (CLASSIFICADOR_LOCAL_ATIVO and NUMPY_DISPONIVEL):
+        return None
+    if not _modelo_carregado:
+        _modelo_carregado = True
+        if os.path.exists(CLASSIFICADOR_LOCAL_PATH):
+            _modelo = ClassificadorLocal.carregar(CLASSIFICADOR_LOCAL_PATH)
+    return _modelo
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.classificador_local", description=__doc__.split("\n\n")[1])
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_treinar = sub.add_parser("treinar", help="treina e exporta o modelo")
+    p_treinar.add_argument("dados", nargs="+", help="arquivos JSONL com texto/label")
+    p_treinar.add_argument("--saida", default=CLASSIFICADOR_LOCAL_PATH)
+    p_treinar.add_argument("--bits", type=int, default=18, help="log2 do número de colunas hashing")
+    p_treinar.add_argument("--epocas", type=int, default=300)
+    p_treinar.add_argument("--validacao", type=float, default=0.2, help="fração separada para validação")
+
+    p_avaliar = sub.add_parser("avaliar", help="mede a concordância com rótulos de referência")
+    p_avaliar.add_argument("dados", nargs="+")
+    p_avaliar.add_argument("--modelo", default=CLASSIFICADOR_LOCAL_PATH)
+    p_avaliar.add_argument("--somente-llm", action="store_true", help="usa só linhas com origem=llm")
+    p_avaliar.add_argument("--confianca", type=float, default=None)
+
+    args = parser.parse_args(argv)
+    if not NUMPY_DISPONIVEL:
+        parser.error("NumPy e SciPy são necessários (pip install numpy scipy).")
+
+    if args.comando == "treinar":
+        textos, labels = ler_exemplos(*args.dados)
+        if not textos:
+            parser.error("Nenhum exemplo encontrado.")
+        ordem = np.random.default_rng(0).permutation(len(textos))
+        n_val = int(len(textos) * args.validacao) if len(textos) >= 20 else 0
+        val, tre = ordem[:n_val], ordem[n_val:]
+        modelo = treinar([textos[i] for i in tre], [labels[i] for i in tre], bits=args.bits, epocas=args.epocas)
+        if n_val:
+            modelo.metricas = avaliar(modelo, [textos[i] for i in val], [labels[i] for i in val])
+        modelo.metricas["exemplos_treino"] = len(tre)
+        modelo.salvar(args.saida)
+        print(json.dumps({"modelo": args.saida, "metricas": modelo.metricas}, ensure_ascii=False, indent=2))
+    else:
+        modelo = ClassificadorLocal.carregar(args.modelo)
+        textos, labels = ler_exemplos(*args.dados, somente_origem="llm" if args.somente_llm else None)
+        print(json.dumps(avaliar(modelo, textos, labels, args.confianca), ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_main())
@@ -0,0 +1,143 @@
+import os
+import json
+from typing import List, Literal
+
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError, field_validator
+
+# Pede saída estruturada (response_format com JSON schema) quando a API aceita
+LLM_SAIDA_ESTRUTURADA = os.getenv("LLM_SAIDA_ESTRUTURADA", "1") == "1"
+
+# Contratos das respostas da IA. Os modelos pydantic validam (com o validador
+# compilado do pydantic-core); os esquemas abaixo vão no response_format e seguem
+# as regras do modo "strict" (todos os campos obrigatórios, sem campos extras).
+
+
+class ContratoInvalido(ValueError):
+    """A resposta da IA não segue o contrato (JSON inválido ou campos errados)."""
+
+
+class Classificacao(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    label: Literal["produtivo", "improdutivo", "neutro"]
+    score: float
+
+    @field_validator("label", mode="before")
+    @classmethod
+    def _label_minusculo(cls, valor):
+        return valor.strip().lower() if isinstance(valor, str) else valor
+
+    @field_validator("score")
+    @classmethod
+    def _score_no_intervalo(cls, valor):
+        return min(1.0, max(0.0, valor))
+
+
+class Analise(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    resumo: str = ""
+    temas: List[str] = []
+    acoes: List[str] = []
+
+
+_CLASSIFICACAO = TypeAdapter(Classificacao)
+_ANALISE = TypeAdapter(Analise)
+
+_ESQUEMA_CLASSIFICACAO = {
+    "type": "object",
+    "properties": {
+        "label": {"type": "string", "enum": ["produtivo", "improdutivo", "neutro"]},
+        "score": {"type": "number"},
+    },
+    "required": ["label", "score"],
+    "additionalProperties": False,
+}
+_ESQUEMA_LOTE = {
+    "type": "object",
+    "properties": {"itens": {"type": "array", "items": _ESQUEMA_CLASSIFICACAO}},
+    "required": ["itens"],
+    "additionalProperties": False,
+}
+_ESQUEMA_ANALISE = {
+    "type": "object",
+    "properties": {
+        "resumo": {"type": "string"},
+        "temas": {"type": "array", "items": {"type": "string"}},
+        "acoes": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["resumo", "temas", "acoes"],
+    "additionalProperties": False,
+}
+
+
+def _formato(nome: str, esquema: dict) -> dict:
+    return {"type": "json_schema", "json_schema": {"name": nome, "strict": True, "schema": esquema}}
+
+
+FORMATO_CLASSIFICACAO = _formato("classificacao", _ESQUEMA_CLASSIFICACAO)
+FORMATO_LOTE_CLASSIFICACAO = _formato("lote_classificacao", _ESQUEMA_LOTE)
+FORMATO_ANALISE = _formato("analise", _ESQUEMA_ANALISE)
+
+
+def extrair_json(conteudo: str):
+    """
+    Faz o parse do JSON da resposta. Sem saída estruturada, a IA às vezes adiciona
+    texto ("```json", "aqui está:"): nesse caso usa o trecho entre o primeiro
+    "{"/"[" e o último "}"/"]". Lança ContratoInvalido se não houver JSON.
+    """
+    try:
+        return json.loads(conteudo)
+    except (TypeError, json.JSONDecodeError):
+        pass
+    conteudo = conteudo or ""
+    inicios = [i for i in (conteudo.find("{"), conteudo.find("[")) if i != -1]
+    fim = max(conteudo.rfind("}"), conteudo.rfind("]"))
+    if inicios and fim > min(inicios):
+        try:
+            return json.loads(conteudo[min(inicios):fim + 1])
+        except json.JSONDecodeError:
+            pass
+    raise ContratoInvalido("Resposta da IA não continha JSON válido.")
+
+
+def validar_classificacao(valor):
+    """Valida um item de classificação. Retorna {"label", "score"} ou None se inválido."""
+    try:
+        return _CLASSIFICACAO.validate_python(valor).model_dump()
+    except ValidationError:
+        return None
+
+
+def interpretar_classificacao(conteudo: str) -> dict:
+    """Resposta de uma classificação única -> {"label", "score"} (ou ContratoInvalido)."""
+    item = validar_classificacao(extrair_json(conteudo))
+    if item is None:
+        raise ContratoInvalido("Classificação fora do contrato.")
+    return item
+
+
+def interpretar_lote(conteudo: str, tamanho: int):
+    """
+    Resposta de um lote de classificação -> lista com `tamanho` itens, cada um
+    {"label", "score"} ou None (item fora do contrato). Aceita {"itens": [...]} ou
+    o array direto. Retorna None se não houver um array com o tamanho do lote,
+    já que então não dá para saber a qual mensagem cada item pertence.
+    """
+    try:
+        valor = extrair_json(conteudo)
+    except ContratoInvalido:
+        return None
+    if isinstance(valor, dict):
+        valor = valor.get("itens")
+    if not isinstance(valor, list) or len(valor) != tamanho:
+        return None
+    return [validar_classificacao(item) for item in valor]
+
+
+def interpretar_analise(conteudo: str) -> dict:
+    """Resposta de uma análise -> {"resumo", "temas", "acoes"} (ou ContratoInvalido)."""
+    try:
+        return _ANALISE.validate_python(extrair_json(conteudo)).model_dump()
+    except ValidationError as e:
+        raise ContratoInvalido(f"Análise fora do contrato: {e.error_count()} erro(s).")
@@ -0,0 +1,205 @@
+import os
+import re
+import zlib
+import importlib.util
+from collections import OrderedDict
+
+from app.heuristica import dobrar
+
+# NumPy é opcional: acelera o cálculo das assinaturas (sem ele, o cálculo é feito em Python puro)
+NUMPY_DISPONIVEL = importlib.util.find_spec("numpy") is not None
+if NUMPY_DISPONIVEL:
+    import numpy as np
+
+# Agrupamento de mensagens quase idênticas (mesmo modelo de reclamação, mesma campanha)
+DUPLICATAS_ATIVO = os.getenv("DUPLICATAS_ATIVO", "1") == "1"
+# Similaridade de Jaccard (estimada) mínima entre os trigramas de palavras de duas mensagens do grupo
+DUPLICATAS_SIMILARIDADE = float(os.getenv("DUPLICATAS_SIMILARIDADE", "0.7"))
+# Mensagens com menos palavras só se agrupam se forem iguais (com os números mascarados)
+DUPLICATAS_MIN_PALAVRAS = int(os.getenv("DUPLICATAS_MIN_PALAVRAS", "8"))
+# Grupos abertos ao mesmo tempo na condensação em fluxo da análise (limita a memória)
+DUPLICATAS_JANELA = int(os.getenv("DUPLICATAS_JANELA", "10000"))
+
+_RE_PALAVRA = re.compile(r"\w+")
+_RE_NUMERO = re.compile(r"\d+")
+_MASCARA = (1 << 64) - 1
+# MinHash com 64 funções, em 16 faixas de 4: pares com Jaccard 0,7 viram candidatos
+# com ~99% de chance; com Jaccard 0,3, ~12% (descartados na comparação da assinatura).
+_PERMUTACOES = 64
+_LINHAS_POR_FAIXA = 4
+# Sementes fixas (o agrupamento não depende do processo nem do PYTHONHASHSEED)
+_SEMENTES = [(0x9E3779B97F4A7C15 * (i + 1)) & _MASCARA for i in range(_PERMUTACOES)]
+if NUMPY_DISPONIVEL:
+    _SEMENTES_NP = np.array(_SEMENTES, dtype=np.uint64)
+# Prefixo que marca, para a análise, quantas mensagens um representante substitui
+_RE_PESO = re.compile(r"^\[(\d+) mensagens semelhantes\]\n")
+
+
+def _palavras(texto: str) -> list:
+    # Minúsculas, sem acentos e com os números mascarados (nº de pedido, datas, valores)
+    return _RE_PALAVRA.findall(_RE_NUMERO.sub("0", dobrar(texto)))
+
+
+def _misturar(h: int) -> int:
+    # Finalizador do splitmix64
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & _MASCARA
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & _MASCARA
+    return h ^ (h >> 31)
+
+
+def assinatura_minhash(palavras: list) -> tuple:
+    """
+    Assinatura MinHash (64 valores) do conjunto de trigramas de palavras: a fração
+    de posições iguais entre duas assinaturas estima a similaridade de Jaccard.
+    """
+    trigramas = {" ".join(palavras[i:i + 3]) for i in range(max(1, len(palavras) - 2))}
+    hashes = [zlib.crc32(t.encode("utf-8")) for t in trigramas]
+    if NUMPY_DISPONIVEL:
+        # (trigramas x permutações) de uma vez; o uint64 do NumPy já faz o "& _MASCARA"
+        h = np.array(hashes, dtype=np.uint64)[:, None] ^ _SEMENTES_NP[None, :]
+        h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        h = h ^ (h >> np.uint64(31))
+        return tuple(h.min(axis=0).tolist())
+    return tuple(min(_misturar(h ^ semente) for h in hashes) for semente in _SEMENTES)
+
+
+def similaridade(a: tuple, b: tuple) -> float:
+    """Jaccard estimado entre duas assinaturas MinHash."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class IndiceDuplicatas:
+    """
+    Índice incremental de mensagens quase idênticas. Cada grupo é identificado pelo
+    identificador da primeira mensagem (o representante). A busca usa LSH: a assinatura
+    MinHash é dividida em faixas e só os representantes com alguma faixa igual são
+    comparados, então o custo por mensagem não cresce com o número de grupos.
+    """
+
+    def __init__(self, similaridade_minima: float = None, min_palavras: int = None):
+        self.similaridade_minima = DUPLICATAS_SIMILARIDADE if similaridade_minima is None else similaridade_minima
+        self.min_palavras = DUPLICATAS_MIN_PALAVRAS if min_palavras is None else min_palavras
+        self._faixas = [{} for _ in range(_PERMUTACOES // _LINHAS_POR_FAIXA)]
+        self._assinaturas = {}
+        self._curtas = {}
+        self._chave_curta = {}
+        self.tamanhos = {}
+
+    @staticmethod
+    def _partes(assinatura: tuple):
+        return [assinatura[i:i + _LINHAS_POR_FAIXA] for i in range(0, _PERMUTACOES, _LINHAS_POR_FAIXA)]
+
+    def agrupar(self, texto: str, ident):
+        """Coloca a mensagem em um grupo e retorna o identificador do grupo."""
+        palavras = _palavras(texto)
+        if len(palavras) < self.min_palavras:
+            chave = " ".join(palavras)
+            grupo = self._curtas.setdefault(chave, ident)
+            if grupo == ident:
+                self._chave_curta[ident] = chave
+        else:
+            assinatura = assinatura_minhash(palavras)
+            partes = self._partes(assinatura)
+            grupo = None
+            melhor = self.similaridade_minima
+            vistos = set()
+            for faixa, parte in zip(self._faixas, partes):
+                for candidato in faixa.get(parte, ()):
+                    if candidato in vistos:
+                        continue
+                    vistos.add(candidato)
+                    sim = similaridade(assinatura, self._assinaturas[candidato])
+                    if sim > melhor or (sim == melhor and (grupo is None or candidato < grupo)):
+                        grupo, melhor = candidato, sim
+            if grupo is None:
+                grupo = ident
+                self._assinaturas[ident] = assinatura
+                for faixa, parte in zip(self._faixas, partes):
+                    faixa.setdefault(parte, []).append(ident)
+        self.tamanhos[grupo] = self.tamanhos.get(grupo, 0) + 1
+        return grupo
+
+    def remover(self, grupo) -> int:
+        """Fecha o grupo: mensagens que chegarem depois não entram mais nele. Retorna o tamanho final."""
+        chave = self._chave_curta.pop(grupo, None)
+        if chave is not None:
+            del self._curtas[chave]
+        assinatura = self._assinaturas.pop(grupo, None)
+        if assinatura is not None:
+            for faixa, parte in zip(self._faixas, self._partes(assinatura)):
+                membros = faixa[parte]
+                membros.remove(grupo)
+                if not membros:
+                    del faixa[parte]
+        return self.tamanhos.pop(grupo)
+
+    @property
+    def total_grupos(self) -> int:
+        return len(self.tamanhos)
+
+
+def condensar_mensagens(mensagens, janela: int = None, contagem: dict = None):
+    """
+    Agrupa as mensagens (iterável de textos, lido sob demanda) e gera (texto_representante, tamanho)
+    assim que cada grupo fecha. Ficam abertos no máximo `janela` grupos (DUPLICATAS_JANELA): ao abrir
+    mais um, fecha o que está há mais tempo sem receber mensagens, e uma quase duplicata dele que
+    chegar depois abre um grupo novo. Só os representantes dos grupos abertos ficam em memória.
+    `contagem`, se passado, recebe {"mensagens": ..., "grupos": ...} conforme a entrada é lida.
+    """
+    janela = max(1, janela or DUPLICATAS_JANELA)
+    indice = IndiceDuplicatas()
+    # Representantes dos grupos abertos, do menos para o mais recentemente usado
+    abertos = OrderedDict()
+    contagem = contagem if contagem is not None else {}
+    contagem.update(mensagens=0, grupos=0)
+    for i, texto in enumerate(mensagens):
+        if not texto or not texto.strip():
+            continue
+        contagem["mensagens"] += 1
+        grupo = indice.agrupar(texto, i)
+        if grupo != i:
+            abertos.move_to_end(grupo)
+            continue
+        contagem["grupos"] += 1
+        abertos[i] = texto
+        if len(abertos) > janela:
+            antigo, texto_antigo = abertos.popitem(last=False)
+            yield texto_antigo, indice.remover(antigo)
+    for grupo, texto in abertos.items():
+        yield texto, indice.tamanhos[grupo]
+
+
+def marcar_peso(texto: str, tamanho: int) -> str:
+    """Texto do representante para a análise, com o número de mensagens que ele substitui."""
+    return f"[{tamanho} mensagens semelhantes]\n{texto}" if tamanho > 1 else texto
+
+
+def peso(texto: str) -> int:
+    """Quantas mensagens um texto marcado por marcar_peso representa (1 se não marcado)."""
+    m = _RE_PESO.match(texto)
+    return int(m.group(1)) if m else 1
+
+
+def adaptar_resposta(resposta: str, texto_origem: str, texto_destino: str) -> str:
+    """
+    Reaproveita a resposta gerada para o representante em outra mensagem do grupo:
+    se as duas têm os mesmos números nas mesmas posições do modelo (ex: nº do pedido),
+    os números do representante citados na resposta são trocados pelos da mensagem.
+    """
+    if not resposta:
+        return resposta
+    origem = _RE_NUMERO.findall(texto_origem)
+    destino = _RE_NUMERO.findall(texto_destino)
+    if len(origem) != len(destino):
+        return resposta
+    trocas = {}
+    for de, para in zip(origem, destino):
+        if trocas.setdefault(de, para) != para:
+            # O mesmo número vira dois diferentes: não dá para saber qual usar
+            trocas[de] = None
+    trocas = {de: para for de, para in trocas.items() if para is not None and para != de}
+    if not trocas:
+        return resposta
+    return re.sub(r"(?<!\d)(?:" + "|".join(map(re.escape, sorted(trocas, key=len, reverse=True))) + r")(?!\d)",
+                  lambda m: trocas[m.group()], resposta)
@@ -0,0 +1,271 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from pathlib import Path
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PyPDF2 import PdfReader
+
+from app.lotes import iterar_em_thread
+
+# Processos para extrair páginas (0 = extrai no próprio processo, em thread)
+PDF_PROCESSOS = int(os.getenv("PDF_PROCESSOS", str(os.cpu_count() or 1)))
+# Páginas por tarefa enviada ao pool (menos overhead de IPC por página)
+PDF_PAGINAS_POR_TAREFA = int(os.getenv("PDF_PAGINAS_POR_TAREFA", "8"))
+# Tarefas em voo por PDF: limita quantas páginas ficam prontas em memória esperando a vez
+PDF_TAREFAS_EM_VOO = int(os.getenv("PDF_TAREFAS_EM_VOO", str(max(2, 2 * (os.cpu_count() or 1)))))
+# Cache do texto extraído por hash do arquivo (vazio desativa)
+PDF_CACHE_DIR = os.getenv("PDF_CACHE_DIR", str(Path(tempfile.gettempdir()) / "autou_pdf_cache"))
+# Limites do cache: tamanho total (bytes) e idade (s) desde o último uso; 0 desativa o limite
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+PDF_CACHE_MAX_IDADE = float(os.getenv("PDF_CACHE_MAX_IDADE", str(7 * 24 * 3600)))
+
+
+# --- Lado do worker (roda nos processos do pool) ---
+
+# Último PDF aberto no processo: tarefas seguidas do mesmo arquivo não reabrem o PdfReader
+_reader_worker = {"chave": None, "reader": None}
+
+
+def _extrair_paginas(caminho: str, inicio: int, fim: int) -> list:
+    """Extrai o texto das páginas [inicio, fim) de um PDF em disco ("" para páginas com erro)."""
+    info = os.stat(caminho)
+    chave = (caminho, info.st_mtime_ns, info.st_size)
+    if _reader_worker["chave"] != chave:
+        _reader_worker["reader"] = PdfReader(caminho)
+        _reader_worker["chave"] = chave
+    reader = _reader_worker["reader"]
+    textos = []
+    for i in range(inicio, fim):
+        try:
+            textos.append(reader.pages[i].extract_text() or "")
+        except Exception:
+            textos.append("")
+    return textos
+
+
+# --- Lado do servidor ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    # Pool único por processo, criado sob demanda (None se desativado ou indisponível)
+    global _pool
+    if PDF_PROCESSOS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ProcessPoolExecutor(max_workers=PDF_PROCESSOS)
+            except (OSError, NotImplementedError):
+                return None
+    return _pool
+
+
+def encerrar_pool(esperar: bool = False):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=esperar, cancel_futures=True)
+            _pool = None
+
+
+def hash_arquivo(caminho: str) -> str:
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+def _caminho_cache(digest: str):
+    if not PDF_CACHE_DIR:
+        return None
+    return Path(PDF_CACHE_DIR) / f"{digest}.jsonl"
+
+
+def _ler_cache(caminho_cache):
+    # Uma página por linha (JSON), lidas sob demanda
+    with open(caminho_cache, encoding="utf-8") as f:
+        # A data de modificação marca o último uso (a limpeza apaga os menos usados)
+        os.utime(caminho_cache)
+        for linha in f:
+            yield json.loads(linha)
+
+
+class _GravadorCache:
+    """Grava as páginas no cache conforme saem; só publica o arquivo se a extração terminar."""
+
+    def __init__(self, caminho_cache):
+        self.destino = caminho_cache
+        self._arquivo = None
+        if caminho_cache is not None:
+            caminho_cache.parent.mkdir(parents=True, exist_ok=True)
+            self._tmp = caminho_cache.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            self._arquivo = open(self._tmp, "w", encoding="utf-8")
+
+    def escrever(self, texto: str):
+        if self._arquivo is not None:
+            self._arquivo.write(json.dumps(texto, ensure_ascii=False) + "\n")
+
+    def concluir(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            os.replace(self._tmp, self.destino)
+            self._arquivo = None
+
+    def descartar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            Path(self._tmp).unlink(missing_ok=True)
+            self._arquivo = None
+
+
+def limpar_cache_pdf(diretorio: str = None) -> int:
+    """
+    Aplica os limites do cache de PDF: apaga os arquivos sem uso há mais de PDF_CACHE_MAX_IDADE
+    (inclusive temporários de extrações interrompidas) e, se o total ainda passar de
+    PDF_CACHE_MAX_BYTES, os usados há mais tempo. Retorna quantos arquivos foram apagados.
+    """
+    diretorio = diretorio or PDF_CACHE_DIR
+    if not diretorio:
+        return 0
+    agora = time.time()
+    arquivos = []
+    apagados = 0
+    try:
+        entradas = list(os.scandir(diretorio))
+    except FileNotFoundError:
+        return 0
+    for entrada in entradas:
+        try:
+            info = entrada.stat()
+        except FileNotFoundError:
+            continue
+        if PDF_CACHE_MAX_IDADE and agora - info.st_mtime > PDF_CACHE_MAX_IDADE:
+            Path(entrada.path).unlink(missing_ok=True)
+            apagados += 1
+        elif entrada.name.endswith(".jsonl"):
+            arquivos.append((info.st_mtime, info.st_size, entrada.path))
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    if PDF_CACHE_MAX_BYTES and total > PDF_CACHE_MAX_BYTES:
+        for _, tamanho, caminho in sorted(arquivos):
+            Path(caminho).unlink(missing_ok=True)
+            apagados += 1
+            total -= tamanho
+            if total <= PDF_CACHE_MAX_BYTES:
+                break
+    return apagados
+
+
+def _faixas(total: int):
+    passo = max(1, PDF_PAGINAS_POR_TAREFA)
+    return [(i, min(i + passo, total)) for i in range(0, total, passo)]
+
+
+def iterar_paginas_pdf(caminho: str):
+    """
+    Gera o texto de cada página, na ordem, extraindo em paralelo no pool de processos.
+    No máximo PDF_TAREFAS_EM_VOO faixas de páginas ficam em andamento/prontas ao mesmo
+    tempo, então a memória não cresce com o número de páginas.
+    Se o arquivo já foi extraído antes (mesmo hash), lê direto do cache.
+    Lança a exceção do PyPDF2 se o arquivo não for um PDF legível.
+    """
+    caminho = str(caminho)
+    caminho_cache = _caminho_cache(hash_arquivo(caminho))
+    if caminho_cache is not None and caminho_cache.exists():
+        yield from _ler_cache(caminho_cache)
+        return
+
+    total = len(PdfReader(caminho).pages)
+    gravador = _GravadorCache(caminho_cache)
+    pool = _obter_pool()
+    try:
+        if pool is None:
+            for inicio, fim in _faixas(total):
+                for texto in _extrair_paginas(caminho, inicio, fim):
+                    gravador.escrever(texto)
+                    yield texto
+        else:
+            faixas = iter(_faixas(total))
+            pendentes = deque()
+            for inicio, fim in faixas:
+                pendentes.append(pool.submit(_extrair_paginas, caminho, inicio, fim))
+                if len(pendentes) >= PDF_TAREFAS_EM_VOO:
+                    break
+            while pendentes:
+                textos = pendentes.popleft().result()
+                # Repõe a janela antes de entregar as páginas, para o pool não ficar ocioso
+                for inicio, fim in faixas:
+                    pendentes.append(pool.submit(_extrair_paginas, caminho, inicio, fim))
+                    break
+                for texto in textos:
+                    gravador.escrever(texto)
+                    yield texto
+    except BaseException:
+        gravador.descartar()
+        raise
+    gravador.concluir()
+    if caminho_cache is not None:
+        limpar_cache_pdf(str(caminho_cache.parent))
+
+
+def iterar_paginas_pdf_async(caminho: str):
+    """
+    Versão assíncrona de iterar_paginas_pdf: hash, abertura e espera pelo pool
+    rodam fora do event loop, que fica livre para outras requisições.
+    """
+    return iterar_em_thread(iterar_paginas_pdf(caminho))
+
+
+def _com_arquivo(conteudo):
+    """
+    Garante um caminho em disco para o PDF (os processos do pool abrem o arquivo).
+    Retorna (caminho, temporario).
+    """
+    if isinstance(conteudo, (str, Path)):
+        return str(conteudo), False
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        if isinstance(conteudo, (bytes, bytearray, memoryview)):
+            tmp.write(conteudo)
+        else:
+            conteudo.seek(0)
+            for bloco in iter(lambda: conteudo.read(1024 * 1024), b""):
+                tmp.write(bloco)
+        return tmp.name, True
+
+
+def iterar_texto_pdf(conteudo):
+    """
+    Texto do PDF em pedaços, uma página por vez, já com o "\\n" que separa as páginas:
+    a concatenação é o texto de extrair_texto_pdf (sem o strip). Só as páginas em
+    andamento ficam em memória.
+    `conteudo` pode ser bytes, um arquivo binário ou um caminho.
+    """
+    caminho, temporario = _com_arquivo(conteudo)
+    try:
+        for i, texto in enumerate(iterar_paginas_pdf(caminho)):
+            yield "\n" + texto if i else texto
+    finally:
+        if temporario:
+            os.unlink(caminho)
+
+
+def iterar_texto_pdf_async(conteudo):
+    """Versão assíncrona de iterar_texto_pdf (extração e leitura do upload fora do event loop)."""
+    return iterar_em_thread(iterar_texto_pdf(conteudo))
+
+
+def extrair_texto_pdf(conteudo) -> str:
+    """
+    Texto completo do PDF (páginas unidas por "\\n"), igual ao extrator antigo.
+    `conteudo` pode ser bytes, um arquivo binário ou um caminho. Para processar o
+    texto conforme as páginas saem, use iterar_texto_pdf.
+    """
+    return "".join(iterar_texto_pdf(conteudo)).strip()
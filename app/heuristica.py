@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import bisect
+import unicodedata
+from pathlib import Path
+
+# Arquivo de regras (termos com peso por label); pode ser trocado via ambiente
+HEURISTICA_REGRAS_PATH = os.getenv("HEURISTICA_REGRAS_PATH", str(Path(__file__).parent / "regras_heuristica.json"))
+
+
+_RE_COMBINANTES = re.compile("[\u0300-\u036f]")
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+def dobrar(texto: str) -> str:
+    """Minúsculas e sem acentos ("Reunião" -> "reuniao"), usado em termos e mensagens."""
+    return _RE_COMBINANTES.sub("", unicodedata.normalize("NFD", texto.lower()))
+
+
+def _regex_trie(no: dict) -> str:
+    """
+    Monta a alternância a partir de uma trie de termos, fatorando prefixos comuns
+    ("agendar|agendad*" -> "agenda(?:d\\w*|r)"): o motor de regex não retesta o
+    mesmo prefixo para cada termo.
+    """
+    alternativas = []
+    for ch in sorted(k for k in no if k not in ("", "*")):
+        alternativas.append((r"\s+" if ch == " " else re.escape(ch)) + _regex_trie(no[ch]))
+    if "*" in no:
+        alternativas.append(r"\w*")
+    if not alternativas:
+        return ""
+    if "" in no:
+        return "(?:" + "|".join(alternativas) + ")?"
+    if len(alternativas) == 1:
+        return alternativas[0]
+    return "(?:" + "|".join(alternativas) + ")"
+
+
+class MotorRegras:
+    """
+    Classificador por palavras-chave com peso por label.
+    Todos os termos são compilados em uma única regex (alternância fatorada em trie) com
+    limites de palavra e sem acentos, então cada mensagem é percorrida uma só vez.
+    Um termo terminado em "*" casa como prefixo ("confirm*" -> confirma, confirmação...).
+    Cada termo conta uma vez por mensagem (presença, não frequência).
+    """
+
+    def __init__(self, regras: dict):
+        padrao = regras.get("padrao") or {}
+        self.label_padrao = padrao.get("label", "neutro")
+        self.score_padrao = float(padrao.get("score", 0.3))
+        # A ordem dos labels no arquivo desempata (o primeiro vence)
+        self.labels = list((regras.get("labels") or {}).keys())
+        self.peso_total = {}
+        # termo dobrado -> [(label, peso), ...]
+        self._exatos = {}
+        self._prefixos = {}
+        trie = {}
+        for label, termos in (regras.get("labels") or {}).items():
+            self.peso_total[label] = float(sum(termos.values())) or 1.0
+            for termo, peso in termos.items():
+                termo = _RE_ESPACOS.sub(" ", dobrar(termo.strip()))
+                if not termo.rstrip("*"):
+                    continue
+                destino = self._prefixos if termo.endswith("*") else self._exatos
+                destino.setdefault(termo.rstrip("*"), []).append((label, float(peso)))
+                no = trie
+                for ch in termo.rstrip("*"):
+                    no = no.setdefault(ch, {})
+                no["*" if termo.endswith("*") else ""] = True
+        self._tamanhos_prefixo = sorted({len(p) for p in self._prefixos})
+        self._regex = re.compile(r"\b" + _regex_trie(trie) + r"\b") if trie else None
+
+    @classmethod
+    def de_arquivo(cls, caminho: str = HEURISTICA_REGRAS_PATH) -> "MotorRegras":
+        with open(caminho, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def _termos_do_trecho(self, trecho: str):
+        # Termos (exatos e prefixos) que correspondem a um trecho casado pela regex
+        trecho = _RE_ESPACOS.sub(" ", trecho)
+        if trecho in self._exatos:
+            yield "=" + trecho
+        for tamanho in self._tamanhos_prefixo:
+            if tamanho <= len(trecho) and trecho[:tamanho] in self._prefixos:
+                yield "*" + trecho[:tamanho]
+
+    def _pontuar(self, encontrados: set):
+        # Soma os pesos dos termos encontrados e escolhe o label com maior peso
+        if not encontrados:
+            return self.label_padrao, self.score_padrao
+        pesos = {}
+        for termo in encontrados:
+            regras = self._exatos if termo[0] == "=" else self._prefixos
+            for label, peso in regras[termo[1:]]:
+                pesos[label] = pesos.get(label, 0.0) + peso
+        melhor = max(self.labels, key=lambda l: pesos.get(l, 0.0))
+        if pesos.get(melhor, 0.0) <= 0:
+            return self.label_padrao, self.score_padrao
+        # normaliza para 0.5 .. 0.9
+        score = 0.5 + min(pesos[melhor] / self.peso_total[melhor], 0.4)
+        return melhor, round(score, 2)
+
+    def classificar(self, texto: str):
+        """Retorna (label, score) para uma mensagem."""
+        if not texto:
+            return "neutro", 0.0
+        if self._regex is None:
+            return self.label_padrao, self.score_padrao
+        encontrados = set()
+        for trecho in set(self._regex.findall(dobrar(texto))):
+            encontrados.update(self._termos_do_trecho(trecho))
+        return self._pontuar(encontrados)
+
+    def classificar_lote(self, textos: list) -> list:
+        """
+        Classifica várias mensagens em uma única varredura: os textos dobrados são
+        concatenados e cada casamento é atribuído à mensagem pela posição.
+        Retorna [(label, score), ...] na mesma ordem.
+        """
+        if self._regex is None:
+            return [("neutro", 0.0) if not t else (self.label_padrao, self.score_padrao) for t in textos]
+        partes = [dobrar(t or "") for t in textos]
+        inicios = []
+        pos = 0
+        for parte in partes:
+            inicios.append(pos)
+            pos += len(parte) + 1
+        trechos = [set() for _ in textos]
+        # "\x00" entre as mensagens garante o limite de palavra na junção e, como não casa
+        # com "\s+" nem com "\w*", nenhum termo de várias palavras atravessa duas mensagens
+        for m in self._regex.finditer("\x00".join(partes)):
+            trechos[bisect.bisect_right(inicios, m.start()) - 1].add(m.group())
+        # Cada trecho distinto é resolvido para termos uma única vez no lote
+        termos = {}
+        encontrados = []
+        for achados in trechos:
+            conjunto = set()
+            for trecho in achados:
+                if trecho not in termos:
+                    termos[trecho] = tuple(self._termos_do_trecho(trecho))
+                conjunto.update(termos[trecho])
+            encontrados.append(conjunto)
+        return [
+            ("neutro", 0.0) if not texto else self._pontuar(achados)
+            for texto, achados in zip(textos, encontrados)
+        ]
+
+
+_motor = None
+
+
+def obter_motor() -> MotorRegras:
+    # Instância única, carregada do arquivo de regras na primeira chamada
+    global _motor
+    if _motor is None:
+        _motor = MotorRegras.de_arquivo()
+    return _motor
+
+
+def recarregar_regras(caminho: str = None) -> MotorRegras:
+    """Relê o arquivo de regras (ex: depois de editá-lo) e troca o motor em uso."""
+    global _motor
+    _motor = MotorRegras.de_arquivo(caminho or HEURISTICA_REGRAS_PATH)
+    return _motor
@@ -0,0 +1,430 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import asyncio
+import itertools
+import threading
+from pathlib import Path
+
+from app.nlp_utils import (
+    extrair_texto_async,
+    preprocessar_texto,
+    iterar_classificacao_e_resposta_async,
+    resumir_classificacoes,
+)
+from app.leitor_mbox import iterar_emails_mbox
+from app.uploads import detectar_formato
+from app.acervo import anotar_emails
+from app.triagem import obter_triagem, manter_triagem, descartar_puladas
+from app.analise_hierarquica import gerar_analise_hierarquica_async
+from app.cache import somar_contadores_cache
+
+# Diretório dos jobs: banco SQLite com o estado e cópias dos uploads (para retomar após reinício)
+JOBS_DIR = os.getenv("JOBS_DIR", "jobs")
+# Jobs executados ao mesmo tempo por processo
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+# Mensagens por lote de job: o progresso e os resultados parciais são gravados a cada lote
+JOBS_LOTE_MENSAGENS = int(os.getenv("JOBS_LOTE_MENSAGENS", "200"))
+# Segundos sem sinal de vida até um job "executando" ser considerado abandonado e retomado
+JOBS_LEASE = float(os.getenv("JOBS_LEASE", "30"))
+# Segundos que um job concluído (ou com erro) fica consultável antes de ser apagado, com os lotes e a entrada
+JOBS_RETENCAO = float(os.getenv("JOBS_RETENCAO", str(7 * 24 * 3600)))
+# Intervalo (s) entre as limpezas dos jobs vencidos
+JOBS_LIMPEZA_INTERVALO = float(os.getenv("JOBS_LIMPEZA_INTERVALO", "3600"))
+
+TIPOS_JOB = ("classify", "analise")
+
+
+def _agora() -> float:
+    return time.time()
+
+
+class FilaJobs:
+    """
+    Fila de jobs persistida em SQLite, sem broker externo.
+      - `jobs`: estado, progresso e resultado final de cada job;
+      - `job_lotes`: resultado de cada lote concluído (resultados parciais e ponto de retomada).
+    Os workers são tarefas asyncio no loop do servidor (o trabalho é I/O com a IA).
+    Um job "executando" cujo dono parou de renovar o lease volta a ser elegível,
+    e o novo worker continua a partir do último lote gravado.
+    Os métodos que acessam o banco são síncronos; os workers os chamam em asyncio.to_thread.
+    Jobs terminados há mais de `retencao` segundos são apagados (limpar_antigos).
+    """
+
+    def __init__(self, diretorio: str = JOBS_DIR, workers: int = JOBS_WORKERS,
+                 lote_mensagens: int = JOBS_LOTE_MENSAGENS, lease: float = JOBS_LEASE,
+                 retencao: float = JOBS_RETENCAO):
+        self.diretorio = Path(diretorio)
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        self.workers = max(1, workers)
+        self.lote_mensagens = max(1, lote_mensagens)
+        self.lease = lease
+        self.retencao = retencao
+        self.dono = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.diretorio / "jobs.db"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, tipo TEXT NOT NULL, status TEXT NOT NULL,"
+            " arquivo TEXT, nome_arquivo TEXT, progresso TEXT NOT NULL DEFAULT '{}',"
+            " resultado TEXT, erro TEXT, dono TEXT,"
+            " criado_em REAL NOT NULL, atualizado_em REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS job_lotes ("
+            " job_id TEXT NOT NULL, indice INTEGER NOT NULL, dados TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, indice))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, atualizado_em)")
+        self._novo_job = None
+        self._tarefas = []
+        # progresso em memória dos jobs em execução neste processo (mais fino que o gravado)
+        self._progresso_vivo = {}
+
+    # --- Criação e consulta ---
+
+    def criar(self, tipo: str, origem, nome_arquivo: str = None) -> str:
+        """
+        Registra um job e copia a entrada para o diretório de jobs.
+        `origem` é um arquivo binário (ex: UploadFile.file) ou o texto enviado no formulário.
+        """
+        if tipo not in TIPOS_JOB:
+            raise ValueError(f"Tipo de job desconhecido: {tipo}")
+        job_id = uuid.uuid4().hex
+        caminho = self.diretorio / f"{job_id}.entrada"
+        if isinstance(origem, str):
+            caminho.write_text(origem, encoding="utf-8")
+            nome_arquivo = None
+        else:
+            with open(caminho, "wb") as destino:
+                shutil.copyfileobj(origem, destino, 1024 * 1024)
+        agora = _agora()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, tipo, status, arquivo, nome_arquivo, criado_em, atualizado_em)"
+                " VALUES (?, ?, 'pendente', ?, ?, ?, ?)",
+                (job_id, tipo, str(caminho), nome_arquivo, agora, agora),
+            )
+        if self._novo_job is not None:
+            self._novo_job.set()
+        return job_id
+
+    def obter(self, job_id: str, desde: int = 0):
+        """
+        Estado do job com os resultados parciais dos lotes a partir de `desde`
+        (para o polling buscar só o que é novo). Retorna None se o job não existe.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tipo, status, progresso, resultado, erro, criado_em, atualizado_em FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            lotes = self._db.execute(
+                "SELECT indice, dados FROM job_lotes WHERE job_id = ? AND indice >= ? ORDER BY indice",
+                (job_id, desde),
+            ).fetchall()
+        tipo, status, progresso, resultado, erro, criado_em, atualizado_em = row
+        progresso = dict(json.loads(progresso), **self._progresso_vivo.get(job_id, {}))
+        estado = {
+            "id": job_id,
+            "tipo": tipo,
+            "status": status,
+            "progresso": progresso,
+            "criado_em": criado_em,
+            "atualizado_em": atualizado_em,
+            "erro": erro,
+            "resultado": json.loads(resultado) if resultado else None,
+            "proximo_lote": (lotes[-1][0] + 1) if lotes else desde,
+        }
+        dados = [json.loads(d) for _, d in lotes]
+        if tipo == "classify":
+            estado["parcial"] = {
+                "classificacoes": [c for d in dados for c in d["classificacoes"]],
+                "respostas": [r for d in dados for r in d["respostas"]],
+            }
+        else:
+            estado["parcial"] = {"analises_parciais": dados}
+        return estado
+
+    # --- Workers ---
+
+    def iniciar(self):
+        # Chamado no startup do servidor (precisa de um event loop rodando)
+        self._novo_job = asyncio.Event()
+        self._tarefas = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tarefas.append(asyncio.create_task(self._limpar_periodicamente()))
+
+    async def parar(self):
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._tarefas = []
+        # Jobs interrompidos voltam para a fila (retomados do último lote gravado no próximo start)
+        await asyncio.to_thread(self._devolver_executando)
+
+    def _devolver_executando(self):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'pendente' WHERE status = 'executando' AND dono = ?", (self.dono,)
+            )
+
+    def limpar_antigos(self) -> int:
+        """
+        Apaga os jobs concluídos ou com erro há mais de `retencao` segundos: a linha do job,
+        os lotes gravados e a cópia da entrada. Retorna quantos jobs foram apagados.
+        """
+        limite = _agora() - self.retencao
+        with self._lock:
+            vencidos = self._db.execute(
+                "SELECT id, arquivo FROM jobs WHERE status IN ('concluido', 'erro') AND atualizado_em < ?", (limite,)
+            ).fetchall()
+            if not vencidos:
+                return 0
+            ids = [(job_id,) for job_id, _ in vencidos]
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM job_lotes WHERE job_id = ?", ids)
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", ids)
+            self._db.execute("COMMIT")
+        for _, arquivo in vencidos:
+            if arquivo:
+                Path(arquivo).unlink(missing_ok=True)
+        return len(vencidos)
+
+    async def _limpar_periodicamente(self):
+        while True:
+            await asyncio.to_thread(self.limpar_antigos)
+            await asyncio.sleep(JOBS_LIMPEZA_INTERVALO)
+
+    def _reivindicar(self):
+        # Pega o próximo job pendente (ou abandonado) de forma atômica entre processos
+        agora = _agora()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status = 'pendente'"
+                " OR (status = 'executando' AND atualizado_em < ?) ORDER BY criado_em LIMIT 1",
+                (agora - self.lease,),
+            ).fetchone()
+            if row is None:
+                return None
+            cur = self._db.execute(
+                "UPDATE jobs SET status = 'executando', dono = ?, atualizado_em = ?"
+                " WHERE id = ? AND (status = 'pendente' OR (status = 'executando' AND atualizado_em < ?))",
+                (self.dono, agora, row[0], agora - self.lease),
+            )
+            return row[0] if cur.rowcount == 1 else None
+
+    async def _worker(self):
+        while True:
+            # Limpa o aviso antes de procurar, para não perder um job criado no meio
+            self._novo_job.clear()
+            job_id = await asyncio.to_thread(self._reivindicar)
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._novo_job.wait(), timeout=self.lease / 2)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._executar(job_id)
+
+    async def _renovar_lease(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            await asyncio.to_thread(self._renovar, job_id)
+
+    def _renovar(self, job_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET atualizado_em = ? WHERE id = ? AND dono = ?", (_agora(), job_id, self.dono)
+            )
+
+    def _carregar(self, job_id: str):
+        # Entrada do job e lotes já gravados (ponto de retomada)
+        with self._lock:
+            tipo, arquivo, nome_arquivo = self._db.execute(
+                "SELECT tipo, arquivo, nome_arquivo FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            salvos = {
+                indice: json.loads(dados)
+                for indice, dados in self._db.execute(
+                    "SELECT indice, dados FROM job_lotes WHERE job_id = ?", (job_id,)
+                )
+            }
+        return tipo, arquivo, nome_arquivo, salvos
+
+    async def _executar(self, job_id: str):
+        tipo, arquivo, nome_arquivo, salvos = await asyncio.to_thread(self._carregar, job_id)
+        renovacao = asyncio.create_task(self._renovar_lease(job_id))
+        try:
+            if tipo == "classify":
+                resultado = await self._executar_classificacao(job_id, arquivo, nome_arquivo, salvos)
+            else:
+                resultado = await self._executar_analise(job_id, arquivo, nome_arquivo, salvos)
+        except asyncio.CancelledError:
+            # Servidor parando: parar() devolve o job para a fila
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self._finalizar, job_id, "erro", erro=str(e))
+        else:
+            await asyncio.to_thread(self._finalizar, job_id, "concluido", resultado=resultado)
+            Path(arquivo).unlink(missing_ok=True)
+        finally:
+            renovacao.cancel()
+            self._progresso_vivo.pop(job_id, None)
+
+    def _finalizar(self, job_id: str, status: str, resultado=None, erro: str = None):
+        progresso = self._progresso_vivo.get(job_id)
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, resultado = ?, erro = ?, atualizado_em = ?,"
+                " progresso = COALESCE(?, progresso) WHERE id = ?",
+                (
+                    status,
+                    json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+                    erro,
+                    _agora(),
+                    json.dumps(progresso) if progresso is not None else None,
+                    job_id,
+                ),
+            )
+
+    def _gravar_lote(self, job_id: str, indice: int, dados: dict):
+        # Resultado do lote + progresso na mesma transação: é o ponto de retomada
+        progresso = json.dumps(self._progresso_vivo.get(job_id, {}))
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute(
+                "INSERT OR REPLACE INTO job_lotes (job_id, indice, dados) VALUES (?, ?, ?)",
+                (job_id, indice, json.dumps(dados, ensure_ascii=False)),
+            )
+            self._db.execute(
+                "UPDATE jobs SET progresso = ?, atualizado_em = ? WHERE id = ?", (progresso, _agora(), job_id)
+            )
+            self._db.execute("COMMIT")
+
+    # --- Tipos de job ---
+
+    async def _mensagens(self, arquivo: str, nome_arquivo: str):
+        """
+        Mesmo tratamento de entrada do /classify, lendo a cópia gravada do upload.
+        Retorna um iterador de textos (mbox: lido mensagem a mensagem do disco).
+        """
+        # Formato pelos primeiros bytes (já validado na criação do job, ver app/uploads.py)
+        formato = detectar_formato(Path(arquivo), nome_arquivo) if nome_arquivo else "texto"
+        if formato == "mbox":
+            def _do_mbox():
+                with open(arquivo, "rb") as f:
+                    yield from anotar_emails(iterar_emails_mbox(f, obter_triagem()))
+            return _do_mbox()
+        if nome_arquivo:
+            texto = await extrair_texto_async(Path(arquivo), nome_arquivo, formato) or ""
+        else:
+            texto = Path(arquivo).read_text(encoding="utf-8")
+        return (parte for parte in texto.split("\n\n---\n\n") if parte.strip())
+
+    async def _executar_classificacao(self, job_id: str, arquivo: str, nome_arquivo: str, salvos: dict):
+        progresso = {"mensagens_lidas": 0, "classificadas": 0, "respondidas": 0, "lotes_concluidos": 0}
+        for dados in salvos.values():
+            n = len(dados["classificacoes"])
+            progresso["mensagens_lidas"] += n
+            progresso["classificadas"] += n
+            progresso["respondidas"] += sum(1 for r in dados["respostas"] if r is not None)
+            progresso["lotes_concluidos"] += 1
+        self._progresso_vivo[job_id] = progresso
+
+        def _lidas(mensagens):
+            for texto in mensagens:
+                progresso["mensagens_lidas"] += 1
+                yield manter_triagem(texto, preprocessar_texto(texto))
+
+        mensagens = await self._mensagens(arquivo, nome_arquivo)
+        # Retomada: os lotes já gravados são pulados sem reclassificar
+        pular = sum(len(d["classificacoes"]) for d in salvos.values())
+        for _ in itertools.islice(mensagens, pular):
+            pass
+
+        lidas = _lidas(mensagens)
+        indice = len(salvos)
+        # Índice global da primeira mensagem do lote ("grupo" vem relativo ao lote)
+        inicio = pular
+        meta_total = {"classificacao": [], "respostas": []}
+        while True:
+            lote = list(itertools.islice(lidas, self.lote_mensagens))
+            if not lote:
+                break
+            classificacoes = [None] * len(lote)
+            respostas = [None] * len(lote)
+            meta_pipeline = {}
+            async for evento in iterar_classificacao_e_resposta_async(lote, meta=meta_pipeline):
+                if evento[0] == "classificacao":
+                    item = evento[2]
+                    if "grupo" in item:
+                        item = dict(item, grupo=item["grupo"] + inicio)
+                    classificacoes[evento[1]] = item
+                    progresso["classificadas"] += 1
+                else:
+                    respostas[evento[1]] = evento[2]
+                    if evento[2] is not None:
+                        progresso["respondidas"] += 1
+            meta_total["classificacao"].append(meta_pipeline.get("classificacao", {}))
+            meta_total["respostas"].append(meta_pipeline.get("respostas", {}))
+            progresso["lotes_concluidos"] += 1
+            salvos[indice] = {"classificacoes": classificacoes, "respostas": respostas}
+            await asyncio.to_thread(self._gravar_lote, job_id, indice, salvos[indice])
+            indice += 1
+            inicio += len(lote)
+
+        todas = [c for i in sorted(salvos) for c in salvos[i]["classificacoes"]]
+        if not todas:
+            raise ValueError("Nenhum conteúdo enviado para análise.")
+        return {
+            "classificacao": resumir_classificacoes(todas),
+            "total": len(todas),
+            "meta": {
+                "cache": somar_contadores_cache(*meta_total["classificacao"], *meta_total["respostas"]),
+                "triagem": {"puladas": sum(m.get("triagem", {}).get("puladas", 0) for m in meta_total["classificacao"])},
+            },
+        }
+
+    async def _executar_analise(self, job_id: str, arquivo: str, nome_arquivo: str, salvos: dict):
+        progresso = {"mensagens_lidas": 0, "blocos_concluidos": len(salvos)}
+        self._progresso_vivo[job_id] = progresso
+
+        def _lidas(mensagens):
+            for texto in mensagens:
+                progresso["mensagens_lidas"] += 1
+                yield texto
+
+        async def _ao_concluir_bloco(indice, parcial):
+            progresso["blocos_concluidos"] += 1
+            await asyncio.to_thread(self._gravar_lote, job_id, indice, parcial)
+
+        # Mensagens que a triagem por cabeçalhos manda pular ficam fora da análise
+        triagem = {}
+        analise, meta = await gerar_analise_hierarquica_async(
+            _lidas(descartar_puladas(await self._mensagens(arquivo, nome_arquivo), triagem)),
+            parciais_salvos=salvos,
+            ao_concluir_bloco=_ao_concluir_bloco,
+        )
+        if meta.get("source") == "none":
+            raise ValueError("Nenhum conteúdo enviado para análise.")
+        if triagem.get("puladas"):
+            meta["triagem"] = triagem
+        return {"analise": analise, "meta": meta}
+
+
+_fila = None
+
+
+def obter_fila() -> FilaJobs:
+    # Instância única da fila por processo
+    global _fila
+    if _fila is None:
+        _fila = FilaJobs()
+    return _fila
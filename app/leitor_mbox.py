@@ -0,0 +1,182 @@
+import io
+import mmap
+import email
+from email.header import decode_header
+from dataclasses import dataclass, field
+
+from app.triagem import PULAR, ler_cabecalhos
+
+
+@dataclass
+class MensagemEmail:
+    """
+    Uma mensagem extraída do mbox.
+    `inicio` e `fim` são as posições (em bytes) do bloco da mensagem no arquivo,
+    contadas a partir da posição em que a leitura começou.
+    `triagem` é o veredito da triagem por cabeçalhos (app/triagem.py), se alguma regra casou;
+    com a ação "pular", o corpo não é decodificado (fica vazio).
+    """
+    assunto: str
+    corpo: str
+    cabecalhos: dict = field(default_factory=dict)
+    inicio: int = 0
+    fim: int = 0
+    triagem: dict = None
+
+    @property
+    def texto(self) -> str:
+        # Concatena assunto e corpo no formato usado pelos prompts
+        if self.assunto and self.corpo:
+            return f"Assunto: {self.assunto}\n\n{self.corpo}"
+        elif self.assunto:
+            return f"Assunto: {self.assunto}"
+        return self.corpo
+
+
+def iterar_emails_mbox(arquivo, triagem=None):
+    """
+    Lê um mbox de forma incremental (linha a linha) e gera uma MensagemEmail por vez.
+    Aceita um arquivo binário (ex: UploadFile.file, já spooled em disco), um mmap ou bytes.
+    Só o bloco da mensagem atual fica em memória.
+    Com `triagem` (app/triagem.Triagem), os cabeçalhos brutos de cada mensagem são avaliados
+    antes do parse: as que uma regra manda pular saem só com assunto e cabeçalhos.
+    """
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        arquivo = io.BytesIO(arquivo)
+    elif isinstance(arquivo, mmap.mmap):
+        # mmap não itera por linhas
+        arquivo.seek(0)
+        arquivo = iter(arquivo.readline, b"")
+
+    bloco = []
+    inicio = 0
+    posicao = 0
+    for linha in arquivo:
+        # O separador padrão de mbox é uma linha que começa com "From "
+        if linha.startswith(b"From ") and bloco:
+            msg = _mensagem_triada(b"".join(bloco), inicio, posicao, triagem)
+            if msg is not None:
+                yield msg
+            bloco = []
+            inicio = posicao
+        bloco.append(linha)
+        posicao += len(linha)
+
+    if bloco:
+        msg = _mensagem_triada(b"".join(bloco), inicio, posicao, triagem)
+        if msg is not None:
+            yield msg
+
+
+def _mensagem_triada(part: bytes, inicio: int, fim: int, triagem=None):
+    """
+    Passa o bloco pela triagem (se houver) antes do parse completo: com a ação "pular",
+    só os cabeçalhos são lidos e o corpo (MIME, charsets) nem é decodificado.
+    """
+    if triagem is None:
+        return _mensagem_de_bytes(part, inicio, fim)
+    veredito, _ = triagem.avaliar(part)
+    if veredito is None:
+        return _mensagem_de_bytes(part, inicio, fim)
+    if veredito["acao"] != PULAR:
+        msg = _mensagem_de_bytes(part, inicio, fim)
+        if msg is not None:
+            msg.triagem = veredito
+        return msg
+    if not part.strip():
+        return None
+    cabecalhos = {nome: _decodificar_cabecalho(valor) for nome, valor in ler_cabecalhos(part).items()}
+    # Sem assunto, a mensagem ainda precisa de um texto para ter o seu resultado na lista
+    assunto = cabecalhos.get("subject", "").strip() or "(sem assunto)"
+    return MensagemEmail(assunto=assunto, corpo="", cabecalhos=cabecalhos,
+                         inicio=inicio, fim=fim, triagem=veredito)
+
+
+def _mensagem_de_bytes(part: bytes, inicio: int, fim: int):
+    """
+    Converte o bloco bruto de uma mensagem em MensagemEmail (ou None se estiver vazio).
+    """
+    part = part.strip()
+    if not part:
+        return None
+    try:
+        # Usa a lib 'email' para parsear os bytes de cada mensagem
+        msg = email.message_from_bytes(part)
+    except Exception:
+        # Fallback se o parse falhar: decodifica o bloco como texto puro
+        try:
+            txt = part.decode("utf-8", errors="ignore")
+        except Exception:
+            txt = part.decode("latin-1", errors="ignore")
+        return MensagemEmail(assunto="", corpo=txt.strip(), inicio=inicio, fim=fim)
+
+    subj = _decodificar_cabecalho(msg.get('subject', '') or '')
+    body = ""
+
+    # Tenta extrair o corpo (body) da mensagem
+    if msg.is_multipart():
+        # Se for multipart, procura pela parte 'text/plain'
+        for p in msg.walk():
+            ctype = p.get_content_type()
+            disp = str(p.get('Content-Disposition') or "")
+            if ctype == 'text/plain' and 'attachment' not in disp:
+                try:
+                    payload = p.get_payload(decode=True) or b""
+                    # Tenta decodificar com o charset_or 'utf-8'
+                    body = payload.decode(p.get_content_charset() or 'utf-8', errors='ignore')
+                    break
+                except Exception:
+                    # Fallback para latin-1 se utf-8 falhar
+                    try:
+                        body = payload.decode('latin-1', errors='ignore')
+                        break
+                    except Exception:
+                        body = ""
+    else:
+        # Se for mensagem simples, pega o payload direto
+        try:
+            payload = msg.get_payload(decode=True)
+            if payload is None:
+                raw = msg.get_payload()
+                if isinstance(raw, str):
+                    body = raw
+                else:
+                    body = str(raw)
+            else:
+                body = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
+        except Exception:
+            try:
+                body = msg.get_payload()
+                if isinstance(body, bytes):
+                    body = body.decode('utf-8', errors='ignore')
+            except Exception:
+                body = ""
+
+    # Guarda os cabeçalhos (primeira ocorrência de cada um) para uso posterior
+    cabecalhos = {}
+    for nome, valor in msg.items():
+        cabecalhos.setdefault(nome.lower(), _decodificar_cabecalho(valor))
+
+    return MensagemEmail(assunto=subj.strip(), corpo=body.strip(), cabecalhos=cabecalhos, inicio=inicio, fim=fim)
+
+
+def _decodificar_cabecalho(valor) -> str:
+    """
+    Converte um cabeçalho (str ou email.header.Header) em texto, decodificando
+    encoded-words (=?utf-8?...?=) e bytes 8-bit crus (tratados como utf-8).
+    """
+    try:
+        partes = decode_header(valor)
+    except Exception:
+        return str(valor)
+    textos = []
+    for pedaco, charset in partes:
+        if isinstance(pedaco, bytes):
+            if not charset or charset == "unknown-8bit":
+                charset = "utf-8"
+            try:
+                pedaco = pedaco.decode(charset, errors="replace")
+            except LookupError:
+                pedaco = pedaco.decode("utf-8", errors="replace")
+        textos.append(pedaco)
+    return "".join(textos)
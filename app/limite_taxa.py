@@ -0,0 +1,139 @@
+import os
+import time
+import struct
+import asyncio
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: o limite vale só para o processo
+    fcntl = None
+
+from app.metricas import contar
+
+# Limites da conta na IA, somados entre todos os processos (0 = sem limite)
+LLM_LIMITE_RPM = float(os.getenv("LLM_LIMITE_RPM", "0"))
+LLM_LIMITE_TPM = float(os.getenv("LLM_LIMITE_TPM", "0"))
+# Quantos segundos de limite podem ser gastos de uma vez (rajada) depois de um período ocioso
+LLM_LIMITE_RAJADA = float(os.getenv("LLM_LIMITE_RAJADA", "1"))
+# Arquivo com o estado dos baldes, compartilhado pelos workers da mesma máquina
+LLM_LIMITE_ARQUIVO = os.getenv("LLM_LIMITE_ARQUIVO", os.path.join(tempfile.gettempdir(), "autou_limite_llm"))
+# Pausa (s) aplicada a todos os processos quando a IA responde 429 sem Retry-After
+LLM_LIMITE_PAUSA_429 = float(os.getenv("LLM_LIMITE_PAUSA_429", "1"))
+
+# Estado: requisições disponíveis, tokens disponíveis, última atualização, pausado até
+_ESTADO = struct.Struct("<dddd")
+
+
+class LimitadorTaxa:
+    """
+    Token bucket compartilhado entre processos para as chamadas à IA: um balde de
+    requisições (RPM) e um de tokens (TPM, estimados antes da chamada).
+
+    O estado fica em um arquivo de 32 bytes protegido por flock, então vários workers
+    (uvicorn --workers, app/servidor.py) dividem o mesmo limite sem serviço externo.
+    Cada chamada reserva o seu custo na hora (o saldo pode ficar negativo) e espera o
+    tempo que falta para o saldo voltar a zero: as chamadas saem espaçadas, na ordem
+    de reserva, em vez de todas tentarem ao mesmo tempo e voltarem com 429.
+    Um 429 pausa todos os processos pelo Retry-After.
+    """
+
+    def __init__(self, rpm: float = LLM_LIMITE_RPM, tpm: float = LLM_LIMITE_TPM,
+                 caminho: str = LLM_LIMITE_ARQUIVO, rajada: float = LLM_LIMITE_RAJADA):
+        self.taxa_req = rpm / 60.0
+        self.taxa_tok = tpm / 60.0
+        self.cap_req = max(1.0, self.taxa_req * rajada)
+        self.cap_tok = max(1.0, self.taxa_tok * rajada)
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._estado_local = None
+        self._fd = None
+        if fcntl is not None:
+            self._fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+
+    @contextmanager
+    def _travado(self):
+        with self._lock:
+            if self._fd is None:
+                yield
+                return
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _ler(self, agora: float) -> list:
+        if self._fd is None:
+            dados = self._estado_local
+        else:
+            dados = os.pread(self._fd, _ESTADO.size, 0)
+        if not dados or len(dados) < _ESTADO.size:
+            # Primeiro uso: baldes cheios
+            return [self.cap_req, self.cap_tok, agora, 0.0]
+        return list(_ESTADO.unpack(dados))
+
+    def _gravar(self, estado: list):
+        dados = _ESTADO.pack(*estado)
+        if self._fd is None:
+            self._estado_local = dados
+        else:
+            os.pwrite(self._fd, dados, 0)
+
+    def reservar(self, tokens: int) -> float:
+        """Reserva uma chamada de `tokens` tokens e retorna quantos segundos esperar antes de enviá-la."""
+        agora = time.time()
+        with self._travado():
+            req, tok, ultimo, pausado_ate = self._ler(agora)
+            decorrido = max(0.0, agora - ultimo)
+            req = min(self.cap_req, req + decorrido * self.taxa_req)
+            tok = min(self.cap_tok, tok + decorrido * self.taxa_tok)
+            espera = max(0.0, pausado_ate - agora)
+            if self.taxa_req > 0:
+                req -= 1
+                espera = max(espera, -req / self.taxa_req)
+            if self.taxa_tok > 0:
+                # Uma chamada maior que o balde inteiro espera só o balde encher
+                tok -= min(tokens, self.cap_tok)
+                espera = max(espera, -tok / self.taxa_tok)
+            self._gravar([req, tok, agora, pausado_ate])
+        return espera
+
+    async def aguardar(self, tokens: int):
+        espera = self.reservar(tokens)
+        if espera > 0:
+            contar("autou_llm_limite_espera_segundos_total", espera)
+            await asyncio.sleep(espera)
+
+    def pausar(self, segundos: float):
+        """Suspende as chamadas de todos os processos por `segundos` (ex: Retry-After de um 429)."""
+        agora = time.time()
+        with self._travado():
+            estado = self._ler(agora)
+            estado[3] = max(estado[3], agora + segundos)
+            self._gravar(estado)
+        contar("autou_llm_pausas_total")
+
+
+def segundos_retry_after(resposta) -> float:
+    """Valor do cabeçalho Retry-After (em segundos) de uma resposta 429, ou LLM_LIMITE_PAUSA_429."""
+    valor = resposta.headers.get("retry-after") if resposta is not None else None
+    try:
+        return max(0.0, float(valor))
+    except (TypeError, ValueError):
+        return LLM_LIMITE_PAUSA_429
+
+
+_limitador = None
+
+
+def obter_limitador():
+    # Instância única por processo (None se nenhum limite estiver configurado)
+    global _limitador
+    if LLM_LIMITE_RPM <= 0 and LLM_LIMITE_TPM <= 0:
+        return None
+    if _limitador is None:
+        _limitador = LimitadorTaxa()
+    return _limitador
@@ -0,0 +1,135 @@
+import os
+import asyncio
+import importlib.util
+
+import httpx
+
+from app.tokens import estimar_tokens
+from app.limite_taxa import obter_limitador, segundos_retry_after
+
+# Configuração do pool de conexões (pode ser ajustada via variáveis de ambiente)
+LLM_MAX_CONCORRENCIA = int(os.getenv("LLM_MAX_CONCORRENCIA", "16"))
+LLM_MAX_CONEXOES = int(os.getenv("LLM_MAX_CONEXOES", "32"))
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# HTTP/2 só é ativado se o pacote 'h2' estiver instalado (httpx[http2])
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") != "0" and importlib.util.find_spec("h2") is not None
+
+
+class ClienteLLM:
+    """
+    Cliente HTTP assíncrono compartilhado para as chamadas de LLM.
+    Mantém um único httpx.AsyncClient (pool com keep-alive e HTTP/2) por event loop
+    e limita o número de requisições simultâneas com um semáforo. Com LLM_LIMITE_RPM/TPM,
+    cada chamada passa antes pelo limite de taxa compartilhado entre processos (app/limite_taxa.py),
+    exceto com `limitar_taxa=False` (ex: modelo local, que não conta para o limite da conta).
+    """
+
+    def __init__(self, max_concorrencia: int = LLM_MAX_CONCORRENCIA, max_conexoes: int = LLM_MAX_CONEXOES,
+                 max_keepalive: int = LLM_MAX_KEEPALIVE, keepalive_expiry: float = LLM_KEEPALIVE_EXPIRY,
+                 timeout: float = LLM_TIMEOUT, http2: bool = LLM_HTTP2, limitar_taxa: bool = True):
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.limitar_taxa = limitar_taxa
+        self.max_conexoes = max_conexoes
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.http2 = http2
+        self._http = None
+        self._semaforo = None
+        self._loop = None
+
+    def _garantir_sessao(self) -> httpx.AsyncClient:
+        # O AsyncClient fica preso ao loop em que foi criado; se o loop mudou
+        # (ex: wrappers síncronos usando asyncio.run), cria uma nova sessão.
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._loop is not loop:
+            limites = httpx.Limits(
+                max_connections=self.max_conexoes,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            )
+            self._http = httpx.AsyncClient(http2=self.http2, limits=limites, timeout=self.timeout)
+            self._semaforo = asyncio.Semaphore(self.max_concorrencia)
+            self._loop = loop
+        return self._http
+
+    async def post_json(self, url: str, payload: dict, headers: dict = None) -> dict:
+        """
+        Envia um POST JSON usando a sessão compartilhada e retorna o corpo já parseado.
+        Lança httpx.HTTPStatusError se o status não for 2xx.
+        """
+        http = self._garantir_sessao()
+        limitador = obter_limitador() if self.limitar_taxa else None
+        if limitador is not None:
+            await limitador.aguardar(_custo_tokens(payload))
+        async with self._semaforo:
+            resp = await http.post(url, json=payload, headers=headers)
+        if resp.status_code == 429 and limitador is not None:
+            # Os outros processos também param, em vez de baterem no limite ao mesmo tempo
+            limitador.pausar(segundos_retry_after(resp))
+        resp.raise_for_status()
+        return resp.json()
+
+    async def fechar(self):
+        # Fecha a sessão apenas se ela pertence ao loop atual (loops encerrados não aceitam aclose)
+        if self._http is not None and self._loop is asyncio.get_running_loop():
+            await self._http.aclose()
+        self._http = None
+        self._semaforo = None
+        self._loop = None
+
+
+def _custo_tokens(payload: dict) -> int:
+    # O limite de tokens por minuto da conta conta o prompt e o max_tokens pedido
+    prompt = sum(estimar_tokens(m.get("content") or "") for m in payload.get("messages", []))
+    return prompt + int(payload.get("max_tokens") or 0)
+
+
+_cliente = None
+# Clientes próprios de cada provedor (app/provedores.py), fechados junto com o principal
+_clientes = []
+
+
+def obter_cliente() -> ClienteLLM:
+    # Instância única do cliente, compartilhada por todas as chamadas do processo
+    global _cliente
+    if _cliente is None:
+        _cliente = ClienteLLM()
+    return _cliente
+
+
+def novo_cliente(**opcoes) -> ClienteLLM:
+    """Cliente com pool, concorrência e timeout próprios (um por provedor de IA)."""
+    cliente = ClienteLLM(**opcoes)
+    _clientes.append(cliente)
+    return cliente
+
+
+async def fechar_cliente():
+    for cliente in [_cliente] + _clientes:
+        if cliente is not None:
+            await cliente.fechar()
+
+
+def executar_sincrono(coro):
+    """
+    Executa uma corrotina a partir de código síncrono (usado pelos wrappers de nlp_utils).
+    Não pode ser chamada de dentro de um event loop: nesse caso use a versão async.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("Função síncrona chamada dentro de um event loop; use a versão *_async.")
+
+    async def _rodar():
+        try:
+            return await coro
+        finally:
+            await fechar_cliente()
+
+    return asyncio.run(_rodar())
@@ -0,0 +1,153 @@
+import asyncio
+
+import httpx
+
+
+def eh_sobrecarga(exc: Exception) -> bool:
+    """
+    Indica se o erro sinaliza sobrecarga do provedor (429, 5xx ou timeout),
+    caso em que vale reduzir a concorrência e tentar de novo.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, (httpx.TimeoutException, httpx.TransportError))
+
+
+class LimiteAdaptativo:
+    """
+    Limite de lotes simultâneos no estilo AIMD:
+      - começa em `maximo` e sobe +1 a cada `janela` sucessos seguidos (até `maximo`);
+      - cai pela metade (mínimo 1) quando o provedor responde 429/5xx.
+    """
+
+    def __init__(self, maximo: int, janela: int = 4):
+        self.maximo = max(1, maximo)
+        self.limite = self.maximo
+        self.janela = max(1, janela)
+        self._em_uso = 0
+        self._sucessos = 0
+        self._cond = asyncio.Condition()
+
+    async def adquirir(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._em_uso < self.limite)
+            self._em_uso += 1
+
+    async def liberar(self):
+        async with self._cond:
+            self._em_uso -= 1
+            self._cond.notify_all()
+
+    def registrar_sucesso(self):
+        self._sucessos += 1
+        if self._sucessos >= self.janela and self.limite < self.maximo:
+            self.limite += 1
+            self._sucessos = 0
+
+    def registrar_sobrecarga(self):
+        self._sucessos = 0
+        self.limite = max(1, self.limite // 2)
+
+
+async def aiterar(iteravel):
+    """Percorre com `async for` um iterável síncrono (lista, gerador) ou assíncrono."""
+    if hasattr(iteravel, "__aiter__"):
+        async for item in iteravel:
+            yield item
+    else:
+        for item in iteravel:
+            yield item
+
+
+async def encadear(primeiros: list, restantes):
+    """Como itertools.chain(primeiros, restantes), aceitando `restantes` assíncrono."""
+    for item in primeiros:
+        yield item
+    async for item in aiterar(restantes):
+        yield item
+
+
+async def iterar_em_thread(gerador):
+    """
+    Percorre um gerador síncrono que bloqueia (disco, pool de processos) sem travar o
+    event loop: cada next() roda em asyncio.to_thread. Só um item é pedido por vez.
+    """
+    fim = object()
+    try:
+        while True:
+            item = await asyncio.to_thread(next, gerador, fim)
+            if item is fim:
+                break
+            yield item
+    finally:
+        try:
+            gerador.close()
+        except ValueError:
+            # Cancelado com um next() ainda rodando na thread: o gerador fecha ao ser coletado
+            pass
+
+
+async def iterar_em_lotes(lotes, processar, limite: LimiteAdaptativo):
+    """
+    Gerador assíncrono: executa `processar(lote)` (corrotina) para cada lote, com no
+    máximo `limite.limite` lotes em voo, e entrega (indice_do_lote, resultado) assim que
+    cada lote termina (ordem de conclusão). Os lotes são consumidos sob demanda
+    (aceita geradores, síncronos ou assíncronos). Um erro não tratado em `processar`
+    cancela o restante e sobe aqui.
+    """
+    fila = asyncio.Queue()
+    tarefas = set()
+    fim = object()
+
+    async def _rodar(indice, lote):
+        try:
+            await fila.put((indice, await processar(lote), None))
+        except Exception as e:
+            await fila.put((indice, None, e))
+        finally:
+            await limite.liberar()
+
+    async def _despachar():
+        total = 0
+        try:
+            async for lote in aiterar(lotes):
+                await limite.adquirir()
+                tarefa = asyncio.create_task(_rodar(total, lote))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+                total += 1
+        except Exception as e:
+            await fila.put((fim, None, e))
+            return
+        await fila.put((fim, total, None))
+
+    despachante = asyncio.create_task(_despachar())
+    recebidos = 0
+    total = None
+    try:
+        while total is None or recebidos < total:
+            indice, resultado, erro = await fila.get()
+            if erro is not None:
+                raise erro
+            if indice is fim:
+                total = resultado
+                continue
+            recebidos += 1
+            yield indice, resultado
+    finally:
+        despachante.cancel()
+        for tarefa in list(tarefas):
+            tarefa.cancel()
+
+
+async def executar_em_lotes(lotes, processar, limite: LimiteAdaptativo) -> list:
+    """
+    Executa `processar(lote)` (corrotina) para cada lote, com no máximo `limite.limite`
+    lotes em voo ao mesmo tempo. Os lotes são consumidos sob demanda (aceita geradores)
+    e os resultados voltam na mesma ordem da entrada.
+    """
+    resultados = {}
+    async for indice, resultado in iterar_em_lotes(lotes, processar, limite):
+        resultados[indice] = resultado
+    return [resultados[i] for i in range(len(resultados))]
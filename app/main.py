@@ -1,17 +1,43 @@
 # Importações principais do FastAPI
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, Query
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 from typing import Optional
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 
 # Importa as funções de lógica de IA do nosso arquivo nlp_utils
 from app.nlp_utils import (
-    extrair_texto,
+    extrair_texto_async,
+    iterar_mensagens_pdf_async,
     preprocessar_texto,
-    classificar_com_openai,
-    gerar_resposta_com_openai,
-    gerar_analise_geral
+    classificar_com_openai_async,
+    iterar_classificacao_e_resposta_async,
+    resumir_classificacoes,
+    gerar_resposta_com_openai_async,
+)
+from app.analise_hierarquica import gerar_analise_hierarquica_async
+from app.jobs import obter_fila
+from app.lotes import aiterar, encadear, iterar_em_thread
+from app.extrator_pdf import encerrar_pool
+from app.llm_client import fechar_cliente
+from app.cache import obter_cache, somar_contadores_cache
+from app.leitor_mbox import iterar_emails_mbox
+from app.acervo import obter_acervo, anotar_emails
+from app.metricas import MiddlewareMetricas, obter_registro, contar, medir, rastro_atual, METRICAS_RASTRO
+from app.resiliencia import DisjuntorAberto
+from app.provedores import situacao_disjuntor
+from app.triagem import obter_triagem, descartar_puladas
+from app.uploads import (
+    MiddlewareLimiteUpload,
+    RotaUpload,
+    UploadRecusado,
+    validar_upload,
+    verificar_mensagens,
+    contar_mensagens_texto,
 )
 
 # Define o caminho base do projeto (onde este arquivo main.py está)
@@ -19,62 +45,245 @@ BASE_DIR = Path(__file__).parent
 # Define o diretório dos arquivos estáticos (CSS, JS, imagens)
 STATIC_DIR = BASE_DIR / "static"
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Na inicialização, sobe os workers da fila de jobs (retomando jobs interrompidos)
+    fila = obter_fila()
+    fila.iniciar()
+    yield
+    # Na finalização do servidor, para os workers, fecha o pool de conexões HTTP usado nas
+    # chamadas à IA e encerra o pool de processos da extração de PDF
+    await fila.parar()
+    await fechar_cliente()
+    encerrar_pool()
+    acervo = obter_acervo()
+    if acervo is not None:
+        # As gravações do acervo rodam numa thread própria: espera a fila esvaziar
+        acervo.descarregar()
+        await asyncio.to_thread(acervo.aguardar_escritas)
+    cache = obter_cache()
+    if cache is not None:
+        # Idem para as gravações do cache em disco
+        await asyncio.to_thread(cache.aguardar_escritas)
+
+
 # Cria a instância principal do aplicativo FastAPI
-app = FastAPI(title="AutoU - API")
+app = FastAPI(title="AutoU - API", lifespan=lifespan)
+# Formulários das rotas lidos com o spool de UPLOAD_SPOOL_BYTES (ver app/uploads.RotaUpload)
+app.router.route_class = RotaUpload
+# Corpos acima de UPLOAD_MAX_BYTES são recusados (413) antes de o multipart ser lido
+app.add_middleware(MiddlewareLimiteUpload)
+# Tempo/contagem por rota, rastro por requisição e Server-Timing (ver app/metricas.py)
+app.add_middleware(MiddlewareMetricas)
 
 # "Monta" o diretório estático. Isso permite que o navegador
 # acesse arquivos como /static/img/logo.png
 app.mount("/static", StaticFiles(directory=str(STATIC_DIR)), name="static")
 
 
-@app.get("/", response_class=FileResponse)
-async def index():
-    # Rota principal (GET) que serve o nosso frontend
-    # Simplesmente retorna o arquivo HTML estático
-    return FileResponse(STATIC_DIR / "index.html")
+def _validar_upload(file: UploadFile) -> str:
+    # Tamanho, formato (pelos primeiros bytes, não pela extensão) e número de mensagens do mbox,
+    # antes de qualquer extração. Retorna "pdf", "mbox" ou "texto"; lança UploadRecusado.
+    with medir("validacao_upload"):
+        return validar_upload(file.file, file.filename)
 
 
-@app.post("/classify")
-async def classify(text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None)):
+def _recusado(e: UploadRecusado) -> JSONResponse:
+    return JSONResponse(status_code=e.status, content={"erro": e.mensagem})
+
+
+def _registrar_upload(file: Optional[UploadFile]):
+    # Bytes recebidos (/metrics)
+    if file is not None:
+        contar("autou_bytes_entrada_total", file.size or 0)
+
+
+def _completar_meta(meta: dict) -> dict:
+    # Estado do disjuntor da IA (fechado/aberto/meio_aberto): com ele aberto, as classificações
+    # vêm da heurística e as respostas são as padrão. Com METRICAS_RASTRO=1, inclui também
+    # o tempo gasto em cada etapa desta requisição.
+    meta["disjuntor"] = situacao_disjuntor()
+    if METRICAS_RASTRO:
+        meta["rastro"] = rastro_atual()
+    return meta
+
+
+def _mensagens_do_mbox(file: UploadFile):
+    # Gera o texto pré-processado de cada mensagem, lendo o mbox do arquivo spooled do upload
+    # (os cabeçalhos — remetente, data, Message-ID — vão para o acervo). A triagem por
+    # cabeçalhos decide as mensagens em massa/automáticas antes de decodificar o corpo.
+    file.file.seek(0)
+    return anotar_emails(iterar_emails_mbox(file.file, obter_triagem()), preprocessar_texto)
+
+
+async def _ler_entrada_classificacao(text: Optional[str], file: Optional[UploadFile]):
     """
-    Endpoint para a aba "Classificar & Responder".
-    Recebe 'text' (Form) ou 'file' (Upload). Retorna:
-      { "classificacao": {"label":..., "score":...}, "resposta": "...", "meta": {...} }
+    Lê a entrada de /classify e /classify/stream.
+    Retorna (primeiras, mensagens, erro):
+      - `primeiras`: lista com até 2 mensagens já lidas (1 item = rota de e-mail único);
+      - `mensagens`: iterador (síncrono ou assíncrono) com o restante (mbox e PDF: lidos
+        sob demanda do arquivo spooled);
+      - `erro`: JSONResponse 400 quando não há conteúdo válido (413/415 quando o upload é recusado).
     """
     texto_original = ""
+    mensagens = None
+    _registrar_upload(file)
 
     # Prioriza o processamento do arquivo (file) se ele for enviado
     if file:
         try:
-            # Lê o arquivo como bytes e passa para a função de extração
-            content = await file.read()
-            texto_original = extrair_texto(content, file.filename) or ""
+            formato = await asyncio.to_thread(_validar_upload, file)
+        except UploadRecusado as e:
+            return [], None, _recusado(e)
+        try:
+            if formato == "mbox":
+                # mbox: as mensagens são lidas uma a uma direto do arquivo (sem carregar tudo),
+                # fora do event loop
+                mensagens = iterar_em_thread(_mensagens_do_mbox(file))
+            elif formato == "pdf":
+                # PDF: páginas extraídas fora do event loop; as mensagens saem conforme são lidas
+                mensagens = iterar_mensagens_pdf_async(file.file)
+            else:
+                # Extrai o texto do arquivo spooled
+                texto_original = await extrair_texto_async(file.file, file.filename, formato) or ""
         except Exception as e:
             # Se falhar ao ler o arquivo, retorna um erro claro
-            return JSONResponse(status_code=400, content={"erro": f"Erro ao extrair texto: {str(e)}"})
+            return [], None, JSONResponse(status_code=400, content={"erro": f"Erro ao extrair texto: {str(e)}"})
     else:
         # Se não houver arquivo, usa o texto vindo do formulário
         texto_original = text or ""
 
+    if mensagens is None:
+        # Limpa o texto e separa os e-mails (separador definido no extrair_emails_de_mbox)
+        texto_limpo = preprocessar_texto(texto_original)
+        try:
+            verificar_mensagens(contar_mensagens_texto(texto_limpo))
+        except UploadRecusado as e:
+            return [], None, _recusado(e)
+        mensagens = (p.strip() for p in texto_limpo.split("\n\n---\n\n") if p.strip())
+
+    mensagens = aiterar(mensagens)
+    primeiras = []
+    try:
+        async for mensagem in mensagens:
+            primeiras.append(mensagem)
+            if len(primeiras) == 2:
+                break
+    except UploadRecusado as e:
+        return [], None, _recusado(e)
+    except Exception as e:
+        return [], None, JSONResponse(status_code=400, content={"erro": f"Erro ao extrair texto: {str(e)}"})
+
     # Validação: Garante que temos algum texto para analisar
-    if not texto_original.strip():
+    if not primeiras:
+        return [], None, JSONResponse(status_code=400, content={"erro": "Nenhum conteúdo enviado para análise."})
+
+    return primeiras, mensagens, None
+
+
+def _juntar_respostas(respostas: list) -> str:
+    # Texto único com as respostas numeradas (exibição e botão "Copiar" do frontend)
+    return "\n\n---\n\n".join(f"[{i + 1}] {r}" for i, r in enumerate(respostas) if r)
+
+
+@app.get("/", response_class=FileResponse)
+async def index():
+    # Rota principal (GET) que serve o nosso frontend
+    # Simplesmente retorna o arquivo HTML estático
+    return FileResponse(STATIC_DIR / "index.html")
+
+
+async def _criar_job(tipo: str, text: Optional[str], file: Optional[UploadFile]):
+    # Grava a entrada e enfileira o job; a resposta sai na hora com o id para polling em /jobs/{id}
+    if file:
+        _registrar_upload(file)
+        try:
+            await asyncio.to_thread(_validar_upload, file)
+        except UploadRecusado as e:
+            return _recusado(e)
+        job_id = await asyncio.to_thread(obter_fila().criar, tipo, file.file, file.filename)
+    elif text and text.strip():
+        try:
+            verificar_mensagens(contar_mensagens_texto(text))
+        except UploadRecusado as e:
+            return _recusado(e)
+        job_id = await asyncio.to_thread(obter_fila().criar, tipo, text)
+    else:
         return JSONResponse(status_code=400, content={"erro": "Nenhum conteúdo enviado para análise."})
+    return JSONResponse(status_code=202, content={"job_id": job_id, "status": "pendente", "url": f"/jobs/{job_id}"})
 
-    # Limpa o texto antes de enviar para a IA
-    texto_limpo = preprocessar_texto(texto_original)
+
+@app.post("/classify")
+async def classify(text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None),
+                   assincrono: bool = Form(False)):
+    """
+    Endpoint para a aba "Classificar & Responder".
+    Recebe 'text' (Form) ou 'file' (Upload). Retorna:
+      { "classificacao": {"label":..., "score":...}, "resposta": "...", "meta": {...} }
+    Com vários e-mails, também retorna listas alinhadas por mensagem:
+      "classificacoes": [{"label":..., "score":...}, ...], "respostas": ["..." | null, ...]
+    e "classificacao" passa a ser o resumo (label mais frequente + contagem).
+    Com assincrono=true, responde 202 com o id de um job (acompanhar em /jobs/{id}).
+    """
+    if assincrono:
+        return await _criar_job("classify", text, file)
+
+    primeiras, mensagens, erro = await _ler_entrada_classificacao(text, file)
+    if erro is not None:
+        return erro
+
+    # --- Vários e-mails: classificação em lote + uma resposta por mensagem ---
+    if len(primeiras) > 1:
+        classificacoes = {}
+        respostas = {}
+        meta_pipeline = {}
+        try:
+            async for evento in iterar_classificacao_e_resposta_async(encadear(primeiras, mensagens), meta=meta_pipeline):
+                if evento[0] == "classificacao":
+                    classificacoes[evento[1]] = evento[2]
+                else:
+                    respostas[evento[1]] = evento[2]
+        except UploadRecusado as e:
+            # PDF: o número de mensagens só é conhecido durante a extração
+            return _recusado(e)
+        except Exception as e:
+            return JSONResponse(status_code=500, content={"erro": "Falha na classificação.", "detalhe": str(e)})
+
+        lista_clf = [classificacoes[i] for i in range(len(classificacoes))]
+        lista_resp = [respostas.get(i) for i in range(len(classificacoes))]
+        meta_clf = meta_pipeline.get("classificacao", {})
+        meta_resp = meta_pipeline.get("respostas", {})
+        return {
+            "classificacao": resumir_classificacoes(lista_clf),
+            "classificacoes": lista_clf,
+            "resposta": _juntar_respostas(lista_resp),
+            "respostas": lista_resp,
+            "meta": _completar_meta({
+                "origem": meta_clf.get("source", "openai"),
+                "classificacao_raw": meta_clf,
+                "resposta_raw": meta_resp,
+                "cache": somar_contadores_cache(meta_clf, meta_resp)
+            })
+        }
+
+    # --- E-mail único ---
+    texto_limpo = primeiras[0]
 
     # --- 1ª Chamada de IA: Classificar ---
     try:
-        # Tenta classificar o texto (pode ser um ou vários e-mails)
-        label, score, meta_clf = classificar_com_openai(texto_limpo)
+        label, score, meta_clf = await classificar_com_openai_async(texto_limpo)
     except Exception as e:
         # Retorna um erro 500 se a IA falhar
         return JSONResponse(status_code=500, content={"erro": "Falha na classificação.", "detalhe": str(e)})
 
     # --- 2ª Chamada de IA: Gerar Resposta ---
     try:
-        # Usa o 'label' da etapa anterior para gerar uma resposta contextual
-        resposta, meta_resp = gerar_resposta_com_openai(texto_limpo, label)
+        if meta_clf.get("source") == "triagem":
+            # Decidida pelos cabeçalhos: o corpo nem foi decodificado, não há o que responder
+            resposta, meta_resp = "", {"source": "ignorada"}
+        else:
+            # Usa o 'label' da etapa anterior para gerar uma resposta contextual
+            resposta, meta_resp = await gerar_resposta_com_openai_async(texto_limpo, label)
     except Exception as e:
         # Se a geração falhar, o nlp_utils já tem um fallback,
         # mas garantimos que não quebre aqui.
@@ -85,42 +294,205 @@ async def classify(text: Optional[str] = Form(None), file: Optional[UploadFile]
     meta_combined = {
         "origem": meta_clf.get("source", "openai"),
         "classificacao_raw": meta_clf,
-        "resposta_raw": meta_resp
+        "resposta_raw": meta_resp,
+        "cache": somar_contadores_cache(meta_clf, meta_resp)
     }
 
     # Retorna a resposta final para o frontend
     return {
         "classificacao": {"label": label, "score": score},
         "resposta": resposta,
-        "meta": meta_combined
+        "meta": _completar_meta(meta_combined)
     }
 
 
+@app.post("/classify/stream")
+async def classify_stream(text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None)):
+    """
+    Versão em streaming do /classify (NDJSON, um objeto JSON por linha).
+    Cada mensagem é emitida assim que o lote dela termina, e a resposta dela
+    assim que é gerada (null para mensagens improdutivas):
+      {"tipo": "classificacao", "indice": 0, "label": "...", "score": 0.9}
+      {"tipo": "resposta", "indice": 0, "resposta": "..."}
+    Por fim: {"tipo": "fim", "total": N, "meta": {...}}  (ou {"tipo": "erro", ...} em caso de falha).
+    """
+    primeiras, mensagens, erro = await _ler_entrada_classificacao(text, file)
+    if erro is not None:
+        return erro
+
+    async def _eventos():
+        if len(primeiras) == 1:
+            # E-mail único: mesma rota (prompt de JSON único) do /classify
+            try:
+                label, score, meta_clf = await classificar_com_openai_async(primeiras[0])
+            except Exception as e:
+                yield _linha_ndjson({"tipo": "erro", "erro": "Falha na classificação.", "detalhe": str(e)})
+                return
+            yield _linha_ndjson({"tipo": "classificacao", "indice": 0, "label": label, "score": score})
+            try:
+                if meta_clf.get("source") == "triagem":
+                    resposta, meta_resp = "", {"source": "ignorada"}
+                else:
+                    resposta, meta_resp = await gerar_resposta_com_openai_async(primeiras[0], label)
+            except Exception as e:
+                resposta, meta_resp = "", {"error": str(e)}
+            yield _linha_ndjson({"tipo": "resposta", "indice": 0, "resposta": resposta})
+            total = 1
+        else:
+            meta_pipeline = {}
+            total = 0
+            try:
+                async for evento in iterar_classificacao_e_resposta_async(encadear(primeiras, mensagens), meta=meta_pipeline):
+                    if evento[0] == "classificacao":
+                        total += 1
+                        yield _linha_ndjson({"tipo": "classificacao", "indice": evento[1], **evento[2]})
+                    else:
+                        yield _linha_ndjson({"tipo": "resposta", "indice": evento[1], "resposta": evento[2]})
+            except UploadRecusado as e:
+                yield _linha_ndjson({"tipo": "erro", "erro": e.mensagem})
+                return
+            except Exception as e:
+                yield _linha_ndjson({"tipo": "erro", "erro": "Falha na classificação.", "detalhe": str(e)})
+                return
+            meta_clf = meta_pipeline.get("classificacao", {})
+            meta_resp = meta_pipeline.get("respostas", {})
+
+        meta_combined = {
+            "origem": meta_clf.get("source", "openai"),
+            "classificacao_raw": meta_clf,
+            "resposta_raw": meta_resp,
+            "cache": somar_contadores_cache(meta_clf, meta_resp)
+        }
+        yield _linha_ndjson({"tipo": "fim", "total": total, "meta": _completar_meta(meta_combined)})
+
+    # X-Accel-Buffering desliga o buffer de proxies (nginx) para as linhas chegarem na hora
+    return StreamingResponse(
+        _eventos(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _linha_ndjson(obj: dict) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
 @app.post("/analise")
-async def analise(text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None)):
+async def analise(text: Optional[str] = Form(None), file: Optional[UploadFile] = File(None),
+                  assincrono: bool = Form(False)):
     # Endpoint para a aba "Análise & Insights"
+    if assincrono:
+        return await _criar_job("analise", text, file)
+
     texto_original = ""
+    mensagens = None
+    triagem = None
 
     # Lógica de extração de texto (idêntica ao /classify)
+    _registrar_upload(file)
     if file:
         try:
-            content = await file.read()
-            texto_original = extrair_texto(content, file.filename) or ""
+            formato = await asyncio.to_thread(_validar_upload, file)
+        except UploadRecusado as e:
+            return _recusado(e)
+        try:
+            if formato == "mbox":
+                # mbox: as mensagens são lidas uma a uma direto do arquivo spooled; as que a
+                # triagem por cabeçalhos manda pular (massa/automáticas) ficam fora da análise
+                file.file.seek(0)
+                triagem = {}
+                mensagens = descartar_puladas(anotar_emails(iterar_emails_mbox(file.file, obter_triagem())), triagem)
+            else:
+                texto_original = await extrair_texto_async(file.file, file.filename, formato) or ""
         except Exception as e:
             return JSONResponse(status_code=400, content={"erro": f"Erro ao extrair texto: {str(e)}"})
     else:
         texto_original = text or ""
 
-    # Validação
-    if not texto_original.strip():
-        return JSONResponse(status_code=400, content={"erro": "Nenhum conteúdo enviado para análise."})
+    if mensagens is None:
+        # Validação
+        if not texto_original.strip():
+            return JSONResponse(status_code=400, content={"erro": "Nenhum conteúdo enviado para análise."})
+        try:
+            verificar_mensagens(contar_mensagens_texto(texto_original))
+        except UploadRecusado as e:
+            return _recusado(e)
+        mensagens = [p for p in texto_original.split("\n\n---\n\n") if p.strip()]
 
     # --- Chamada de IA: Gerar Análise ---
     try:
-        # Chama a função que pede à IA um JSON estruturado (resumo, temas, ações)
-        analise, meta = gerar_analise_geral(texto_original)
+        # Caixas grandes são analisadas em blocos (map) e combinadas (reduce);
+        # se tudo couber em uma chamada, o fluxo é o mesmo de antes.
+        analise, meta = await gerar_analise_hierarquica_async(mensagens)
     except Exception as e:
+        disjuntor = situacao_disjuntor()
+        if isinstance(e, DisjuntorAberto) or disjuntor["estado"] == "aberto":
+            # A análise não tem substituto local: avisa na hora quando tentar de novo
+            return JSONResponse(
+                status_code=503,
+                content={"erro": "IA indisponível no momento. Tente novamente em instantes.", "detalhe": str(e),
+                         "disjuntor": disjuntor},
+                headers={"Retry-After": str(int(disjuntor.get("tentar_em_s", 0)) + 1)},
+            )
         return JSONResponse(status_code=500, content={"erro": "Falha ao gerar análise.", "detalhe": str(e)})
 
+    if meta.get("source") == "none":
+        return JSONResponse(status_code=400, content={"erro": "Nenhum conteúdo enviado para análise."})
+    if triagem and triagem.get("puladas"):
+        meta["triagem"] = triagem
+
     # Retorna o JSON de análise direto para o frontend
-    return {"analise": analise, "meta": meta}
\ No newline at end of file
+    return {"analise": analise, "meta": _completar_meta(meta)}
+
+
+@app.get("/mensagens")
+async def consultar_mensagens(label: Optional[str] = None, remetente: Optional[str] = None,
+                              desde: Optional[datetime] = None, ate: Optional[datetime] = None,
+                              q: Optional[str] = None, limite: int = Query(50, ge=1, le=500),
+                              offset: int = Query(0, ge=0)):
+    """
+    Busca no acervo das mensagens já processadas, sem chamar a IA: por label,
+    remetente (trecho), intervalo de datas (ISO 8601) e texto livre (`q`).
+    """
+    acervo = obter_acervo()
+    if acervo is None:
+        return JSONResponse(status_code=404, content={"erro": "Acervo desativado (ACERVO_DB_PATH vazio)."})
+    return await asyncio.to_thread(
+        acervo.consultar, label, remetente, _epoch(desde), _epoch(ate), q, limite, offset
+    )
+
+
+@app.get("/mensagens/resumo")
+async def resumo_mensagens():
+    # Totais do acervo por label (sem chamar a IA)
+    acervo = obter_acervo()
+    if acervo is None:
+        return JSONResponse(status_code=404, content={"erro": "Acervo desativado (ACERVO_DB_PATH vazio)."})
+    return await asyncio.to_thread(acervo.resumo)
+
+
+def _epoch(data: Optional[datetime]):
+    # Datas sem fuso são tratadas como UTC
+    if data is None:
+        return None
+    if data.tzinfo is None:
+        data = data.replace(tzinfo=timezone.utc)
+    return data.timestamp()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metricas():
+    # Contadores e histogramas do processo no formato texto do Prometheus
+    return PlainTextResponse(obter_registro().exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/jobs/{job_id}")
+async def consultar_job(job_id: str, desde: int = Query(0, ge=0)):
+    """
+    Estado de um job criado com assincrono=true: status (pendente|executando|concluido|erro),
+    progresso, resultados parciais dos lotes a partir de `desde` e o resultado final.
+    """
+    estado = await asyncio.to_thread(obter_fila().obter, job_id, desde)
+    if estado is None:
+        return JSONResponse(status_code=404, content={"erro": "Job não encontrado."})
+    return estado
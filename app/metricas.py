@@ -0,0 +1,239 @@
+import os
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Métricas do processo (contadores e histogramas) expostas em /metrics no formato do Prometheus
+METRICAS_ATIVO = os.getenv("METRICAS_ATIVO", "1") == "1"
+# Cabeçalho Server-Timing com o tempo de cada etapa da requisição
+METRICAS_SERVER_TIMING = os.getenv("METRICAS_SERVER_TIMING", "0") == "1"
+# Rastro por requisição (tempo e chamadas por etapa) em meta["rastro"], para depuração
+METRICAS_RASTRO = os.getenv("METRICAS_RASTRO", "0") == "1"
+
+# Limites (em segundos) das faixas dos histogramas de tempo
+_FAIXAS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Descrição e tipo de cada métrica (as que não estão aqui saem como "untyped")
+_DESCRICOES = {
+    "autou_requisicoes_total": ("counter", "Requisições HTTP por rota e status."),
+    "autou_requisicao_segundos": ("histogram", "Tempo até o fim da resposta HTTP, por rota."),
+    "autou_etapa_segundos": ("histogram", "Tempo de cada etapa do processamento."),
+    "autou_bytes_entrada_total": ("counter", "Bytes recebidos em uploads."),
+    "autou_mensagens_total": ("counter", "Mensagens classificadas, pela origem do resultado."),
+    "autou_respostas_total": ("counter", "Respostas emitidas, pela origem."),
+    "autou_lotes_total": ("counter", "Lotes de classificação enviados à IA, por status final."),
+    "autou_llm_chamadas_total": ("counter", "Chamadas à IA por etapa, provedor e resultado (ok ou status/erro)."),
+    "autou_llm_retentativas_total": ("counter", "Chamadas de lote repetidas por sobrecarga (429/5xx/timeout)."),
+    "autou_llm_tokens_total": ("counter", "Tokens informados no usage das respostas da IA."),
+    "autou_llm_limite_espera_segundos_total": ("counter", "Tempo esperando o limite de taxa compartilhado (RPM/TPM)."),
+    "autou_llm_pausas_total": ("counter", "Pausas de todos os processos após um 429 da IA."),
+    "autou_llm_hedges_total": ("counter", "Chamadas lentas duplicadas (hedge), pela cópia que respondeu primeiro."),
+    "autou_llm_disjuntor_estado": ("gauge", "Estado atual do disjuntor de cada provedor de IA (1 no estado em que está)."),
+    "autou_llm_disjuntor_transicoes_total": ("counter", "Mudanças de estado do disjuntor de cada provedor de IA."),
+    "autou_llm_custo_usd_total": ("counter", "Custo estimado das chamadas à IA (US$) por provedor, pelo usage e pelos preços configurados."),
+    "autou_llm_desvios_total": ("counter", "Chamadas que falharam no provedor escolhido e foram para o próximo da rota."),
+    "autou_cache_consultas_total": ("counter", "Consultas ao cache de resultados (hit/miss)."),
+}
+
+# Rastro da requisição atual: etapa -> [segundos, chamadas]
+_rastro = contextvars.ContextVar("rastro", default=None)
+# Etapa em andamento (rotula as chamadas à IA feitas dentro dela)
+_etapa = contextvars.ContextVar("etapa", default="outra")
+
+
+def _chave_labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _formatar_labels(labels: tuple, extra: tuple = ()) -> str:
+    pares = labels + extra
+    if not pares:
+        return ""
+    texto = ",".join(
+        '%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pares
+    )
+    return "{" + texto + "}"
+
+
+def _numero(valor: float) -> str:
+    return str(int(valor)) if float(valor).is_integer() else repr(float(valor))
+
+
+class RegistroMetricas:
+    """
+    Registro em memória de contadores e histogramas com labels (por processo).
+    Coletores (funções chamadas na hora da exportação) cobrem valores que já são
+    contados em outro lugar, como hits/misses do cache.
+    """
+
+    def __init__(self, faixas: tuple = _FAIXAS):
+        self.faixas = faixas
+        self._lock = threading.Lock()
+        self._contadores = {}
+        self._histogramas = {}
+        self._coletores = []
+
+    def contar(self, nome: str, valor: float = 1, **labels):
+        if not METRICAS_ATIVO:
+            return
+        chave = (nome, _chave_labels(labels))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def observar(self, nome: str, valor: float, **labels):
+        if not METRICAS_ATIVO:
+            return
+        chave = (nome, _chave_labels(labels))
+        posicao = bisect.bisect_left(self.faixas, valor)
+        with self._lock:
+            hist = self._histogramas.get(chave)
+            if hist is None:
+                # [contagem por faixa (+Inf no fim), soma, total]
+                hist = self._histogramas[chave] = [[0] * (len(self.faixas) + 1), 0.0, 0]
+            hist[0][posicao] += 1
+            hist[1] += valor
+            hist[2] += 1
+
+    def registrar_coletor(self, coletor):
+        """`coletor()` devolve [(nome, {labels}, valor), ...] de contadores mantidos fora do registro."""
+        self._coletores.append(coletor)
+
+    def exportar(self) -> str:
+        """Todas as métricas no formato texto do Prometheus (versão 0.0.4)."""
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {k: (list(v[0]), v[1], v[2]) for k, v in self._histogramas.items()}
+        for coletor in self._coletores:
+            for nome, labels, valor in coletor():
+                chave = (nome, _chave_labels(labels))
+                contadores[chave] = contadores.get(chave, 0) + valor
+
+        por_nome = {}
+        for (nome, labels), valor in contadores.items():
+            por_nome.setdefault(nome, []).append((labels, valor))
+        for (nome, labels), hist in histogramas.items():
+            por_nome.setdefault(nome, []).append((labels, hist))
+
+        linhas = []
+        for nome in sorted(por_nome):
+            tipo, descricao = _DESCRICOES.get(nome, ("untyped", ""))
+            if descricao:
+                linhas.append(f"# HELP {nome} {descricao}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for labels, valor in sorted(por_nome[nome], key=lambda item: item[0]):
+                if isinstance(valor, tuple):
+                    contagens, soma, total = valor
+                    acumulado = 0
+                    for limite, n in zip(self.faixas + ("+Inf",), contagens):
+                        acumulado += n
+                        le = limite if isinstance(limite, str) else _numero(limite)
+                        linhas.append(f"{nome}_bucket{_formatar_labels(labels, (('le', le),))} {acumulado}")
+                    linhas.append(f"{nome}_sum{_formatar_labels(labels)} {_numero(soma)}")
+                    linhas.append(f"{nome}_count{_formatar_labels(labels)} {total}")
+                else:
+                    linhas.append(f"{nome}{_formatar_labels(labels)} {_numero(valor)}")
+        return "\n".join(linhas) + "\n"
+
+
+_registro = RegistroMetricas()
+
+
+def obter_registro() -> RegistroMetricas:
+    return _registro
+
+
+def contar(nome: str, valor: float = 1, **labels):
+    _registro.contar(nome, valor, **labels)
+
+
+def observar(nome: str, valor: float, **labels):
+    _registro.observar(nome, valor, **labels)
+
+
+def etapa_atual() -> str:
+    return _etapa.get()
+
+
+@contextmanager
+def medir(etapa: str):
+    """
+    Mede o tempo de uma etapa (histograma autou_etapa_segundos e rastro da requisição).
+    Funciona também em código assíncrono: o tempo inclui as esperas dentro do bloco.
+    """
+    marca = _etapa.set(etapa)
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        _etapa.reset(marca)
+        observar("autou_etapa_segundos", duracao, etapa=etapa)
+        rastro = _rastro.get()
+        if rastro is not None:
+            acumulado = rastro.setdefault(etapa, [0.0, 0])
+            acumulado[0] += duracao
+            acumulado[1] += 1
+
+
+def registrar_uso_llm(usage):
+    """Soma os tokens do `usage` de uma resposta da IA."""
+    if not isinstance(usage, dict):
+        return
+    for tipo in ("prompt", "completion"):
+        valor = usage.get(f"{tipo}_tokens")
+        if isinstance(valor, (int, float)):
+            contar("autou_llm_tokens_total", valor, tipo=tipo)
+
+
+def rastro_atual():
+    """Rastro da requisição atual: {etapa: {"ms", "chamadas"}} (None fora de uma requisição)."""
+    rastro = _rastro.get()
+    if rastro is None:
+        return None
+    return {etapa: {"ms": round(s * 1000, 1), "chamadas": n} for etapa, (s, n) in rastro.items()}
+
+
+def _server_timing(rastro: dict, total: float) -> str:
+    itens = [f"{etapa};dur={s * 1000:.1f}" for etapa, (s, _) in rastro.items()]
+    itens.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(itens)
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI: abre o rastro de cada requisição, conta requisições por rota/status,
+    mede o tempo até o fim da resposta e (se METRICAS_SERVER_TIMING) envia o cabeçalho
+    Server-Timing. Em respostas em streaming, o Server-Timing só cobre o que aconteceu
+    antes do primeiro byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        marca = _rastro.set({})
+        inicio = time.perf_counter()
+        status = {"codigo": 500}
+
+        async def _enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                status["codigo"] = mensagem["status"]
+                if METRICAS_SERVER_TIMING:
+                    cabecalho = _server_timing(_rastro.get() or {}, time.perf_counter() - inicio)
+                    mensagem = dict(mensagem, headers=list(mensagem.get("headers", [])) + [
+                        (b"server-timing", cabecalho.encode("latin-1"))
+                    ])
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, _enviar)
+        finally:
+            _rastro.reset(marca)
+            rota = getattr(scope.get("route"), "path", None) or "desconhecida"
+            contar("autou_requisicoes_total", rota=rota, status=status["codigo"])
+            observar("autou_requisicao_segundos", time.perf_counter() - inicio, rota=rota)
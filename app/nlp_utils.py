@@ -1,201 +1,339 @@
 import os
-import io
-import re
 import json
-import requests
-from PyPDF2 import PdfReader
+import time
+import asyncio
+import itertools
+import collections
+import httpx
 from dotenv import load_dotenv
-import email
+
+from app.llm_client import executar_sincrono
+from app.leitor_mbox import iterar_emails_mbox
+from app.lotes import LimiteAdaptativo, iterar_em_lotes, iterar_em_thread, aiterar
+from app.cache import obter_cache, chave_cache
+from app.heuristica import obter_motor
+from app.extrator_pdf import extrair_texto_pdf, iterar_texto_pdf
+from app.normalizador import normalizar_texto, iterar_normalizado
+from app.classificador_local import obter_classificador_local, registrar_rotulos_llm, CLASSIFICADOR_LOCAL_LOTE
+from app.planejador_lotes import PlanejadorLotes, reduzir_mensagem, max_tokens_saida
+from app.duplicatas import IndiceDuplicatas, DUPLICATAS_ATIVO, adaptar_resposta
+from app.acervo import obter_acervo, hash_normalizado
+from app.metricas import medir, contar, etapa_atual, registrar_uso_llm
+from app.uploads import detectar_formato, mapear, limitar_mensagens
+from app.resiliencia import DisjuntorAberto
+from app.provedores import obter_roteador
+from app.tokens import estimar_tokens
+from app.triagem import PULAR, obter_triagem, triagem_de
+from app import contratos
+from app.contratos import (
+    ContratoInvalido,
+    FORMATO_CLASSIFICACAO,
+    FORMATO_LOTE_CLASSIFICACAO,
+    FORMATO_ANALISE,
+    interpretar_classificacao,
+    interpretar_lote,
+    interpretar_analise,
+)
 
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Lotes de classificação enviados em paralelo por requisição (limite inicial/máximo)
+LOTES_EM_VOO = int(os.getenv("LOTES_EM_VOO", "4"))
+# Chamadas extras por lote para reparar respostas fora do contrato (bissecção)
+LOTE_MAX_REPAROS = int(os.getenv("LOTE_MAX_REPAROS", "8"))
+
+# Versões dos prompts: fazem parte da chave do cache, então devem ser
+# incrementadas sempre que o texto de um prompt mudar.
+PROMPT_VERSAO_CLASSIFICACAO = "clf-v3"
+PROMPT_VERSAO_RESPOSTA = "resp-v2"
+PROMPT_VERSAO_ANALISE = "anal-v2"
 
-OPENAI_URL = "https://api.openai.com/v1/chat/completions"
-# Usando o gpt-4o-mini, que é mais rápido e barato para esta tarefa.
-OPENAI_MODEL = "gpt-4o-mini"
+# Respostas por mensagem geradas em paralelo por requisição
+RESPOSTAS_EM_VOO = int(os.getenv("RESPOSTAS_EM_VOO", "8"))
+# Teto de tokens da resposta de uma mensagem (2 a 6 frases cabem com folga)
+RESPOSTA_MAX_TOKENS = int(os.getenv("RESPOSTA_MAX_TOKENS", "300"))
+# Respostas de grupos de quase duplicatas guardadas para reaproveitar nas demais mensagens do grupo
+RESPOSTAS_GRUPOS_MAX = int(os.getenv("RESPOSTAS_GRUPOS_MAX", "10000"))
+# Labels que não recebem resposta automática
+LABELS_SEM_RESPOSTA = ("improdutivo",)
+# Respostas padrão (por label) usadas quando a IA não responde ou está fora (disjuntor aberto)
+RESPOSTA_PADRAO = "Obrigado pelo envio. Recebi seu e-mail e vou analisar os pontos e retornar em breve."
+RESPOSTAS_PADRAO = {
+    "produtivo": "Obrigado pelo contato. Recebemos sua solicitação e nossa equipe vai analisá-la e "
+                 "retornar com uma posição o quanto antes.",
+    "neutro": "Obrigado pela mensagem. Ficamos à disposição caso precise de algo.",
+}
 
 
-def extrair_texto(file_bytes: bytes, filename: str) -> str:
+def extrair_texto(file_bytes: bytes, filename: str, formato: str = None) -> str:
     """
     Extrai texto de .txt, .pdf, .mbox (fallback: tenta leitura como texto).
+    `file_bytes` pode ser bytes ou qualquer buffer (memoryview, mmap: ver app/uploads.mapear).
+    `formato` ("pdf", "mbox" ou "texto", ver app/uploads.detectar_formato) tem precedência
+    sobre a extensão do nome do arquivo.
     Retorna string limpa.
     """
     if not file_bytes:
         return ""
-    name = filename.lower()
-    
-    if name.endswith(".txt"):
+    if formato is None:
+        name = (filename or "").lower()
+        formato = "pdf" if name.endswith(".pdf") else "mbox" if name.endswith(".mbox") else "texto"
+
+    if formato == "pdf":
         try:
-            return file_bytes.decode("utf-8", errors="ignore")
+            # Páginas extraídas em paralelo (pool de processos) e com cache por hash do arquivo
+            return extrair_texto_pdf(file_bytes)
         except Exception:
-            return file_bytes.decode("latin-1", errors="ignore")
-    
-    elif name.endswith(".pdf"):
-        try:
-            reader = PdfReader(io.BytesIO(file_bytes))
-            textos = []
-            for p in reader.pages:
-                try:
-                    textos.append(p.extract_text() or "")
-                except Exception:
-                    textos.append("")
-            return "\n".join(textos).strip()
-        except Exception as e:
             # Fallback: se a leitura do PDF falhar, tenta ler como texto
-            try:
-                return file_bytes.decode("utf-8", errors="ignore")
-            except Exception:
-                return ""
-    
-    elif name.endswith(".mbox"):
+            return _decodificar(file_bytes)
+
+    elif formato == "mbox":
         # Tenta a extração estruturada de e-mails do mbox
         try:
             return extrair_emails_de_mbox(file_bytes)
         except Exception:
             # Se falhar, trata como um arquivo de texto normal
-            try:
-                return file_bytes.decode("utf-8", errors="ignore")
-            except Exception:
-                return ""
-    else:
-        # Padrão para outros tipos de arquivo: tenta decodificar como texto
+            return _decodificar(file_bytes)
+
+    # Texto (e padrão para outros tipos de arquivo): decodifica direto do buffer, sem cópia em bytes
+    return _decodificar(file_bytes)
+
+
+def _decodificar(conteudo) -> str:
+    try:
+        return str(conteudo, "utf-8", errors="ignore")
+    except Exception:
+        return ""
+
+
+async def extrair_texto_async(arquivo, filename: str, formato: str = None) -> str:
+    """
+    Versão assíncrona de extrair_texto, para uso nos endpoints.
+    Aceita bytes, um arquivo binário (ex: UploadFile.file) ou um Path; o conteúdo é lido
+    por mmap (sem copiar o arquivo inteiro para a memória do processo).
+    Sem `formato`, ele é detectado pelos primeiros bytes (app/uploads.detectar_formato).
+    PDFs são extraídos no pool de processos sem bloquear o event loop; para classificar
+    um PDF conforme as páginas saem, use iterar_mensagens_pdf_async.
+    """
+    formato = formato or detectar_formato(arquivo, filename)
+    with medir("extracao"):
+        return await asyncio.to_thread(_extrair_mapeado, arquivo, filename, formato)
+
+
+def _extrair_mapeado(arquivo, filename: str, formato: str) -> str:
+    if formato == "pdf":
+        # O extrator do PDF lê o arquivo (ou o Path) direto, sem mmap
         try:
-            return file_bytes.decode("utf-8", errors="ignore")
+            return extrair_texto_pdf(arquivo)
         except Exception:
-            return ""
+            # Fallback: se a leitura do PDF falhar, tenta ler como texto
+            formato = "texto"
+    with mapear(arquivo) as conteudo:
+        return extrair_texto(conteudo, filename, formato)
+
 
+def dividir_mensagens(pedacos):
+    """
+    Separa em e-mails (separador do extrair_emails_de_mbox) um texto que chega em pedaços.
+    Mesmo resultado de `[p.strip() for p in texto.split("\\n\\n---\\n\\n") if p.strip()]`
+    sobre o texto inteiro, mas só a mensagem em andamento fica em memória.
+    """
+    separador = "\n\n---\n\n"
+    resto = ""
+    for pedaco in pedacos:
+        # O separador pode ter começado no fim do pedaço anterior
+        busca = max(0, len(resto) - len(separador) + 1)
+        resto += pedaco
+        inicio = 0
+        while True:
+            fim = resto.find(separador, max(inicio, busca))
+            if fim < 0:
+                break
+            parte = resto[inicio:fim].strip()
+            if parte:
+                yield parte
+            inicio = fim + len(separador)
+        resto = resto[inicio:]
+    parte = resto.strip()
+    if parte:
+        yield parte
+
+
+def iterar_mensagens_pdf(arquivo):
+    """
+    E-mails de um PDF (já pré-processados), gerados conforme as páginas são extraídas:
+    páginas -> normalização em fluxo (app/normalizador.iterar_normalizado) -> separação.
+    O resultado é o mesmo de preprocessar_texto(extrair_texto(...)) seguido do split, mas o
+    texto inteiro nunca fica em memória. PDF ilegível cai para a leitura como texto.
+    Lança UploadRecusado ao passar de UPLOAD_MAX_MENSAGENS.
+    """
+    paginas = iterar_texto_pdf(arquivo)
+    try:
+        # O PyPDF2 só falha ao abrir o arquivo, antes da primeira página
+        primeira = next(paginas, "")
+    except Exception:
+        with mapear(arquivo) as conteudo:
+            pedacos = [_decodificar(conteudo)]
+    else:
+        pedacos = itertools.chain([primeira], paginas)
+    yield from limitar_mensagens(dividir_mensagens(iterar_normalizado(pedacos)))
+
+
+def iterar_mensagens_pdf_async(arquivo):
+    """Versão assíncrona de iterar_mensagens_pdf: extração, normalização e separação fora do event loop."""
+    return iterar_em_thread(iterar_mensagens_pdf(arquivo))
 
-def extrair_emails_de_mbox(file_bytes: bytes) -> str:
+
+def extrair_emails_de_mbox(file_bytes) -> str:
     """
-    Extrai mensagens de um arquivo .mbox fornecido como bytes.
+    Extrai mensagens de um arquivo .mbox fornecido como bytes (ou arquivo binário).
     Retorna uma única string que concatena (subject + corpo) de cada mensagem,
     separadas por duas quebras de linha.
+    Para processar mensagem a mensagem sem montar a string, use iterar_emails_mbox.
     """
     if not file_bytes:
         return ""
 
-    # Divide o arquivo mbox em mensagens individuais.
-    # O separador padrão de mbox é uma linha que começa com "From "
-    parts = re.split(rb'\n(?=From )', file_bytes)
-    textos = []
-
-    for part in parts:
-        part = part.strip()
-        if not part:
-            continue
-        try:
-            # Usa a lib 'email' para parsear os bytes de cada mensagem
-            msg = email.message_from_bytes(part)
-        except Exception:
-            # Fallback se o parse falhar: decodifica o bloco como texto puro
-            try:
-                txt = part.decode("utf-8", errors="ignore")
-            except Exception:
-                txt = part.decode("latin-1", errors="ignore")
-            textos.append(txt)
-            continue
-
-        subj = msg.get('subject', '') or ''
-        body = ""
-
-        # Tenta extrair o corpo (body) da mensagem
-        if msg.is_multipart():
-            # Se for multipart, procura pela parte 'text/plain'
-            for p in msg.walk():
-                ctype = p.get_content_type()
-                disp = str(p.get('Content-Disposition') or "")
-                if ctype == 'text/plain' and 'attachment' not in disp:
-                    try:
-                        payload = p.get_payload(decode=True) or b""
-                        # Tenta decodificar com o charset_or 'utf-8'
-                        body = payload.decode(p.get_content_charset() or 'utf-8', errors='ignore')
-                        break
-                    except Exception:
-                        # Fallback para latin-1 se utf-8 falhar
-                        try:
-                            body = payload.decode('latin-1', errors='ignore')
-                            break
-                        except Exception:
-                            body = ""
-        else:
-            # Se for mensagem simples, pega o payload direto
-            try:
-                payload = msg.get_payload(decode=True)
-                if payload is None:
-                    raw = msg.get_payload()
-                    if isinstance(raw, str):
-                        body = raw
-                    else:
-                        body = str(raw)
-                else:
-                    body = payload.decode(msg.get_content_charset() or 'utf-8', errors='ignore')
-            except Exception:
-                try:
-                    body = msg.get_payload()
-                    if isinstance(body, bytes):
-                        body = body.decode('utf-8', errors='ignore')
-                except Exception:
-                    body = ""
-
-        subj = subj.strip()
-        body = body.strip()
-
-        # Concatena assunto e corpo para formar o texto final da mensagem
-        if subj and body:
-            textos.append(f"Assunto: {subj}\n\n{body}")
-        elif subj:
-            textos.append(f"Assunto: {subj}")
-        elif body:
-            textos.append(body)
-
     # Junta todas as mensagens extraídas com um separador claro (---)
     # Este separador é usado depois para dividir os e-mails para a IA
-    return "\n\n---\n\n".join(textos)
+    return "\n\n---\n\n".join(m.texto for m in iterar_emails_mbox(file_bytes) if m.texto)
 
 
 def preprocessar_texto(texto: str) -> str:
     """
     Limpeza simples de texto: normaliza espaços, remove caracteres estranhos básicos.
+    As regras rodam em uma única passada (ver app/normalizador.py); para textos muito
+    grandes, use normalizar_em_pedacos.
     """
-    if not texto:
-        return ""
-    texto = texto.replace("\r", "\n")
-    # Remove caracteres não-imprimíveis ou estranhos, mantendo acentuação
-    texto = re.sub(r"[^\x00-\x7F\u00C0-\u017F\n\t,.!?;:()\"'@%$ªºº\-—\s]", " ", texto)
-    # Normaliza espaços e quebras de linha
-    texto = re.sub(r"[ \t]+", " ", texto)
-    texto = re.sub(r"\n{3,}", "\n\n", texto)
-    return texto.strip()
+    with medir("preprocessamento"):
+        return normalizar_texto(texto)
+
+
+def _rejeitou_formato(e: Exception) -> bool:
+    # 400/422 citando o response_format: a API (ou o modelo) não aceita saída estruturada
+    if not isinstance(e, httpx.HTTPStatusError) or e.response.status_code not in (400, 422):
+        return False
+    try:
+        corpo = e.response.text
+    except Exception:
+        return False
+    return "response_format" in corpo or "json_schema" in corpo
 
 
-def _call_openai_system_user(system_prompt: str, user_prompt: str, max_tokens: int = 1000, temperature: float = 0.0):
+async def _call_openai_system_user_async(system_prompt: str, user_prompt: str, max_tokens: int = 1000, temperature: float = 0.0,
+                                         formato: dict = None, ao_sobrecarregar=None, tarefa: str = "padrao"):
     """
-    Wrapper simples para chamada ao endpoint de chat completions usando requests.
-    Retorna (conteudo_texto, data_response_json)
+    Chamada assíncrona ao endpoint de chat completions usando o cliente do provedor (pool HTTP/2).
+    O provedor é escolhido pelo roteador (app/provedores.py) entre os da rota da `tarefa`
+    ("classificacao", "resposta", "analise"), pelo custo e pela latência esperada; se ele
+    falhar (após as retentativas) ou estiver com o disjuntor aberto, o próximo da rota é tentado.
+    `formato` é o response_format (JSON schema, ver app/contratos.py); se o provedor recusar,
+    a saída estruturada é desligada para ele e a chamada é refeita sem ele.
+    A chamada passa pela camada de resiliência (app/resiliencia.py): retentativas em 429/5xx/timeout
+    (respeitando o Retry-After), cópia da requisição quando ela demora além do normal e disjuntor,
+    que faz a chamada falhar na hora com DisjuntorAberto se a IA estiver fora.
+    `ao_sobrecarregar()` é avisado a cada 429/5xx/timeout.
+    Retorna (conteudo_texto, data_response_json); data["provedor"] indica quem respondeu.
     """
-    if not OPENAI_API_KEY:
-        raise RuntimeError("OPENAI_API_KEY não configurada no ambiente.")
+    roteador = obter_roteador()
+    tokens_entrada = estimar_tokens(system_prompt) + estimar_tokens(user_prompt)
+    provedores = roteador.ordenar(tarefa, tokens_entrada, max_tokens)
+    if not provedores:
+        abertos = [p.chamador.disjuntor for p in roteador.candidatos(tarefa) if not p.chamador.disjuntor.disponivel()]
+        if abertos:
+            raise DisjuntorAberto(min(d.tentar_em() for d in abertos))
+        raise RuntimeError("Nenhum provedor de IA disponível (configure OPENAI_API_KEY ou LLM_PROVEDORES_PATH).")
 
+    mensagens = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    for posicao, provedor in enumerate(provedores):
+        try:
+            data = await _chamar_provedor(provedor, mensagens, max_tokens, temperature, formato, ao_sobrecarregar)
+            break
+        except (httpx.HTTPError, DisjuntorAberto) as e:
+            if posicao == len(provedores) - 1:
+                raise
+            # Falhou depois das retentativas (ou o disjuntor abriu): tenta o próximo da rota
+            contar("autou_llm_desvios_total", provedor=provedor.nome)
+    registrar_uso_llm(data.get("usage") if isinstance(data, dict) else None)
+    try:
+        content = data["choices"][0]["message"]["content"]
+    except Exception:
+        content = ""
+    return content, data
+
+
+async def _chamar_provedor(provedor, mensagens: list, max_tokens: int, temperature: float, formato: dict, ao_sobrecarregar):
     payload = {
-        "model": OPENAI_MODEL,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ],
+        "model": provedor.modelo,
+        "messages": mensagens,
         "max_tokens": max_tokens,
         "temperature": temperature # 0.0 para respostas determinísticas
     }
+    if formato is not None and contratos.LLM_SAIDA_ESTRUTURADA and provedor.saida_estruturada:
+        payload["response_format"] = formato
 
-    resp = requests.post(OPENAI_URL, headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}, json=payload, timeout=30)
-    # Garante que a API retornou um status OK (ex: 200)
-    resp.raise_for_status()
-    data = resp.json()
+    # O cliente já valida o status HTTP (raise_for_status) e devolve o JSON
+    headers = provedor.cabecalhos()
+    etapa = etapa_atual()
+    inicio = time.monotonic()
+    provedor.em_uso += 1
     try:
-        content = data["choices"][0]["message"]["content"]
-    except Exception:
-        content = ""
-    return content, data
+        try:
+            data = await provedor.chamador.chamar(lambda: _post_medido(provedor, payload, headers), etapa, ao_sobrecarregar)
+        except httpx.HTTPStatusError as e:
+            if "response_format" not in payload or not _rejeitou_formato(e):
+                raise
+            provedor.saida_estruturada = False
+            del payload["response_format"]
+            data = await provedor.chamador.chamar(lambda: _post_medido(provedor, payload, headers), etapa, ao_sobrecarregar)
+    finally:
+        provedor.em_uso -= 1
+    provedor.registrar_latencia(time.monotonic() - inicio)
+    if isinstance(data, dict):
+        uso = data.get("usage") or {}
+        custo = provedor.custo(uso.get("prompt_tokens") or 0, uso.get("completion_tokens") or 0)
+        if custo:
+            contar("autou_llm_custo_usd_total", custo, provedor=provedor.nome)
+        data["provedor"] = provedor.nome
+    return data
+
+
+async def _post_medido(provedor, payload: dict, headers: dict):
+    # Uma chamada HTTP à IA: tempo (etapa "llm") e resultado, rotulados pela etapa que a fez e pelo provedor
+    etapa = etapa_atual()
+    try:
+        with medir("llm"):
+            data = await provedor.cliente.post_json(provedor.url, payload, headers=headers)
+    except httpx.HTTPStatusError as e:
+        contar("autou_llm_chamadas_total", etapa=etapa, provedor=provedor.nome, resultado=e.response.status_code)
+        raise
+    except Exception as e:
+        contar("autou_llm_chamadas_total", etapa=etapa, provedor=provedor.nome, resultado=type(e).__name__)
+        raise
+    contar("autou_llm_chamadas_total", etapa=etapa, provedor=provedor.nome, resultado="ok")
+    return data
+
+
+def _modelo_da_tarefa(tarefa: str) -> str:
+    # Modelos que podem responder a tarefa: entram na chave do cache no lugar do nome do modelo
+    return obter_roteador().assinatura(tarefa)
+
+
+def _versao(tarefa: str, versao_prompt: str, temperatura: float) -> str:
+    # Versão dos resultados guardados no acervo: os mesmos campos de chave_cache (modelos, prompt, temperatura)
+    return "|".join((_modelo_da_tarefa(tarefa), versao_prompt, repr(float(temperatura))))
+
+
+def _call_openai_system_user(system_prompt: str, user_prompt: str, max_tokens: int = 1000, temperature: float = 0.0,
+                             formato: dict = None):
+    """
+    Wrapper síncrono de _call_openai_system_user_async.
+    Retorna (conteudo_texto, data_response_json)
+    """
+    return executar_sincrono(_call_openai_system_user_async(system_prompt, user_prompt, max_tokens, temperature, formato))
 
 
 # Classificador heurístico simples para usar como fallback
@@ -204,32 +342,124 @@ def simple_heuristic_classifier(texto: str):
     Heurística simples: procura palavras-chave para decidir label.
     Retorna (label, score)
     (mantém labels esperados: 'produtivo', 'improdutivo', 'neutro')
+    As palavras-chave e pesos ficam no arquivo de regras (app/regras_heuristica.json).
     """
-    if not texto:
-        return "neutro", 0.0
-
-    txt = texto.lower()
-    # Palavras-chave que indicam produtividade ou necessidade de ação
-    productive_keywords = ["reunião", "deadline", "prazo", "entrega", "concluir", "aprovado", "confirma", "ok", "agendar", "agendada", "projeto", "tarefa", "pendente", "prioridade", "ajuda"]
-    # Palavras-chave que indicam spam ou e-mails inúteis
-    unproductive_keywords = ["spam", "promoção", "oferta", "unsubscribe", "loteria", "ganhou", "propaganda", "anúncio", "fake"]
-
-    prod_score = sum(1 for k in productive_keywords if k in txt)
-    unprod_score = sum(1 for k in unproductive_keywords if k in txt)
-
-    if prod_score == 0 and unprod_score == 0:
-        # Se não encontrar nada, considera neutro
-        return "neutro", 0.3
-    if prod_score >= unprod_score:
-        # normaliza para 0.5 .. 0.9
-        score = 0.5 + min(prod_score / len(productive_keywords), 0.4)
-        return "produtivo", round(score, 2)
+    return obter_motor().classificar(texto)
+
+
+def classificar_heuristica_lote(textos: list) -> list:
+    """
+    Versão em lote da heurística: uma única varredura para todas as mensagens.
+    Retorna [{"label":..., "score":...}, ...] na mesma ordem.
+    """
+    return [{"label": lab, "score": sc} for lab, sc in obter_motor().classificar_lote(textos)]
+
+
+async def _chamar_lote_com_retry(system: str, user: str, max_tokens: int, limite: LimiteAdaptativo, formato: dict = None,
+                                 tarefa: str = "classificacao"):
+    """
+    Chama a IA para um lote. As retentativas em caso de sobrecarga (429/5xx/timeout) ficam
+    na camada de resiliência; cada sobrecarga avisa o limite adaptativo para reduzir a concorrência.
+    """
+    resultado = await _call_openai_system_user_async(system, user, max_tokens=max_tokens, temperature=0.0,
+                                                     formato=formato, ao_sobrecarregar=limite.registrar_sobrecarga,
+                                                     tarefa=tarefa)
+    limite.registrar_sucesso()
+    return resultado
+
+
+async def _classificar_lote_async(lote: list, limite: LimiteAdaptativo, planejador: PlanejadorLotes = None):
+    """
+    Classifica um lote de mensagens (já reduzidas por reduzir_mensagem). Retorna
+    (lista_de_resultados, batch_meta). A resposta é validada pelo contrato (app/contratos.py):
+    itens inválidos são reenviados sozinhos e, se a resposta inteira não servir (JSON
+    quebrado ou tamanho errado), o lote é dividido ao meio e só as metades que falharem
+    são repetidas, até LOTE_MAX_REPAROS chamadas extras. O que sobrar cai na heurística.
+    """
+    system = (
+        "Você é um classificador que deve retornar EXATAMENTE um JSON no formato "
+        "{\"itens\":[...]}, sem texto extra. Cada item do array corresponde a uma mensagem "
+        "na ordem recebida e deve ter: {\"label\":\"produtivo|improdutivo|neutro\",\"score\":<0-1>}."
+    )
+    resultados = [None] * len(lote)
+    batch_meta = {"usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}, "chamadas": 0, "reparos": 0}
+
+    async def _chamar(indices):
+        user = ("Classifique as mensagens abaixo (mantenha a ordem):\n\n"
+                + "\n\n---\n\n".join(lote[i] for i in indices) + "\n\nResposta: JSON.")
+        conteudo, data = await _chamar_lote_com_retry(system, user, max_tokens_saida(len(indices)), limite,
+                                                      formato=FORMATO_LOTE_CLASSIFICACAO)
+        if batch_meta["chamadas"] == 0:
+            batch_meta["raw"] = conteudo
+            if planejador is not None:
+                planejador.registrar_uso(system + user, data.get("usage"))
+        batch_meta["chamadas"] += 1
+        provedores = batch_meta.setdefault("provedores", {})
+        provedores[data.get("provedor")] = provedores.get(data.get("provedor"), 0) + 1
+        for campo, valor in (data.get("usage") or {}).items():
+            if campo in batch_meta["usage"] and isinstance(valor, int):
+                batch_meta["usage"][campo] += valor
+        return interpretar_lote(conteudo, len(indices))
+
+    async def _resolver():
+        # Em largura: as metades de um mesmo nível são tentadas antes de descer mais,
+        # para o limite de reparos não se esgotar todo num único ramo
+        pendentes = collections.deque([list(range(len(lote)))])
+        while pendentes:
+            indices = pendentes.popleft()
+            if batch_meta["chamadas"]:
+                if batch_meta["reparos"] >= LOTE_MAX_REPAROS:
+                    break
+                batch_meta["reparos"] += 1
+            itens = await _chamar(indices)
+            if itens is not None:
+                for i, item in zip(indices, itens):
+                    resultados[i] = item
+                invalidos = [i for i, item in zip(indices, itens) if item is None]
+                if len(invalidos) < len(indices):
+                    # Reenvia só os itens inválidos
+                    if invalidos:
+                        pendentes.append(invalidos)
+                    continue
+            # Nada se aproveitou: divide o lote ao meio
+            if len(indices) > 1:
+                meio = len(indices) // 2
+                pendentes.extend((indices[:meio], indices[meio:]))
+
+    try:
+        await _resolver()
+    except (httpx.HTTPError, DisjuntorAberto) as e:
+        # A IA não respondeu mesmo após os retries (ou está fora): o que faltou cai na heurística
+        batch_meta["erro"] = str(e)
+        if isinstance(e, DisjuntorAberto):
+            batch_meta["degradado"] = True
+
+    # Fallback: heurística para as mensagens que a IA não resolveu
+    faltantes = [i for i, item in enumerate(resultados) if item is None]
+    if faltantes:
+        for i, item in zip(faltantes, classificar_heuristica_lote([lote[i] for i in faltantes])):
+            resultados[i] = item
+        batch_meta["heuristica"] = faltantes
+    if not faltantes:
+        batch_meta["status"] = "repaired_ok" if batch_meta["reparos"] else "ok"
+    elif len(faltantes) < len(lote):
+        batch_meta["status"] = "partial_fallback"
     else:
-        score = 0.5 + min(unprod_score / len(unproductive_keywords), 0.4)
-        return "improdutivo", round(score, 2)
+        batch_meta["status"] = "heuristic_fallback"
+    contar("autou_lotes_total", status=batch_meta["status"])
+    return resultados, batch_meta
+
+
+def _chave_classificacao(texto: str) -> str:
+    # Chave de cache de uma mensagem: conteúdo normalizado + modelo + versão do prompt + temperatura
+    return _chave_normalizada(preprocessar_texto(texto))
+
 
+def _chave_normalizada(normalizado: str) -> str:
+    return chave_cache("classificacao", normalizado, _modelo_da_tarefa("classificacao"), PROMPT_VERSAO_CLASSIFICACAO, 0.0)
 
-def classificar_com_openai(texto: str, max_por_lote: int = 10):
+
+async def classificar_com_openai_async(texto: str, max_por_lote: int = None, max_em_voo: int = None):
     """
     Entrada: texto (pode conter vários e-mails separados por '\n\n---\n\n').
     Retorna:
@@ -237,9 +467,11 @@ def classificar_com_openai(texto: str, max_por_lote: int = 10):
       - se single: (label, score, meta)
     Estratégia:
       1) split em partes,
-      2) processar por lotes (max_por_lote),
+      2) processar por lotes montados por orçamento de tokens (até max_por_lote mensagens,
+         ver app/planejador_lotes.py), até max_em_voo lotes em paralelo,
       3) para cada lote, exigir JSON array estrito no prompt,
-      4) validar comprimento, retry/reformat, fallback heurístico por item faltante.
+      4) validar a resposta pelo contrato, reparar por bissecção e usar a heurística
+         só nos itens que a IA não resolveu.
     """
     if not texto:
         raise ValueError("Texto vazio para classificação.")
@@ -248,148 +480,367 @@ def classificar_com_openai(texto: str, max_por_lote: int = 10):
     partes = [p.strip() for p in texto.split("\n\n---\n\n") if p.strip()]
     multiple = len(partes) > 1
 
+    cache = obter_cache()
+
     # --- Rota 1: E-mail único ---
     # Se for apenas um e-mail, o fluxo é mais simples
     if not multiple:
+        triagem = triagem_de(texto)
+        if triagem is not None and triagem["acao"] == PULAR:
+            # Mensagem do mbox decidida pelos cabeçalhos (app/triagem.py): sem cache nem IA
+            contar("autou_mensagens_total", origem="triagem")
+            return triagem["label"], triagem["score"], {"source": "triagem", "triagem": triagem["regra"]}
+
+        chave = _chave_classificacao(texto) if cache is not None else None
+        if chave is not None:
+            em_cache = await cache.obter_async(chave)
+            if em_cache is not None:
+                contar("autou_mensagens_total", origem="cache")
+                return em_cache["label"], em_cache["score"], {"source": "cache", "cache": {"hits": 1, "misses": 0}}
+
+        # Modelo local: se estiver confiante, dispensa a chamada à IA
+        modelo_local = obter_classificador_local()
+        if modelo_local is not None:
+            local = modelo_local.prever_confiantes([texto])[0]
+            if local is not None:
+                contar("autou_mensagens_total", origem="local")
+                return local["label"], local["score"], {"source": "local"}
+
         # Prompt curto e rígido para JSON único
         system = "Você é um classificador. Responda SOMENTE com um JSON: {\"label\":\"produtivo|improdutivo|neutro\",\"score\":0-1}"
-        user = f"Classifique este texto:\n\n{texto}\n\nResposta: JSON."
-        conteudo, data = _call_openai_system_user(system, user, max_tokens=800, temperature=0.0)
-        meta = {"source": "openai", "raw": conteudo, "usage": data.get("usage")}
+        user = f"Classifique este texto:\n\n{reduzir_mensagem(texto)}\n\nResposta: JSON."
         try:
-            # Tenta parsear a resposta da IA
-            parsed = json.loads(conteudo)
-            label = parsed.get("label", "neutro").lower()
-            score = float(parsed.get("score", 0.0))
+            with medir("classificacao"):
+                conteudo, data = await _call_openai_system_user_async(system, user, max_tokens=max_tokens_saida(1),
+                                                                      temperature=0.0, formato=FORMATO_CLASSIFICACAO,
+                                                                      tarefa="classificacao")
+        except (httpx.HTTPError, DisjuntorAberto) as e:
+            # IA fora ou sem resposta após as retentativas: heurística, sem devolver erro ao usuário
+            contar("autou_mensagens_total", origem="heuristica")
+            lab, sc = simple_heuristic_classifier(texto)
+            meta = {"source": "heuristica", "fallback": "heuristic_single", "error": str(e),
+                    "degradado": isinstance(e, DisjuntorAberto)}
+            return lab, sc, meta
+        meta = {"source": "openai", "provedor": data.get("provedor"), "raw": conteudo, "usage": data.get("usage")}
+        if chave is not None:
+            meta["cache"] = {"hits": 0, "misses": 1}
+        try:
+            # Valida a resposta da IA pelo contrato
+            item = interpretar_classificacao(conteudo)
+            label, score = item["label"], item["score"]
+            if chave is not None:
+                cache.guardar(chave, {"label": label, "score": score})
+            registrar_rotulos_llm([texto], [{"label": label, "score": score}])
+            contar("autou_mensagens_total", origem="ia")
             return label, score, meta
-        except Exception:
-            # Fallback: Se a IA falhar ou o JSON for inválido, usa a heurística
+        except ContratoInvalido:
+            # Fallback: Se o JSON for inválido ou fora do contrato, usa a heurística
+            contar("autou_mensagens_total", origem="heuristica")
             lab, sc = simple_heuristic_classifier(texto)
             meta["fallback"] = "heuristic_single"
             meta["heuristic_details"] = {"label": lab, "score": sc}
             return lab, sc, meta
 
     # --- Rota 2: Múltiplos e-mails (processamento em lote) ---
-    aggregated = []
-    meta = {"source": "openai", "batches": []}
-    for i in range(0, len(partes), max_por_lote):
-        lote = partes[i:i + max_por_lote]
-        system = (
-            "Você é um classificador que deve retornar EXATAMENTE um JSON ARRAY, sem texto extra. "
-            "Cada item do array corresponde a uma mensagem na ordem recebida e deve ter: "
-            "{\"label\":\"produtivo|improdutivo|neutro\",\"score\":<0-1>}."
-        )
-        user = "Classifique as mensagens abaixo (mantenha a ordem):\n\n" + "\n\n---\n\n".join(lote) + "\n\nResposta: JSON array."
-        
-        # Tentativa 1: Chamar a IA para o lote
-        conteudo, data = _call_openai_system_user(system, user, max_tokens=600, temperature=0.0)
-
-        parsed = None
-        # Tenta parsear o JSON direto
-        try:
-            parsed = json.loads(conteudo)
-        except Exception:
-            # Se falhar, tenta limpar a resposta (IA às vezes adiciona texto "```json" ou "aqui está:")
-            s = conteudo.find("[")
-            e = conteudo.rfind("]")
-            if s != -1 and e != -1 and e > s:
-                try:
-                    parsed = json.loads(conteudo[s:e+1])
-                except Exception:
-                    parsed = None
-
-        batch_meta = {"raw": conteudo, "usage": data.get("usage")}
-        
-        # Se deu tudo certo (é uma lista e o tamanho bate com o lote), adiciona
-        if isinstance(parsed, list) and len(parsed) == len(lote):
-            normalized = []
-            for it in parsed:
-                if isinstance(it, dict):
-                    lab = (it.get("label") or "neutro").lower()
-                    try:
-                        sc = float(it.get("score", 0.0))
-                    except Exception:
-                        sc = 0.0
-                else:
-                    lab, sc = simple_heuristic_classifier(str(it))
-                normalized.append({"label": lab, "score": sc})
-            aggregated.extend(normalized)
-            batch_meta["status"] = "ok"
-            meta["batches"].append(batch_meta)
-            continue # Vai para o próximo lote
-
-        # Tentativa 2: Reformatar (se a Tentativa 1 falhou)
-        # Pede à IA para corrigir a saída anterior (que provavelmente veio com texto extra)
-        try:
-            system2 = "A saída anterior não estava no formato correto. Refaça retornando APENAS um JSON ARRAY com os campos label, score."
-            user2 = "Reformate a saída anterior como JSON array."
-            conteudo2, data2 = _call_openai_system_user(system2, user2, max_tokens=600, temperature=0.0)
-            parsed2 = None
-            try:
-                parsed2 = json.loads(conteudo2)
-            except Exception:
-                # Tenta limpar o JSON de novo
-                s = conteudo2.find("[")
-                e = conteudo2.rfind("]")
-                if s != -1 and e != -1 and e > s:
-                    try:
-                        parsed2 = json.loads(conteudo2[s:e+1])
-                    except Exception:
-                        parsed2 = None
-            batch_meta["reformat_attempt"] = conteudo2
-            batch_meta["usage_reformat"] = data2.get("usage")
-            
-            # Se a reformatação funcionou, adiciona
-            if isinstance(parsed2, list) and len(parsed2) == len(lote):
-                normalized = []
-                for it in parsed2:
-                    if isinstance(it, dict):
-                        lab = (it.get("label") or "neutro").lower()
-                        try:
-                            sc = float(it.get("score", 0.0))
-                        except Exception:
-                            sc = 0.0
-                    else:
-                        lab, sc = simple_heuristic_classifier(str(it))
-                    normalized.append({"label": lab, "score": sc})
-                aggregated.extend(normalized)
-                batch_meta["status"] = "reformatted_ok"
-                meta["batches"].append(batch_meta)
+    return await _classificar_varias_async(partes, max_por_lote, max_em_voo)
+
+
+async def classificar_mensagens_async(mensagens, max_por_lote: int = None, max_em_voo: int = None):
+    """
+    Mesma classificação de classificar_com_openai_async, mas recebendo as mensagens
+    já separadas (qualquer iterável de strings, ex: gerador sobre iterar_emails_mbox).
+    As mensagens são consumidas sob demanda, sem montar/dividir uma string única.
+    Retorna (label, score, meta) se houver uma única mensagem, senão (lista, meta).
+    """
+    mensagens = (m for m in mensagens if m and m.strip())
+    primeiras = list(itertools.islice(mensagens, 2))
+    if not primeiras:
+        raise ValueError("Texto vazio para classificação.")
+    if len(primeiras) == 1:
+        return await classificar_com_openai_async(primeiras[0], max_por_lote, max_em_voo)
+    return await _classificar_varias_async(itertools.chain(primeiras, mensagens), max_por_lote, max_em_voo)
+
+
+async def _classificar_varias_async(mensagens, max_por_lote: int, max_em_voo: int = None):
+    """
+    Rota de múltiplos e-mails: junta os resultados de iterar_classificacoes_async na ordem.
+    Retorna (lista_de_resultados_na_ordem, meta).
+    """
+    meta = {}
+    resultados = {}
+    async for pares in iterar_classificacoes_async(mensagens, max_por_lote, max_em_voo, meta):
+        for idx, resultado, _ in pares:
+            resultados[idx] = resultado
+    return [resultados[i] for i in range(len(resultados))], meta
+
+
+async def iterar_classificacoes_async(mensagens, max_por_lote: int = None, max_em_voo: int = None, meta: dict = None):
+    """
+    Classifica um iterável de mensagens (síncrono ou assíncrono, ex: iterar_mensagens_pdf_async)
+    e gera, assim que ficam prontas, listas de tuplas (indice_da_mensagem, {"label":..., "score":..., "grupo":...}, texto): primeiro o que
+    já está em cache e depois cada lote que a IA termina (ordem de conclusão, não de entrada).
+    Mensagens quase idênticas (app/duplicatas.py) formam um grupo: só a primeira vai para a IA
+    e as demais recebem o mesmo resultado; "grupo" é o índice dessa primeira mensagem.
+    Mensagens já classificadas em envios anteriores saem do acervo (app/acervo.py) sem ir à IA;
+    as novas classificações (exceto fallbacks heurísticos) são gravadas nele.
+    Mensagens do mbox que a triagem por cabeçalhos (app/triagem.py) manda pular recebem o label
+    da regra na hora, sem pré-processamento, cache ou IA; as marcadas seguem o fluxo normal.
+    Nos dois casos o resultado traz "triagem" com o nome da regra.
+    Se `meta` for passado, é preenchido com batches/cache/em_voo_final/planejamento/duplicatas/acervo/triagem ao final.
+    """
+    cache = obter_cache()
+    acervo = obter_acervo()
+    versao_acervo = _versao("classificacao", PROMPT_VERSAO_CLASSIFICACAO, 0.0)
+    contadores_acervo = {"reaproveitadas": 0, "gravadas": 0}
+    # Índices que não devem ser gravados no acervo (vieram dele ou são fallback heurístico)
+    nao_gravar = set()
+    # chave -> hash_normalizado das mensagens que podem estar no acervo (consultado por lote da IA)
+    hash_da_chave = {}
+    meta = meta if meta is not None else {}
+    meta["source"] = "openai"
+    contadores = {"hits": 0, "misses": 0}
+    # chave -> (índice, texto) de mensagens repetidas ou quase duplicatas aguardando o
+    # resultado da mensagem já enviada à IA
+    repetidas = {}
+    # chave -> resultado de mensagens já processadas neste envio (inclusive fallbacks)
+    resolvidos = {}
+    batches = []
+    indice = IndiceDuplicatas() if DUPLICATAS_ATIVO else None
+    # chave -> grupo (índice do representante) e grupo -> chave do representante
+    grupo_da_chave = {}
+    chave_do_grupo = {}
+    contadores_grupos = {"quase_duplicadas": 0}
+    contadores_triagem = {"puladas": 0, "marcadas": 0, "regras": {}}
+    # índice -> regra de triagem das mensagens marcadas (anotada no resultado quando ele sair)
+    marcadas = {}
+
+    modelo_local = obter_classificador_local()
+    contadores_local = {"resolvidas": 0, "enviadas_ia": 0}
+    # Os lotes da IA fecham pelo orçamento de tokens ou pelo número de mensagens
+    planejador = PlanejadorLotes(max_itens=max_por_lote)
+    max_prontos = planejador.max_itens
+    prontos = []
+    candidatas = []
+    # Sem modelo local, as mensagens seguem direto para os lotes da IA
+    tamanho_candidatas = CLASSIFICADOR_LOCAL_LOTE if modelo_local is not None else 1
+
+    async def _gerar_lotes():
+        nonlocal prontos
+        idx = -1
+        async for texto in aiterar(mensagens):
+            idx += 1
+            triagem = triagem_de(texto)
+            if triagem is not None:
+                regras = contadores_triagem["regras"]
+                regras[triagem["regra"]] = regras.get(triagem["regra"], 0) + 1
+                if triagem["acao"] == PULAR:
+                    # Decidida pelos cabeçalhos: nem vai para o acervo como classificação da IA
+                    contadores_triagem["puladas"] += 1
+                    nao_gravar.add(idx)
+                    resultado = {"label": triagem["label"], "score": triagem["score"], "grupo": idx,
+                                 "triagem": triagem["regra"]}
+                    prontos.append((idx, resultado, texto))
+                    if len(prontos) >= max_prontos:
+                        yield "pronto", prontos
+                        prontos = []
+                    continue
+                contadores_triagem["marcadas"] += 1
+                marcadas[idx] = triagem["regra"]
+            normalizado = preprocessar_texto(texto)
+            chave = _chave_normalizada(normalizado)
+            grupo = grupo_da_chave.get(chave)
+            if grupo is None:
+                grupo = indice.agrupar(texto, idx) if indice is not None else idx
+                grupo_da_chave[chave] = grupo
+            elif indice is not None:
+                indice.tamanhos[grupo] += 1
+            chave_grupo = chave_do_grupo.setdefault(grupo, chave)
+
+            em_cache = resolvidos.get(chave)
+            if em_cache is None and cache is not None:
+                em_cache = await cache.obter_async(chave)
+            if em_cache is not None:
+                contadores["hits"] += 1
+            elif chave_grupo != chave and chave not in repetidas:
+                # Quase duplicata: usa o resultado (ou a chamada pendente) do representante do grupo
+                contadores_grupos["quase_duplicadas"] += 1
+                if chave_grupo in repetidas:
+                    repetidas[chave_grupo].append((idx, texto))
+                    continue
+                em_cache = resolvidos.get(chave_grupo)
+                if em_cache is None and cache is not None:
+                    em_cache = await cache.obter_async(chave_grupo)
+            if em_cache is not None:
+                # Cópia para que alterações no resultado não contaminem o cache
+                prontos.append((idx, dict(em_cache, grupo=grupo), texto))
+                if len(prontos) >= max_prontos:
+                    yield "pronto", prontos
+                    prontos = []
                 continue
-        except Exception:
-            pass # Se a reformatação falhar, segue para a heurística
-
-        # Fallback Final: Heurística por item
-        # Se as duas tentativas da IA falharem, usa a heurística item por item
-        filled = []
-        if isinstance(parsed, list):
-            # Usa os itens que vieram e aplica heurística para os faltantes
-            for j in range(len(lote)):
-                if j < len(parsed) and isinstance(parsed[j], dict):
-                    lab = (parsed[j].get("label") or "neutro").lower()
-                    try:
-                        sc = float(parsed[j].get("score", 0.0))
-                    except Exception:
-                        sc = 0.0
-                elif j < len(parsed):
-                    lab, sc = simple_heuristic_classifier(str(parsed[j]))
-                else:
-                    lab, sc = simple_heuristic_classifier(lote[j])
-                filled.append({"label": lab, "score": sc})
-        else:
-            # Nenhum parse: aplicar heurística completa no lote
-            for msg in lote:
-                lab, sc = simple_heuristic_classifier(msg)
-                filled.append({"label": lab, "score": sc})
-
-        aggregated.extend(filled)
-        batch_meta["status"] = "heuristic_fallback"
-        meta["batches"].append(batch_meta)
+            # Mensagens repetidas dentro do mesmo envio também vão uma única vez para a IA
+            if chave in repetidas:
+                repetidas[chave].append((idx, texto))
+                contadores["hits"] += 1
+                continue
+            repetidas[chave] = []
+            contadores["misses"] += 1
+            if acervo is not None:
+                hash_da_chave[chave] = hash_normalizado(normalizado)
+            candidatas.append((idx, texto, chave))
+            if len(candidatas) >= tamanho_candidatas:
+                for item in _separar_candidatas():
+                    yield item
+        for item in _separar_candidatas():
+            yield item
+        if prontos:
+            yield "pronto", prontos
+        lote = planejador.fechar()
+        if lote:
+            yield "ia", lote
 
-    return aggregated, meta
+    def _separar_candidatas():
+        # O modelo local classifica as candidatas de uma vez (vetorizado); as que ele
+        # resolve com confiança não vão para a IA, o restante segue nos lotes.
+        nonlocal prontos
+        locais = modelo_local.prever_confiantes([t for _, t, _ in candidatas]) if modelo_local else [None] * len(candidatas)
+        for (idx, texto, chave), resultado in zip(candidatas, locais):
+            if resultado is not None:
+                contadores_local["resolvidas"] += 1
+                hash_da_chave.pop(chave, None)
+                resolvidos[chave] = resultado
+                grupo = grupo_da_chave[chave]
+                prontos.append((idx, dict(resultado, grupo=grupo), texto))
+                for copia, texto_copia in repetidas.pop(chave, ()):
+                    prontos.append((copia, dict(resultado, grupo=grupo), texto_copia))
+                continue
+            contadores_local["enviadas_ia"] += 1
+            # A IA recebe a mensagem sem histórico citado e sem assinatura
+            reduzido = reduzir_mensagem(texto)
+            fechado = planejador.adicionar((idx, texto, chave, reduzido), planejador.estimar(reduzido))
+            if fechado:
+                if prontos:
+                    yield "pronto", prontos
+                    prontos = []
+                yield "ia", fechado
+        if len(prontos) >= max_prontos:
+            yield "pronto", prontos
+            prontos = []
+        candidatas.clear()
 
+    def _resolver(pares, idx, texto, chave, resultado):
+        # Resultado da mensagem enviada (e das repetidas que esperavam por ela)
+        grupo = grupo_da_chave[chave]
+        resolvidos[chave] = resultado
+        pares.append((idx, dict(resultado, grupo=grupo), texto))
+        copias = repetidas.pop(chave, ())
+        for copia, texto_copia in copias:
+            pares.append((copia, dict(resultado, grupo=grupo), texto_copia))
+        return copias
 
-def gerar_resposta_com_openai(texto: str, label: str = None):
+    async def _processar(item):
+        tipo, conteudo = item
+        if tipo == "pronto":
+            return conteudo, None
+        pares = []
+        if acervo is not None:
+            # Camada seguinte ao cache: uma consulta (fora do loop de eventos) por lote planejado
+            hashes = [hash_da_chave.pop(chave) for _, _, chave, _ in conteudo]
+            guardados = await asyncio.to_thread(acervo.obter_varios, hashes, versao_acervo)
+            restantes = []
+            for item_lote, chave_acervo in zip(conteudo, hashes):
+                guardado = guardados.get(chave_acervo)
+                if guardado is None:
+                    restantes.append(item_lote)
+                    continue
+                idx, texto, chave, _ = item_lote
+                contadores_acervo["reaproveitadas"] += 1
+                nao_gravar.add(idx)
+                nao_gravar.update(copia for copia, _ in _resolver(pares, idx, texto, chave, guardado))
+                if cache is not None:
+                    cache.guardar(chave, dict(guardado))
+            if not restantes:
+                return pares, None
+            conteudo = restantes
+        with medir("classificacao_lote"):
+            normalized, batch_meta = await _classificar_lote_async([reduzido for *_, reduzido in conteudo], limite,
+                                                                   planejador)
+        batch_meta["mensagens"] = len(conteudo)
+        # Só guarda no cache (e no log de rótulos) o que veio da IA: fallbacks heurísticos ficam de fora
+        heuristica = set(batch_meta.get("heuristica", ()))
+        da_ia = []
+        for j, ((idx, texto, chave, _), resultado) in enumerate(zip(conteudo, normalized)):
+            copias = _resolver(pares, idx, texto, chave, resultado)
+            if j in heuristica:
+                nao_gravar.add(idx)
+                nao_gravar.update(copia for copia, _ in copias)
+            else:
+                da_ia.append((texto, resultado))
+                if cache is not None:
+                    cache.guardar(chave, dict(resultado))
+        if da_ia:
+            registrar_rotulos_llm([t for t, _ in da_ia], [r for _, r in da_ia])
+        return pares, (conteudo[0][0], batch_meta)
+
+    # Os lotes são enviados em paralelo (até max_em_voo por vez, reduzido em caso de 429/5xx).
+    # Cada lote cuida do próprio retry e fallback.
+    limite = LimiteAdaptativo(max_em_voo or LOTES_EM_VOO)
+    async for _, (pares, batch) in iterar_em_lotes(_gerar_lotes(), _processar, limite):
+        if batch is not None:
+            batches.append(batch)
+        if marcadas:
+            for idx, resultado, _ in pares:
+                if idx in marcadas:
+                    resultado["triagem"] = marcadas.pop(idx)
+        if acervo is not None:
+            novos = [(texto, resultado) for idx, resultado, texto in pares if idx not in nao_gravar]
+            nao_gravar.difference_update(idx for idx, _, _ in pares)
+            if novos:
+                acervo.registrar_classificacoes(novos, versao_acervo)
+                contadores_acervo["gravadas"] += len(novos)
+        yield pares
+
+    # batches na ordem das mensagens (os lotes terminam fora de ordem)
+    meta["batches"] = [batch_meta for _, batch_meta in sorted(batches, key=lambda b: b[0])]
+    meta["em_voo_final"] = limite.limite
+    meta["planejamento"] = {
+        "orcamento_tokens": planejador.orcamento_tokens,
+        "max_mensagens": planejador.max_itens,
+        "fator_tokens": round(planejador.calibrador.fator, 3),
+    }
+    if cache is not None:
+        meta["cache"] = contadores
+    if modelo_local is not None:
+        meta["local"] = dict(contadores_local, validacao=modelo_local.metricas)
+    meta["duplicatas"] = dict(contadores_grupos, grupos=len(chave_do_grupo))
+    if acervo is not None:
+        meta["acervo"] = contadores_acervo
+    if obter_triagem() is not None or contadores_triagem["regras"]:
+        meta["triagem"] = contadores_triagem
+
+    # Mensagens por origem do resultado (/metrics)
+    heuristicas = sum(len(b.get("heuristica", ())) for b in meta["batches"])
+    origens = {
+        "ia": sum(b["mensagens"] for b in meta["batches"]) - heuristicas,
+        "heuristica": heuristicas,
+        "cache": contadores["hits"],
+        "acervo": contadores_acervo["reaproveitadas"],
+        "local": contadores_local["resolvidas"],
+        "duplicata": contadores_grupos["quase_duplicadas"],
+        "triagem": contadores_triagem["puladas"],
+    }
+    for origem, n in origens.items():
+        if n:
+            contar("autou_mensagens_total", n, origem=origem)
+
+
+def classificar_com_openai(texto: str, max_por_lote: int = None, max_em_voo: int = None):
+    """
+    Wrapper síncrono de classificar_com_openai_async (mesmo retorno).
+    """
+    return executar_sincrono(classificar_com_openai_async(texto, max_por_lote, max_em_voo))
+
+
+async def gerar_resposta_com_openai_async(texto: str, label: str = None):
     """
     Gera uma resposta automática baseada no conteúdo do e-mail e na classificação.
     Se a chamada ao OpenAI falhar, retorna fallback de texto padrão.
@@ -398,31 +849,215 @@ def gerar_resposta_com_openai(texto: str, label: str = None):
         return "", {"source": "none"}
     system = "Você é um assistente que escreve respostas curtas e profissionais a e-mails, " \
              "contextualizando pela classificação fornecida."
+    # Uma mensagem por chamada (as listas de e-mails são respondidas uma a uma)
     user = (
     f"Classificação: {label}\n\n"
-    f"Texto:\n{texto}\n\n"
-    "Escreva uma resposta curta (2-6 sentenças).\n"
-    # Instrução chave para o caso de uso de múltiplos e-mails (como no PDF)
-    "Você pode ultrapassar esse limite apenas se houver 2 ou mais e-mails; "
-    "nesse caso, gere 2-6 sentenças para cada e-mail e organize as respostas separadamente dividindo os por `---`."
+    f"E-mail:\n{texto}\n\n"
+    "Escreva uma resposta curta (2-6 sentenças) a este e-mail. "
+    "Devolva só o texto da resposta, sem assunto nem comentários."
 )
 
+    # A resposta depende do texto e da classificação recebida
+    cache = obter_cache()
+    chave = None
+    if cache is not None:
+        chave = chave_cache("resposta", preprocessar_texto(texto), _modelo_da_tarefa("resposta"), PROMPT_VERSAO_RESPOSTA, 0.2,
+                            extra=json.dumps(label, sort_keys=True, ensure_ascii=False))
+        em_cache = await cache.obter_async(chave)
+        if em_cache is not None:
+            return em_cache, {"source": "cache", "cache": {"hits": 1, "misses": 0}}
+
     try:
-        # max_tokens alto (2500) para garantir que a IA consiga gerar
-        # respostas para todos os e-mails em um lote grande (essa foi a correção anterior).
-        conteudo, data = _call_openai_system_user(system, user, max_tokens=2500, temperature=0.2)
+        with medir("resposta"):
+            conteudo, data = await _call_openai_system_user_async(system, user, max_tokens=RESPOSTA_MAX_TOKENS,
+                                                                  temperature=0.2, tarefa="resposta")
         resposta = conteudo.strip()
-        meta = {"source": "openai", "raw": conteudo, "usage": data.get("usage")}
+        meta = {"source": "openai", "provedor": data.get("provedor"), "raw": conteudo, "usage": data.get("usage")}
+        if chave is not None:
+            meta["cache"] = {"hits": 0, "misses": 1}
+            if resposta:
+                cache.guardar(chave, resposta)
         return resposta, meta
     except Exception as e:
-        # Fallback de resposta: Se a API da OpenAI falhar, retorna uma
-        # resposta padrão para não quebrar a interface do usuário.
-        fallback = "Obrigado pelo envio. Recebi seu e-mail e vou analisar os pontos e retornar em breve."
-        meta = {"source": "fallback", "error": str(e), "fallback_response": True}
+        # Fallback de resposta: Se a API da OpenAI falhar (ou o disjuntor estiver aberto), retorna
+        # a resposta padrão do label na hora, para não quebrar a interface do usuário.
+        fallback = RESPOSTAS_PADRAO.get(label, RESPOSTA_PADRAO)
+        meta = {"source": "fallback", "error": str(e), "fallback_response": True,
+                "degradado": isinstance(e, DisjuntorAberto)}
         return fallback, meta
 
 
-def gerar_analise_geral(texto: str):
+def gerar_resposta_com_openai(texto: str, label: str = None):
+    """
+    Wrapper síncrono de gerar_resposta_com_openai_async (mesmo retorno).
+    """
+    return executar_sincrono(gerar_resposta_com_openai_async(texto, label))
+
+
+async def iterar_classificacao_e_resposta_async(mensagens, max_por_lote: int = None, max_em_voo: int = None,
+                                               max_respostas_em_voo: int = None, meta: dict = None):
+    """
+    Classifica as mensagens (iterar_classificacoes_async) e, assim que cada uma fica
+    classificada, gera a resposta dela com o próprio label, em paralelo.
+    Gera eventos na ordem em que ficam prontos:
+      ("classificacao", indice, {"label":..., "score":...})
+      ("resposta", indice, resposta_ou_None, meta_resposta)
+    Mensagens com label em LABELS_SEM_RESPOSTA (ex: 'improdutivo') não vão para a IA: resposta None.
+    Em um grupo de quase duplicatas, só a primeira mensagem de cada label tem a resposta gerada;
+    as demais reaproveitam essa resposta (com os números da própria mensagem, ver adaptar_resposta).
+    Respostas já geradas em envios anteriores (mesma mensagem, mesmo label e mesma versão) saem do acervo.
+    Se `meta` for passado, recebe "classificacao" (meta dos lotes) e "respostas" (contadores) no fim.
+    """
+    meta = meta if meta is not None else {}
+    acervo = obter_acervo()
+    versao_acervo = _versao("resposta", PROMPT_VERSAO_RESPOSTA, 0.2)
+    meta_clf = {}
+    fila = asyncio.Queue()
+    # O semáforo é adquirido antes de criar a tarefa: se as respostas atrasarem,
+    # a classificação espera em vez de acumular textos em memória.
+    semaforo = asyncio.Semaphore(max_respostas_em_voo or RESPOSTAS_EM_VOO)
+    tarefas = set()
+    contadores = {"geradas": 0, "ignoradas": 0, "fallback": 0, "reaproveitadas": 0, "acervo": 0,
+                  "cache": {"hits": 0, "misses": 0}}
+    # (grupo, label) -> futuro com (resposta, meta, texto) da primeira mensagem do grupo
+    respostas_grupo = collections.OrderedDict()
+    fim = object()
+
+    async def _responder(idx, texto, label, futuro):
+        try:
+            resposta, meta_resp = await gerar_resposta_com_openai_async(texto, label)
+        finally:
+            semaforo.release()
+        futuro.set_result((resposta, meta_resp, texto))
+        contadores["fallback" if meta_resp.get("fallback_response") else "geradas"] += 1
+        if acervo is not None and resposta and not meta_resp.get("fallback_response"):
+            acervo.registrar_resposta(texto, label, resposta, versao_acervo)
+        for k, v in (meta_resp.get("cache") or {}).items():
+            contadores["cache"][k] += v
+        await fila.put(("resposta", idx, resposta, meta_resp))
+
+    async def _reaproveitar(idx, texto, label, futuro):
+        resposta, meta_resp, texto_origem = await futuro
+        contadores["reaproveitadas"] += 1
+        meta_copia = {"source": "grupo", "origem": meta_resp.get("source")}
+        resposta = adaptar_resposta(resposta, texto_origem, texto)
+        if acervo is not None and resposta and not meta_resp.get("fallback_response"):
+            acervo.registrar_resposta(texto, label, resposta, versao_acervo)
+        await fila.put(("resposta", idx, resposta, meta_copia))
+
+    def _agendar(coro):
+        tarefa = asyncio.create_task(coro)
+        tarefas.add(tarefa)
+        tarefa.add_done_callback(tarefas.discard)
+
+    async def _classificar():
+        try:
+            async for pares in iterar_classificacoes_async(mensagens, max_por_lote, max_em_voo, meta_clf):
+                # Emite todas as classificações do lote antes de esperar vaga para as respostas
+                for idx, item, _ in pares:
+                    await fila.put(("classificacao", idx, item))
+                # Respostas guardadas no acervo: uma consulta por lote, fora do loop de eventos
+                guardadas = {}
+                if acervo is not None:
+                    pendentes = [(idx, texto, item.get("label")) for idx, item, texto in pares
+                                 if item.get("label") not in LABELS_SEM_RESPOSTA]
+                    if pendentes:
+                        achadas = await asyncio.to_thread(
+                            acervo.obter_respostas, [(texto, label) for _, texto, label in pendentes], versao_acervo
+                        )
+                        guardadas = {idx: r for (idx, _, _), r in zip(pendentes, achadas) if r is not None}
+                for idx, item, texto in pares:
+                    if item.get("label") in LABELS_SEM_RESPOSTA:
+                        contadores["ignoradas"] += 1
+                        await fila.put(("resposta", idx, None, {"source": "ignorada"}))
+                        continue
+                    chave_grupo = (item.get("grupo", idx), item.get("label"))
+                    futuro = respostas_grupo.get(chave_grupo)
+                    guardada = guardadas.get(idx)
+                    if guardada is not None:
+                        contadores["acervo"] += 1
+                        meta_resp = {"source": "acervo"}
+                        await fila.put(("resposta", idx, guardada, meta_resp))
+                        if futuro is None:
+                            # As quase duplicatas seguintes reaproveitam a resposta guardada
+                            futuro = asyncio.get_running_loop().create_future()
+                            futuro.set_result((guardada, meta_resp, texto))
+                            respostas_grupo[chave_grupo] = futuro
+                            if len(respostas_grupo) > RESPOSTAS_GRUPOS_MAX:
+                                respostas_grupo.popitem(last=False)
+                        continue
+                    if futuro is not None:
+                        _agendar(_reaproveitar(idx, texto, item.get("label"), futuro))
+                        continue
+                    futuro = asyncio.get_running_loop().create_future()
+                    respostas_grupo[chave_grupo] = futuro
+                    if len(respostas_grupo) > RESPOSTAS_GRUPOS_MAX:
+                        respostas_grupo.popitem(last=False)
+                    await semaforo.acquire()
+                    _agendar(_responder(idx, texto, item.get("label"), futuro))
+            if tarefas:
+                await asyncio.gather(*list(tarefas))
+        except Exception as e:
+            await fila.put((fim, e))
+            return
+        await fila.put((fim, None))
+
+    produtor = asyncio.create_task(_classificar())
+    try:
+        while True:
+            evento = await fila.get()
+            if evento[0] is fim:
+                if evento[1] is not None:
+                    raise evento[1]
+                break
+            if evento[0] == "resposta":
+                contar("autou_respostas_total", origem=evento[3].get("source") or "desconhecida")
+            yield evento
+        meta["classificacao"] = meta_clf
+        meta["respostas"] = contadores
+    finally:
+        produtor.cancel()
+        for tarefa in list(tarefas):
+            tarefa.cancel()
+
+
+async def gerar_respostas_async(mensagens: list, classificacoes: list, max_respostas_em_voo: int = None):
+    """
+    Gera uma resposta por mensagem, em paralelo, usando o label de cada uma.
+    Retorna (respostas, metas) alinhados com `mensagens` (None para mensagens sem resposta).
+    """
+    respostas = [None] * len(mensagens)
+    metas = [None] * len(mensagens)
+    semaforo = asyncio.Semaphore(max_respostas_em_voo or RESPOSTAS_EM_VOO)
+
+    async def _responder(idx):
+        label = (classificacoes[idx] or {}).get("label")
+        if label in LABELS_SEM_RESPOSTA:
+            metas[idx] = {"source": "ignorada"}
+            return
+        async with semaforo:
+            respostas[idx], metas[idx] = await gerar_resposta_com_openai_async(mensagens[idx], label)
+
+    await asyncio.gather(*[_responder(i) for i in range(len(mensagens))])
+    return respostas, metas
+
+
+def resumir_classificacoes(classificacoes: list) -> dict:
+    """
+    Resume várias classificações em um único {"label", "score", "contagem"}:
+    label mais frequente e score médio das mensagens com esse label.
+    """
+    contagem = {}
+    for item in classificacoes:
+        contagem[item["label"]] = contagem.get(item["label"], 0) + 1
+    if not contagem:
+        return {"label": "neutro", "score": 0.0, "contagem": {}}
+    label = max(contagem, key=contagem.get)
+    scores = [float(item.get("score") or 0.0) for item in classificacoes if item["label"] == label]
+    return {"label": label, "score": round(sum(scores) / len(scores), 2), "contagem": contagem}
+
+
+async def gerar_analise_geral_async(texto: str):
     """
     Função que recebe um texto (ou vários e-mails concatenados) e pede à IA
     um JSON com insights: { "sugestoes": [...], "temas": [...], "resumo": "..." }
@@ -431,6 +1066,20 @@ def gerar_analise_geral(texto: str):
     if not texto:
         return {}, {"source": "none"}
 
+    cache = obter_cache()
+    acervo = obter_acervo()
+    chave = None
+    if cache is not None or acervo is not None:
+        chave = chave_cache("analise", preprocessar_texto(texto), _modelo_da_tarefa("analise"), PROMPT_VERSAO_ANALISE, 0.0)
+    if cache is not None:
+        em_cache = await cache.obter_async(chave)
+        if em_cache is not None:
+            return em_cache, {"source": "cache", "cache": {"hits": 1, "misses": 0}}
+    if acervo is not None:
+        guardada = await asyncio.to_thread(acervo.obter_parcial, chave)
+        if guardada is not None:
+            return guardada, {"source": "acervo"}
+
     system = "Você é um assistente que analisa múltiplos e-mails e fornece um JSON com insights."
     user = (
     # O prompt exige um JSON EXCLUSIVO para facilitar o parse no backend
@@ -447,27 +1096,29 @@ def gerar_analise_geral(texto: str):
     " • NÃO devolva listas vazias.\n"
     " • NÃO adicione textos fora do JSON.\n"
     " • NÃO inclua explicações, justificativas ou observações.\n"
-    " • Se identificar muitos temas semelhantes, agrupe-os e escolha apenas os mais relevantes.\n\n"
+    " • Se identificar muitos temas semelhantes, agrupe-os e escolha apenas os mais relevantes.\n"
+    " • Um e-mail precedido de \"[N mensagens semelhantes]\" representa N e-mails quase iguais: pese-o por N.\n\n"
     "Conteúdo para análise:\n" + texto + "\n\n"
     "Retorne SOMENTE o JSON final, nada além disso."
     )
 
-    conteudo, data = _call_openai_system_user(system, user, max_tokens=1000, temperature=0.0)
+    conteudo, data = await _call_openai_system_user_async(system, user, max_tokens=1000, temperature=0.0,
+                                                          formato=FORMATO_ANALISE, tarefa="analise")
 
-    try:
-        # Tenta parsear o JSON
-        analise_json = json.loads(conteudo)
-    except json.JSONDecodeError:
-        # Fallback: Se a IA adicionou texto extra, tenta encontrar o JSON
-        start = conteudo.find("{")
-        end = conteudo.rfind("}")
-        if start != -1 and end != -1:
-            try:
-                analise_json = json.loads(conteudo[start:end+1])
-            except Exception as e:
-                raise ValueError("Resposta da IA não era JSON válido e não pôde ser recuperada.")
-        else:
-            raise ValueError("Resposta da IA não continha JSON válido.")
-
-    meta = {"source": "openai", "raw": conteudo, "usage": data.get("usage")}
-    return analise_json, meta
\ No newline at end of file
+    # Lança ContratoInvalido (ValueError) se a resposta não for a análise esperada
+    analise_json = interpretar_analise(conteudo)
+
+    meta = {"source": "openai", "provedor": data.get("provedor"), "raw": conteudo, "usage": data.get("usage")}
+    if cache is not None:
+        cache.guardar(chave, analise_json)
+        meta["cache"] = {"hits": 0, "misses": 1}
+    if acervo is not None:
+        acervo.guardar_parcial(chave, analise_json)
+    return analise_json, meta
+
+
+def gerar_analise_geral(texto: str):
+    """
+    Wrapper síncrono de gerar_analise_geral_async (mesmo retorno).
+    """
+    return executar_sincrono(gerar_analise_geral_async(texto))
@@ -0,0 +1,106 @@
+import re
+
+# Normalização de texto em uma passada, com o mesmo resultado das regras originais de
+# preprocessar_texto:
+#   1) "\r" -> "\n"
+#   2) caracteres fora do conjunto permitido -> " "
+#   3) [ \t]+ -> " "
+#   4) \n{3,} -> "\n\n"
+#   5) strip()
+# Como todo caractere proibido vira espaço e espaços/tabs seguidos viram um só, cada
+# sequência de "espaço, tab ou proibido" vira " "; e cada sequência de \r/\n vira
+# "\n\n" (3+) ou o mesmo número de "\n". As regras 1-4 cabem em uma única regex, que
+# só casa onde algo muda: o espaço simples entre palavras e "\n"/"\n\n" não geram
+# substituição. Todas as alternativas começam por uma classe de caracteres, o que
+# permite ao motor de regex pular direto para os candidatos.
+
+# Espaços Unicode que o \s do conjunto permitido original aceita (todos estão abaixo de U+3001)
+_ESPACOS_UNICODE = "".join(chr(c) for c in range(0x3001) if chr(c).isspace() and chr(c) not in " \t\r\n")
+
+# Permitidos que não entram nas sequências de espaço nem de quebra de linha
+_PERMITIDOS = (
+    "\\x00-\\x08\\x0b\\x0c\\x0e-\\x1f\\x21-\\x7f\\u00c0-\\u017f\\u00aa\\u00ba\\u2014"
+    + "".join("\\u%04x" % ord(c) for c in _ESPACOS_UNICODE if ord(c) > 0x7f)
+)
+# Qualquer caractere de uma sequência de espaço ("espaço", tab ou proibido)
+_ESPACO = "[^\\r\\n" + _PERMITIDOS + "]"
+# Idem, exceto o espaço simples (tab ou proibido)
+_ESPACO_NAO_SIMPLES = "[^ \\r\\n" + _PERMITIDOS + "]"
+
+_RE_NORMALIZAR = re.compile(
+    _ESPACO_NAO_SIMPLES + _ESPACO + "*"   # sequência com tab/proibido no início
+    + "| " + _ESPACO + "+"               # 2+ caracteres começando por espaço
+    + "|[\\r\\n]{3,}"                    # 3+ quebras de linha
+    + "|\\r[\\r\\n]?|\\n\\r"             # 1-2 quebras com \r
+)
+# Caracteres que podem continuar uma sequência no próximo pedaço
+_RE_CONTINUA = re.compile("[\\r\\n]|" + _ESPACO)
+
+
+def _substituir(m) -> str:
+    trecho = m.group()
+    if trecho[0] in "\r\n":
+        return "\n\n" if len(trecho) >= 3 else "\n" * len(trecho)
+    return " "
+
+
+def _compactar(m) -> str:
+    # Versão "sem perda" para sequências que ainda podem continuar: 3+ quebras ficam 3
+    trecho = m.group()
+    if trecho[0] in "\r\n":
+        return "\n\n\n" if len(trecho) >= 3 else trecho
+    return " "
+
+
+def normalizar_texto(texto: str) -> str:
+    """Normaliza um texto inteiro (mesmo resultado de preprocessar_texto)."""
+    if not texto:
+        return ""
+    return _RE_NORMALIZAR.sub(_substituir, texto).strip()
+
+
+def iterar_normalizado(pedacos):
+    """
+    Normaliza um texto recebido em pedaços (iterável de str) e gera o resultado
+    também em pedaços; a concatenação é idêntica a normalizar_texto(texto_inteiro).
+    Sequências de espaço/quebras de linha no fim de um pedaço ficam retidas até o
+    próximo, para as regras funcionarem na fronteira; o strip das pontas também é
+    feito no fluxo (espaços finais só saem se vier texto depois).
+    """
+    resto = ""
+    inicio = True
+    espera = ""
+    for pedaco in pedacos:
+        if not pedaco:
+            continue
+        texto = resto + pedaco
+        corte = len(texto)
+        while corte > 0 and _RE_CONTINUA.match(texto, corte - 1):
+            corte -= 1
+        resto = texto[corte:]
+        if len(resto) > 4096:
+            # Sequência longa só de espaços/quebras: compacta sem mudar o resultado final
+            resto = _RE_NORMALIZAR.sub(_compactar, resto)
+        saida = _RE_NORMALIZAR.sub(_substituir, texto[:corte])
+        if not saida:
+            continue
+        if inicio:
+            saida = saida.lstrip()
+            if not saida:
+                continue
+            inicio = False
+        sem_final = saida.rstrip()
+        if sem_final:
+            yield espera + sem_final
+            espera = saida[len(sem_final):]
+        else:
+            espera += saida
+    # O que sobra em `resto`/`espera` é só espaço e quebra de linha: cai no strip final
+
+
+def normalizar_em_pedacos(texto: str, tamanho: int = 1 << 20):
+    """
+    Gera o texto normalizado em pedaços de ~`tamanho` caracteres de entrada, sem
+    criar cópias do texto inteiro a cada regra (útil para textos de centenas de MB).
+    """
+    return iterar_normalizado(texto[i:i + tamanho] for i in range(0, len(texto), tamanho))
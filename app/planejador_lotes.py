@@ -0,0 +1,126 @@
+import os
+import re
+
+from app.tokens import estimar_tokens, caracteres_para_tokens, CalibradorTokens
+
+# Orçamento de tokens de entrada (mensagens) por lote de classificação
+LOTE_ORCAMENTO_TOKENS = int(os.getenv("LOTE_ORCAMENTO_TOKENS", "6000"))
+# Máximo de mensagens por lote (a saída cresce com o número de itens)
+LOTE_MAX_MENSAGENS = int(os.getenv("LOTE_MAX_MENSAGENS", "50"))
+# Tokens por mensagem depois de remover citações/assinatura (o excedente é cortado)
+LOTE_MAX_TOKENS_MENSAGEM = int(os.getenv("LOTE_MAX_TOKENS_MENSAGEM", "1000"))
+# max_tokens da resposta: tokens por item do array + margem fixa
+LOTE_TOKENS_POR_ITEM = int(os.getenv("LOTE_TOKENS_POR_ITEM", "20"))
+LOTE_TOKENS_MARGEM = int(os.getenv("LOTE_TOKENS_MARGEM", "32"))
+
+# Início do histórico citado em respostas: "Em <data>, <fulano> escreveu:" (às vezes
+# quebrado em duas linhas), "-----Original Message-----" e o cabeçalho do Outlook.
+_RE_HISTORICO = re.compile(
+    r"^(?:Em|On)\s[^\n]{0,300}(?:\n[^\n]{0,120})?\b(?:escreveu|wrote)\s*:"
+    r"|^-{2,}\s*(?:Mensagem original|Original Message)\s*-{2,}"
+    r"|^(?:De|From):[^\n]*\n(?:[^\n]*\n){0,2}?(?:Enviad[oa](?: em)?|Sent|Data|Date):",
+    re.MULTILINE | re.IGNORECASE,
+)
+# Linhas citadas com ">"
+_RE_LINHA_CITADA = re.compile(r"^[ \t]*>[^\n]*(?:\n|$)", re.MULTILINE)
+# Início da assinatura: delimitador "-- " e rodapés de celular cortam a partir da linha;
+# fechos ("Atenciosamente,") cortam o que vem depois deles (nome, cargo, telefone...).
+_RE_ASSINATURA = re.compile(
+    r"^(?:--[ \t]*$|(?:Enviado do meu|Enviado de meu|Sent from my)\b)",
+    re.MULTILINE | re.IGNORECASE,
+)
+_RE_FECHO = re.compile(
+    r"^[ \t]*(?:atenciosamente|att\.?|at\.te|abraços?|abs\.?|cordialmente|saudações|"
+    r"grat[oa]|obrigad[oa]|regards|best regards|kind regards|best|cheers|thanks)[ \t]*[,.!]?[ \t]*$",
+    re.MULTILINE | re.IGNORECASE,
+)
+# Calibração compartilhada pelos lotes de todas as requisições do processo
+_calibrador = CalibradorTokens()
+
+# Assinatura só é procurada no fim da mensagem, e o trecho depois do fecho tem de ser curto
+_JANELA_ASSINATURA = 600
+_MAX_ASSINATURA = 300
+_MAX_LINHAS_ASSINATURA = 6
+
+
+def reduzir_mensagem(texto: str, max_tokens: int = None) -> str:
+    """
+    Versão da mensagem enviada à IA na classificação: sem histórico citado, sem
+    linhas com ">" e sem assinatura, cortada em `max_tokens` (LOTE_MAX_TOKENS_MENSAGEM).
+    Se a limpeza apagar tudo, usa o texto original (só com o corte de tamanho).
+    """
+    if not texto:
+        return ""
+    reduzido = texto
+    m = _RE_HISTORICO.search(reduzido)
+    if m:
+        reduzido = reduzido[:m.start()]
+    if ">" in reduzido:
+        reduzido = _RE_LINHA_CITADA.sub("", reduzido)
+    inicio_janela = max(0, len(reduzido) - _JANELA_ASSINATURA)
+    m = _RE_ASSINATURA.search(reduzido, inicio_janela)
+    if m:
+        reduzido = reduzido[:m.start()]
+    for fecho in _RE_FECHO.finditer(reduzido, max(0, len(reduzido) - _JANELA_ASSINATURA)):
+        # Só é assinatura se o que vem depois do fecho for curto (nome, cargo, contato)
+        resto = reduzido[fecho.end():]
+        if len(resto) <= _MAX_ASSINATURA and resto.count("\n") <= _MAX_LINHAS_ASSINATURA:
+            reduzido = reduzido[:fecho.end()]
+            break
+    reduzido = reduzido.strip()
+    if not reduzido:
+        reduzido = texto
+
+    limite = caracteres_para_tokens(max_tokens or LOTE_MAX_TOKENS_MENSAGEM)
+    if len(reduzido) > limite:
+        corte = reduzido.rfind(" ", limite // 2, limite)
+        reduzido = reduzido[:corte if corte != -1 else limite].rstrip()
+    return reduzido
+
+
+def max_tokens_saida(itens: int) -> int:
+    """max_tokens da resposta de um lote com `itens` mensagens (um objeto curto por item)."""
+    return LOTE_TOKENS_POR_ITEM * max(1, itens) + LOTE_TOKENS_MARGEM
+
+
+class PlanejadorLotes:
+    """
+    Monta os lotes de classificação pelo tamanho estimado em tokens: cada lote recebe
+    mensagens até LOTE_ORCAMENTO_TOKENS ou LOTE_MAX_MENSAGENS, o que vier primeiro.
+    Mensagens curtas rendem lotes grandes (menos requisições) e mensagens longas não
+    estouram o contexto nem a resposta.
+    """
+
+    def __init__(self, orcamento_tokens: int = None, max_itens: int = None, calibrador: CalibradorTokens = None):
+        self.orcamento_tokens = orcamento_tokens or LOTE_ORCAMENTO_TOKENS
+        self.max_itens = max(1, max_itens or LOTE_MAX_MENSAGENS)
+        self.calibrador = calibrador or _calibrador
+        self.itens = []
+        self.tokens = 0
+
+    def estimar(self, texto: str) -> int:
+        return self.calibrador.estimar(texto)
+
+    def adicionar(self, item, tokens: int):
+        """
+        Acrescenta `item` (com `tokens` estimados) ao lote em montagem.
+        Se ele não couber, devolve o lote anterior já fechado; senão devolve None.
+        """
+        fechado = None
+        if self.itens and (self.tokens + tokens > self.orcamento_tokens or len(self.itens) >= self.max_itens):
+            fechado = self.fechar()
+        self.itens.append(item)
+        self.tokens += tokens
+        return fechado
+
+    def fechar(self) -> list:
+        """Fecha e devolve o lote em montagem (lista vazia se não houver nada)."""
+        itens = self.itens
+        self.itens = []
+        self.tokens = 0
+        return itens
+
+    def registrar_uso(self, texto_enviado: str, usage) -> None:
+        """Calibra a estimativa com usage.prompt_tokens de uma chamada já feita."""
+        if isinstance(usage, dict):
+            self.calibrador.registrar(estimar_tokens(texto_enviado), usage.get("prompt_tokens"))
@@ -0,0 +1,196 @@
+import os
+import json
+
+from dotenv import load_dotenv
+
+from app.llm_client import novo_cliente, LLM_MAX_CONCORRENCIA, LLM_TIMEOUT
+from app.resiliencia import ChamadorResiliente, Disjuntor, ABERTO, FECHADO, MEIO_ABERTO
+from app.metricas import obter_registro
+
+load_dotenv()
+
+# Sem arquivo de provedores, tudo vai para um único provedor "openai" (OPENAI_URL / OPENAI_MODEL)
+OPENAI_URL = os.getenv("OPENAI_URL", "https://api.openai.com/v1/chat/completions")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+# Preços do modelo padrão (US$ por 1 milhão de tokens), usados no roteamento e em /metrics
+OPENAI_PRECO_ENTRADA = float(os.getenv("OPENAI_PRECO_ENTRADA", "0.15"))
+OPENAI_PRECO_SAIDA = float(os.getenv("OPENAI_PRECO_SAIDA", "0.6"))
+# Arquivo JSON com os provedores e as rotas por tarefa (ver app/provedores_exemplo.json)
+LLM_PROVEDORES_PATH = os.getenv("LLM_PROVEDORES_PATH")
+# Quanto vale (em US$) cada segundo de espera na escolha do provedor: 0 = só o custo conta
+LLM_ROTEADOR_PESO_LATENCIA = float(os.getenv("LLM_ROTEADOR_PESO_LATENCIA", "0.0005"))
+# Latência presumida de um provedor ainda sem chamadas (s)
+_LATENCIA_INICIAL = 1.0
+# Peso da última chamada na média móvel de latência
+_PESO_LATENCIA = 0.2
+
+
+class Provedor:
+    """
+    Um backend de chat completions compatível com a API da OpenAI: a própria OpenAI ou um
+    servidor local (llama.cpp, vLLM, Ollama...). Cada provedor tem pool HTTP, limite de
+    concorrência, timeout e disjuntor próprios; provedores locais não passam pelo limite
+    de taxa da conta (LLM_LIMITE_RPM/TPM).
+    """
+
+    def __init__(self, nome: str, url: str, modelo: str, chave_env: str = None, local: bool = False,
+                 max_concorrencia: int = LLM_MAX_CONCORRENCIA, timeout: float = LLM_TIMEOUT,
+                 preco_entrada: float = 0.0, preco_saida: float = 0.0, max_tokens_entrada: int = None,
+                 saida_estruturada: bool = True):
+        self.nome = nome
+        self.url = url
+        self.modelo = modelo
+        self.chave_env = chave_env
+        self.local = local
+        self.max_concorrencia = max(1, max_concorrencia)
+        self.preco_entrada = preco_entrada
+        self.preco_saida = preco_saida
+        self.max_tokens_entrada = max_tokens_entrada
+        # Desligada sozinha se o servidor recusar o response_format
+        self.saida_estruturada = saida_estruturada
+        self.cliente = novo_cliente(max_concorrencia=self.max_concorrencia, timeout=timeout,
+                                    limitar_taxa=not local)
+        self.chamador = ChamadorResiliente(Disjuntor(nome))
+        self.em_uso = 0
+        self.latencia = None
+
+    @property
+    def chave(self):
+        return os.getenv(self.chave_env) if self.chave_env else None
+
+    def disponivel(self) -> bool:
+        # Sem a chave configurada (ou com o disjuntor aberto), o provedor fica fora da rota
+        if self.chave_env and not self.chave:
+            return False
+        return self.chamador.disjuntor.disponivel()
+
+    def cabecalhos(self) -> dict:
+        chave = self.chave
+        return {"Authorization": f"Bearer {chave}"} if chave else {}
+
+    def custo(self, tokens_entrada: int, tokens_saida: int) -> float:
+        """Custo (US$) de uma chamada com esses tokens."""
+        return (tokens_entrada * self.preco_entrada + tokens_saida * self.preco_saida) / 1_000_000
+
+    def latencia_esperada(self) -> float:
+        # Latência média, multiplicada pela fila: com todas as vagas ocupadas, a chamada espera uma rodada
+        base = self.latencia if self.latencia is not None else _LATENCIA_INICIAL
+        return base * (1 + self.em_uso // self.max_concorrencia)
+
+    def registrar_latencia(self, segundos: float):
+        if self.latencia is None:
+            self.latencia = segundos
+        else:
+            self.latencia += _PESO_LATENCIA * (segundos - self.latencia)
+
+
+class Roteador:
+    """
+    Escolhe o provedor de cada chamada entre os candidatos da tarefa (rotas), pelo menor
+    custo estimado + LLM_ROTEADOR_PESO_LATENCIA × latência esperada (que cresce quando o
+    provedor está com as vagas ocupadas). Assim o caminho barato e rápido atende a maior
+    parte do tráfego e o excedente transborda para o próximo. Provedores sem chave, com o
+    disjuntor aberto ou com contexto menor que o prompt ficam de fora; a lista devolvida
+    é a ordem de tentativa (o seguinte é usado se o primeiro falhar).
+    """
+
+    def __init__(self, provedores: dict, rotas: dict = None):
+        if not provedores:
+            raise ValueError("Nenhum provedor de IA configurado.")
+        self.provedores = provedores
+        self.rotas = {}
+        for tarefa, nomes in (rotas or {}).items():
+            desconhecidos = [n for n in nomes if n not in provedores]
+            if desconhecidos:
+                raise ValueError(f"Rota '{tarefa}' usa provedores inexistentes: {desconhecidos}")
+            self.rotas[tarefa] = list(nomes)
+
+    def candidatos(self, tarefa: str) -> list:
+        nomes = self.rotas.get(tarefa) or self.rotas.get("padrao") or list(self.provedores)
+        return [self.provedores[n] for n in nomes]
+
+    def ordenar(self, tarefa: str, tokens_entrada: int, tokens_saida: int) -> list:
+        """Provedores da tarefa na ordem de tentativa."""
+        candidatos = [
+            p for p in self.candidatos(tarefa)
+            if p.disponivel() and (not p.max_tokens_entrada or tokens_entrada <= p.max_tokens_entrada)
+        ]
+
+        def _pontuacao(provedor):
+            return provedor.custo(tokens_entrada, tokens_saida) + LLM_ROTEADOR_PESO_LATENCIA * provedor.latencia_esperada()
+
+        return sorted(candidatos, key=_pontuacao)
+
+    def assinatura(self, tarefa: str) -> str:
+        """Modelos da rota da tarefa (entra na chave do cache: mudar a rota não reaproveita resultados)."""
+        return "+".join(p.modelo for p in self.candidatos(tarefa))
+
+    def situacao(self) -> dict:
+        """
+        Estado dos disjuntores para o meta das respostas. Com um provedor, o dele; com vários,
+        "aberto" só quando todos estão abertos (modo degradado) e o detalhe por provedor.
+        """
+        por_provedor = {nome: p.chamador.disjuntor.situacao() for nome, p in self.provedores.items()}
+        if len(por_provedor) == 1:
+            return next(iter(por_provedor.values()))
+        estados = [s["estado"] for s in por_provedor.values()]
+        if all(e == ABERTO for e in estados):
+            estado = ABERTO
+        elif FECHADO in estados:
+            estado = FECHADO
+        else:
+            estado = MEIO_ABERTO
+        situacao = {"estado": estado, "provedores": por_provedor}
+        if estado == ABERTO:
+            situacao["tentar_em_s"] = min(s["tentar_em_s"] for s in por_provedor.values())
+        return situacao
+
+
+def _provedor_padrao() -> Provedor:
+    return Provedor("openai", OPENAI_URL, OPENAI_MODEL, chave_env="OPENAI_API_KEY",
+                    preco_entrada=OPENAI_PRECO_ENTRADA, preco_saida=OPENAI_PRECO_SAIDA)
+
+
+def carregar_roteador(caminho: str = LLM_PROVEDORES_PATH) -> Roteador:
+    """
+    Monta o roteador a partir do arquivo JSON:
+      {"provedores": {"nome": {"url", "modelo", "chave_env", "local", "max_concorrencia", "timeout",
+                               "preco_entrada", "preco_saida", "max_tokens_entrada", "saida_estruturada"}},
+       "rotas": {"classificacao": ["nome", ...], "resposta": [...], "analise": [...], "padrao": [...]}}
+    Sem arquivo, usa só o provedor "openai" (OPENAI_URL / OPENAI_MODEL / OPENAI_API_KEY).
+    """
+    if not caminho:
+        return Roteador({"openai": _provedor_padrao()})
+    with open(caminho, encoding="utf-8") as f:
+        config = json.load(f)
+    provedores = {nome: Provedor(nome, **opcoes) for nome, opcoes in (config.get("provedores") or {}).items()}
+    return Roteador(provedores, config.get("rotas"))
+
+
+_roteador = None
+
+
+def obter_roteador() -> Roteador:
+    # Instância única por processo (provedores, disjuntores e latências compartilhados pelas requisições)
+    global _roteador
+    if _roteador is None:
+        _roteador = carregar_roteador()
+    return _roteador
+
+
+def situacao_disjuntor() -> dict:
+    return obter_roteador().situacao()
+
+
+def _coletar_metricas():
+    # Estado atual do disjuntor de cada provedor para o /metrics (1 no estado em que está)
+    if _roteador is None:
+        return []
+    return [
+        ("autou_llm_disjuntor_estado", {"provedor": nome, "estado": e}, int(e == p.chamador.disjuntor.estado))
+        for nome, p in _roteador.provedores.items()
+        for e in (FECHADO, ABERTO, MEIO_ABERTO)
+    ]
+
+
+obter_registro().registrar_coletor(_coletar_metricas)
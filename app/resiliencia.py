@@ -0,0 +1,276 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import collections
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from app.lotes import eh_sobrecarga
+from app.metricas import contar
+
+# Tentativas por chamada quando a IA responde 429/5xx ou não responde (timeout/conexão).
+# Os nomes antigos (LOTE_*) continuam valendo como padrão.
+LLM_MAX_TENTATIVAS = max(1, int(os.getenv("LLM_MAX_TENTATIVAS", os.getenv("LOTE_MAX_TENTATIVAS", "3"))))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", os.getenv("LOTE_BACKOFF_BASE", "0.5")))
+# Teto (s) de cada espera entre tentativas, inclusive quando o Retry-After pede mais
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+# Hedging: se a chamada passar do percentil LLM_HEDGE_PERCENTIL das latências recentes (da mesma
+# etapa), uma cópia é enviada e vale a que responder primeiro
+LLM_HEDGE_ATIVO = os.getenv("LLM_HEDGE_ATIVO", "1") == "1"
+LLM_HEDGE_PERCENTIL = float(os.getenv("LLM_HEDGE_PERCENTIL", "0.95"))
+LLM_HEDGE_MIN_S = float(os.getenv("LLM_HEDGE_MIN_S", "1.0"))
+# Fração máxima das chamadas que podem ganhar uma cópia (limita o custo extra)
+LLM_HEDGE_FRACAO = float(os.getenv("LLM_HEDGE_FRACAO", "0.1"))
+# Latências guardadas por etapa e mínimo de amostras antes de começar a duplicar
+_HEDGE_AMOSTRAS = 200
+_HEDGE_MIN_AMOSTRAS = 20
+
+# Disjuntor: abre com LLM_DISJUNTOR_FALHAS falhas seguidas ou com a taxa de falhas das últimas
+# LLM_DISJUNTOR_JANELA chamadas acima de LLM_DISJUNTOR_TAXA; fica aberto LLM_DISJUNTOR_ABERTO_S
+LLM_DISJUNTOR_FALHAS = int(os.getenv("LLM_DISJUNTOR_FALHAS", "5"))
+LLM_DISJUNTOR_TAXA = float(os.getenv("LLM_DISJUNTOR_TAXA", "0.5"))
+LLM_DISJUNTOR_JANELA = int(os.getenv("LLM_DISJUNTOR_JANELA", "20"))
+LLM_DISJUNTOR_ABERTO_S = float(os.getenv("LLM_DISJUNTOR_ABERTO_S", "30"))
+
+FECHADO = "fechado"
+ABERTO = "aberto"
+MEIO_ABERTO = "meio_aberto"
+
+
+class DisjuntorAberto(RuntimeError):
+    """A IA está fora (disjuntor aberto): a chamada nem é enviada."""
+
+    def __init__(self, tentar_em: float):
+        super().__init__(f"IA indisponível (disjuntor aberto); nova tentativa em {tentar_em:.0f}s.")
+        self.tentar_em = tentar_em
+
+
+def falha_do_provedor(exc: Exception) -> bool:
+    """
+    Erros que indicam a IA degradada (5xx, timeout, conexão) e contam para o disjuntor.
+    429 fica de fora: é limite de taxa (tratado com espera), não indisponibilidade.
+    """
+    if isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 429:
+        return False
+    return eh_sobrecarga(exc)
+
+
+class Disjuntor:
+    """
+    Circuit breaker das chamadas a um provedor de IA (por processo):
+      - fechado: as chamadas passam; falhas do provedor são contadas;
+      - aberto: as chamadas falham na hora com DisjuntorAberto (quem chama cai na heurística
+        ou na resposta padrão, sem esperar timeouts);
+      - meio_aberto: passado o tempo de abertura, uma chamada de teste passa por vez;
+        se der certo o disjuntor fecha, se falhar volta a abrir.
+    """
+
+    def __init__(self, nome: str = "openai", falhas_seguidas: int = LLM_DISJUNTOR_FALHAS, taxa: float = LLM_DISJUNTOR_TAXA,
+                 janela: int = LLM_DISJUNTOR_JANELA, aberto_s: float = LLM_DISJUNTOR_ABERTO_S):
+        self.nome = nome
+        self.falhas_seguidas = max(1, falhas_seguidas)
+        self.taxa = taxa
+        self.janela = max(1, janela)
+        self.aberto_s = aberto_s
+        self.estado = FECHADO
+        self._resultados = collections.deque(maxlen=self.janela)
+        self._seguidas = 0
+        self._aberto_ate = 0.0
+        self._sondando = False
+        self._lock = threading.Lock()
+
+    def permitir(self) -> bool:
+        """True se a chamada pode ser enviada (em meio_aberto, só uma por vez)."""
+        with self._lock:
+            if self.estado == ABERTO:
+                if time.monotonic() < self._aberto_ate:
+                    return False
+                self._mudar(MEIO_ABERTO)
+            if self.estado == MEIO_ABERTO:
+                if self._sondando:
+                    return False
+                self._sondando = True
+            return True
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self._resultados.append(True)
+            self._seguidas = 0
+            if self.estado == MEIO_ABERTO:
+                self._sondando = False
+                self._resultados.clear()
+                self._mudar(FECHADO)
+
+    def registrar_falha(self):
+        with self._lock:
+            self._resultados.append(False)
+            self._seguidas += 1
+            if self.estado == MEIO_ABERTO:
+                self._sondando = False
+                self._abrir()
+                return
+            if self.estado != FECHADO:
+                return
+            falhas = self._resultados.count(False)
+            if self._seguidas >= self.falhas_seguidas or (
+                len(self._resultados) >= self.janela and falhas / len(self._resultados) >= self.taxa
+            ):
+                self._abrir()
+
+    def liberar_sonda(self):
+        # A chamada de teste terminou sem dizer nada sobre a IA (ex: erro 400 ou cancelamento)
+        with self._lock:
+            self._sondando = False
+
+    def disponivel(self) -> bool:
+        # Sem mudar o estado (permitir() é que reserva a chamada de teste do meio_aberto)
+        return self.estado != ABERTO or self.tentar_em() == 0
+
+    def tentar_em(self) -> float:
+        return max(0.0, self._aberto_ate - time.monotonic())
+
+    def situacao(self) -> dict:
+        """Estado para o meta das respostas: {"estado", "falhas_recentes", "tentar_em_s"}."""
+        with self._lock:
+            situacao = {"estado": self.estado, "falhas_recentes": self._resultados.count(False)}
+            if self.estado == ABERTO:
+                situacao["tentar_em_s"] = round(self.tentar_em(), 1)
+            return situacao
+
+    def _abrir(self):
+        self._aberto_ate = time.monotonic() + self.aberto_s
+        self._mudar(ABERTO)
+
+    def _mudar(self, estado: str):
+        if estado != self.estado:
+            self.estado = estado
+            contar("autou_llm_disjuntor_transicoes_total", provedor=self.nome, estado=estado)
+
+
+class LatenciasRecentes:
+    """Latências das últimas chamadas bem-sucedidas por etapa, para decidir quando duplicar (hedge)."""
+
+    def __init__(self, amostras: int = _HEDGE_AMOSTRAS):
+        self._por_etapa = collections.defaultdict(lambda: collections.deque(maxlen=amostras))
+
+    def registrar(self, etapa: str, segundos: float):
+        self._por_etapa[etapa].append(segundos)
+
+    def limite_hedge(self, etapa: str):
+        """Segundos após os quais a chamada ganha uma cópia (None se ainda não há amostras)."""
+        latencias = self._por_etapa.get(etapa)
+        if not latencias or len(latencias) < _HEDGE_MIN_AMOSTRAS:
+            return None
+        ordenadas = sorted(latencias)
+        percentil = ordenadas[min(len(ordenadas) - 1, int(LLM_HEDGE_PERCENTIL * len(ordenadas)))]
+        return max(LLM_HEDGE_MIN_S, percentil)
+
+
+def _retry_after(exc: Exception):
+    # Retry-After em segundos ou data HTTP (None se ausente ou inválido)
+    if not isinstance(exc, httpx.HTTPStatusError):
+        return None
+    valor = exc.response.headers.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def espera_retentativa(tentativa: int, exc: Exception = None) -> float:
+    """Backoff exponencial com jitter; o Retry-After do provedor, se houver, é o mínimo."""
+    espera = random.uniform(0.5, 1.0) * LLM_BACKOFF_BASE * (2 ** tentativa)
+    pedido = _retry_after(exc)
+    if pedido is not None:
+        espera = max(espera, pedido)
+    return min(espera, LLM_BACKOFF_MAX)
+
+
+class ChamadorResiliente:
+    """
+    Envolve as chamadas a um provedor de IA com retentativas (backoff exponencial
+    respeitando o Retry-After), hedging contra a cauda de latência e o disjuntor.
+    """
+
+    def __init__(self, disjuntor: Disjuntor = None):
+        self.disjuntor = disjuntor or Disjuntor()
+        self.latencias = LatenciasRecentes()
+        self.chamadas = 0
+        self.hedges = 0
+
+    async def chamar(self, enviar, etapa: str = "outra", ao_sobrecarregar=None):
+        """
+        Executa `enviar()` (fábrica de corrotinas: cada chamada é uma requisição nova).
+        `ao_sobrecarregar()` é avisado a cada 429/5xx/timeout (ex: LimiteAdaptativo dos lotes).
+        Lança DisjuntorAberto se a IA estiver fora, ou o último erro após as tentativas.
+        """
+        for tentativa in range(LLM_MAX_TENTATIVAS):
+            if not self.disjuntor.permitir():
+                contar("autou_llm_chamadas_total", etapa=etapa, resultado="disjuntor_aberto")
+                raise DisjuntorAberto(self.disjuntor.tentar_em())
+            sonda = self.disjuntor.estado == MEIO_ABERTO
+            try:
+                return await self._enviar_com_hedge(enviar, etapa, permitir_hedge=not sonda)
+            except Exception as e:
+                if not eh_sobrecarga(e):
+                    raise
+                if ao_sobrecarregar is not None:
+                    ao_sobrecarregar()
+                if tentativa == LLM_MAX_TENTATIVAS - 1:
+                    raise
+                contar("autou_llm_retentativas_total")
+                await asyncio.sleep(espera_retentativa(tentativa, e))
+            finally:
+                if sonda:
+                    self.disjuntor.liberar_sonda()
+
+    async def _enviar_registrando(self, enviar, etapa: str):
+        inicio = time.monotonic()
+        try:
+            resultado = await enviar()
+        except Exception as e:
+            if falha_do_provedor(e):
+                self.disjuntor.registrar_falha()
+            raise
+        self.disjuntor.registrar_sucesso()
+        self.latencias.registrar(etapa, time.monotonic() - inicio)
+        return resultado
+
+    async def _enviar_com_hedge(self, enviar, etapa: str, permitir_hedge: bool = True):
+        self.chamadas += 1
+        limite = self.latencias.limite_hedge(etapa) if LLM_HEDGE_ATIVO and permitir_hedge else None
+        if limite is None:
+            return await self._enviar_registrando(enviar, etapa)
+
+        original = asyncio.ensure_future(self._enviar_registrando(enviar, etapa))
+        pendentes = {original}
+        try:
+            feitas, _ = await asyncio.wait(pendentes, timeout=limite)
+            if feitas or self.hedges >= LLM_HEDGE_FRACAO * self.chamadas:
+                return await original
+            # A chamada passou do percentil: envia uma cópia e fica com a primeira que responder
+            self.hedges += 1
+            copia = asyncio.ensure_future(self._enviar_registrando(enviar, etapa))
+            pendentes.add(copia)
+            erro = None
+            while pendentes:
+                feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for tarefa in feitas:
+                    if tarefa.exception() is None:
+                        contar("autou_llm_hedges_total", vencedora="copia" if tarefa is copia else "original")
+                        return tarefa.result()
+                    erro = tarefa.exception()
+            raise erro
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
@@ -0,0 +1,59 @@
+"""
+Sobe a API com vários processos (workers do uvicorn) coordenados entre si:
+  - workers: um por CPU disponível (SERVIDOR_WORKERS / --workers para fixar);
+  - cache de resultados em disco compartilhado (CACHE_DB_PATH; padrão cache/resultados.db),
+    então o que um worker já classificou serve para os outros;
+  - limite de taxa da IA compartilhado (LLM_LIMITE_RPM / LLM_LIMITE_TPM, ver app/limite_taxa.py):
+    o limite da conta vale para a soma dos workers, não para cada um;
+  - pool de extração de PDF dividido entre os workers (PDF_PROCESSOS = CPUs / workers).
+Variáveis já definidas no ambiente têm precedência.
+
+Uso:
+    python -m app.servidor
+    python -m app.servidor --workers 4 --porta 8000
+"""
+import os
+import argparse
+
+import uvicorn
+
+SERVIDOR_WORKERS = int(os.getenv("SERVIDOR_WORKERS", "0"))
+SERVIDOR_HOST = os.getenv("SERVIDOR_HOST", "0.0.0.0")
+SERVIDOR_PORTA = int(os.getenv("SERVIDOR_PORTA", os.getenv("PORT", "8000")))
+
+
+def cpus_disponiveis() -> int:
+    # Respeita o affinity/cgroup do processo (ex: contêiner limitado a 2 CPUs) quando o SO informa
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def preparar_ambiente(workers: int):
+    """Padrões do modo multi-processo, aplicados antes de os workers importarem app.main."""
+    cpus = cpus_disponiveis()
+    os.environ.setdefault("CACHE_DB_PATH", os.path.join("cache", "resultados.db"))
+    if os.environ["CACHE_DB_PATH"]:
+        os.makedirs(os.path.dirname(os.environ["CACHE_DB_PATH"]) or ".", exist_ok=True)
+    os.environ.setdefault("PDF_PROCESSOS", str(max(1, cpus // workers)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sobe a API com vários workers coordenados")
+    parser.add_argument("--workers", type=int, default=SERVIDOR_WORKERS, help="0 = um por CPU")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--porta", type=int, default=SERVIDOR_PORTA)
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    workers = args.workers if args.workers > 0 else cpus_disponiveis()
+    preparar_ambiente(workers)
+    print(f"AutoU: {workers} worker(s) em {args.host}:{args.porta} "
+          f"(cache {os.environ['CACHE_DB_PATH'] or 'só em memória'}, "
+          f"limite da IA {os.getenv('LLM_LIMITE_RPM', '0')} req/min e {os.getenv('LLM_LIMITE_TPM', '0')} tokens/min)")
+    uvicorn.run("app.main:app", host=args.host, port=args.porta, workers=workers, log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+
+# Estimativa de tokens sem tokenizer: média de caracteres por token nos modelos GPT
+# para texto em português/inglês (pode ser calibrada via ambiente).
+CARACTERES_POR_TOKEN = float(os.getenv("CARACTERES_POR_TOKEN", "4.0"))
+
+
+def estimar_tokens(texto: str) -> int:
+    """Estimativa rápida do número de tokens de um texto."""
+    if not texto:
+        return 0
+    return int(len(texto) / CARACTERES_POR_TOKEN) + 1
+
+
+def caracteres_para_tokens(tokens: int) -> int:
+    """Quantidade aproximada de caracteres que cabe em `tokens` tokens."""
+    return int(tokens * CARACTERES_POR_TOKEN)
+
+
+class CalibradorTokens:
+    """
+    Ajusta a estimativa de tokens com o uso real devolvido pela IA (usage.prompt_tokens):
+    guarda a razão real/estimado em média móvel exponencial. Fica separado de
+    estimar_tokens para que a divisão em blocos da análise continue determinística.
+    """
+
+    def __init__(self, peso: float = 0.2, minimo: float = 0.5, maximo: float = 2.5):
+        self.fator = 1.0
+        self.peso = peso
+        self.minimo = minimo
+        self.maximo = maximo
+
+    def estimar(self, texto: str) -> int:
+        return int(estimar_tokens(texto) * self.fator) + 1 if texto else 0
+
+    def registrar(self, estimado: int, real) -> None:
+        """Registra uma chamada: `estimado` por estimar_tokens, `real` vindo do usage da API."""
+        try:
+            real = int(real)
+        except (TypeError, ValueError):
+            return
+        if estimado <= 0 or real <= 0:
+            return
+        razao = min(self.maximo, max(self.minimo, real / estimado))
+        self.fator += self.peso * (razao - self.fator)
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+from pathlib import Path
+
+# Triagem pelos cabeçalhos brutos do mbox, antes de decodificar o corpo (0 desativa)
+TRIAGEM_ATIVA = os.getenv("TRIAGEM_ATIVA", "1") == "1"
+# Arquivo de regras (cabeçalho + condição -> label); pode ser trocado via ambiente
+TRIAGEM_REGRAS_PATH = os.getenv("TRIAGEM_REGRAS_PATH", str(Path(__file__).parent / "regras_triagem.json"))
+
+PULAR = "pular"
+MARCAR = "marcar"
+
+_RE_DOMINIO = re.compile(r"@([\w.-]+)")
+
+
+def ler_cabecalhos(bloco: bytes, nomes=None) -> dict:
+    """
+    Lê só o bloco de cabeçalhos de uma mensagem bruta (até a primeira linha vazia), sem
+    email.message_from_bytes nem decodificação do corpo. Junta as linhas de continuação e
+    guarda a primeira ocorrência de cada cabeçalho (nome em minúsculas); com `nomes`,
+    só os cabeçalhos pedidos. Os valores são latin-1 crus (encoded-words não são decodificadas).
+    """
+    fim = len(bloco)
+    for separador in (b"\n\n", b"\r\n\r\n"):
+        posicao = bloco.find(separador)
+        if 0 <= posicao < fim:
+            fim = posicao
+    cabecalhos = {}
+    atual = None
+    for linha in bytes(bloco[:fim]).split(b"\n"):
+        if linha[:1] in (b" ", b"\t"):
+            # Continuação do cabeçalho anterior (folding)
+            if atual is not None:
+                cabecalhos[atual] += " " + linha.strip().decode("latin-1")
+            continue
+        nome, separador, valor = linha.partition(b":")
+        atual = None
+        # A linha "From " do mbox (sem ":" no nome) e linhas inválidas são ignoradas
+        if not separador or b" " in nome.strip():
+            continue
+        nome = nome.strip().lower().decode("latin-1")
+        if nome in cabecalhos or (nomes is not None and nome not in nomes):
+            continue
+        cabecalhos[nome] = valor.strip().decode("latin-1")
+        atual = nome
+    return cabecalhos
+
+
+class RegraTriagem:
+    """
+    Uma regra: o cabeçalho e a condição (sem condição, basta o cabeçalho existir):
+      - "valores": o valor (primeira palavra, sem maiúsculas) é um destes;
+      - "exceto": o valor não é nenhum destes (ex: Auto-Submitted diferente de "no");
+      - "contem": o valor contém um destes trechos;
+      - "dominios": um endereço do valor é de um destes domínios (ou subdomínio).
+    "acao" é "pular" (a mensagem recebe o label da regra sem decodificar o corpo nem
+    chamar a IA) ou "marcar" (segue o fluxo normal, com a regra anotada no resultado).
+    """
+
+    def __init__(self, regra: dict):
+        self.nome = regra.get("nome") or regra["cabecalho"]
+        self.cabecalho = regra["cabecalho"].lower()
+        self.valores = {v.lower() for v in regra.get("valores", ())}
+        self.exceto = {v.lower() for v in regra.get("exceto", ())}
+        self.contem = [v.lower() for v in regra.get("contem", ())]
+        self.dominios = [d.lower().lstrip("@.") for d in regra.get("dominios", ())]
+        self.label = regra.get("label", "improdutivo")
+        self.score = float(regra.get("score", 0.9))
+        self.acao = regra.get("acao", PULAR)
+        if self.acao not in (PULAR, MARCAR):
+            raise ValueError(f"Ação de triagem inválida na regra '{self.nome}': {self.acao}")
+
+    def casa(self, cabecalhos: dict) -> bool:
+        valor = (cabecalhos.get(self.cabecalho) or "").strip().lower()
+        if not valor:
+            return False
+        palavra = valor.split(None, 1)[0].strip(";,")
+        if self.valores and palavra not in self.valores:
+            return False
+        if self.exceto and palavra in self.exceto:
+            return False
+        if self.contem and not any(t in valor for t in self.contem):
+            return False
+        if self.dominios:
+            return any(
+                dominio == d or dominio.endswith("." + d)
+                for dominio in _RE_DOMINIO.findall(valor)
+                for d in self.dominios
+            )
+        return True
+
+    def veredito(self) -> dict:
+        return {"regra": self.nome, "label": self.label, "score": self.score, "acao": self.acao}
+
+
+class Triagem:
+    """
+    Triagem das mensagens do mbox pelos cabeçalhos brutos (List-Unsubscribe, Precedence: bulk,
+    Auto-Submitted, domínios de envio em massa...). Só os cabeçalhos citados nas regras são
+    lidos; as regras "pular" têm precedência sobre as "marcar" e, entre elas, vale a ordem do arquivo.
+    """
+
+    def __init__(self, regras: dict):
+        self.regras = [RegraTriagem(r) for r in regras.get("regras", ())]
+        self.nomes = {r.cabecalho for r in self.regras}
+
+    @classmethod
+    def de_arquivo(cls, caminho: str = TRIAGEM_REGRAS_PATH) -> "Triagem":
+        with open(caminho, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def avaliar(self, bloco: bytes):
+        """
+        Retorna (veredito, cabecalhos) para o bloco bruto de uma mensagem; veredito é
+        {"regra", "label", "score", "acao"} ou None se nenhuma regra casar.
+        """
+        cabecalhos = ler_cabecalhos(bloco, self.nomes)
+        marcada = None
+        for regra in self.regras:
+            if regra.casa(cabecalhos):
+                if regra.acao == PULAR:
+                    return regra.veredito(), cabecalhos
+                if marcada is None:
+                    marcada = regra.veredito()
+        return marcada, cabecalhos
+
+
+class TextoTriado(str):
+    """
+    Texto de uma mensagem que passou pela triagem: o próprio texto (str), com o veredito em
+    `triagem`, para que a classificação (nlp_utils.iterar_classificacoes_async) o reconheça.
+    """
+
+    def __new__(cls, texto: str, triagem: dict):
+        obj = super().__new__(cls, texto)
+        obj.triagem = triagem
+        return obj
+
+
+def triagem_de(texto):
+    """Veredito da triagem de um texto (None se ele não passou por ela ou nenhuma regra casou)."""
+    return getattr(texto, "triagem", None)
+
+
+def manter_triagem(origem, texto: str) -> str:
+    # Reaplica o veredito de `origem` em `texto` (ex: depois de preprocessar_texto)
+    triagem = triagem_de(origem)
+    return TextoTriado(texto, triagem) if triagem is not None else texto
+
+
+def descartar_puladas(mensagens, contagem: dict):
+    """
+    Remove do iterável as mensagens que a triagem manda pular (ex: na análise, em que
+    não há resultado por mensagem); `contagem` recebe {"puladas": N, "regras": {regra: N}}.
+    """
+    contagem.setdefault("puladas", 0)
+    contagem.setdefault("regras", {})
+    for texto in mensagens:
+        triagem = triagem_de(texto)
+        if triagem is not None and triagem["acao"] == PULAR:
+            contagem["puladas"] += 1
+            contagem["regras"][triagem["regra"]] = contagem["regras"].get(triagem["regra"], 0) + 1
+            continue
+        yield texto
+
+
+_triagem = None
+
+
+def obter_triagem():
+    # Instância única, carregada do arquivo de regras na primeira chamada (None se desativada)
+    global _triagem
+    if not TRIAGEM_ATIVA:
+        return None
+    if _triagem is None:
+        _triagem = Triagem.de_arquivo()
+    return _triagem
@@ -0,0 +1,289 @@
+import os
+import re
+import mmap
+import json
+from pathlib import Path
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+from fastapi.routing import APIRoute
+from starlette.formparsers import MultiPartException, MultiPartParser
+from starlette.requests import Request
+
+# Tamanho máximo de um upload, em bytes (0 = sem limite)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+# Máximo de mensagens por upload (mbox: blocos "From "; texto: partes separadas por "---").
+# Verificado depois que o upload termina (o tamanho recebido já é limitado por UPLOAD_MAX_BYTES)
+UPLOAD_MAX_MENSAGENS = int(os.getenv("UPLOAD_MAX_MENSAGENS", "1000000"))
+# Quanto de cada arquivo enviado fica em memória antes de ir para o arquivo temporário em disco
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+
+# Folga para os cabeçalhos do multipart e os campos de formulário (text, assincrono)
+_FOLGA_MULTIPART = 2 * 1024 * 1024
+# Os formatos aceitos são reconhecidos pelos primeiros bytes do arquivo
+_TAMANHO_CABECA = 2048
+_ASSINATURAS_BINARIAS = (
+    (b"PK\x03\x04", "zip/docx/xlsx"),
+    (b"\x1f\x8b", "gzip"),
+    (b"\x89PNG", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF8", "gif"),
+    (b"\xd0\xcf\x11\xe0", "doc/xls"),
+    (b"7z\xbc\xaf", "7z"),
+    (b"Rar!", "rar"),
+)
+_BOM_UTF8 = b"\xef\xbb\xbf"
+# Linha "From_" que abre uma mensagem do mbox: remetente e data no formato do asctime
+# ("From fulano@ex.com Mon Jan  1 00:00:00 2024", às vezes com fuso antes do ano)
+_RE_LINHA_FROM = re.compile(
+    rb"From \S+ +[A-Z][a-z]{2} +[A-Z][a-z]{2} +\d{1,2} +\d{1,2}:\d{2}(?::\d{2})?(?: +\S+)? +\d{4}[ \t]*\r?\n"
+)
+
+
+class UploadRecusado(Exception):
+    """Upload rejeitado antes do processamento (tamanho, formato ou número de mensagens)."""
+
+    def __init__(self, status: int, mensagem: str):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+def _cabeca(arquivo) -> bytes:
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        return bytes(arquivo[:_TAMANHO_CABECA])
+    if isinstance(arquivo, (str, Path)):
+        with open(arquivo, "rb") as f:
+            return f.read(_TAMANHO_CABECA)
+    arquivo.seek(0)
+    cabeca = arquivo.read(_TAMANHO_CABECA)
+    arquivo.seek(0)
+    return cabeca
+
+
+def detectar_formato(arquivo, filename: str = None) -> str:
+    """
+    Formato do upload pelos primeiros bytes: "pdf" (%PDF-), "mbox" (começa com uma
+    linha "From_" completa, com remetente e data) ou "texto". Um .txt nunca é tratado
+    como mbox (um e-mail colado que começa com "From " continua sendo texto). A extensão
+    .mbox só decide quando o conteúdo não diz nada. Arquivos binários conhecidos
+    (zip, imagens...) ou com bytes nulos são recusados (415).
+    """
+    cabeca = _cabeca(arquivo)
+    if b"%PDF-" in cabeca[:1024]:
+        return "pdf"
+    nome = (filename or "").lower()
+    inicio = cabeca[len(_BOM_UTF8):] if cabeca.startswith(_BOM_UTF8) else cabeca
+    if not nome.endswith(".txt") and _RE_LINHA_FROM.match(inicio.lstrip()):
+        return "mbox"
+    for assinatura, tipo in _ASSINATURAS_BINARIAS:
+        if cabeca.startswith(assinatura):
+            raise UploadRecusado(415, f"Formato de arquivo não suportado ({tipo}). Envie .txt, .pdf ou .mbox.")
+    if b"\x00" in cabeca:
+        raise UploadRecusado(415, "Arquivo binário não suportado. Envie .txt, .pdf ou .mbox.")
+    if nome.endswith(".mbox"):
+        return "mbox"
+    return "texto"
+
+
+def tamanho_arquivo(arquivo) -> int:
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        return len(arquivo)
+    if isinstance(arquivo, (str, Path)):
+        return os.path.getsize(arquivo)
+    posicao = arquivo.tell()
+    tamanho = arquivo.seek(0, 2)
+    arquivo.seek(posicao)
+    return tamanho
+
+
+def verificar_tamanho(tamanho: int):
+    if UPLOAD_MAX_BYTES and tamanho > UPLOAD_MAX_BYTES:
+        raise UploadRecusado(413, f"Arquivo maior que o limite de {UPLOAD_MAX_BYTES // (1024 * 1024)} MB.")
+
+
+def verificar_mensagens(quantidade: int):
+    if UPLOAD_MAX_MENSAGENS and quantidade > UPLOAD_MAX_MENSAGENS:
+        raise UploadRecusado(413, f"O envio tem {quantidade} mensagens; o limite é {UPLOAD_MAX_MENSAGENS}.")
+
+
+def limitar_mensagens(mensagens):
+    """
+    Repassa as mensagens conforme chegam e lança UploadRecusado (413) ao passar do limite.
+    Para entradas cujo total só se conhece no fim da leitura (ex: PDF extraído em fluxo).
+    """
+    for quantidade, mensagem in enumerate(mensagens, 1):
+        if UPLOAD_MAX_MENSAGENS and quantidade > UPLOAD_MAX_MENSAGENS:
+            raise UploadRecusado(413, f"O envio tem mais de {UPLOAD_MAX_MENSAGENS} mensagens, o limite.")
+        yield mensagem
+
+
+@contextmanager
+def mapear(arquivo):
+    """
+    Conteúdo do arquivo como buffer: mmap do arquivo em disco (ou do temporário do upload),
+    sem copiar. Arquivos de até UPLOAD_SPOOL_BYTES (os uploads que ainda estão só em memória)
+    são lidos com read(): a cópia é limitada ao tamanho do spool.
+    """
+    if isinstance(arquivo, (bytes, bytearray, memoryview)):
+        with memoryview(arquivo) as conteudo:
+            yield conteudo
+        return
+    if isinstance(arquivo, (str, Path)):
+        with open(arquivo, "rb") as f:
+            with mapear(f) as conteudo:
+                yield conteudo
+        return
+    tamanho = tamanho_arquivo(arquivo)
+    if tamanho <= UPLOAD_SPOOL_BYTES:
+        posicao = arquivo.tell()
+        arquivo.seek(0)
+        conteudo = arquivo.read()
+        arquivo.seek(posicao)
+        yield conteudo
+        return
+    # Num SpooledTemporaryFile, fileno() passa o conteúdo para o temporário em disco se ainda não passou
+    with mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as conteudo:
+        yield conteudo
+
+
+def contar_mensagens_mbox(arquivo) -> int:
+    """
+    Número de mensagens de um mbox, contando as linhas "From " (o mesmo critério de
+    iterar_emails_mbox) direto no buffer mapeado, sem decodificar nada.
+    """
+    with mapear(arquivo) as conteudo:
+        if not len(conteudo):
+            return 0
+        if isinstance(conteudo, memoryview):
+            # bytes passados diretamente (memoryview não tem find)
+            conteudo = conteudo.tobytes()
+        # O primeiro bloco não tem "\n" antes do "From " (ou nem começa com ele)
+        total = 1
+        posicao = conteudo.find(b"\nFrom ")
+        while posicao != -1:
+            total += 1
+            posicao = conteudo.find(b"\nFrom ", posicao + 1)
+        return total
+
+
+def contar_mensagens_texto(texto: str) -> int:
+    # Mesmo separador usado para dividir o texto em e-mails
+    return texto.count("\n\n---\n\n") + 1 if texto.strip() else 0
+
+
+def validar_upload(arquivo, filename: str = None) -> str:
+    """
+    Checagens feitas antes de qualquer processamento: tamanho, formato (pelos bytes)
+    e, em mbox, o número de mensagens. Retorna o formato; lança UploadRecusado.
+    """
+    verificar_tamanho(tamanho_arquivo(arquivo))
+    formato = detectar_formato(arquivo, filename)
+    if formato == "mbox":
+        verificar_mensagens(contar_mensagens_mbox(arquivo))
+    return formato
+
+
+class ParserUpload(MultiPartParser):
+    """Parser multipart dos uploads: cada arquivo fica em memória até UPLOAD_SPOOL_BYTES e depois vai para disco."""
+
+    spool_max_size = UPLOAD_SPOOL_BYTES
+
+
+class RequisicaoUpload(Request):
+    """Request cujo formulário multipart é lido com ParserUpload (o parser padrão do Starlette fica intacto)."""
+
+    _formulario = None
+
+    async def form(self, *, max_files: int = 1000, max_fields: int = 1000, max_part_size: int = 1024 * 1024):
+        # Só o "await request.form()" (o que o FastAPI usa) é suportado, não o "async with"
+        if self._formulario is not None:
+            return self._formulario
+        limites = {"max_files": max_files, "max_fields": max_fields, "max_part_size": max_part_size}
+        if not (self.headers.get("content-type") or "").startswith("multipart/form-data"):
+            return await super().form(**limites)
+        try:
+            self._formulario = await ParserUpload(self.headers, self.stream(), **limites).parse()
+        except MultiPartException as e:
+            raise HTTPException(status_code=400, detail=e.message)
+        return self._formulario
+
+    async def close(self):
+        if self._formulario is not None:
+            await self._formulario.close()
+        await super().close()
+
+
+class RotaUpload(APIRoute):
+    """Rota do FastAPI que entrega RequisicaoUpload aos endpoints (app.router.route_class)."""
+
+    def get_route_handler(self):
+        manipulador = super().get_route_handler()
+
+        async def _manipular(request: Request):
+            return await manipulador(RequisicaoUpload(request.scope, request.receive))
+
+        return _manipular
+
+
+class MiddlewareLimiteUpload:
+    """
+    Middleware ASGI que recusa (413) corpos acima de UPLOAD_MAX_BYTES antes de o
+    multipart ser lido: pelo Content-Length, quando informado, e contando os bytes
+    recebidos (envio chunked), sem esperar o fim do upload.
+    """
+
+    def __init__(self, app, limite: int = None):
+        self.app = app
+        self.limite = (UPLOAD_MAX_BYTES + _FOLGA_MULTIPART) if limite is None else limite
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not UPLOAD_MAX_BYTES:
+            await self.app(scope, receive, send)
+            return
+        for nome, valor in scope.get("headers", ()):
+            if nome == b"content-length" and valor.isdigit() and int(valor) > self.limite:
+                await self._recusar(send)
+                return
+
+        recebidos = 0
+        estourou = False
+        iniciou = False
+
+        async def _receber():
+            nonlocal recebidos, estourou
+            if estourou:
+                return {"type": "http.disconnect"}
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                recebidos += len(mensagem.get("body", b""))
+                if recebidos > self.limite:
+                    # A aplicação vê o cliente "desconectado" e para de ler; a resposta é o 413
+                    estourou = True
+                    return {"type": "http.disconnect"}
+            return mensagem
+
+        async def _enviar(mensagem):
+            nonlocal iniciou
+            if estourou:
+                return
+            if mensagem["type"] == "http.response.start":
+                iniciou = True
+            await send(mensagem)
+
+        try:
+            await self.app(scope, _receber, _enviar)
+        except Exception:
+            if not estourou:
+                raise
+        if estourou and not iniciou:
+            await self._recusar(send)
+
+    async def _recusar(self, send):
+        corpo = json.dumps(
+            {"erro": f"Arquivo maior que o limite de {UPLOAD_MAX_BYTES // (1024 * 1024)} MB."}, ensure_ascii=False
+        ).encode("utf-8")
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": corpo})
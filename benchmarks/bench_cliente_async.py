@@ -0,0 +1,68 @@
+"""
+Benchmark do cliente assíncrono de LLM contra o stub local (benchmarks/stub_openai.py).
+
+Compara:
+  - sequencial: N chamadas síncronas (comportamento antigo, uma por vez no event loop);
+  - concorrente: N requisições simultâneas ao /classify usando a versão async.
+
+Uso:
+    python -m benchmarks.bench_cliente_async --requisicoes 50 --latencia-ms 300
+"""
+import argparse
+import asyncio
+import os
+import time
+
+PORTA = 8765
+os.environ.setdefault("OPENAI_URL", f"http://127.0.0.1:{PORTA}/v1/chat/completions")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+import httpx  # noqa: E402
+
+from benchmarks.stub_openai import iniciar_em_thread  # noqa: E402
+from app import nlp_utils  # noqa: E402
+from app.main import app  # noqa: E402
+
+
+def bench_sequencial(n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        label, _, _ = nlp_utils.classificar_com_openai("Preciso do status do meu pedido.")
+        nlp_utils.gerar_resposta_com_openai("Preciso do status do meu pedido.", label)
+    return time.perf_counter() - t0
+
+
+async def bench_concorrente(n: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as cli:
+        t0 = time.perf_counter()
+        resps = await asyncio.gather(*[
+            cli.post("/classify", data={"text": "Preciso do status do meu pedido."}) for _ in range(n)
+        ])
+        dt = time.perf_counter() - t0
+    falhas = sum(1 for r in resps if r.status_code != 200)
+    if falhas:
+        print(f"  aviso: {falhas} requisições com erro")
+    return dt
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requisicoes", type=int, default=50)
+    parser.add_argument("--latencia-ms", type=float, default=300.0)
+    args = parser.parse_args()
+
+    server = iniciar_em_thread(PORTA, args.latencia_ms)
+    try:
+        n = args.requisicoes
+        seq = bench_sequencial(n)
+        conc = asyncio.run(bench_concorrente(n))
+        print(f"latência injetada: {args.latencia_ms:.0f} ms | requisições: {n}")
+        print(f"sequencial (sync):   {seq:7.2f}s  {n / seq:7.1f} req/s")
+        print(f"concorrente (async): {conc:7.2f}s  {n / conc:7.1f} req/s  ({seq / conc:.1f}x)")
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
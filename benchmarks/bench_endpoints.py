@@ -0,0 +1,258 @@
+"""
+Benchmark de ponta a ponta dos endpoints contra o stub da OpenAI (sem chave real).
+Sobe o stub e a API (uvicorn) em subprocessos, gera um corpus sintético (benchmarks/corpus.py),
+envia `--requisicoes` uploads (até `--concorrencia` ao mesmo tempo) e mede:
+latência p50/p99 por requisição, mensagens/s, pico de RSS da API (e dos processos filhos,
+como o pool de PDF), chamadas/falhas do stub e lotes por status (/metrics).
+
+Cada execução é gravada em uma linha de `--resultados` (JSONL) e comparada com a última
+execução com os mesmos parâmetros.
+
+Uso:
+    python -m benchmarks.bench_endpoints --cenario classify --formato mbox --mensagens 10000
+    python -m benchmarks.bench_endpoints --cenario analise --formato pdf --mensagens 5000 --requisicoes 3
+    python -m benchmarks.bench_endpoints --cenario classify --mensagens 2000 --taxa-erro 0.05 --taxa-malformado 0.1
+    python -m benchmarks.bench_endpoints --cenario classify --mensagens 2000 --env LOTE_MAX_MENSAGENS=20
+    python -m benchmarks.bench_endpoints --workers 4 --concorrencia 8 --limite-rpm 1200 --env LLM_LIMITE_RPM=1200
+
+Com --workers, a API sobe por app/servidor.py (vários processos); o RSS dos workers
+aparece em rss_pico_filhos_mb.
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.corpus import GRAVADORES
+
+RESULTADOS_PADRAO = os.path.join("benchmarks", "resultados", "endpoints.jsonl")
+# Cenário -> (rota, resposta em streaming)
+CENARIOS = {
+    "classify": ("/classify", False),
+    "classify_stream": ("/classify/stream", True),
+    "analise": ("/analise", False),
+}
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _aguardar(url: str, processo: subprocess.Popen, limite_s: float = 30.0):
+    fim = time.monotonic() + limite_s
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError(f"Processo encerrou ao subir ({url}).")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Tempo esgotado esperando {url}.")
+
+
+def _memoria_pico_mb(pid: int) -> dict:
+    """Pico de RSS (VmHWM) do processo e a soma dos picos dos filhos vivos (Linux; None em outros sistemas)."""
+    def _vmhwm(p):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for linha in f:
+                    if linha.startswith("VmHWM:"):
+                        return int(linha.split()[1]) / 1024
+        except OSError:
+            return None
+        return None
+
+    def _filhos(p):
+        try:
+            with open(f"/proc/{p}/task/{p}/children") as f:
+                return [int(x) for x in f.read().split()]
+        except OSError:
+            return []
+
+    principal = _vmhwm(pid)
+    filhos = [v for v in (_vmhwm(f) for f in _filhos(pid)) if v is not None]
+    return {"rss_pico_mb": principal, "rss_pico_filhos_mb": sum(filhos) if filhos else 0.0}
+
+
+def _percentil(valores: list, p: float):
+    if not valores:
+        return None
+    # Percentil pelo posto mais próximo
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(p * len(ordenados)) - 1)]
+
+
+def _lotes_por_status(metricas: str) -> dict:
+    lotes = {}
+    for linha in metricas.splitlines():
+        if linha.startswith("autou_lotes_total{"):
+            rotulo, valor = linha.rsplit(" ", 1)
+            status = rotulo.split('status="', 1)[1].split('"', 1)[0]
+            lotes[status] = lotes.get(status, 0) + float(valor)
+    return lotes
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _enviar(cliente: httpx.Client, url: str, caminho: str, nome: str, streaming: bool) -> dict:
+    t0 = time.perf_counter()
+    primeiro_byte = None
+    with open(caminho, "rb") as f:
+        if streaming:
+            with cliente.stream("POST", url, files={"file": (nome, f)}) as r:
+                for _ in r.iter_bytes():
+                    if primeiro_byte is None:
+                        primeiro_byte = time.perf_counter() - t0
+                status = r.status_code
+        else:
+            r = cliente.post(url, files={"file": (nome, f)})
+            status = r.status_code
+    return {"segundos": time.perf_counter() - t0, "primeiro_byte": primeiro_byte, "status": status}
+
+
+def _comparar(anterior: dict, atual: dict):
+    print(f"comparação com {anterior['data']} (commit {anterior.get('commit')}):")
+    for campo in ("p50_s", "p99_s", "mensagens_por_s", "rss_pico_mb"):
+        a, b = anterior.get(campo), atual.get(campo)
+        if a and b is not None:
+            print(f"  {campo:16s} {a:10.3f} -> {b:10.3f}  ({(b - a) / a * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ponta a ponta dos endpoints com o stub da OpenAI")
+    parser.add_argument("--cenario", choices=sorted(CENARIOS), default="classify")
+    parser.add_argument("--formato", choices=sorted(GRAVADORES), default="mbox")
+    parser.add_argument("--mensagens", type=int, default=1000)
+    parser.add_argument("--requisicoes", type=int, default=3)
+    parser.add_argument("--concorrencia", type=int, default=1)
+    parser.add_argument("--latencia-ms", type=float, default=50.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    parser.add_argument("--taxa-malformado", type=float, default=0.0)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--limite-rpm", type=float, default=0.0, help="limite de requisições por minuto do stub")
+    parser.add_argument("--workers", type=int, default=0, help="sobe a API com app/servidor.py e N workers")
+    parser.add_argument("--fracao-unicas", type=float, default=0.3)
+    parser.add_argument("--env", action="append", default=[], metavar="CHAVE=VALOR",
+                        help="variável de ambiente extra para a API (pode repetir)")
+    parser.add_argument("--resultados", default=RESULTADOS_PADRAO)
+    parser.add_argument("--nao-salvar", action="store_true")
+    args = parser.parse_args()
+
+    rota, streaming = CENARIOS[args.cenario]
+    extras = dict(item.split("=", 1) for item in args.env)
+    with tempfile.TemporaryDirectory() as tmp:
+        nome = f"corpus.{args.formato}"
+        caminho = os.path.join(tmp, nome)
+        t0 = time.perf_counter()
+        tamanho = GRAVADORES[args.formato](caminho, args.mensagens, args.semente, args.fracao_unicas)
+        print(f"corpus: {args.mensagens} mensagens ({args.formato}), {tamanho / 1024 / 1024:.1f} MB, "
+              f"gerado em {time.perf_counter() - t0:.1f}s")
+
+        porta_stub, porta_api = _porta_livre(), _porta_livre()
+        stub = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.stub_openai", "--porta", str(porta_stub),
+             "--latencia-ms", str(args.latencia_ms), "--taxa-erro", str(args.taxa_erro),
+             "--taxa-malformado", str(args.taxa_malformado), "--semente", str(args.semente),
+             "--limite-rpm", str(args.limite_rpm)],
+        )
+        # Cache, acervo e cache de PDF desligados: cada requisição refaz todo o trabalho
+        env = dict(os.environ, OPENAI_URL=f"http://127.0.0.1:{porta_stub}/v1/chat/completions",
+                   OPENAI_API_KEY="stub", CACHE_ATIVO="0", CACHE_DB_PATH="", ACERVO_DB_PATH="", PDF_CACHE_DIR="",
+                   JOBS_DIR=os.path.join(tmp, "jobs"), CLASSIFICACOES_LOG_PATH="")
+        env.update(extras)
+        if args.workers:
+            comando = ["-m", "app.servidor", "--workers", str(args.workers), "--host", "127.0.0.1",
+                       "--porta", str(porta_api), "--log-level", "warning"]
+        else:
+            comando = ["-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(porta_api),
+                       "--log-level", "warning"]
+        api = subprocess.Popen([sys.executable] + comando, env=env)
+        try:
+            _aguardar(f"http://127.0.0.1:{porta_stub}/stub/contadores", stub)
+            _aguardar(f"http://127.0.0.1:{porta_api}/metrics", api)
+            url = f"http://127.0.0.1:{porta_api}{rota}"
+            with httpx.Client(timeout=None) as cliente, ThreadPoolExecutor(args.concorrencia) as pool:
+                inicio = time.perf_counter()
+                medidas = list(pool.map(lambda _: _enviar(cliente, url, caminho, nome, streaming),
+                                        range(args.requisicoes)))
+                total_s = time.perf_counter() - inicio
+                memoria = _memoria_pico_mb(api.pid)
+                chamadas = cliente.get(f"http://127.0.0.1:{porta_stub}/stub/contadores").json()
+                lotes = _lotes_por_status(cliente.get(f"http://127.0.0.1:{porta_api}/metrics").text)
+        finally:
+            for processo in (api, stub):
+                processo.terminate()
+                try:
+                    processo.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    processo.kill()
+
+    latencias = [m["segundos"] for m in medidas]
+    status = {}
+    for m in medidas:
+        status[str(m["status"])] = status.get(str(m["status"]), 0) + 1
+    resultado = {
+        "data": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit_atual(),
+        "parametros": {
+            "cenario": args.cenario, "formato": args.formato, "mensagens": args.mensagens,
+            "requisicoes": args.requisicoes, "concorrencia": args.concorrencia, "latencia_ms": args.latencia_ms,
+            "taxa_erro": args.taxa_erro, "taxa_malformado": args.taxa_malformado, "semente": args.semente,
+            "fracao_unicas": args.fracao_unicas, "limite_rpm": args.limite_rpm, "workers": args.workers,
+            "env": extras,
+        },
+        "p50_s": _percentil(latencias, 0.50),
+        "p99_s": _percentil(latencias, 0.99),
+        "total_s": total_s,
+        "mensagens_por_s": args.mensagens * args.requisicoes / total_s if total_s else None,
+        "status_http": status,
+        "stub": chamadas,
+        "lotes": lotes,
+        **memoria,
+    }
+    if streaming:
+        resultado["primeiro_byte_p50_s"] = _percentil([m["primeiro_byte"] for m in medidas if m["primeiro_byte"]], 0.5)
+
+    print(f"{args.cenario} ({args.formato}, {args.mensagens} msgs x {args.requisicoes}, concorrência {args.concorrencia}): "
+          f"p50 {resultado['p50_s']:.2f}s  p99 {resultado['p99_s']:.2f}s  "
+          f"{resultado['mensagens_por_s']:.0f} msg/s  RSS pico {resultado['rss_pico_mb'] or 0:.0f} MB "
+          f"(filhos {resultado['rss_pico_filhos_mb']:.0f} MB)")
+    print(f"HTTP {status} | stub {chamadas} | lotes {lotes}")
+
+    if args.nao_salvar:
+        return
+    anterior = None
+    if os.path.exists(args.resultados):
+        with open(args.resultados, encoding="utf-8") as f:
+            for linha in f:
+                registro = json.loads(linha)
+                if registro.get("parametros") == resultado["parametros"]:
+                    anterior = registro
+    if anterior is not None:
+        _comparar(anterior, resultado)
+    os.makedirs(os.path.dirname(args.resultados) or ".", exist_ok=True)
+    with open(args.resultados, "a", encoding="utf-8") as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    print(f"resultado gravado em {args.resultados}")
+
+
+if __name__ == "__main__":
+    main()
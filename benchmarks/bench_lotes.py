@@ -0,0 +1,45 @@
+"""
+Benchmark do envio paralelo de lotes em classificar_com_openai (rota de múltiplos e-mails).
+Mede o tempo total para N mensagens variando o limite de lotes em voo.
+
+Uso:
+    python -m benchmarks.bench_lotes --mensagens 500 --latencia-ms 300 --em-voo 1 4 16
+"""
+import argparse
+import os
+import time
+
+PORTA = 8766
+os.environ.setdefault("OPENAI_URL", f"http://127.0.0.1:{PORTA}/v1/chat/completions")
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+from benchmarks.stub_openai import iniciar_em_thread  # noqa: E402
+from app import nlp_utils  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensagens", type=int, default=500)
+    parser.add_argument("--latencia-ms", type=float, default=300.0)
+    parser.add_argument("--em-voo", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    texto = "\n\n---\n\n".join(f"Mensagem {i}: preciso do status do pedido {i}." for i in range(args.mensagens))
+    server = iniciar_em_thread(PORTA, args.latencia_ms)
+    try:
+        lotes = -(-args.mensagens // 10)
+        print(f"mensagens: {args.mensagens} | lotes: {lotes} | latência injetada: {args.latencia_ms:.0f} ms")
+        for em_voo in args.em_voo:
+            t0 = time.perf_counter()
+            itens, meta = nlp_utils.classificar_com_openai(texto, max_em_voo=em_voo)
+            dt = time.perf_counter() - t0
+            status = {}
+            for b in meta["batches"]:
+                status[b["status"]] = status.get(b["status"], 0) + 1
+            print(f"em voo={em_voo:3d}: {dt:7.2f}s  {len(itens) / dt:8.1f} msg/s  {status}")
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
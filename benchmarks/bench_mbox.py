@@ -0,0 +1,63 @@
+"""
+Benchmark de memória da leitura de mbox: compara o pico de alocação (tracemalloc)
+de extrair_emails_de_mbox (string única) com iterar_emails_mbox (mensagem a mensagem).
+
+Uso:
+    python -m benchmarks.bench_mbox --mensagens 20000
+"""
+import argparse
+import tempfile
+import time
+import tracemalloc
+
+from app.leitor_mbox import iterar_emails_mbox
+from app.nlp_utils import extrair_emails_de_mbox
+
+
+def gerar_mbox(caminho: str, n: int):
+    with open(caminho, "wb") as f:
+        for i in range(n):
+            f.write(
+                f"From cliente{i}@example.com Sat, 15 Nov 2025 21:18:00 -0000\n"
+                f"From: Cliente {i} <cliente{i}@example.com>\n"
+                f"Subject: Pedido {i} atrasado\n\n"
+                f"Olá, meu pedido {i} ainda não chegou. Podem verificar o status?\n"
+                f"{'Detalhes adicionais do atendimento. ' * 20}\n\n".encode("utf-8")
+            )
+
+
+def medir(func):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    resultado = func()
+    dt = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, dt, pico / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensagens", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".mbox") as tmp:
+        gerar_mbox(tmp.name, args.mensagens)
+        tamanho = tmp.seek(0, 2) / 1024 / 1024
+
+        def _string_unica():
+            with open(tmp.name, "rb") as f:
+                return len(extrair_emails_de_mbox(f.read()).split("\n\n---\n\n"))
+
+        def _iterador():
+            with open(tmp.name, "rb") as f:
+                return sum(1 for _ in iterar_emails_mbox(f))
+
+        print(f"mbox: {args.mensagens} mensagens, {tamanho:.1f} MB")
+        for nome, func in (("string única", _string_unica), ("iterador", _iterador)):
+            n, dt, pico = medir(func)
+            print(f"{nome:13s}: {n} msgs  {dt:6.2f}s  pico {pico:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark do pré-processamento de texto: compara as regras originais de
+preprocessar_texto (replace + três re.sub sobre a string inteira) com o normalizador
+de uma passada (app/normalizador.py), inteiro e em pedaços.
+Mede MB/s e o pico de alocação além do texto de entrada (tracemalloc) e confere
+que a saída é idêntica.
+
+Uso:
+    python -m benchmarks.bench_normalizador --mb 50
+"""
+import argparse
+import random
+import re
+import time
+import tracemalloc
+
+from app.normalizador import normalizar_texto, normalizar_em_pedacos
+
+
+def preprocessar_texto_antigo(texto: str) -> str:
+    # Implementação original, mantida aqui só como referência de resultado e desempenho
+    if not texto:
+        return ""
+    texto = texto.replace("\r", "\n")
+    texto = re.sub(r"[^\x00-\x7FÀ-ſ\n\t,.!?;:()\"'@%$ªºº\-—\s]", " ", texto)
+    texto = re.sub(r"[ \t]+", " ", texto)
+    texto = re.sub(r"\n{3,}", "\n\n", texto)
+    return texto.strip()
+
+
+def gerar_texto(mb: float, semente: int = 0) -> str:
+    # E-mails sintéticos com acentos, CRLF, tabs, linhas em branco e alguns emojis/símbolos
+    rnd = random.Random(semente)
+    trechos = [
+        "Olá, equipe!\r\n\r\nO pedido nº 123 ainda não chegou.\r\n",
+        "Segue   o relatório\tem anexo — favor confirmar.\n\n\n\n",
+        "Promoção imperdível 😀 só hoje ★★★\n",
+        "Atenciosamente,\nJoão da Silva\n\n\n",
+        "Reunião às 14h sobre o projeto €€ (prazo: sexta).\n",
+    ]
+    alvo = int(mb * 1024 * 1024)
+    partes = []
+    tamanho = 0
+    while tamanho < alvo:
+        t = rnd.choice(trechos)
+        partes.append(t)
+        tamanho += len(t)
+    return "".join(partes)
+
+
+def medir(func, texto: str):
+    # Tempo sem tracemalloc (que deixa as alocações bem mais lentas) e pico numa segunda rodada
+    t0 = time.perf_counter()
+    resultado = func(texto)
+    dt = time.perf_counter() - t0
+    del resultado
+    tracemalloc.start()
+    resultado = func(texto)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, dt, pico / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=float, default=50)
+    parser.add_argument("--pedaco-kb", type=int, default=1024)
+    args = parser.parse_args()
+
+    texto = gerar_texto(args.mb)
+    tamanho_mb = len(texto.encode("utf-8")) / 1024 / 1024
+    pedaco = args.pedaco_kb * 1024
+
+    modos = (
+        ("antigo", preprocessar_texto_antigo),
+        ("uma passada", normalizar_texto),
+        # Em pedaços: os pedaços de saída são consumidos sem montar a string final
+        ("em pedaços", lambda t: sum(len(p) for p in normalizar_em_pedacos(t, pedaco))),
+    )
+    print(f"texto: {tamanho_mb:.1f} MB")
+    referencia = None
+    for nome, func in modos:
+        resultado, dt, pico = medir(func, texto)
+        if referencia is None:
+            referencia = resultado
+            ok = "referência"
+        elif isinstance(resultado, int):
+            ok = "idêntico" if resultado == len(referencia) else "DIFERENTE"
+        else:
+            ok = "idêntico" if resultado == referencia else "DIFERENTE"
+        print(f"{nome:12s}: {dt:6.2f}s  {tamanho_mb / dt:7.1f} MB/s  pico {pico:8.1f} MB  ({ok})")
+
+
+if __name__ == "__main__":
+    main()
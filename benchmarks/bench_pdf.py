@@ -0,0 +1,91 @@
+"""
+Benchmark da extração de PDF: páginas/s e pico de RSS do extrator antigo (PdfReader
+sobre BytesIO, página a página no mesmo processo) contra o pool de processos e o cache.
+Cada modo roda em um subprocesso separado, para o pico de RSS não se misturar.
+
+Uso:
+    python -m benchmarks.bench_pdf --paginas 500 --processos 4
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import escrever_pdf
+
+
+def gerar_pdf(caminho: str, paginas: int, linhas_por_pagina: int = 40):
+    """Gera um PDF simples (Helvetica, texto puro) com `paginas` páginas."""
+    escrever_pdf(caminho, (
+        [f"Pagina {p + 1} - atendimento SAC linha {i}: cliente relata atraso no pedido {p * 100 + i}."
+         for i in range(linhas_por_pagina)]
+        for p in range(paginas)
+    ), paginas)
+
+
+def _rss_mb(quem) -> float:
+    # ru_maxrss vem em KB no Linux
+    return resource.getrusage(quem).ru_maxrss / 1024
+
+
+def _rodar_modo(modo: str, caminho: str, paginas: int):
+    from PyPDF2 import PdfReader
+    from app import extrator_pdf
+
+    t0 = time.perf_counter()
+    if modo == "antigo":
+        with open(caminho, "rb") as f:
+            reader = PdfReader(io.BytesIO(f.read()))
+        texto = "\n".join((p.extract_text() or "") for p in reader.pages).strip()
+    else:
+        if modo == "pool":
+            extrator_pdf.PDF_CACHE_DIR = ""
+        texto = extrator_pdf.extrair_texto_pdf(caminho)
+    dt = time.perf_counter() - t0
+    extrator_pdf.encerrar_pool(esperar=True)
+    print(json.dumps({
+        "modo": modo,
+        "segundos": dt,
+        "paginas_por_s": paginas / dt if dt else None,
+        "caracteres": len(texto),
+        "rss_mb": _rss_mb(resource.RUSAGE_SELF),
+        "rss_filhos_mb": _rss_mb(resource.RUSAGE_CHILDREN),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paginas", type=int, default=500)
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--modo", help=argparse.SUPPRESS)
+    parser.add_argument("--arquivo", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.modo:
+        _rodar_modo(args.modo, args.arquivo, args.paginas)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        caminho = os.path.join(tmp, "sac.pdf")
+        gerar_pdf(caminho, args.paginas)
+        env = dict(os.environ, PDF_PROCESSOS=str(args.processos), PDF_CACHE_DIR=os.path.join(tmp, "cache"))
+        print(f"PDF: {args.paginas} páginas, {os.path.getsize(caminho) / 1024 / 1024:.1f} MB, {args.processos} processos")
+        # "cache_frio" extrai e grava o cache; "cache" lê do cache gravado
+        for modo in ("antigo", "pool", "cache_frio", "cache"):
+            saida = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_pdf", "--modo", modo, "--arquivo", caminho,
+                 "--paginas", str(args.paginas)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout
+            r = json.loads(saida)
+            print(f"{modo:10s}: {r['segundos']:6.2f}s  {r['paginas_por_s']:8.1f} pág/s  "
+                  f"RSS {r['rss_mb']:6.1f} MB (filhos {r['rss_filhos_mb']:6.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
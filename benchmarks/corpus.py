@@ -0,0 +1,196 @@
+"""
+Geradores de corpus sintético (txt, mbox e pdf) para os benchmarks, de 1 mil a 1 milhão
+de mensagens. A saída é gravada em fluxo (nada do corpus fica inteiro em memória) e é
+reprodutível pela semente.
+
+Cada mensagem sai de um modelo (pedido atrasado, boleto, agradecimento, promoção...),
+com números, nomes e datas sorteados, ou é uma mensagem "única" com palavras sorteadas
+(--fracao-unicas): assim o corpus tem tanto quase duplicatas quanto conteúdo variado.
+
+Uso:
+    python -m benchmarks.corpus --formato mbox --mensagens 100000 --saida /tmp/sac.mbox
+"""
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+
+SEPARADOR = "\n\n---\n\n"
+
+_MODELOS = [
+    ("Pedido {n} atrasado",
+     "Olá, meu pedido {n} ainda não chegou. Comprei no dia {d}/{m} e o prazo era de {k} dias úteis. "
+     "Podem verificar o status da entrega?"),
+    ("Segunda via do boleto",
+     "Bom dia, preciso da segunda via do boleto da fatura {n}, com vencimento em {d}/{m}. "
+     "O código de barras do e-mail anterior não está funcionando."),
+    ("Erro no acesso",
+     "Não consigo acessar minha conta desde {d}/{m}. Aparece o erro {k}{n} ao fazer login, "
+     "já tentei redefinir a senha e nada. Podem ajudar?"),
+    ("Troca de produto",
+     "Recebi o produto do pedido {n} com defeito. Gostaria de solicitar a troca ou o reembolso "
+     "de R$ {k}{d},00 o quanto antes."),
+    ("Obrigado!",
+     "Oi, passando só para agradecer o atendimento de {d}/{m}. Foi tudo resolvido, obrigado!"),
+    ("Feliz aniversário",
+     "Parabéns pelos {k} anos da empresa! Desejamos muito sucesso para toda a equipe."),
+    ("Promoção imperdível",
+     "Só hoje: {k}0% de desconto em toda a loja com o cupom SAC{n}. Oferta válida até {d}/{m}."),
+]
+_PALAVRAS = (
+    "contrato reunião suporte acesso senha fatura api erro login cadastro relatório prazo entrega "
+    "nota fiscal pagamento estorno assinatura plano upgrade integração sistema planilha cobrança "
+    "atendimento protocolo cancelamento endereço boleto cartão pix transferência limite conta"
+).split()
+_NOMES = ["Ana", "Bruno", "Carla", "Diego", "Elisa", "Fábio", "Gabi", "Hugo", "Iara", "João"]
+_INICIO = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def gerar_mensagens(n: int, semente: int = 0, fracao_unicas: float = 0.3):
+    """Gera `n` dicts {"assunto", "corpo", "remetente", "data"} de forma determinística."""
+    sorteio = random.Random(semente)
+    for i in range(n):
+        nome = sorteio.choice(_NOMES)
+        remetente = f"{nome} {i % 997} <{nome.lower()}{i % 997}@exemplo.com.br>"
+        data = _INICIO + timedelta(minutes=7 * i + sorteio.randrange(7))
+        if sorteio.random() < fracao_unicas:
+            palavras = [sorteio.choice(_PALAVRAS) for _ in range(sorteio.randint(12, 60))]
+            assunto = f"Assunto {i}: {palavras[0]}"
+            corpo = f"Mensagem {i}. " + " ".join(palavras) + "."
+        else:
+            modelo_assunto, modelo_corpo = sorteio.choice(_MODELOS)
+            campos = {"n": sorteio.randint(10000, 99999), "d": sorteio.randint(1, 28),
+                      "m": sorteio.randint(1, 12), "k": sorteio.randint(2, 9)}
+            assunto = modelo_assunto.format(**campos)
+            corpo = modelo_corpo.format(**campos) + f"\n\nAtenciosamente,\n{nome}"
+        yield {"assunto": assunto, "corpo": corpo, "remetente": remetente, "data": data}
+
+
+def _texto(m: dict) -> str:
+    # Mesmo formato de MensagemEmail.texto
+    return f"Assunto: {m['assunto']}\n\n{m['corpo']}"
+
+
+def gravar_txt(caminho: str, n: int, semente: int = 0, fracao_unicas: float = 0.3) -> int:
+    """Mensagens separadas por "---" (formato aceito no campo text e em .txt). Retorna o tamanho em bytes."""
+    with open(caminho, "w", encoding="utf-8") as f:
+        for i, m in enumerate(gerar_mensagens(n, semente, fracao_unicas)):
+            if i:
+                f.write(SEPARADOR)
+            f.write(_texto(m))
+        return f.tell()
+
+
+def gravar_mbox(caminho: str, n: int, semente: int = 0, fracao_unicas: float = 0.3) -> int:
+    """Uma mensagem por bloco "From ", com Message-ID, From, Date e Subject. Retorna o tamanho em bytes."""
+    with open(caminho, "wb") as f:
+        for i, m in enumerate(gerar_mensagens(n, semente, fracao_unicas)):
+            data = m["data"].strftime("%a, %d %b %Y %H:%M:%S +0000")
+            corpo = m["corpo"].replace("\nFrom ", "\n>From ")
+            f.write(
+                f"From cliente@exemplo.com.br {m['data'].strftime('%a %b %d %H:%M:%S %Y')}\n"
+                f"Message-ID: <{i}.{semente}@exemplo.com.br>\n"
+                f"From: {m['remetente']}\n"
+                f"Date: {data}\n"
+                f"Subject: {m['assunto']}\n"
+                f"Content-Type: text/plain; charset=utf-8\n\n"
+                f"{corpo}\n\n".encode("utf-8")
+            )
+        return f.tell()
+
+
+def gravar_pdf(caminho: str, n: int, semente: int = 0, fracao_unicas: float = 0.3,
+               mensagens_por_pagina: int = 8) -> int:
+    """
+    PDF com `mensagens_por_pagina` mensagens por página. A extração de PDF devolve um texto
+    único (sem os separadores), então serve para medir extração e análise. Retorna o tamanho em bytes.
+    """
+    paginas = -(-n // mensagens_por_pagina)
+
+    def _linhas():
+        pagina = []
+        for i, m in enumerate(gerar_mensagens(n, semente, fracao_unicas), start=1):
+            pagina.append(f"{m['remetente']} - {m['data']:%d/%m/%Y} - {m['assunto']}")
+            pagina.extend(_quebrar(m["corpo"].replace("\n", " "), 90))
+            if i % mensagens_por_pagina == 0:
+                yield pagina
+                pagina = []
+        if pagina:
+            yield pagina
+
+    escrever_pdf(caminho, _linhas(), paginas)
+    with open(caminho, "rb") as f:
+        return f.seek(0, 2)
+
+
+def _quebrar(texto: str, largura: int) -> list:
+    linhas, atual = [], ""
+    for palavra in texto.split():
+        if atual and len(atual) + 1 + len(palavra) > largura:
+            linhas.append(atual)
+            atual = palavra
+        else:
+            atual = f"{atual} {palavra}" if atual else palavra
+    if atual:
+        linhas.append(atual)
+    return linhas
+
+
+def _literal_pdf(linha: str) -> bytes:
+    texto = linha.encode("latin-1", errors="replace")
+    return b"(" + texto.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def escrever_pdf(caminho: str, paginas, total_paginas: int):
+    """
+    Grava um PDF simples (Helvetica, texto puro) página a página. `paginas` é um iterável
+    de listas de linhas com exatamente `total_paginas` itens (a numeração dos objetos
+    depende do total, para não precisar guardar as páginas em memória).
+    """
+    # Objetos: 1 = fonte; página p (0..P-1) = conteúdo 2+2p e página 3+2p; depois árvore e catálogo
+    raiz = 2 + 2 * total_paginas
+    catalogo = raiz + 1
+    offsets = []
+    with open(caminho, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+
+        def _obj(conteudo: bytes):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % len(offsets) + conteudo + b"\nendobj\n")
+
+        _obj(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        escritas = 0
+        for linhas in paginas:
+            texto = b"BT /F1 10 Tf 40 800 Td 12 TL " + b" ".join(_literal_pdf(l) + b" '" for l in linhas) + b" ET"
+            _obj(b"<< /Length %d >>\nstream\n" % len(texto) + texto + b"\nendstream")
+            _obj(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] /Contents %d 0 R"
+                 b" /Resources << /Font << /F1 1 0 R >> >> >>" % (raiz, len(offsets)))
+            escritas += 1
+        if escritas != total_paginas:
+            raise ValueError(f"Esperava {total_paginas} páginas, recebeu {escritas}.")
+        kids = b" ".join(b"%d 0 R" % (3 + 2 * p) for p in range(total_paginas))
+        _obj(b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % total_paginas)
+        _obj(b"<< /Type /Catalog /Pages %d 0 R >>" % raiz)
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1))
+        for off in offsets:
+            f.write(b"%010d 00000 n \n" % off)
+        f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, catalogo, xref))
+
+
+GRAVADORES = {"txt": gravar_txt, "mbox": gravar_mbox, "pdf": gravar_pdf}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um corpus sintético de mensagens")
+    parser.add_argument("--formato", choices=sorted(GRAVADORES), default="mbox")
+    parser.add_argument("--mensagens", type=int, default=1000)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--fracao-unicas", type=float, default=0.3)
+    parser.add_argument("--saida", required=True)
+    args = parser.parse_args()
+    tamanho = GRAVADORES[args.formato](args.saida, args.mensagens, args.semente, args.fracao_unicas)
+    print(f"{args.saida}: {args.mensagens} mensagens, {tamanho / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Servidor local compatível com o endpoint /v1/chat/completions da OpenAI,
+usado para benchmarks sem chave real. Injeta latência configurável e, opcionalmente,
+falhas: erros HTTP (429/500/503) e respostas com JSON malformado, em taxas fixas.
+Com --limite-rpm, imita o limite de requisições por minuto da conta: acima dele
+responde 429 com Retry-After (útil para medir vários workers contra o mesmo limite).
+
+Uso:
+    python -m benchmarks.stub_openai --porta 8765 --latencia-ms 300 --taxa-erro 0.02 --taxa-malformado 0.05
+    python -m benchmarks.stub_openai --porta 8765 --limite-rpm 600
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI(title="Stub OpenAI")
+app.state.latencia_ms = 300.0
+app.state.taxa_erro = 0.0
+app.state.taxa_malformado = 0.0
+app.state.sorteio = random.Random()
+app.state.limite_rpm = 0.0
+# Balde do limite por minuto: [disponível, última atualização]
+app.state.balde = [0.0, 0.0]
+app.state.contadores = {"chamadas": 0, "erros": 0, "malformadas": 0, "limitadas": 0}
+
+
+def _conteudo_fake(system: str, user: str) -> str:
+    # Gera uma resposta plausível de acordo com o tipo de prompt recebido
+    if '{"itens"' in system:
+        n = user.count("\n\n---\n\n") + 1
+        return json.dumps({"itens": [{"label": "produtivo", "score": 0.9} for _ in range(n)]})
+    if "classificador" in system:
+        return json.dumps({"label": "produtivo", "score": 0.9})
+    if "insights" in system or "análises parciais" in system:
+        return json.dumps({"resumo": "Resumo sintético.", "temas": ["tema"], "acoes": ["ação"]})
+    return "Obrigado pelo contato. Vamos analisar e retornar em breve."
+
+
+def _malformar(conteudo: str, sorteio: random.Random) -> str:
+    # Falhas típicas de saída sem JSON schema: texto em volta, JSON cortado ou item fora do contrato
+    if not conteudo.startswith(("{", "[")):
+        return conteudo
+    tipo = sorteio.randrange(3)
+    if tipo == 0:
+        return "Claro! Aqui está o resultado:\n" + conteudo[:len(conteudo) // 2]
+    if tipo == 1:
+        return conteudo[:-1]
+    return conteudo.replace('"produtivo"', '"talvez"', 1)
+
+
+def _consumir_limite() -> float:
+    # Token bucket com capacidade de 1 segundo de limite; retorna 0 ou os segundos até liberar
+    if app.state.limite_rpm <= 0:
+        return 0.0
+    taxa = app.state.limite_rpm / 60.0
+    capacidade = max(1.0, taxa)
+    agora = time.monotonic()
+    disponivel, ultimo = app.state.balde
+    disponivel = min(capacidade, disponivel + (agora - ultimo) * taxa)
+    if disponivel < 1:
+        app.state.balde = [disponivel, agora]
+        return (1 - disponivel) / taxa
+    app.state.balde = [disponivel - 1, agora]
+    return 0.0
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    msgs = body.get("messages", [])
+    system = msgs[0]["content"] if msgs else ""
+    user = msgs[-1]["content"] if msgs else ""
+    await asyncio.sleep(app.state.latencia_ms / 1000.0)
+    contadores = app.state.contadores
+    contadores["chamadas"] += 1
+    espera = _consumir_limite()
+    if espera > 0:
+        contadores["limitadas"] += 1
+        return JSONResponse(status_code=429, content={"error": {"message": "limite de requisições por minuto"}},
+                            headers={"Retry-After": f"{espera:.2f}"})
+    sorteio = app.state.sorteio
+    if sorteio.random() < app.state.taxa_erro:
+        contadores["erros"] += 1
+        status = sorteio.choice((429, 500, 503))
+        headers = {"Retry-After": "1"} if status == 429 else {}
+        return JSONResponse(status_code=status, content={"error": {"message": "falha simulada"}}, headers=headers)
+    conteudo = _conteudo_fake(system, user)
+    if sorteio.random() < app.state.taxa_malformado:
+        contadores["malformadas"] += 1
+        conteudo = _malformar(conteudo, sorteio)
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": conteudo}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": len(user) // 4, "completion_tokens": len(conteudo) // 4, "total_tokens": (len(user) + len(conteudo)) // 4},
+    }
+
+
+@app.get("/stub/contadores")
+async def contadores():
+    # Chamadas recebidas e falhas injetadas desde a subida do stub
+    return app.state.contadores
+
+
+def configurar(latencia_ms: float = 300.0, taxa_erro: float = 0.0, taxa_malformado: float = 0.0, semente: int = None,
+               limite_rpm: float = 0.0):
+    app.state.latencia_ms = latencia_ms
+    app.state.taxa_erro = taxa_erro
+    app.state.taxa_malformado = taxa_malformado
+    app.state.sorteio = random.Random(semente)
+    app.state.limite_rpm = limite_rpm
+    app.state.balde = [max(1.0, limite_rpm / 60.0), time.monotonic()]
+
+
+def iniciar_em_thread(porta: int = 8765, latencia_ms: float = 300.0, taxa_erro: float = 0.0,
+                      taxa_malformado: float = 0.0, semente: int = None, limite_rpm: float = 0.0) -> uvicorn.Server:
+    """
+    Sobe o stub numa thread daemon e aguarda ficar pronto. Retorna o uvicorn.Server
+    (chame server.should_exit = True para encerrar).
+    """
+    configurar(latencia_ms, taxa_erro, taxa_malformado, semente, limite_rpm)
+    config = uvicorn.Config(app, host="127.0.0.1", port=porta, log_level="warning")
+    server = uvicorn.Server(config)
+    t = threading.Thread(target=server.run, daemon=True)
+    t.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local do endpoint de chat completions")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=300.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração das chamadas respondidas com 429/500/503")
+    parser.add_argument("--taxa-malformado", type=float, default=0.0, help="fração das respostas com JSON malformado")
+    parser.add_argument("--semente", type=int, default=None, help="semente do sorteio das falhas (reprodutível)")
+    parser.add_argument("--limite-rpm", type=float, default=0.0, help="requisições por minuto aceitas (0 = sem limite)")
+    args = parser.parse_args()
+    configurar(args.latencia_ms, args.taxa_erro, args.taxa_malformado, args.semente, args.limite_rpm)
+    uvicorn.run(app, host="127.0.0.1", port=args.porta, log_level="warning")
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import socket
+import tempfile
+import subprocess
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# As configurações do app são lidas na importação dos módulos: o ambiente dos testes
+# é montado aqui, antes de qualquer "import app...". A IA é o stub de benchmarks/stub_openai.py.
+PORTA_STUB = _porta_livre()
+_TEMP = tempfile.mkdtemp(prefix="autou_testes_")
+os.environ.update({
+    "OPENAI_URL": f"http://127.0.0.1:{PORTA_STUB}/v1/chat/completions",
+    "OPENAI_API_KEY": "chave-de-teste",
+    "LLM_PROVEDORES_PATH": "",
+    "LLM_BACKOFF_BASE": "0.01",
+    "LLM_TIMEOUT": "5",
+    "LLM_HEDGE_ATIVO": "0",
+    "CLASSIFICADOR_LOCAL_ATIVO": "0",
+    "CACHE_DB_PATH": "",
+    "ACERVO_DB_PATH": "",
+    "JOBS_DIR": os.path.join(_TEMP, "jobs"),
+    "UPLOAD_MAX_MENSAGENS": "50",
+})
+
+
+@pytest.fixture(scope="session", autouse=True)
+def stub_openai():
+    """Stub da API de chat completions num subprocesso (porta PORTA_STUB) durante toda a sessão."""
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.stub_openai", "--porta", str(PORTA_STUB), "--latencia-ms", "5"],
+        cwd=RAIZ, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    limite = time.monotonic() + 20
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", PORTA_STUB), timeout=0.2).close()
+            break
+        except OSError:
+            if processo.poll() is not None or time.monotonic() > limite:
+                processo.kill()
+                raise RuntimeError("O stub da OpenAI não subiu.")
+            time.sleep(0.1)
+    yield PORTA_STUB
+    processo.kill()
+    processo.wait()
+
+
+@pytest.fixture
+def cliente():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as c:
+        yield c
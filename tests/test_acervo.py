@@ -0,0 +1,44 @@
+from app.acervo import AcervoMensagens, hash_mensagem
+
+PEDIDO = "Bom dia, o pedido 1001 ainda não chegou, podem verificar?"
+BOLETO = "Preciso da segunda via do boleto da fatura de março."
+
+
+def test_classificacao_so_volta_na_mesma_versao_e_dentro_do_prazo(tmp_path):
+    acervo = AcervoMensagens(str(tmp_path / "acervo.db"))
+    acervo.registrar_classificacoes([(PEDIDO, {"label": "produtivo", "score": 0.9})], "gpt|clf-v1|0.0")
+    acervo.aguardar_escritas()
+    chave = hash_mensagem(PEDIDO)
+    assert acervo.obter(chave, "gpt|clf-v1|0.0") == {"label": "produtivo", "score": 0.9}
+    assert acervo.obter(chave, "gpt|clf-v2|0.0") is None
+    assert acervo.obter_varios([chave, hash_mensagem(BOLETO)], "gpt|clf-v1|0.0") == {
+        chave: {"label": "produtivo", "score": 0.9}
+    }
+    acervo.ttl = -1
+    assert acervo.obter(chave, "gpt|clf-v1|0.0") is None
+
+
+def test_respostas_por_label_e_versao(tmp_path):
+    acervo = AcervoMensagens(str(tmp_path / "acervo.db"))
+    acervo.registrar_classificacoes([(PEDIDO, {"label": "produtivo", "score": 0.9}),
+                                     (BOLETO, {"label": "produtivo", "score": 0.8})], "v")
+    acervo.registrar_resposta(PEDIDO, "produtivo", "Vamos verificar o pedido.", "resp-v2")
+    acervo.aguardar_escritas()
+    assert acervo.obter_respostas([(PEDIDO, "produtivo"), (PEDIDO, "neutro"), (BOLETO, "produtivo")], "resp-v2") == [
+        "Vamos verificar o pedido.", None, None
+    ]
+    assert acervo.obter_resposta(PEDIDO, "produtivo", "resp-v1") is None
+
+
+def test_anotar_e_consultar(tmp_path):
+    acervo = AcervoMensagens(str(tmp_path / "acervo.db"))
+    acervo.anotar(PEDIDO, {"from": "Cliente <c@ex.com>", "subject": "Pedido 1001", "message-id": "<m1@ex.com>",
+                           "date": "Mon, 01 Jan 2024 10:00:00 +0000"})
+    acervo.descarregar()
+    acervo.registrar_classificacoes([(PEDIDO, {"label": "produtivo", "score": 0.9})], "v")
+    # A busca espera as gravações enfileiradas
+    resultado = acervo.consultar(texto="pedido")
+    assert resultado["total"] == 1
+    item = resultado["itens"][0]
+    assert (item["message_id"], item["assunto"], item["label"]) == ("m1@ex.com", "Pedido 1001", "produtivo")
+    assert acervo.resumo() == {"total": 1, "com_resposta": 0, "por_label": {"produtivo": 1}}
@@ -0,0 +1,83 @@
+import asyncio
+import itertools
+import threading
+
+from app import analise_hierarquica
+from app.analise_hierarquica import (_agrupar_parciais, _combinar_localmente, dividir_em_blocos,
+                                     gerar_analise_hierarquica_async)
+from app.tokens import estimar_tokens
+
+
+def _mensagens(n: int):
+    for i in range(n):
+        yield f"Cliente {i}: o pedido {1000 + i} chegou com a caixa amassada e faltando a nota fiscal do item."
+
+
+def test_blocos_respeitam_o_orcamento_e_leem_a_entrada_sob_demanda():
+    lidas = []
+
+    def _contar(mensagens):
+        for m in mensagens:
+            lidas.append(m)
+            yield m
+
+    blocos = dividir_em_blocos(_contar(_mensagens(10_000)), orcamento_tokens=200)
+    primeiros = list(itertools.islice(blocos, 3))
+    assert all(sum(estimar_tokens(t) for t in bloco) <= 200 for bloco in primeiros)
+    assert len(lidas) < 100
+    # Mensagem maior que o orçamento é cortada em pedaços
+    grande = "\n\n".join(["parágrafo " * 40] * 10)
+    assert len(list(dividir_em_blocos([grande], orcamento_tokens=200))) > 1
+
+
+def test_fronteiras_dependem_do_conteudo():
+    # Uma mensagem nova no início só muda os primeiros blocos
+    mensagens = list(_mensagens(300))
+    antes = list(dividir_em_blocos(mensagens, orcamento_tokens=400))
+    depois = list(dividir_em_blocos(["Mensagem nova sobre outro assunto qualquer."] + mensagens, orcamento_tokens=400))
+    assert antes[-5:] == depois[-5:]
+
+
+def test_reducao_local_e_grupos_de_parciais():
+    parciais = [{"resumo": f"r{i}", "temas": ["entrega"] + (["boleto"] if i % 2 else []), "acoes": [], "mensagens": 2}
+                for i in range(5)]
+    combinado = _combinar_localmente(parciais)
+    assert combinado["temas"] == ["entrega", "boleto"] and combinado["mensagens"] == 10
+    grupos = list(_agrupar_parciais(parciais * 4, orcamento_tokens=10_000))
+    assert [len(g) for g in grupos] == [8, 8, 4]
+
+
+def test_analise_map_reduce_pelo_stub(monkeypatch):
+    monkeypatch.setattr(analise_hierarquica, "obter_cache", lambda: None)
+    monkeypatch.setattr(analise_hierarquica, "DUPLICATAS_ATIVO", False)
+    concluidos = {}
+
+    async def _guardar(indice, parcial):
+        concluidos[indice] = parcial
+
+    analise, meta = asyncio.run(gerar_analise_hierarquica_async(
+        _mensagens(200), orcamento_tokens=400, ao_concluir_bloco=_guardar))
+    assert set(analise) == {"resumo", "temas", "acoes"}
+    assert meta["modo"] == "hierarquico" and meta["blocos"] > 1 and meta["rodadas_reducao"] >= 1
+    assert meta["blocos_com_erro"] == 0 and len(concluidos) == meta["blocos"]
+    # Retomada: os blocos já salvos não voltam para a IA
+    _, meta = asyncio.run(gerar_analise_hierarquica_async(_mensagens(200), orcamento_tokens=400,
+                                                          parciais_salvos=concluidos))
+    assert meta["blocos_retomados"] == meta["blocos"]
+
+
+def test_entrada_lida_e_agrupada_fora_do_event_loop(monkeypatch):
+    monkeypatch.setattr(analise_hierarquica, "obter_cache", lambda: None)
+    threads = set()
+
+    def _entrada():
+        for texto in _mensagens(200):
+            threads.add(threading.get_ident())
+            yield texto
+        # Campanha repetida: entra uma vez só na análise
+        for _ in range(100):
+            yield "Promoção imperdível de fim de ano para todos os clientes cadastrados na nossa loja virtual."
+
+    analise, meta = asyncio.run(gerar_analise_hierarquica_async(_entrada(), orcamento_tokens=400))
+    assert threading.get_ident() not in threads
+    assert meta["duplicatas"] == {"mensagens": 300, "grupos": 2}
@@ -0,0 +1,73 @@
+import json
+
+MENSAGENS = [
+    "Bom dia, o pedido 1001 ainda não chegou, podem verificar?",
+    "Preciso da segunda via do boleto da fatura de março.",
+    "Meu cadastro está com o endereço errado, como corrijo?",
+]
+
+
+def test_classify_uma_mensagem(cliente):
+    r = cliente.post("/classify", data={"text": MENSAGENS[0]})
+    assert r.status_code == 200
+    corpo = r.json()
+    assert corpo["classificacao"]["label"] == "produtivo"
+    assert corpo["resposta"]
+    assert corpo["meta"]["disjuntor"]["estado"] == "fechado"
+
+
+def test_classify_varias_mensagens(cliente):
+    r = cliente.post("/classify", files={"file": ("emails.txt", "\n\n---\n\n".join(MENSAGENS).encode())})
+    assert r.status_code == 200
+    corpo = r.json()
+    assert len(corpo["classificacoes"]) == len(corpo["respostas"]) == len(MENSAGENS)
+    assert corpo["classificacao"]["contagem"] == {"produtivo": len(MENSAGENS)}
+    assert all(corpo["respostas"])
+
+
+def test_classify_sem_conteudo(cliente):
+    assert cliente.post("/classify", data={"text": "   "}).status_code == 400
+
+
+def test_classify_assincrono_e_consulta_do_job(cliente):
+    r = cliente.post("/classify", data={"text": "\n\n---\n\n".join(MENSAGENS), "assincrono": "true"})
+    assert r.status_code == 202
+    job = r.json()
+    assert cliente.get(job["url"]).json()["id"] == job["job_id"]
+    assert cliente.get("/jobs/nao-existe").status_code == 404
+
+
+def test_acervo_desligado_por_padrao(cliente):
+    assert cliente.get("/mensagens").status_code == 404
+
+
+def _linhas(resposta) -> list:
+    return [json.loads(linha) for linha in resposta.text.splitlines()]
+
+
+def test_classify_stream_emite_ndjson_por_mensagem(cliente):
+    r = cliente.post("/classify/stream", data={"text": "\n\n---\n\n".join(MENSAGENS)})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("application/x-ndjson")
+    eventos = _linhas(r)
+    assert eventos[-1]["tipo"] == "fim" and eventos[-1]["total"] == len(MENSAGENS)
+    classificacoes = [e for e in eventos if e["tipo"] == "classificacao"]
+    respostas = [e for e in eventos if e["tipo"] == "resposta"]
+    assert sorted(e["indice"] for e in classificacoes) == sorted(e["indice"] for e in respostas) == [0, 1, 2]
+    # A resposta de cada mensagem só sai depois da classificação dela
+    posicao = {(e["tipo"], e["indice"]): i for i, e in enumerate(eventos) if "indice" in e}
+    assert all(posicao["classificacao", i] < posicao["resposta", i] for i in range(len(MENSAGENS)))
+
+
+def test_classify_stream_uma_mensagem_e_erro_de_entrada(cliente):
+    eventos = _linhas(cliente.post("/classify/stream", data={"text": MENSAGENS[1]}))
+    assert [e["tipo"] for e in eventos] == ["classificacao", "resposta", "fim"]
+    assert eventos[0]["label"] == "produtivo" and eventos[1]["resposta"]
+    assert cliente.post("/classify/stream", data={"text": ""}).status_code == 400
+
+
+def test_classify_pdf_ilegivel_cai_para_texto_em_fluxo(cliente):
+    conteudo = ("%PDF-1.4 corrompido\n\n---\n\n" + "\n\n---\n\n".join(MENSAGENS)).encode()
+    r = cliente.post("/classify", files={"file": ("emails.pdf", conteudo, "application/pdf")})
+    assert r.status_code == 200
+    assert len(r.json()["classificacoes"]) == len(MENSAGENS) + 1
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from PyPDF2 import PdfReader
+
+from app.leitor_mbox import iterar_emails_mbox
+from benchmarks import stub_openai
+from benchmarks.corpus import SEPARADOR, gerar_mensagens, gravar_mbox, gravar_pdf, gravar_txt
+
+
+@pytest.fixture
+def stub():
+    stub_openai.configurar(latencia_ms=0, semente=1)
+    stub_openai.app.state.contadores = {"chamadas": 0, "erros": 0, "malformadas": 0, "limitadas": 0}
+    with TestClient(stub_openai.app) as c:
+        yield c
+    stub_openai.configurar()
+
+
+def _chamar(cliente, system: str, user: str = "mensagem"):
+    return cliente.post("/v1/chat/completions", json={
+        "model": "stub", "messages": [{"role": "system", "content": system}, {"role": "user", "content": user}]})
+
+
+def _conteudo(resposta) -> str:
+    return resposta.json()["choices"][0]["message"]["content"]
+
+
+def test_stub_responde_conforme_o_prompt(stub):
+    lote = json.loads(_conteudo(_chamar(stub, 'Responda {"itens": [...]}', SEPARADOR.join("abc"))))
+    assert len(lote["itens"]) == 3
+    assert json.loads(_conteudo(_chamar(stub, "Você é um classificador")))["label"] == "produtivo"
+    assert set(json.loads(_conteudo(_chamar(stub, "fornece um JSON com insights")))) == {"resumo", "temas", "acoes"}
+    resposta = _chamar(stub, "Escreva uma resposta")
+    assert _conteudo(resposta).startswith("Obrigado") and resposta.json()["usage"]["total_tokens"] > 0
+    assert stub.get("/stub/contadores").json()["chamadas"] == 4
+
+
+def test_stub_injeta_erros_e_json_malformado(stub):
+    stub_openai.configurar(latencia_ms=0, taxa_erro=1.0, semente=1)
+    assert {_chamar(stub, "classificador").status_code for _ in range(30)} == {429, 500, 503}
+    stub_openai.configurar(latencia_ms=0, taxa_malformado=1.0, semente=1)
+    for _ in range(10):
+        conteudo = _conteudo(_chamar(stub, "classificador"))
+        try:
+            assert json.loads(conteudo)["label"] == "talvez"
+        except json.JSONDecodeError:
+            pass
+    contadores = stub.get("/stub/contadores").json()
+    assert contadores["erros"] == 30 and contadores["malformadas"] == 10
+
+
+def test_stub_limite_por_minuto_responde_429_com_retry_after(stub):
+    stub_openai.configurar(latencia_ms=0, limite_rpm=60)
+    assert _chamar(stub, "classificador").status_code == 200
+    limitada = _chamar(stub, "classificador")
+    assert limitada.status_code == 429 and 0 < float(limitada.headers["Retry-After"]) <= 1
+    assert stub.get("/stub/contadores").json()["limitadas"] == 1
+
+
+def test_corpus_deterministico_com_campanhas_e_mensagens_unicas():
+    mensagens = list(gerar_mensagens(200, semente=5))
+    assert mensagens == list(gerar_mensagens(200, semente=5)) != list(gerar_mensagens(200, semente=6))
+    assert len({m["corpo"] for m in mensagens}) < 200
+    assert all(m["data"] < n["data"] for m, n in zip(mensagens, mensagens[1:]))
+
+
+def test_corpus_gravado_em_txt_mbox_e_pdf(tmp_path):
+    txt = tmp_path / "caixa.txt"
+    assert gravar_txt(str(txt), 30) == txt.stat().st_size
+    assert len(txt.read_text(encoding="utf-8").split(SEPARADOR)) == 30
+
+    mbox = tmp_path / "caixa.mbox"
+    gravar_mbox(str(mbox), 30, semente=2)
+    lidas = list(iterar_emails_mbox(mbox.read_bytes()))
+    assert [m.assunto for m in lidas] == [m["assunto"] for m in gerar_mensagens(30, semente=2)]
+
+    pdf = tmp_path / "caixa.pdf"
+    gravar_pdf(str(pdf), 30, mensagens_por_pagina=8)
+    leitor = PdfReader(str(pdf))
+    assert len(leitor.pages) == 4
+    assert next(gerar_mensagens(30))["assunto"] in leitor.pages[0].extract_text()
@@ -0,0 +1,107 @@
+import time
+import asyncio
+import threading
+
+from app import cache as cache_mod
+from app.cache import CacheResultados, chave_cache, somar_contadores_cache
+from app.nlp_utils import classificar_com_openai
+
+
+def test_chave_muda_com_modelo_prompt_temperatura_e_extra():
+    base = chave_cache("classificacao", "texto", "gpt-teste", "clf-v1", 0.0)
+    assert base == chave_cache("classificacao", "texto", "gpt-teste", "clf-v1", 0)
+    variacoes = {
+        chave_cache("resposta", "texto", "gpt-teste", "clf-v1", 0.0),
+        chave_cache("classificacao", "texto!", "gpt-teste", "clf-v1", 0.0),
+        chave_cache("classificacao", "texto", "outro", "clf-v1", 0.0),
+        chave_cache("classificacao", "texto", "gpt-teste", "clf-v2", 0.0),
+        chave_cache("classificacao", "texto", "gpt-teste", "clf-v1", 0.2),
+        chave_cache("classificacao", "texto", "gpt-teste", "clf-v1", 0.0, extra="produtivo"),
+    }
+    assert base not in variacoes and len(variacoes) == 6
+
+
+def test_lru_ttl_e_contadores():
+    cache = CacheResultados(max_itens=2, ttl=60, caminho_db=None)
+    cache.guardar("a", {"label": "produtivo"})
+    cache.guardar("b", 1)
+    assert cache.obter("a") == {"label": "produtivo"}
+    # "b" é o menos usado: sai quando "c" entra
+    cache.guardar("c", 2)
+    assert cache.obter("b") is None
+    assert cache.estatisticas() == {"hits": 1, "misses": 1, "itens_memoria": 2, "disco": False}
+    cache.ttl = -1
+    cache.guardar("d", 3)
+    assert cache.obter("d") is None
+
+
+def test_camada_em_disco_sobrevive_a_uma_nova_instancia(tmp_path):
+    caminho = str(tmp_path / "cache.db")
+    antigo = CacheResultados(caminho_db=caminho)
+    antigo.guardar("chave", {"label": "neutro", "score": 0.5})
+    antigo.aguardar_escritas()
+    novo = CacheResultados(caminho_db=caminho)
+    assert asyncio.run(novo.obter_async("chave")) == {"label": "neutro", "score": 0.5}
+    # Depois da leitura do disco, a chave fica na memória
+    assert "chave" in novo._memoria and novo.hits == 1
+
+
+def test_gravacoes_em_disco_agrupadas_por_transacao(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod, "CACHE_LOTE_ESCRITA", 100)
+    conectar = CacheResultados._conectar
+    liberar = threading.Event()
+    transacoes = []
+
+    def _conectar(caminho_db, timeout_ms):
+        db = conectar(caminho_db, timeout_ms)
+        if threading.current_thread().name == "cache-escrita":
+            # A thread de escrita só começa depois que todas as gravações entram na fila
+            liberar.wait()
+            db.set_trace_callback(lambda sql: transacoes.append(sql) if sql == "COMMIT" else None)
+        return db
+
+    monkeypatch.setattr(CacheResultados, "_conectar", staticmethod(_conectar))
+    cache = CacheResultados(caminho_db=str(tmp_path / "cache.db"))
+    for i in range(250):
+        cache.guardar(f"k{i}", i)
+    liberar.set()
+    cache.aguardar_escritas()
+    assert len(transacoes) == 3
+    assert cache._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 250
+
+
+def test_disco_ocupado_cai_para_a_memoria(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod, "CACHE_DISCO_TIMEOUT_MS", 20)
+    cache = CacheResultados(caminho_db=str(tmp_path / "cache.db"))
+    cache.guardar("no_disco", 1)
+    cache.aguardar_escritas()
+    cache._memoria.clear()
+    cache.guardar("na_memoria", 2)
+    # Leitura lenta em andamento: a próxima consulta ao disco desiste em vez de esperar
+    with cache._lock_db:
+        inicio = time.perf_counter()
+        assert cache.obter("na_memoria") == 2
+        assert asyncio.run(cache.obter_async("no_disco")) is None
+        assert time.perf_counter() - inicio < 1
+    assert cache.obter("no_disco") == 1
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_entradas_vencidas_sao_apagadas_periodicamente(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_mod, "CACHE_LIMPEZA_INTERVALO", 0.05)
+    cache = CacheResultados(ttl=-1, caminho_db=str(tmp_path / "cache.db"))
+    cache.guardar("vencida", 1)
+    cache.aguardar_escritas()
+    limite = time.monotonic() + 5
+    while cache._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] and time.monotonic() < limite:
+        time.sleep(0.02)
+    assert cache._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0] == 0
+
+
+def test_segunda_classificacao_sai_do_cache():
+    texto = "Olá, o boleto 778812 veio com o valor errado, podem corrigir?"
+    label, _, meta = classificar_com_openai(texto)
+    assert meta["source"] == "openai" and meta["cache"] == {"hits": 0, "misses": 1}
+    label_cache, _, meta = classificar_com_openai(texto)
+    assert (label_cache, meta["source"]) == (label, "cache")
+    assert somar_contadores_cache(meta, {"cache": {"hits": 2, "misses": 1}}, None) == {"hits": 3, "misses": 1}
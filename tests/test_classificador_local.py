@@ -0,0 +1,64 @@
+import json
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from app import classificador_local, nlp_utils
+from app.classificador_local import ClassificadorLocal, avaliar, ler_exemplos, registrar_rotulos_llm, treinar
+
+PRODUTIVAS = [f"O pedido {i} não chegou, podem verificar a entrega?" for i in range(20)]
+IMPRODUTIVAS = [f"Feliz natal a toda a equipe, abraços {i}!" for i in range(20)]
+
+
+@pytest.fixture(scope="module")
+def modelo():
+    return treinar(PRODUTIVAS + IMPRODUTIVAS, ["produtivo"] * 20 + ["improdutivo"] * 20, bits=12, epocas=100)
+
+
+def test_modelo_aprende_e_sobrevive_ao_arquivo(modelo, tmp_path):
+    assert [l for l, _ in modelo.prever(["O pedido 99 não chegou", "Feliz natal, abraços"])] == ["produtivo", "improdutivo"]
+    caminho = str(tmp_path / "modelo.npz")
+    modelo.salvar(caminho)
+    carregado = ClassificadorLocal.carregar(caminho)
+    assert carregado.classes == modelo.classes and carregado.bits == 12
+    assert carregado.prever(PRODUTIVAS[:3]) == pytest.approx(modelo.prever(PRODUTIVAS[:3]), abs=1e-4)
+
+
+def test_so_as_previsoes_confiantes_dispensam_a_ia(modelo):
+    resultados = modelo.prever_confiantes(["O pedido 5 não chegou", "xyz"], confianca=0.8)
+    assert resultados[0]["label"] == "produtivo" and resultados[1] is None
+    metricas = avaliar(modelo, PRODUTIVAS[:5] + IMPRODUTIVAS[:5], ["produtivo"] * 5 + ["improdutivo"] * 5, confianca=0.0)
+    assert metricas["concordancia"] == metricas["cobertura"] == 1.0
+
+
+def test_log_de_rotulos_da_ia_vira_dados_de_treino(monkeypatch, tmp_path):
+    log = tmp_path / "rotulos.jsonl"
+    monkeypatch.setattr(classificador_local, "CLASSIFICACOES_LOG_PATH", str(log))
+    registrar_rotulos_llm(["O pedido 1 atrasou"], [{"label": "produtivo", "score": 0.9}])
+    with open(log, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"texto": "Oi", "label": "Neutro", "origem": "humano"}) + "\n\n")
+    assert ler_exemplos(str(log)) == (["O pedido 1 atrasou", "Oi"], ["produtivo", "neutro"])
+    assert ler_exemplos(str(log), somente_origem="llm") == (["O pedido 1 atrasou"], ["produtivo"])
+
+
+def test_mensagens_confiantes_nao_vao_para_a_ia(modelo, monkeypatch):
+    monkeypatch.setattr(nlp_utils, "obter_classificador_local", lambda: modelo)
+    monkeypatch.setattr(nlp_utils, "obter_cache", lambda: None)
+    monkeypatch.setattr(classificador_local, "CLASSIFICADOR_LOCAL_CONFIANCA", 0.6)
+    enviadas = []
+    original = nlp_utils._classificar_lote_async
+
+    async def _contar(lote, *args, **kwargs):
+        enviadas.extend(lote)
+        return await original(lote, *args, **kwargs)
+
+    monkeypatch.setattr(nlp_utils, "_classificar_lote_async", _contar)
+    mensagens = ["O pedido 7 não chegou, podem verificar a entrega?", "Feliz natal a toda a equipe!",
+                 "Qual é a cor do céu em Marte segundo a NASA?"]
+    resultados, meta = asyncio.run(nlp_utils.classificar_mensagens_async(mensagens, max_por_lote=10))
+    assert [r["label"] for r in resultados[:2]] == ["produtivo", "improdutivo"]
+    assert meta["local"]["resolvidas"] + meta["local"]["enviadas_ia"] == len(mensagens)
+    assert len(enviadas) == meta["local"]["enviadas_ia"] < len(mensagens)
@@ -0,0 +1,92 @@
+import json
+import asyncio
+
+from app import nlp_utils
+from app.contratos import interpretar_lote
+from app.lotes import LimiteAdaptativo
+
+SEPARADOR = "\n\n---\n\n"
+
+
+def test_interpretar_lote_aceita_objeto_ou_array():
+    itens = [{"label": "produtivo", "score": 0.9}, {"label": "neutro", "score": 0.4}]
+    assert interpretar_lote(json.dumps({"itens": itens}), 2) == itens
+    assert interpretar_lote(json.dumps(itens), 2) == itens
+
+
+def test_interpretar_lote_tolera_texto_em_volta_do_json():
+    conteudo = "Claro! Aqui está:\n```json\n" + json.dumps({"itens": [{"label": "improdutivo", "score": 1}]}) + "\n```"
+    assert interpretar_lote(conteudo, 1) == [{"label": "improdutivo", "score": 1.0}]
+
+
+def test_interpretar_lote_marca_item_fora_do_contrato():
+    conteudo = json.dumps({"itens": [{"label": "talvez", "score": 0.5}, {"label": "neutro", "score": 0.5}]})
+    assert interpretar_lote(conteudo, 2) == [None, {"label": "neutro", "score": 0.5}]
+
+
+def test_interpretar_lote_recusa_tamanho_errado_ou_json_quebrado():
+    assert interpretar_lote(json.dumps({"itens": [{"label": "neutro", "score": 0.5}]}), 2) is None
+    assert interpretar_lote('{"itens": [{"label": "neutro"', 1) is None
+    assert interpretar_lote("sem json nenhum", 1) is None
+
+
+def _ia_falsa(monkeypatch, responder):
+    """Troca a chamada de lote da IA por `responder(mensagens)`; retorna a lista de tamanhos enviados."""
+    enviados = []
+
+    async def _chamar(system, user, max_tokens, limite, formato=None, tarefa="classificacao"):
+        corpo = user.split("\n\n", 1)[1].rsplit("\n\nResposta:", 1)[0]
+        mensagens = corpo.split(SEPARADOR)
+        enviados.append(len(mensagens))
+        return responder(mensagens), {"usage": {}, "provedor": "teste"}
+
+    monkeypatch.setattr(nlp_utils, "_chamar_lote_com_retry", _chamar)
+    return enviados
+
+
+def _classificar(lote):
+    return asyncio.run(nlp_utils._classificar_lote_async(lote, LimiteAdaptativo(2)))
+
+
+def _lote(n):
+    return [f"Mensagem {i} sobre o pedido {i}" for i in range(n)]
+
+
+def test_lote_quebrado_e_reparado_por_bisseccao(monkeypatch):
+    # Só lotes de até 2 mensagens voltam dentro do contrato
+    def _responder(mensagens):
+        if len(mensagens) > 2:
+            return "Claro! {\"itens\": ["
+        return json.dumps({"itens": [{"label": "neutro", "score": 0.8} for _ in mensagens]})
+
+    enviados = _ia_falsa(monkeypatch, _responder)
+    resultados, meta = _classificar(_lote(8))
+    assert resultados == [{"label": "neutro", "score": 0.8}] * 8
+    # 8 -> 4 + 4 -> 2 + 2 + 2 + 2 (em largura)
+    assert enviados == [8, 4, 4, 2, 2, 2, 2]
+    assert meta["status"] == "repaired_ok"
+    assert meta["reparos"] == 6
+    assert "heuristica" not in meta
+
+
+def test_so_os_itens_invalidos_sao_reenviados(monkeypatch):
+    def _responder(mensagens):
+        itens = [{"label": "talvez" if "pedido 1" in m and len(mensagens) > 1 else "produtivo", "score": 0.9}
+                 for m in mensagens]
+        return json.dumps({"itens": itens})
+
+    enviados = _ia_falsa(monkeypatch, _responder)
+    resultados, meta = _classificar(_lote(3))
+    assert enviados == [3, 1]
+    assert [r["label"] for r in resultados] == ["produtivo"] * 3
+    assert meta["status"] == "repaired_ok"
+
+
+def test_limite_de_reparos_manda_o_restante_para_a_heuristica(monkeypatch):
+    monkeypatch.setattr(nlp_utils, "LOTE_MAX_REPAROS", 2)
+    enviados = _ia_falsa(monkeypatch, lambda mensagens: "não é json")
+    resultados, meta = _classificar(_lote(8))
+    assert enviados == [8, 4, 4]
+    assert meta["status"] == "heuristic_fallback"
+    assert meta["heuristica"] == list(range(8))
+    assert all(r["label"] in ("produtivo", "improdutivo", "neutro") for r in resultados)
@@ -0,0 +1,75 @@
+import random
+
+from app.duplicatas import IndiceDuplicatas, adaptar_resposta, condensar_mensagens, marcar_peso, peso
+
+MODELO = "Bom dia, o pedido {} chegou com a caixa amassada e faltando a nota fiscal do item comprado na loja."
+
+PALAVRAS = ("boleto fatura entrega prazo reunião contrato cadastro senha acesso nota pedido troca "
+            "devolução cobrança suporte sistema relatório proposta orçamento visita").split()
+
+
+def test_quase_duplicatas_com_numeros_diferentes_formam_um_grupo():
+    indice = IndiceDuplicatas()
+    assert [indice.agrupar(MODELO.format(1000 + i), i) for i in range(5)] == [0] * 5
+    assert indice.agrupar("Preciso da segunda via do boleto da fatura de março, que venceu ontem à noite.", 5) == 5
+    # Mensagens curtas só se agrupam se forem iguais (com os números mascarados)
+    assert indice.agrupar("Pedido 12 ok", 6) == indice.agrupar("pedido 99 OK", 7) == 6
+    assert indice.agrupar("Pedido 12 cancelado", 8) == 8
+    assert indice.tamanhos == {0: 5, 5: 1, 6: 2, 8: 1} and indice.total_grupos == 4
+
+
+def test_grupo_removido_nao_recebe_mais_mensagens():
+    indice = IndiceDuplicatas()
+    indice.agrupar(MODELO.format(1), 0)
+    indice.agrupar("Pedido 12 ok", 1)
+    assert indice.remover(0) == 1 and indice.remover(1) == 1
+    assert indice.agrupar(MODELO.format(2), 2) == 2
+    assert indice.agrupar("Pedido 13 ok", 3) == 3
+
+
+def _unica(aleatorio) -> str:
+    return " ".join(aleatorio.choice(PALAVRAS) for _ in range(12))
+
+
+def test_condensar_gera_grupos_fechados_sem_ler_a_entrada_toda():
+    lidas = []
+    aleatorio = random.Random(3)
+    unicas = [_unica(aleatorio) for _ in range(500)]
+
+    def _entrada():
+        for i in range(1000):
+            lidas.append(i)
+            # Campanha repetida intercalada com mensagens únicas
+            yield MODELO.format(i) if i % 2 else unicas[i // 2]
+
+    contagem = {}
+    grupos = condensar_mensagens(_entrada(), janela=10, contagem=contagem)
+    primeiro = next(grupos)
+    assert primeiro == (unicas[0], 1)
+    assert len(lidas) < 30
+    restantes = list(grupos)
+    # A campanha segue aberta (recebe mensagens o tempo todo) e sai com todas as cópias
+    assert (MODELO.format(1), 500) in restantes
+    assert contagem == {"mensagens": 1000, "grupos": 501}
+    assert sum(n for _, n in [primeiro] + restantes) == 1000
+
+
+def test_janela_cheia_fecha_o_grupo_mais_antigo():
+    mensagens = [MODELO.format(1), "Outra mensagem qualquer, sem relação com a primeira, sobre outro tema.",
+                 MODELO.format(2)]
+    assert list(condensar_mensagens(mensagens, janela=1)) == [(mensagens[0], 1), (mensagens[1], 1), (mensagens[2], 1)]
+    assert list(condensar_mensagens(mensagens)) == [(mensagens[1], 1), (mensagens[0], 2)]
+
+
+def test_peso_marcado_no_texto():
+    assert marcar_peso("texto", 1) == "texto" and peso("texto") == 1
+    assert peso(marcar_peso("texto", 12)) == 12
+
+
+def test_adaptar_resposta_troca_os_numeros_do_representante():
+    origem, destino = MODELO.format(1001), MODELO.format(2002)
+    assert adaptar_resposta("O pedido 1001 será reenviado.", origem, destino) == "O pedido 2002 será reenviado."
+    # Números em quantidade diferente ou ambíguos: a resposta fica como está
+    assert adaptar_resposta("Pedido 1001.", origem, "sem números") == "Pedido 1001."
+    assert adaptar_resposta("Pedido 5.", "5 e 5", "6 e 7") == "Pedido 5."
+    assert adaptar_resposta("", origem, destino) == ""
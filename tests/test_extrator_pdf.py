@@ -0,0 +1,114 @@
+import os
+import time
+
+import pytest
+
+from app import extrator_pdf, uploads
+from app.extrator_pdf import extrair_texto_pdf, iterar_paginas_pdf, iterar_texto_pdf
+from app.nlp_utils import dividir_mensagens, extrair_texto, iterar_mensagens_pdf, preprocessar_texto
+from app.uploads import UploadRecusado
+from benchmarks.corpus import escrever_pdf
+
+
+SEPARADOR = "\n\n---\n\n"
+
+
+def _pdf(caminho, paginas: int = 20) -> list:
+    linhas = [[f"Pagina {p} linha {i}: pedido {p * 10 + i} atrasado." for i in range(3)] for p in range(paginas)]
+    escrever_pdf(str(caminho), linhas, paginas)
+    return linhas
+
+
+@pytest.fixture
+def sem_pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(extrator_pdf, "PDF_PROCESSOS", 0)
+    monkeypatch.setattr(extrator_pdf, "PDF_CACHE_DIR", str(tmp_path / "cache"))
+
+
+def test_paginas_na_ordem_com_e_sem_pool(monkeypatch, tmp_path, sem_pool):
+    caminho = tmp_path / "caixa.pdf"
+    linhas = _pdf(caminho)
+    paginas = list(iterar_paginas_pdf(caminho))
+    assert len(paginas) == 20
+    assert all(l[0] in pagina for l, pagina in zip(linhas, paginas))
+    monkeypatch.setattr(extrator_pdf, "PDF_PROCESSOS", 2)
+    monkeypatch.setattr(extrator_pdf, "PDF_PAGINAS_POR_TAREFA", 3)
+    monkeypatch.setattr(extrator_pdf, "PDF_CACHE_DIR", "")
+    try:
+        assert list(iterar_paginas_pdf(caminho)) == paginas
+    finally:
+        extrator_pdf.encerrar_pool(esperar=True)
+    assert extrair_texto_pdf(caminho.read_bytes()) == "\n".join(paginas).strip()
+
+
+def test_segunda_extracao_sai_do_cache(monkeypatch, tmp_path, sem_pool):
+    caminho = tmp_path / "caixa.pdf"
+    _pdf(caminho, 5)
+    primeira = list(iterar_paginas_pdf(caminho))
+
+    def _nao_extrair(*args):
+        raise AssertionError("deveria ler do cache")
+
+    monkeypatch.setattr(extrator_pdf, "_extrair_paginas", _nao_extrair)
+    assert list(iterar_paginas_pdf(caminho)) == primeira
+
+
+def test_extracao_interrompida_nao_publica_o_cache(tmp_path, sem_pool):
+    caminho = tmp_path / "caixa.pdf"
+    _pdf(caminho, 20)
+    paginas = iterar_paginas_pdf(caminho)
+    next(paginas)
+    paginas.close()
+    assert list((tmp_path / "cache").iterdir()) == []
+
+
+def test_pdf_invalido_cai_para_texto(sem_pool):
+    assert extrair_texto(b"%PDF-1.4 isto nao e um pdf", "a.pdf", "pdf") == "%PDF-1.4 isto nao e um pdf"
+
+
+def test_mensagens_do_pdf_saem_em_fluxo_iguais_ao_texto_inteiro(tmp_path, sem_pool):
+    caminho = tmp_path / "caixa.pdf"
+    _pdf(caminho, 6)
+    pedacos = list(iterar_texto_pdf(caminho))
+    assert len(pedacos) == 6 and "".join(pedacos).strip() == extrair_texto_pdf(caminho)
+    texto = preprocessar_texto(extrair_texto(caminho.read_bytes(), "a.pdf", "pdf"))
+    assert list(iterar_mensagens_pdf(caminho.read_bytes())) == [p.strip() for p in texto.split(SEPARADOR) if p.strip()]
+
+
+def test_dividir_mensagens_independe_dos_cortes():
+    texto = "  primeira\n\n---\n\n\n\n---\n\nsegunda  \n\n---\n\nterceira\n\n---\n\n"
+    esperado = [p.strip() for p in texto.split(SEPARADOR) if p.strip()]
+    for tamanho in range(1, len(texto) + 1):
+        pedacos = [texto[i:i + tamanho] for i in range(0, len(texto), tamanho)]
+        assert list(dividir_mensagens(pedacos)) == esperado == ["primeira", "segunda", "terceira"]
+
+
+def test_pdf_acima_do_limite_de_mensagens_e_recusado(monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_MAX_MENSAGENS", 2)
+    texto = SEPARADOR.join(["a", "b", "c"]).encode()
+    with pytest.raises(UploadRecusado) as erro:
+        list(iterar_mensagens_pdf(texto))
+    assert erro.value.status == 413
+
+
+def test_limpeza_do_cache_por_idade_e_tamanho(monkeypatch, tmp_path):
+    monkeypatch.setattr(extrator_pdf, "PDF_CACHE_MAX_IDADE", 3600)
+    monkeypatch.setattr(extrator_pdf, "PDF_CACHE_MAX_BYTES", 250)
+    agora = time.time()
+    for nome, idade in [("velho.jsonl", 7200), ("orfao.1.2.tmp", 7200), ("a.jsonl", 30), ("b.jsonl", 20), ("c.jsonl", 10)]:
+        arquivo = tmp_path / nome
+        arquivo.write_text("x" * 100)
+        os.utime(arquivo, (agora - idade, agora - idade))
+    assert extrator_pdf.limpar_cache_pdf(str(tmp_path)) == 3
+    # Sobram os dois usados mais recentemente (200 bytes, abaixo do limite)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.jsonl", "c.jsonl"]
+
+
+def test_leitura_do_cache_renova_o_uso(tmp_path, sem_pool):
+    caminho = tmp_path / "caixa.pdf"
+    _pdf(caminho, 2)
+    list(iterar_paginas_pdf(caminho))
+    (arquivo,) = (tmp_path / "cache").iterdir()
+    os.utime(arquivo, (0, 0))
+    list(iterar_paginas_pdf(caminho))
+    assert arquivo.stat().st_mtime > time.time() - 60
@@ -0,0 +1,45 @@
+from app.heuristica import MotorRegras, dobrar, obter_motor
+
+REGRAS = {
+    "padrao": {"label": "neutro", "score": 0.3},
+    "labels": {
+        "produtivo": {"reuni*": 1, "prazo": 1, "entrega*": 1},
+        "improdutivo": {"ganhou prêmio": 2, "promoç*": 1},
+    },
+}
+
+
+def test_dobrar_tira_acentos_e_maiusculas():
+    assert dobrar("Reunião PROMOÇÃO") == "reuniao promocao"
+
+
+def test_termos_exatos_prefixos_e_multipalavra():
+    motor = MotorRegras(REGRAS)
+    assert motor.classificar("Vamos marcar a REUNIÃO") == ("produtivo", 0.83)
+    assert motor.classificar("Vamos marcar a REUNIÃO do prazo") == ("produtivo", 0.9)
+    # Prefixo casa com o resto da palavra; termo exato exige a palavra inteira
+    assert motor.classificar("As entregas atrasaram")[0] == "produtivo"
+    assert motor.classificar("prazos")[0] == "neutro"
+    # Termo com espaço aceita qualquer espaçamento entre as palavras
+    assert motor.classificar("Você ganhou\n  premio!") == ("improdutivo", 0.9)
+    assert motor.classificar("nada a ver") == ("neutro", 0.3)
+    assert motor.classificar("") == ("neutro", 0.0)
+
+
+def test_termo_conta_uma_vez_por_mensagem():
+    motor = MotorRegras(REGRAS)
+    assert motor.classificar("promoção promoção promoção reunião") == motor.classificar("promoção reunião")
+
+
+def test_lote_igual_a_uma_mensagem_por_vez():
+    motor = obter_motor()
+    textos = ["Confirmo a reunião de amanhã", "Você ganhou uma promoção!", "", None, "Bom dia",
+              "Projeto pendente: prazo de entrega é sexta"]
+    assert motor.classificar_lote(textos) == [motor.classificar(t) for t in textos]
+
+
+def test_termo_de_varias_palavras_nao_atravessa_mensagens_do_lote():
+    motor = MotorRegras(REGRAS)
+    textos = ["você ganhou", "prêmio da reunião"]
+    assert motor.classificar_lote(textos) == [motor.classificar(t) for t in textos] == [
+        ("neutro", 0.3), ("produtivo", 0.83)]
@@ -0,0 +1,91 @@
+import time
+import asyncio
+
+from app.jobs import FilaJobs
+
+MENSAGENS = [
+    "Bom dia, o pedido 1001 ainda não chegou, podem verificar?",
+    "Preciso da segunda via do boleto da fatura de março.",
+    "Meu cadastro está com o endereço errado, como corrijo?",
+    "O produto do pedido 2002 veio com defeito na tampa.",
+    "Gostaria de cancelar a assinatura a partir do mês que vem.",
+]
+
+
+async def _esperar(fila: FilaJobs, job_id: str, limite: float = 20):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        estado = fila.obter(job_id)
+        if estado["status"] in ("concluido", "erro"):
+            return estado
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"job não terminou: {fila.obter(job_id)}")
+
+
+async def _rodar(fila: FilaJobs, job_id: str):
+    fila.iniciar()
+    try:
+        return await _esperar(fila, job_id)
+    finally:
+        await fila.parar()
+
+
+def test_job_de_classificacao_conclui_com_lotes_parciais(tmp_path):
+    fila = FilaJobs(str(tmp_path), workers=1, lote_mensagens=2)
+    job_id = fila.criar("classify", "\n\n---\n\n".join(MENSAGENS))
+    estado = asyncio.run(_rodar(fila, job_id))
+    assert estado["status"] == "concluido", estado["erro"]
+    assert estado["resultado"]["total"] == len(MENSAGENS)
+    assert estado["progresso"]["lotes_concluidos"] == 3
+    assert len(estado["parcial"]["classificacoes"]) == len(MENSAGENS)
+    # Polling incremental: só os lotes a partir de `desde`
+    assert len(fila.obter(job_id, desde=2)["parcial"]["classificacoes"]) == 1
+
+
+def test_job_abandonado_e_retomado_do_ultimo_lote_gravado(tmp_path):
+    fila = FilaJobs(str(tmp_path), workers=1, lote_mensagens=2, lease=0.5)
+    job_id = fila.criar("classify", "\n\n---\n\n".join(MENSAGENS))
+    # Outro processo classificou o primeiro lote e morreu sem renovar o lease
+    salvo = {"classificacoes": [{"label": "neutro", "score": 0.11, "grupo": 0},
+                                {"label": "neutro", "score": 0.12, "grupo": 1}],
+             "respostas": [None, None]}
+    fila._gravar_lote(job_id, 0, salvo)
+    fila._db.execute("UPDATE jobs SET status = 'executando', dono = 'outro', atualizado_em = ? WHERE id = ?",
+                     (time.time() - 60, job_id))
+
+    estado = asyncio.run(_rodar(fila, job_id))
+    assert estado["status"] == "concluido", estado["erro"]
+    classificacoes = estado["parcial"]["classificacoes"]
+    assert len(classificacoes) == len(MENSAGENS)
+    # O lote gravado não é refeito; os seguintes continuam a numeração das mensagens
+    assert classificacoes[:2] == salvo["classificacoes"]
+    assert all(c["label"] == "produtivo" for c in classificacoes[2:])
+    assert [c["grupo"] for c in classificacoes[2:]] == [2, 3, 4]
+    assert estado["resultado"]["total"] == len(MENSAGENS)
+
+
+def test_parar_devolve_o_job_em_execucao_para_a_fila(tmp_path):
+    fila = FilaJobs(str(tmp_path), workers=1)
+    job_id = fila.criar("classify", MENSAGENS[0])
+    fila._db.execute("UPDATE jobs SET status = 'executando', dono = ? WHERE id = ?", (fila.dono, job_id))
+    asyncio.run(fila.parar())
+    assert fila.obter(job_id)["status"] == "pendente"
+
+
+def test_jobs_terminados_vencidos_sao_apagados_com_lotes_e_entrada(tmp_path):
+    fila = FilaJobs(str(tmp_path), workers=1, retencao=60)
+    antigo = fila.criar("classify", MENSAGENS[0])
+    recente = fila.criar("classify", MENSAGENS[1])
+    pendente = fila.criar("classify", MENSAGENS[2])
+    fila._gravar_lote(antigo, 0, {"classificacoes": [], "respostas": []})
+    fila._finalizar(antigo, "concluido", resultado={"total": 1})
+    fila._finalizar(recente, "erro", erro="falhou")
+    fila._db.execute("UPDATE jobs SET atualizado_em = ? WHERE id IN (?, ?)", (time.time() - 120, antigo, pendente))
+
+    assert fila.limpar_antigos() == 1
+    assert fila.obter(antigo) is None
+    assert fila._db.execute("SELECT COUNT(*) FROM job_lotes WHERE job_id = ?", (antigo,)).fetchone()[0] == 0
+    assert not (tmp_path / f"{antigo}.entrada").exists()
+    # Jobs recentes ou ainda não terminados ficam
+    assert fila.obter(recente)["status"] == "erro" and fila.obter(pendente)["status"] == "pendente"
+    assert (tmp_path / f"{pendente}.entrada").exists()
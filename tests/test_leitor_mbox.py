@@ -0,0 +1,74 @@
+import io
+import mmap
+
+from app.leitor_mbox import iterar_emails_mbox
+
+MBOX = (
+    b"From a@ex.com Mon Jan  1 00:00:00 2024\n"
+    b"From: Cliente <a@ex.com>\n"
+    b"Subject: =?utf-8?q?Pedido_n=C3=A3o_chegou?=\n"
+    b"\n"
+    b"O pedido 10 ainda nao chegou.\n"
+    b"\n"
+    b"From b@ex.com Mon Jan  1 00:00:01 2024\n"
+    b"From: b@ex.com\n"
+    b"Subject: Boleto\n"
+    b"MIME-Version: 1.0\n"
+    b"Content-Type: multipart/mixed; boundary=XX\n"
+    b"\n"
+    b"--XX\n"
+    b"Content-Type: text/plain; charset=latin-1\n"
+    b"Content-Transfer-Encoding: 8bit\n"
+    b"\n"
+    b"Segunda via da fatura de mar\xe7o.\n"
+    b"--XX\n"
+    b"Content-Type: application/pdf\n"
+    b"Content-Disposition: attachment; filename=a.pdf\n"
+    b"\n"
+    b"%PDF-1.4\n"
+    b"--XX--\n"
+)
+
+
+def test_mensagens_com_cabecalhos_decodificados_e_posicoes():
+    mensagens = list(iterar_emails_mbox(MBOX))
+    assert [m.assunto for m in mensagens] == ["Pedido não chegou", "Boleto"]
+    assert mensagens[0].corpo == "O pedido 10 ainda nao chegou."
+    # Multipart: só a parte text/plain, no charset declarado; o anexo fica de fora
+    assert mensagens[1].corpo == "Segunda via da fatura de março."
+    assert mensagens[1].texto == "Assunto: Boleto\n\nSegunda via da fatura de março."
+    assert mensagens[0].cabecalhos["from"] == "Cliente <a@ex.com>"
+    assert (mensagens[0].inicio, mensagens[1].fim) == (0, len(MBOX))
+    assert MBOX[mensagens[1].inicio:].startswith(b"From b@ex.com")
+
+
+def test_bytes_arquivo_e_mmap_dao_o_mesmo_resultado(tmp_path):
+    caminho = tmp_path / "caixa.mbox"
+    caminho.write_bytes(MBOX)
+    esperado = [(m.texto, m.inicio, m.fim) for m in iterar_emails_mbox(MBOX)]
+    with open(caminho, "rb") as f:
+        assert [(m.texto, m.inicio, m.fim) for m in iterar_emails_mbox(f)] == esperado
+    with open(caminho, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        assert [(m.texto, m.inicio, m.fim) for m in iterar_emails_mbox(mapa)] == esperado
+
+
+def test_leitura_incremental():
+    lidas = []
+
+    class Arquivo(io.BytesIO):
+        def __iter__(self):
+            for linha in io.BytesIO(self.getvalue()):
+                lidas.append(linha)
+                yield linha
+
+    mensagens = iterar_emails_mbox(Arquivo(MBOX * 1000))
+    primeira = next(mensagens)
+    assert primeira.assunto == "Pedido não chegou"
+    # A primeira mensagem sai ao encontrar o "From " da segunda, sem ler o resto do arquivo
+    assert len(lidas) == MBOX.count(b"\n", 0, MBOX.index(b"From b@")) + 1
+
+
+def test_blocos_vazios_sao_ignorados():
+    assert list(iterar_emails_mbox(b"   \n")) == []
+    # Linhas em branco antes do primeiro separador não viram mensagem
+    assert [m.texto for m in iterar_emails_mbox(b"\n\nFrom y\nSubject: Oi\n\ncorpo\n")] == ["Assunto: Oi\n\ncorpo"]
@@ -0,0 +1,43 @@
+import httpx
+import pytest
+
+from app import limite_taxa
+from app.limite_taxa import LimitadorTaxa, segundos_retry_after
+
+
+def test_workers_com_o_mesmo_arquivo_dividem_o_limite(tmp_path):
+    caminho = str(tmp_path / "limite")
+    a = LimitadorTaxa(rpm=60, tpm=0, caminho=caminho)
+    b = LimitadorTaxa(rpm=60, tpm=0, caminho=caminho)
+    # Rajada de 1 s a 1 req/s: a primeira sai na hora e as seguintes ficam espaçadas, na ordem
+    esperas = [a.reservar(10), b.reservar(10), a.reservar(10)]
+    assert esperas[0] == 0
+    assert esperas[1] == pytest.approx(1, abs=0.05) and esperas[2] == pytest.approx(2, abs=0.05)
+
+
+def test_balde_de_tokens_e_chamada_maior_que_o_balde(tmp_path):
+    limitador = LimitadorTaxa(rpm=0, tpm=6000, caminho=str(tmp_path / "limite"))
+    assert limitador.reservar(100) == 0
+    # 100 tokens/s: o saldo negativo de 100 tokens leva ~1 s para zerar
+    assert limitador.reservar(100) == pytest.approx(1, abs=0.05)
+    # Maior que o balde inteiro: cobra só o balde
+    assert limitador.reservar(1_000_000) == pytest.approx(2, abs=0.05)
+
+
+def test_429_pausa_todos_os_processos(tmp_path):
+    caminho = str(tmp_path / "limite")
+    a = LimitadorTaxa(rpm=6000, tpm=0, caminho=caminho)
+    b = LimitadorTaxa(rpm=6000, tpm=0, caminho=caminho)
+    a.pausar(3)
+    assert b.reservar(1) == pytest.approx(3, abs=0.05)
+
+
+def test_retry_after():
+    pedido = httpx.Request("POST", "http://ia")
+    assert segundos_retry_after(httpx.Response(429, headers={"Retry-After": "2.5"}, request=pedido)) == 2.5
+    sem = httpx.Response(429, request=pedido)
+    assert segundos_retry_after(sem) == segundos_retry_after(None) == limite_taxa.LLM_LIMITE_PAUSA_429
+
+
+def test_sem_limite_configurado_nao_ha_limitador():
+    assert limite_taxa.obter_limitador() is None
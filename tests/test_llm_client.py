@@ -0,0 +1,44 @@
+import asyncio
+
+import pytest
+
+from app.llm_client import ClienteLLM, executar_sincrono
+
+
+def test_sessao_unica_por_event_loop(stub_openai):
+    cliente = ClienteLLM(max_concorrencia=2)
+    url = f"http://127.0.0.1:{stub_openai}/v1/chat/completions"
+    payload = {"model": "gpt-teste", "messages": [{"role": "user", "content": "Olá"}], "max_tokens": 10}
+
+    async def _rodar():
+        sessoes = set()
+
+        async def _chamar():
+            sessoes.add(id(cliente._garantir_sessao()))
+            return await cliente.post_json(url, payload)
+
+        respostas = await asyncio.gather(*(_chamar() for _ in range(6)))
+        sessao = cliente._http
+        await cliente.fechar()
+        return respostas, sessoes, sessao
+
+    respostas, sessoes, sessao = asyncio.run(_rodar())
+    assert all(r["choices"][0]["message"]["content"] for r in respostas)
+    assert len(sessoes) == 1
+    assert sessao.is_closed and cliente._http is None
+    # Um novo loop (wrapper síncrono) ganha uma sessão nova
+    respostas, _, outra = asyncio.run(_rodar())
+    assert outra is not sessao
+
+
+def test_wrapper_sincrono_recusa_loop_em_execucao():
+    async def _nada():
+        return 1
+
+    assert executar_sincrono(_nada()) == 1
+
+    async def _dentro_do_loop():
+        executar_sincrono(_nada())
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(_dentro_do_loop())
@@ -0,0 +1,72 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.lotes import LimiteAdaptativo, eh_sobrecarga, executar_em_lotes, iterar_em_lotes
+
+
+def test_limite_cai_pela_metade_e_sobe_aos_poucos():
+    limite = LimiteAdaptativo(8, janela=2)
+    limite.registrar_sobrecarga()
+    limite.registrar_sobrecarga()
+    assert limite.limite == 2
+    for _ in range(4):
+        limite.registrar_sucesso()
+    assert limite.limite == 4
+    for _ in range(3):
+        limite.registrar_sobrecarga()
+    assert limite.limite == 1
+
+
+def test_sobrecarga_e_so_429_5xx_ou_timeout():
+    requisicao = httpx.Request("POST", "http://ia.teste")
+
+    def _erro(status):
+        return httpx.HTTPStatusError("erro", request=requisicao, response=httpx.Response(status, request=requisicao))
+
+    assert eh_sobrecarga(_erro(429)) and eh_sobrecarga(_erro(503))
+    assert not eh_sobrecarga(_erro(400))
+    assert eh_sobrecarga(httpx.ReadTimeout("lento"))
+    assert not eh_sobrecarga(ValueError("json"))
+
+
+def test_lotes_respeitam_o_limite_e_voltam_na_ordem_da_entrada():
+    em_voo = {"agora": 0, "maximo": 0}
+
+    async def _processar(lote):
+        em_voo["agora"] += 1
+        em_voo["maximo"] = max(em_voo["maximo"], em_voo["agora"])
+        # Lotes maiores terminam antes, para a ordem de conclusão diferir da de entrada
+        await asyncio.sleep(0.01 / len(lote))
+        em_voo["agora"] -= 1
+        return sum(lote)
+
+    lotes = ([i] * (10 - i) for i in range(8))
+    resultados = asyncio.run(executar_em_lotes(lotes, _processar, LimiteAdaptativo(3)))
+    assert resultados == [i * (10 - i) for i in range(8)]
+    assert em_voo["maximo"] == 3
+
+
+def test_erro_num_lote_cancela_os_demais():
+    cancelados = []
+
+    async def _processar(lote):
+        if lote == 0:
+            raise RuntimeError("falhou")
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelados.append(lote)
+            raise
+
+    async def _rodar():
+        entregues = []
+        with pytest.raises(RuntimeError):
+            async for indice, _ in iterar_em_lotes(range(4), _processar, LimiteAdaptativo(4)):
+                entregues.append(indice)
+        await asyncio.sleep(0)
+        return entregues
+
+    assert asyncio.run(_rodar()) == []
+    assert sorted(cancelados) == [1, 2, 3]
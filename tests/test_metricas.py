@@ -0,0 +1,59 @@
+import asyncio
+
+from app import metricas
+from app.metricas import RegistroMetricas, medir, rastro_atual
+
+
+def test_exporta_contadores_e_histogramas_no_formato_do_prometheus():
+    registro = RegistroMetricas(faixas=(0.1, 1.0))
+    registro.contar("autou_requisicoes_total", rota="/classify", status=200)
+    registro.contar("autou_requisicoes_total", 2, rota="/classify", status=200)
+    registro.observar("autou_etapa_segundos", 0.05, etapa="extracao")
+    registro.observar("autou_etapa_segundos", 0.5, etapa="extracao")
+    registro.observar("autou_etapa_segundos", 5, etapa="extracao")
+    registro.registrar_coletor(lambda: [("autou_cache_total", {"resultado": 'hit "x"'}, 4)])
+    linhas = registro.exportar().splitlines()
+    assert "# TYPE autou_requisicoes_total counter" in linhas
+    assert 'autou_requisicoes_total{rota="/classify",status="200"} 3' in linhas
+    assert [l for l in linhas if l.startswith("autou_etapa_segundos")] == [
+        'autou_etapa_segundos_bucket{etapa="extracao",le="0.1"} 1',
+        'autou_etapa_segundos_bucket{etapa="extracao",le="1"} 2',
+        'autou_etapa_segundos_bucket{etapa="extracao",le="+Inf"} 3',
+        'autou_etapa_segundos_sum{etapa="extracao"} 5.55',
+        'autou_etapa_segundos_count{etapa="extracao"} 3',
+    ]
+    assert 'autou_cache_total{resultado="hit \\"x\\""} 4' in linhas
+
+
+def test_registro_desligado_nao_guarda_nada(monkeypatch):
+    monkeypatch.setattr(metricas, "METRICAS_ATIVO", False)
+    registro = RegistroMetricas()
+    registro.contar("x_total")
+    registro.observar("y_segundos", 1.0)
+    assert registro.exportar() == "\n"
+
+
+def test_medir_alimenta_a_etapa_e_o_rastro_da_requisicao():
+    async def _requisicao():
+        marca = metricas._rastro.set({})
+        try:
+            with medir("classificacao"):
+                assert metricas.etapa_atual() == "classificacao"
+                await asyncio.sleep(0.01)
+            with medir("classificacao"):
+                pass
+            return rastro_atual()
+        finally:
+            metricas._rastro.reset(marca)
+
+    rastro = asyncio.run(_requisicao())
+    assert rastro["classificacao"]["chamadas"] == 2 and rastro["classificacao"]["ms"] >= 10
+    assert metricas.etapa_atual() == "outra" and rastro_atual() is None
+
+
+def test_endpoint_metrics_conta_as_requisicoes(cliente):
+    cliente.post("/classify", data={"text": "O pedido 1001 não chegou."})
+    r = cliente.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'autou_requisicoes_total{rota="/classify",status="200"}' in r.text
+    assert 'autou_etapa_segundos_count{etapa="preprocessamento"}' in r.text
@@ -0,0 +1,67 @@
+import asyncio
+
+import httpx
+
+from app import nlp_utils
+from app.nlp_utils import RESPOSTAS_PADRAO, gerar_respostas_async, iterar_classificacao_e_resposta_async
+
+
+def _sem_cache(monkeypatch):
+    monkeypatch.setattr(nlp_utils, "obter_cache", lambda: None)
+
+
+def test_uma_resposta_por_mensagem_e_nenhuma_para_improdutivas(monkeypatch):
+    _sem_cache(monkeypatch)
+    mensagens = ["O pedido 10 não chegou.", "Promoção imperdível!", "Preciso do boleto."]
+    classificacoes = [{"label": "produtivo"}, {"label": "improdutivo"}, {"label": "neutro"}]
+    respostas, metas = asyncio.run(gerar_respostas_async(mensagens, classificacoes))
+    assert respostas[1] is None and metas[1] == {"source": "ignorada"}
+    assert respostas[0] and respostas[2]
+    assert metas[0]["source"] == metas[2]["source"] == "openai"
+
+
+def test_falha_da_ia_usa_a_resposta_padrao_do_label(monkeypatch):
+    _sem_cache(monkeypatch)
+
+    async def _falhar(*args, **kwargs):
+        raise httpx.ConnectError("fora do ar")
+
+    monkeypatch.setattr(nlp_utils, "_call_openai_system_user_async", _falhar)
+    resposta, meta = nlp_utils.gerar_resposta_com_openai("O pedido 10 não chegou.", "produtivo")
+    assert resposta == RESPOSTAS_PADRAO["produtivo"]
+    assert meta["fallback_response"] and not meta["degradado"]
+
+
+def test_respostas_saem_junto_com_as_classificacoes_e_grupos_reaproveitam(monkeypatch):
+    _sem_cache(monkeypatch)
+    mensagens = ["O pedido 10 não chegou.", "O pedido 11 não chegou.", "Promoção!", "Boleto vencido."]
+    itens = [{"label": "produtivo", "score": 0.9, "grupo": 0}, {"label": "produtivo", "score": 0.9, "grupo": 0},
+             {"label": "improdutivo", "score": 0.8, "grupo": 2}, {"label": "produtivo", "score": 0.7, "grupo": 3}]
+    geradas = []
+
+    async def _classificar(msgs, max_por_lote, max_em_voo, meta):
+        lista = list(msgs)
+        yield [(i, itens[i], lista[i]) for i in range(2)]
+        yield [(i, itens[i], lista[i]) for i in range(2, 4)]
+
+    async def _gerar(texto, label):
+        geradas.append(texto)
+        return f"Vamos verificar o pedido 10. ({label})", {"source": "openai"}
+
+    monkeypatch.setattr(nlp_utils, "iterar_classificacoes_async", _classificar)
+    monkeypatch.setattr(nlp_utils, "gerar_resposta_com_openai_async", _gerar)
+
+    async def _rodar():
+        meta = {}
+        eventos = [e async for e in iterar_classificacao_e_resposta_async(iter(mensagens), meta=meta)]
+        return eventos, meta
+
+    eventos, meta = asyncio.run(_rodar())
+    respostas = {e[1]: e[2] for e in eventos if e[0] == "resposta"}
+    assert sorted(e[1] for e in eventos if e[0] == "classificacao") == [0, 1, 2, 3]
+    # Só o representante do grupo e a mensagem avulsa vão para a IA
+    assert geradas == [mensagens[0], mensagens[3]]
+    assert respostas[1] == "Vamos verificar o pedido 11. (produtivo)"
+    assert respostas[2] is None
+    assert {k: meta["respostas"][k] for k in ("geradas", "ignoradas", "reaproveitadas")} == {
+        "geradas": 2, "ignoradas": 1, "reaproveitadas": 1}
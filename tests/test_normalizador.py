@@ -0,0 +1,48 @@
+import random
+import re
+
+from app.normalizador import iterar_normalizado, normalizar_em_pedacos, normalizar_texto
+
+
+def _antigo(texto: str) -> str:
+    # Pipeline original de preprocessar_texto (quatro regex seguidas + strip)
+    if not texto:
+        return ""
+    texto = texto.replace("\r", "\n")
+    texto = re.sub(r"[^\x00-\x7F\u00C0-\u017F\n\t,.!?;:()\"'@%$ªºº\-—\s]", " ", texto)
+    texto = re.sub(r"[ \t]+", " ", texto)
+    texto = re.sub(r"\n{3,}", "\n\n", texto)
+    return texto.strip()
+
+
+# Letras, acentos, espaços Unicode, proibidos (emoji, CJK, aspas curvas) e todas as quebras
+ALFABETO = list("ab ção—ªº.-") + [" ", "\t", "\r", "\n", " ", " ", "　", "\x0b", "\x1f",
+                                 "😀", "中", "“", " ", "\x85"]
+
+
+def _textos(quantidade: int, seed: int = 12):
+    aleatorio = random.Random(seed)
+    for _ in range(quantidade):
+        yield "".join(aleatorio.choice(ALFABETO) for _ in range(aleatorio.randint(0, 80)))
+
+
+def test_uma_passada_igual_ao_pipeline_antigo():
+    for texto in _textos(3000):
+        assert normalizar_texto(texto) == _antigo(texto), repr(texto)
+    assert normalizar_texto("") == _antigo("") == ""
+
+
+def test_em_pedacos_igual_ao_pipeline_antigo_em_qualquer_fronteira():
+    for texto in _textos(400, seed=7):
+        esperado = _antigo(texto)
+        for tamanho in (1, 2, 3, 5, 17):
+            pedacos = [texto[i:i + tamanho] for i in range(0, len(texto), tamanho)]
+            assert "".join(iterar_normalizado(pedacos)) == esperado, (repr(texto), tamanho)
+
+
+def test_sequencia_longa_de_espacos_entre_pedacos():
+    texto = "início" + " \t😀" * 3000 + "\r\n" * 5000 + "fim \n\n"
+    esperado = _antigo(texto)
+    assert esperado == "início \n\nfim"
+    assert "".join(normalizar_em_pedacos(texto, tamanho=1000)) == esperado
+    assert "".join(iterar_normalizado(["", texto[:10], "", texto[10:]])) == esperado
@@ -0,0 +1,67 @@
+from app.planejador_lotes import PlanejadorLotes, max_tokens_saida, reduzir_mensagem, LOTE_TOKENS_MARGEM
+from app.tokens import CalibradorTokens, estimar_tokens
+
+
+def _planejar(planejador, tamanhos: list) -> list:
+    lotes = []
+    for i, tokens in enumerate(tamanhos):
+        fechado = planejador.adicionar(i, tokens)
+        if fechado:
+            lotes.append(fechado)
+    return lotes + [planejador.fechar()]
+
+
+def test_lote_fecha_pelo_orcamento_ou_pelo_numero_de_itens():
+    assert _planejar(PlanejadorLotes(orcamento_tokens=100, max_itens=50), [40, 40, 40, 90, 10]) == [
+        [0, 1], [2], [3, 4]]
+    assert _planejar(PlanejadorLotes(orcamento_tokens=10_000, max_itens=2), [1] * 5) == [[0, 1], [2, 3], [4]]
+    # Mensagem maior que o orçamento vai sozinha, sem lote vazio antes dela
+    assert _planejar(PlanejadorLotes(orcamento_tokens=10), [50, 5]) == [[0], [1]]
+    assert PlanejadorLotes().fechar() == []
+
+
+def test_reduzir_tira_historico_citacoes_e_assinatura():
+    texto = ("Olá, o boleto 123 veio com valor errado.\n> linha citada\nPodem corrigir?\n\n"
+             "Atenciosamente,\nMaria Souza\nFinanceiro\n\n"
+             "Em 10/03/2024 10:00, Suporte <suporte@x.com> escreveu:\n> mensagem anterior")
+    assert reduzir_mensagem(texto) == ("Olá, o boleto 123 veio com valor errado.\nPodem corrigir?\n\n"
+                                       "Atenciosamente,")
+    assert reduzir_mensagem("Segue o relatório.\n-- \nJoão\nEnviado do meu iPhone") == "Segue o relatório."
+    # Fecho seguido de texto longo não é assinatura
+    longo = "Obrigado\n" + "continua o pedido " * 40
+    assert reduzir_mensagem(longo) == longo.strip()
+    # Se a limpeza apagar tudo, fica o original
+    assert reduzir_mensagem("> só citação") == "> só citação"
+
+
+def test_reduzir_corta_no_limite_de_tokens():
+    reduzido = reduzir_mensagem("palavra " * 5000, max_tokens=100)
+    assert estimar_tokens(reduzido) <= 100 and not reduzido.endswith(" ")
+    assert reduzido.startswith("palavra palavra")
+
+
+def test_calibrador_segue_o_uso_real_dentro_dos_limites():
+    calibrador = CalibradorTokens(peso=0.5)
+    texto = "x" * 400
+    base = calibrador.estimar(texto)
+    for _ in range(20):
+        calibrador.registrar(100, 200)
+    assert calibrador.estimar(texto) > 1.9 * base
+    for _ in range(20):
+        calibrador.registrar(100, 10_000)
+    assert calibrador.fator <= calibrador.maximo
+    fator = calibrador.fator
+    calibrador.registrar(100, None)
+    calibrador.registrar(0, 50)
+    assert calibrador.fator == fator
+    assert calibrador.estimar("") == 0
+
+
+def test_registrar_uso_calibra_o_planejador_e_max_tokens_da_saida():
+    planejador = PlanejadorLotes(calibrador=CalibradorTokens(peso=1.0))
+    texto = "mensagem de teste " * 50
+    antes = planejador.estimar(texto)
+    planejador.registrar_uso(texto, {"prompt_tokens": 2 * estimar_tokens(texto)})
+    planejador.registrar_uso(texto, None)
+    assert planejador.estimar(texto) > antes
+    assert max_tokens_saida(10) > max_tokens_saida(1) == max_tokens_saida(0) > LOTE_TOKENS_MARGEM
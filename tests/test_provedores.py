@@ -0,0 +1,85 @@
+import socket
+import asyncio
+
+import pytest
+
+from app import provedores
+from app.nlp_utils import _call_openai_system_user_async
+from app.provedores import Provedor, Roteador, carregar_roteador
+from app.resiliencia import ABERTO, ChamadorResiliente, Disjuntor
+
+
+def _porta_fechada() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _roteador(url_local: str, url_openai: str) -> Roteador:
+    local = Provedor("local", url_local, "modelo-local", local=True, max_concorrencia=2)
+    openai = Provedor("openai", url_openai, "gpt-teste", chave_env="OPENAI_API_KEY",
+                      preco_entrada=0.15, preco_saida=0.6)
+    return Roteador({"local": local, "openai": openai},
+                    {"classificacao": ["local", "openai"], "resposta": ["openai"]})
+
+
+def test_rota_prefere_o_provedor_mais_barato():
+    roteador = _roteador("http://local.teste", "http://openai.teste")
+    assert [p.nome for p in roteador.ordenar("classificacao", 500, 50)] == ["local", "openai"]
+    assert [p.nome for p in roteador.ordenar("resposta", 500, 50)] == ["openai"]
+    # Tarefa sem rota própria usa todos os provedores
+    assert {p.nome for p in roteador.ordenar("analise", 500, 50)} == {"local", "openai"}
+    assert roteador.assinatura("classificacao") == "modelo-local+gpt-teste"
+
+
+def test_provedor_saturado_transborda_para_o_seguinte():
+    roteador = _roteador("http://local.teste", "http://openai.teste")
+    roteador.provedores["local"].em_uso = 4
+    assert [p.nome for p in roteador.ordenar("classificacao", 500, 50)] == ["openai", "local"]
+
+
+def test_provedor_sem_chave_ou_com_disjuntor_aberto_sai_da_rota(monkeypatch):
+    roteador = _roteador("http://local.teste", "http://openai.teste")
+    local = roteador.provedores["local"]
+    local.chamador = ChamadorResiliente(Disjuntor("local", falhas_seguidas=1, aberto_s=60))
+    local.chamador.disjuntor.registrar_falha()
+    assert [p.nome for p in roteador.ordenar("classificacao", 500, 50)] == ["openai"]
+    monkeypatch.delenv("OPENAI_API_KEY")
+    assert roteador.ordenar("classificacao", 500, 50) == []
+
+
+def test_contexto_maximo_do_provedor():
+    roteador = _roteador("http://local.teste", "http://openai.teste")
+    roteador.provedores["local"].max_tokens_entrada = 100
+    assert [p.nome for p in roteador.ordenar("classificacao", 500, 50)] == ["openai"]
+
+
+def test_rota_com_provedor_inexistente_e_recusada():
+    local = Provedor("local", "http://local.teste", "modelo-local", local=True)
+    with pytest.raises(ValueError):
+        Roteador({"local": local}, {"classificacao": ["local", "fantasma"]})
+
+
+def test_sem_arquivo_usa_so_o_provedor_openai():
+    roteador = carregar_roteador("")
+    assert list(roteador.provedores) == ["openai"]
+    assert roteador.assinatura("classificacao") == provedores.OPENAI_MODEL
+
+
+def test_falha_do_provedor_local_desvia_para_o_seguinte(monkeypatch, stub_openai):
+    roteador = _roteador(f"http://127.0.0.1:{_porta_fechada()}/v1/chat/completions",
+                         f"http://127.0.0.1:{stub_openai}/v1/chat/completions")
+    local = roteador.provedores["local"]
+    local.chamador = ChamadorResiliente(Disjuntor("local", falhas_seguidas=1, aberto_s=60))
+    monkeypatch.setattr(provedores, "_roteador", roteador)
+
+    async def _chamar():
+        return await _call_openai_system_user_async("Você é um classificador", "Mensagem", max_tokens=20,
+                                                    tarefa="classificacao")
+
+    conteudo, data = asyncio.run(_chamar())
+    assert data["provedor"] == "openai"
+    assert conteudo
+    assert local.chamador.disjuntor.estado == ABERTO
+    # Com o disjuntor do local aberto, a próxima chamada já vai direto para o seguinte
+    assert [p.nome for p in roteador.ordenar("classificacao", 10, 20)] == ["openai"]
@@ -0,0 +1,113 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from app.resiliencia import (
+    ABERTO,
+    FECHADO,
+    MEIO_ABERTO,
+    ChamadorResiliente,
+    Disjuntor,
+    DisjuntorAberto,
+    LLM_MAX_TENTATIVAS,
+)
+
+
+def _erro_http(status: int) -> httpx.HTTPStatusError:
+    requisicao = httpx.Request("POST", "http://ia.teste/v1/chat/completions")
+    return httpx.HTTPStatusError("erro", request=requisicao, response=httpx.Response(status, request=requisicao))
+
+
+def test_disjuntor_abre_apos_falhas_seguidas():
+    disjuntor = Disjuntor("teste", falhas_seguidas=3, aberto_s=60)
+    for _ in range(2):
+        assert disjuntor.permitir()
+        disjuntor.registrar_falha()
+    assert disjuntor.estado == FECHADO
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == ABERTO
+    assert not disjuntor.permitir()
+    assert not disjuntor.disponivel()
+    assert disjuntor.situacao()["estado"] == ABERTO
+
+
+def test_disjuntor_abre_pela_taxa_de_falhas_da_janela():
+    disjuntor = Disjuntor("teste", falhas_seguidas=100, taxa=0.5, janela=4, aberto_s=60)
+    for sucesso in (True, False, True, False):
+        (disjuntor.registrar_sucesso if sucesso else disjuntor.registrar_falha)()
+    assert disjuntor.estado == ABERTO
+
+
+def test_disjuntor_meio_aberto_deixa_uma_sonda_e_fecha_no_sucesso():
+    disjuntor = Disjuntor("teste", falhas_seguidas=1, aberto_s=0.05)
+    disjuntor.registrar_falha()
+    assert not disjuntor.permitir()
+    time.sleep(0.06)
+    assert disjuntor.permitir()
+    assert disjuntor.estado == MEIO_ABERTO
+    # Só uma chamada de teste por vez
+    assert not disjuntor.permitir()
+    disjuntor.registrar_sucesso()
+    assert disjuntor.estado == FECHADO
+    assert disjuntor.permitir()
+
+
+def test_disjuntor_meio_aberto_volta_a_abrir_na_falha():
+    disjuntor = Disjuntor("teste", falhas_seguidas=1, aberto_s=0.05)
+    disjuntor.registrar_falha()
+    time.sleep(0.06)
+    assert disjuntor.permitir()
+    disjuntor.registrar_falha()
+    assert disjuntor.estado == ABERTO
+    assert not disjuntor.permitir()
+
+
+def test_chamador_repete_sobrecarga_e_devolve_o_resultado():
+    chamadas = []
+
+    async def _enviar():
+        chamadas.append(1)
+        if len(chamadas) < LLM_MAX_TENTATIVAS:
+            raise _erro_http(503)
+        return {"ok": True}
+
+    assert asyncio.run(ChamadorResiliente(Disjuntor("teste", falhas_seguidas=100)).chamar(_enviar)) == {"ok": True}
+    assert len(chamadas) == LLM_MAX_TENTATIVAS
+
+
+def test_chamador_relanca_o_ultimo_erro_apos_as_tentativas():
+    avisos = []
+
+    async def _enviar():
+        raise _erro_http(500)
+
+    chamador = ChamadorResiliente(Disjuntor("teste", falhas_seguidas=100))
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(chamador.chamar(_enviar, ao_sobrecarregar=lambda: avisos.append(1)))
+    assert len(avisos) == LLM_MAX_TENTATIVAS
+
+
+def test_chamador_nao_repete_erro_que_nao_e_sobrecarga():
+    chamadas = []
+
+    async def _enviar():
+        chamadas.append(1)
+        raise _erro_http(400)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(ChamadorResiliente(Disjuntor("teste")).chamar(_enviar))
+    assert len(chamadas) == 1
+
+
+def test_chamador_com_disjuntor_aberto_nem_envia():
+    disjuntor = Disjuntor("teste", falhas_seguidas=1, aberto_s=60)
+    disjuntor.registrar_falha()
+
+    async def _enviar():
+        raise AssertionError("não deveria chamar a IA")
+
+    with pytest.raises(DisjuntorAberto) as erro:
+        asyncio.run(ChamadorResiliente(disjuntor).chamar(_enviar))
+    assert erro.value.tentar_em > 0
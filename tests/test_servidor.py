@@ -0,0 +1,24 @@
+import os
+
+from app import servidor
+
+
+def test_padroes_do_modo_multiprocesso(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("CACHE_DB_PATH", raising=False)
+    monkeypatch.delenv("PDF_PROCESSOS", raising=False)
+    monkeypatch.setattr(servidor, "cpus_disponiveis", lambda: 8)
+    servidor.preparar_ambiente(4)
+    assert os.environ["CACHE_DB_PATH"] == os.path.join("cache", "resultados.db")
+    assert (tmp_path / "cache").is_dir()
+    assert os.environ["PDF_PROCESSOS"] == "2"
+
+
+def test_ambiente_definido_tem_precedencia(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("CACHE_DB_PATH", "")
+    monkeypatch.setenv("PDF_PROCESSOS", "3")
+    servidor.preparar_ambiente(16)
+    assert os.environ["CACHE_DB_PATH"] == "" and os.environ["PDF_PROCESSOS"] == "3"
+    assert not (tmp_path / "cache").exists()
+    assert servidor.cpus_disponiveis() >= 1
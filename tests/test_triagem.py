@@ -0,0 +1,65 @@
+from app.triagem import MARCAR, PULAR, TextoTriado, Triagem, descartar_puladas, ler_cabecalhos, obter_triagem
+
+
+def _bloco(*cabecalhos: str, corpo: str = "Olá, tudo bem?") -> bytes:
+    return ("From x@ex.com Mon Jan  1 00:00:00 2024\n" + "\n".join(cabecalhos) + "\n\n" + corpo + "\n").encode()
+
+
+def test_ler_cabecalhos_junta_continuacoes_e_para_no_corpo():
+    bloco = _bloco("Subject: Oferta", "List-Unsubscribe: <mailto:sair@ex.com>,", " <https://ex.com/sair>",
+                   corpo="Subject: isto é corpo")
+    cabecalhos = ler_cabecalhos(bloco)
+    assert cabecalhos["subject"] == "Oferta"
+    assert cabecalhos["list-unsubscribe"] == "<mailto:sair@ex.com>, <https://ex.com/sair>"
+    assert ler_cabecalhos(bloco, {"subject"}) == {"subject": "Oferta"}
+
+
+def test_regras_padrao():
+    triagem = obter_triagem()
+    casos = {
+        _bloco("From: Loja <ofertas@loja.com>", "List-Unsubscribe: <mailto:sair@loja.com>"): ("lista_descadastro", PULAR),
+        _bloco("From: a@ex.com", "Precedence: bulk"): ("precedencia_massa", PULAR),
+        _bloco("From: a@ex.com", "Auto-Submitted: auto-replied"): ("envio_automatico", PULAR),
+        _bloco("From: News <n@news.mailchimp.com>"): ("plataforma_marketing", PULAR),
+        _bloco("From: Sistema <noreply@banco.com>"): ("remetente_sem_resposta", MARCAR),
+    }
+    for bloco, (regra, acao) in casos.items():
+        veredito, _ = triagem.avaliar(bloco)
+        assert (veredito["regra"], veredito["acao"]) == (regra, acao)
+    assert triagem.avaliar(_bloco("From: cliente@ex.com", "Auto-Submitted: no"))[0] is None
+    assert triagem.avaliar(_bloco("From: cliente@ex.com", "Subject: Pedido atrasado"))[0] is None
+
+
+def test_regra_pular_tem_precedencia_sobre_marcar():
+    triagem = Triagem({"regras": [
+        {"nome": "marca", "cabecalho": "from", "contem": ["noreply"], "acao": "marcar"},
+        {"nome": "pula", "cabecalho": "precedence", "valores": ["bulk"]},
+    ]})
+    veredito, _ = triagem.avaliar(_bloco("From: noreply@ex.com", "Precedence: bulk"))
+    assert veredito["regra"] == "pula"
+
+
+def test_mbox_triado_no_classify(cliente):
+    mbox = b"".join((
+        _bloco("From: Loja <ofertas@loja.com>", "List-Unsubscribe: <mailto:sair@loja.com>", "Subject: Oferta"),
+        _bloco("From: cliente@ex.com", "Subject: Pedido 10 atrasado", corpo="O pedido 10 ainda não chegou."),
+        _bloco("From: a@ex.com", "Precedence: bulk", "Subject: Boletim"),
+    ))
+    r = cliente.post("/classify", files={"file": ("caixa.mbox", mbox)})
+    assert r.status_code == 200
+    classificacoes = r.json()["classificacoes"]
+    assert [c.get("triagem") for c in classificacoes] == ["lista_descadastro", None, "precedencia_massa"]
+    assert [c["label"] for c in classificacoes] == ["improdutivo", "produtivo", "improdutivo"]
+    # Mensagens puladas não recebem resposta
+    assert r.json()["respostas"][0] is None and r.json()["respostas"][2] is None
+
+
+def test_descartar_puladas_conta_por_regra():
+    textos = [
+        TextoTriado("oferta", {"regra": "lista_descadastro", "acao": PULAR}),
+        TextoTriado("aviso", {"regra": "remetente_sem_resposta", "acao": MARCAR}),
+        "pedido",
+    ]
+    contagem = {}
+    assert list(descartar_puladas(textos, contagem)) == ["aviso", "pedido"]
+    assert contagem == {"puladas": 1, "regras": {"lista_descadastro": 1}}
@@ -0,0 +1,131 @@
+import io
+import asyncio
+import inspect
+
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.uploads import (
+    UPLOAD_MAX_MENSAGENS,
+    MiddlewareLimiteUpload,
+    contar_mensagens_mbox,
+    detectar_formato,
+    mapear,
+)
+
+
+def _mbox(n: int) -> bytes:
+    return b"".join(
+        b"From cliente%d@ex.com Mon Jan  1 00:00:00 2024\nFrom: cliente%d@ex.com\nSubject: Pedido %d\n\n"
+        b"Qual o status do pedido %d?\n\n" % (i, i, i, i)
+        for i in range(n)
+    )
+
+
+def _app_pequeno(limite: int) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(MiddlewareLimiteUpload, limite=limite)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"tamanho": len(await file.read())}
+
+    return TestClient(app)
+
+
+def test_corpo_acima_do_limite_pelo_content_length():
+    with _app_pequeno(1024) as c:
+        assert c.post("/upload", files={"file": ("a.txt", b"x" * 100)}).status_code == 200
+        r = c.post("/upload", files={"file": ("a.txt", b"x" * 4096)})
+    assert r.status_code == 413
+    assert "limite" in r.json()["erro"]
+
+
+def test_corpo_chunked_acima_do_limite_e_recusado_durante_o_envio():
+    def _corpo():
+        # Multipart sem Content-Length (chunked): só contando os bytes dá para ver o excesso
+        yield b'--limite\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\n'
+        for _ in range(64):
+            yield b"x" * 1024
+        yield b"\r\n--limite--\r\n"
+
+    with _app_pequeno(8 * 1024) as c:
+        r = c.post("/upload", content=_corpo(), headers={"content-type": "multipart/form-data; boundary=limite"})
+    assert r.status_code == 413
+
+
+def test_mbox_com_mensagens_demais_e_recusado(cliente):
+    r = cliente.post("/classify", files={"file": ("caixa.mbox", _mbox(UPLOAD_MAX_MENSAGENS + 1))})
+    assert r.status_code == 413
+    assert str(UPLOAD_MAX_MENSAGENS) in r.json()["erro"]
+
+
+def test_texto_com_mensagens_demais_e_recusado(cliente):
+    texto = "\n\n---\n\n".join(f"Pedido {i} atrasado" for i in range(UPLOAD_MAX_MENSAGENS + 1))
+    assert cliente.post("/classify", data={"text": texto}).status_code == 413
+    assert cliente.post("/classify", files={"file": ("emails.txt", texto.encode())}).status_code == 413
+
+
+def test_job_com_mensagens_demais_e_recusado_na_criacao(cliente):
+    r = cliente.post("/classify", files={"file": ("caixa.mbox", _mbox(UPLOAD_MAX_MENSAGENS + 1))},
+                     data={"assincrono": "true"})
+    assert r.status_code == 413
+
+
+def test_formato_binario_e_recusado(cliente):
+    r = cliente.post("/classify", files={"file": ("planilha.txt", b"PK\x03\x04" + b"\x00" * 64)})
+    assert r.status_code == 415
+
+
+def test_contagem_e_mapeamento_do_mbox(tmp_path):
+    conteudo = _mbox(7)
+    assert contar_mensagens_mbox(conteudo) == 7
+    assert contar_mensagens_mbox(io.BytesIO(conteudo)) == 7
+    caminho = tmp_path / "caixa.mbox"
+    caminho.write_bytes(conteudo)
+    assert contar_mensagens_mbox(caminho) == 7
+    with mapear(caminho) as mapeado:
+        assert bytes(mapeado[:5]) == b"From "
+
+
+def test_mbox_exige_a_linha_from_completa_e_respeita_o_txt():
+    assert detectar_formato(_mbox(1), "caixa") == "mbox"
+    assert detectar_formato(b"From fulano@ex.com Mon Jan 1 00:00:00 +0000 2024\r\nSubject: x\r\n\r\ny") == "mbox"
+    # E-mail colado que começa com "From " é texto
+    assert detectar_formato(b"From the desk of the CEO: the meeting moved to Friday.") == "texto"
+    assert detectar_formato(_mbox(1), "emails.txt") == "texto"
+    # Sem a linha completa, a extensão .mbox ainda decide
+    assert detectar_formato(b"Subject: x\n\ny", "caixa.mbox") == "mbox"
+
+
+def test_texto_comecando_com_from_vai_para_a_classificacao_como_texto(cliente):
+    r = cliente.post("/classify", files={"file": ("emails.txt", b"From the desk of the CEO: pedido 10 atrasado.")})
+    assert r.status_code == 200 and r.json()["classificacao"]["label"] == "produtivo"
+
+
+def test_formulario_lido_uma_vez_com_await(cliente):
+    from app.uploads import RequisicaoUpload
+
+    assert inspect.iscoroutinefunction(RequisicaoUpload.form)
+    r = cliente.post("/classify", files={"file": ("emails.txt", b"Pedido 10 atrasado.")}, data={"text": "ignorado"})
+    assert r.status_code == 200
+
+
+def test_validacao_do_upload_roda_fora_do_event_loop(cliente, monkeypatch):
+    from app import main
+
+    em_loop = []
+    original = main._validar_upload
+
+    def _validar(file):
+        try:
+            asyncio.get_running_loop()
+            em_loop.append(True)
+        except RuntimeError:
+            em_loop.append(False)
+        return original(file)
+
+    monkeypatch.setattr(main, "_validar_upload", _validar)
+    cliente.post("/classify", files={"file": ("emails.txt", b"Pedido 10 atrasado.")})
+    cliente.post("/analise", files={"file": ("emails.txt", b"Pedido 10 atrasado.")})
+    assert em_loop == [False, False]